@@ -0,0 +1,275 @@
+"""
+Exportación de los lugares y reseñas en caché a archivos tabulares.
+Los registros fluyen por generadores (lectura -> filtro -> fila -> lote) y se
+escriben de a lotes, de modo que la memoria no crece con el tamaño del caché.
+Formatos: JSONL y CSV siempre; Parquet si pyarrow está instalado.
+
+Uso por línea de comandos:
+    python cache_export.py --formato csv --region "Valle del Elqui" --desde 2024-01-01
+"""
+import os
+import csv
+import json
+import time
+import tempfile
+import argparse
+from datetime import date, datetime
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Any, Callable, Iterable, Iterator, Optional, Set, Tuple
+
+from cached_places import CACHE_DIR, iter_registros_en_cache, iter_resenas_en_cache
+from review_index import plegar
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet es opcional
+    pa = None
+    pq = None
+
+
+EXPORT_DIR = CACHE_DIR / "exports"
+TAMANO_LOTE = 1000  # Filas por lote (y por row group en Parquet)
+FORMATOS_EXPORTACION = ["jsonl", "csv", "parquet"]
+CONJUNTOS_EXPORTACION = ["lugares", "resenas"]
+
+# Columnas de cada conjunto con su tipo ("texto", "real", "entero", "logico", "lista")
+COLUMNAS = {
+    "lugares": [
+        ("place_id", "texto"), ("name", "texto"), ("address", "texto"), ("lat", "real"), ("lng", "real"),
+        ("types", "lista"), ("rating", "real"), ("user_ratings_total", "entero"), ("category", "texto"),
+        ("fuente", "texto"), ("timestamp", "texto"), ("query", "texto"), ("ubicacion", "texto"),
+    ],
+    "resenas": [
+        ("place_id", "texto"), ("nombre", "texto"), ("autor", "texto"), ("rating", "real"),
+        ("idioma", "texto"), ("idioma_original", "texto"), ("traducida", "logico"), ("fecha", "texto"),
+        ("time", "entero"), ("texto", "texto"), ("fuente", "texto"), ("timestamp", "texto"),
+    ],
+}
+
+
+class FiltroExportacion:
+    """Filtros por región, consulta y rango de fechas (YYYY-MM-DD, inclusivo)."""
+
+    def __init__(self, region: Optional[str] = None, query: Optional[str] = None,
+                 desde: Optional[str] = None, hasta: Optional[str] = None):
+        self.region = plegar(region.lower()) if region else None
+        self.query = plegar(query.lower()) if query else None
+        self.desde = self._fecha(desde)
+        self.hasta = self._fecha(hasta)
+
+    @staticmethod
+    def _fecha(valor: Optional[str]) -> Optional[str]:
+        if not valor:
+            return None
+        try:
+            return date.fromisoformat(valor).isoformat()
+        except ValueError:
+            raise ValueError(f"Fecha no válida: '{valor}'. Usa el formato YYYY-MM-DD")
+
+    def a_dict(self) -> Dict[str, Optional[str]]:
+        return {"region": self.region, "query": self.query, "desde": self.desde, "hasta": self.hasta}
+
+    def fecha_admitida(self, fecha: str) -> bool:
+        if not (self.desde or self.hasta):
+            return True
+        fecha = (fecha or "")[:10]
+        if not fecha:
+            return False
+        return (self.desde is None or fecha >= self.desde) and (self.hasta is None or fecha <= self.hasta)
+
+    def lugar_admitido(self, registro: Dict[str, Any]) -> bool:
+        """Región y consulta (sin fechas): decide qué lugares cuentan para las reseñas."""
+        if self.region and self.region not in plegar(f"{registro['ubicacion']} {registro['address']}".lower()):
+            return False
+        if self.query and self.query not in plegar((registro["query"] or "").lower()):
+            return False
+        return True
+
+
+def filas_lugares(filtro: FiltroExportacion, cache_dir: Path = CACHE_DIR) -> Iterator[Dict[str, Any]]:
+    """Una fila por aparición de un lugar en el caché; la fecha filtrada es la del caché."""
+    for registro in iter_registros_en_cache(cache_dir):
+        if filtro.lugar_admitido(registro) and filtro.fecha_admitida(registro["timestamp"]):
+            yield registro
+
+
+def _lugares_admitidos(filtro: FiltroExportacion, cache_dir: Path) -> Optional[Set[str]]:
+    """place_ids que pasan los filtros de región y consulta (None si no hay tales filtros)."""
+    if not (filtro.region or filtro.query):
+        return None
+    return {r["place_id"] for r in iter_registros_en_cache(cache_dir) if filtro.lugar_admitido(r)}
+
+
+def filas_resenas(filtro: FiltroExportacion, cache_dir: Path = CACHE_DIR) -> Iterator[Dict[str, Any]]:
+    """Una fila por reseña e idioma; la fecha filtrada es la de publicación de la reseña."""
+    admitidos = _lugares_admitidos(filtro, cache_dir)
+    for entrada in iter_resenas_en_cache(cache_dir):
+        if admitidos is not None and entrada["place_id"] not in admitidos:
+            continue
+        place_data = entrada["place_data"]
+        for review in place_data["reviews"]:
+            epoch = review.get("time") if isinstance(review.get("time"), int) else 0
+            fecha = datetime.fromtimestamp(epoch).date().isoformat() if epoch else ""
+            if not filtro.fecha_admitida(fecha):
+                continue
+            yield {
+                "place_id": entrada["place_id"],
+                "nombre": place_data.get("name", ""),
+                "autor": review.get("author_name", ""),
+                "rating": review.get("rating"),
+                "idioma": review.get("language", ""),
+                "idioma_original": review.get("original_language", review.get("language", "")),
+                "traducida": bool(review.get("translated", False)),
+                "fecha": fecha,
+                "time": epoch,
+                "texto": review.get("text", ""),
+                "fuente": entrada["fuente"],
+                "timestamp": entrada["timestamp"],
+            }
+
+
+FUENTES = {"lugares": filas_lugares, "resenas": filas_resenas}
+
+
+def _lotes(filas: Iterable[Dict[str, Any]], tamano: int = TAMANO_LOTE) -> Iterator[List[Dict[str, Any]]]:
+    iterador = iter(filas)
+    while True:
+        lote = list(islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+def _normalizar(valor: Any, tipo: str) -> Any:
+    """Valor de la columna con el tipo declarado (None si no corresponde)."""
+    if valor is None or (valor == "" and tipo != "texto"):
+        return None
+    if tipo == "real":
+        return float(valor) if isinstance(valor, (int, float)) and not isinstance(valor, bool) else None
+    if tipo == "entero":
+        return valor if isinstance(valor, int) and not isinstance(valor, bool) else None
+    if tipo == "logico":
+        return bool(valor)
+    if tipo == "lista":
+        return [str(v) for v in valor] if isinstance(valor, (list, tuple)) else []
+    return str(valor)
+
+
+def _escribir_jsonl(lotes: Iterable[List[Dict[str, Any]]], archivo, columnas: List[Tuple[str, str]]) -> int:
+    filas = 0
+    for lote in lotes:
+        for fila in lote:
+            archivo.write(json.dumps({c: _normalizar(fila.get(c), t) for c, t in columnas}, ensure_ascii=False))
+            archivo.write("\n")
+        filas += len(lote)
+    return filas
+
+
+def _escribir_csv(lotes: Iterable[List[Dict[str, Any]]], archivo, columnas: List[Tuple[str, str]]) -> int:
+    escritor = csv.writer(archivo)
+    escritor.writerow([c for c, _ in columnas])
+    filas = 0
+    for lote in lotes:
+        for fila in lote:
+            valores = [_normalizar(fila.get(c), t) for c, t in columnas]
+            escritor.writerow(["|".join(v) if isinstance(v, list) else ("" if v is None else v) for v in valores])
+        filas += len(lote)
+    return filas
+
+
+def _esquema_arrow(columnas: List[Tuple[str, str]]):
+    tipos = {"texto": pa.string(), "real": pa.float64(), "entero": pa.int64(),
+             "logico": pa.bool_(), "lista": pa.list_(pa.string())}
+    return pa.schema([(c, tipos[t]) for c, t in columnas])
+
+
+def _escribir_parquet(lotes: Iterable[List[Dict[str, Any]]], ruta: str, columnas: List[Tuple[str, str]]) -> int:
+    esquema = _esquema_arrow(columnas)
+    filas = 0
+    with pq.ParquetWriter(ruta, esquema, compression="zstd") as escritor:
+        for lote in lotes:
+            datos = {c: [_normalizar(fila.get(c), t) for fila in lote] for c, t in columnas}
+            escritor.write_table(pa.Table.from_pydict(datos, schema=esquema))
+            filas += len(lote)
+    return filas
+
+
+def exportar_conjunto(conjunto: str, formato: str, filtro: FiltroExportacion,
+                      destino: Path, cache_dir: Path = CACHE_DIR) -> Dict[str, Any]:
+    """
+    Escribe un conjunto en un archivo temporal y lo mueve a destino al terminar
+    (un lector nunca ve un archivo a medio escribir).
+    """
+    columnas = COLUMNAS[conjunto]
+    lotes = _lotes(FUENTES[conjunto](filtro, cache_dir))
+    destino.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=destino.parent, prefix=f".{destino.name}.", suffix=".tmp")
+    try:
+        if formato == "parquet":
+            os.close(fd)
+            filas = _escribir_parquet(lotes, tmp_name, columnas)
+        else:
+            escribir: Callable = _escribir_csv if formato == "csv" else _escribir_jsonl
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as archivo:
+                filas = escribir(lotes, archivo, columnas)
+        os.replace(tmp_name, destino)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+    return {"conjunto": conjunto, "formato": formato, "ruta": str(destino),
+            "filas": filas, "bytes": destino.stat().st_size}
+
+
+def exportar(conjuntos: Optional[List[str]] = None, formato: str = "jsonl",
+             region: Optional[str] = None, query: Optional[str] = None,
+             desde: Optional[str] = None, hasta: Optional[str] = None,
+             destino_dir: Path = EXPORT_DIR, cache_dir: Path = CACHE_DIR) -> Dict[str, Any]:
+    """
+    Exporta los conjuntos pedidos a destino_dir/<conjunto>_<fecha>.<formato>.
+
+    Raises:
+        ValueError: Conjunto, formato o fecha no válidos, o Parquet sin pyarrow
+    """
+    conjuntos = conjuntos or CONJUNTOS_EXPORTACION
+    invalidos = [c for c in conjuntos if c not in CONJUNTOS_EXPORTACION]
+    if invalidos:
+        raise ValueError(f"Conjuntos no válidos: {invalidos}. Usa: {CONJUNTOS_EXPORTACION}")
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato no válido: {formato}. Usa: {FORMATOS_EXPORTACION}")
+    if formato == "parquet" and pq is None:
+        raise ValueError("El formato parquet requiere pyarrow (pip install pyarrow)")
+    filtro = FiltroExportacion(region, query, desde, hasta)
+
+    inicio = time.perf_counter()
+    sello = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    archivos = [
+        exportar_conjunto(conjunto, formato, filtro, Path(destino_dir) / f"{conjunto}_{sello}.{formato}", cache_dir)
+        for conjunto in conjuntos
+    ]
+    return {
+        "archivos": archivos,
+        "filtros": filtro.a_dict(),
+        "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta lugares y reseñas del caché local")
+    parser.add_argument("--conjuntos", nargs="+", choices=CONJUNTOS_EXPORTACION, default=CONJUNTOS_EXPORTACION)
+    parser.add_argument("--formato", choices=FORMATOS_EXPORTACION, default="jsonl")
+    parser.add_argument("--region", help="Texto contenido en la ubicación o dirección del lugar")
+    parser.add_argument("--query", help="Texto contenido en la consulta que encontró el lugar")
+    parser.add_argument("--desde", help="Fecha mínima YYYY-MM-DD")
+    parser.add_argument("--hasta", help="Fecha máxima YYYY-MM-DD")
+    parser.add_argument("--destino", default=str(EXPORT_DIR), help="Directorio de salida")
+    args = parser.parse_args()
+
+    try:
+        resultado = exportar(args.conjuntos, args.formato, args.region, args.query,
+                             args.desde, args.hasta, Path(args.destino))
+    except ValueError as e:
+        parser.error(str(e))
+    for archivo in resultado["archivos"]:
+        print(f"✓ {archivo['conjunto']}: {archivo['filas']} filas -> {archivo['ruta']} ({archivo['bytes']} bytes)")
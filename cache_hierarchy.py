@@ -0,0 +1,497 @@
+"""
+Jerarquía única de caché para las respuestas de Google: memoria del proceso
+→ almacén local persistente (cache/api/, un archivo JSON por respuesta) → red.
+El cliente v1 resuelve todas sus consultas (detalles, Text Search, Nearby Search
+y geocodificación) a través de esta jerarquía, con una sola clave por solicitud
+(operación + parámetros, incluida la máscara de campos) y una sola vigencia
+(CACHE_EXPIRY_HOURS), de modo que lo que trae cualquier herramienta es un
+acierto para las demás. La política de caché fija, por operación, la
+vigencia (configurable por endpoint) y qué respuestas se guardan; los POST de
+búsqueda se guardan bajo el hash del cuerpo y la máscara de campos aunque la
+API no mande encabezados de caché. Los cachés JSON y respaldos raw_*.json
+anteriores quedan como archivos heredados de solo lectura.
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Any, Callable, Iterator, Optional, Tuple
+
+from cache_store import leer_json, escribir_json_atomico
+
+
+CACHE_DIR = Path("cache")
+CACHE_API_DIR = CACHE_DIR / "api"
+CACHE_EXPIRY_HOURS = float(os.getenv("CACHE_EXPIRY_HOURS", "24"))  # Vigencia por defecto de las entradas
+CACHE_MEMORIA_MAX_ENTRADAS = int(os.getenv("CACHE_MEMORIA_MAX_ENTRADAS", "256"))  # Respuestas en memoria (LRU)
+
+# Vigencia por endpoint (horas); sin la variable se usa CACHE_EXPIRY_HOURS
+VARIABLES_VIGENCIA = {
+    "places.searchText": "CACHE_TTL_SEARCH_TEXT_H",
+    "places.searchNearby": "CACHE_TTL_SEARCH_NEARBY_H",
+    "places.details": "CACHE_TTL_DETAILS_H",
+    "geocoding.geocode": "CACHE_TTL_GEOCODE_H",
+}
+
+NIVELES = ("memoria", "almacen", "heredado", "red")
+
+
+class SinDatosEnCacheError(LookupError):
+    """Se pidió servir solo desde caché y la solicitud no está en ningún nivel."""
+
+
+def clave_cache(operacion: str, parametros: Dict[str, Any]) -> str:
+    """Clave estable de una solicitud: hash del JSON canónico de operación y parámetros."""
+    canonico = json.dumps({"operacion": operacion, "parametros": parametros},
+                          sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(canonico.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _timestamp(entrada: Dict[str, Any]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(entrada["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def iter_entradas_almacen(directorio: Path = CACHE_API_DIR,
+                          operacion: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Recorre las entradas de un almacén local (de a un archivo), vigentes o no."""
+    patron = f"{operacion}/*.json" if operacion else "*/*.json"
+    for path in sorted(Path(directorio).glob(patron)):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entrada = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            continue
+        if isinstance(entrada, dict) and "data" in entrada:
+            yield entrada
+
+
+def _busqueda_con_resultados(data: Any) -> bool:
+    # Las búsquedas vacías las recuerda el caché negativo
+    return bool(data.get("places"))
+
+
+def _geocode_ok(data: Any) -> bool:
+    # ZERO_RESULTS lo recuerda el caché negativo; los errores no se guardan
+    return data.get("status") == "OK"
+
+
+class PoliticaCache:
+    """
+    Vigencia y criterio de guardado por operación. Las respuestas se guardan
+    según la política y no según los encabezados HTTP, así que los POST de
+    búsqueda también quedan en caché.
+    """
+
+    GUARDABLES: Dict[str, Callable[[Any], bool]] = {
+        "places.searchText": _busqueda_con_resultados,
+        "places.searchNearby": _busqueda_con_resultados,
+        "geocoding.geocode": _geocode_ok,
+    }
+
+    def __init__(self, vigencias_horas: Optional[Dict[str, float]] = None,
+                 predeterminada_horas: float = CACHE_EXPIRY_HOURS):
+        self.predeterminada = timedelta(hours=predeterminada_horas)
+        if vigencias_horas is None:
+            vigencias_horas = {operacion: float(os.environ[variable])
+                               for operacion, variable in VARIABLES_VIGENCIA.items() if os.getenv(variable)}
+        self.vigencias = {operacion: timedelta(hours=horas) for operacion, horas in vigencias_horas.items()}
+
+    def vigencia(self, operacion: str) -> timedelta:
+        return self.vigencias.get(operacion, self.predeterminada)
+
+    def guardable(self, operacion: str, data: Any) -> bool:
+        criterio = self.GUARDABLES.get(operacion)
+        return criterio is None or criterio(data)
+
+    def configurar(self, operacion: str, horas: float) -> None:
+        self.vigencias[operacion] = timedelta(hours=horas)
+
+    def describir(self) -> Dict[str, float]:
+        operaciones = sorted(set(VARIABLES_VIGENCIA) | set(self.vigencias))
+        return {operacion: self.vigencia(operacion).total_seconds() / 3600 for operacion in operaciones}
+
+
+class JerarquiaCache:
+    """
+    Memoria (LRU) → almacén local → red, con la misma clave y vigencia en cada nivel.
+    Las entradas devueltas se comparten con la memoria y deben tratarse como solo lectura.
+    """
+
+    def __init__(self, directorio: Path = CACHE_API_DIR, max_memoria: int = CACHE_MEMORIA_MAX_ENTRADAS,
+                 politica: Optional[PoliticaCache] = None):
+        self.directorio = Path(directorio)
+        self.max_memoria = max_memoria
+        self.politica = politica or PoliticaCache()
+        self._memoria: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Cargas en curso: clave -> (candado, hilos que lo usan); la entrada vive hasta que sale el último
+        self._en_vuelo: Dict[str, Tuple[threading.Lock, int]] = {}
+        self._heredados: Dict[str, List[Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]]] = {}
+        self.aciertos = {nivel: 0 for nivel in NIVELES}
+        self.por_operacion: Dict[str, Dict[str, int]] = {}
+
+    def ruta(self, operacion: str, clave: str) -> Path:
+        return self.directorio / operacion / f"{clave}.json"
+
+    def registrar_heredado(self, operacion: str,
+                           resolver: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> None:
+        """
+        Registra un lector de archivos heredados para una operación: recibe los
+        parámetros y retorna una entrada {"timestamp", "data"} o None. Una
+        operación puede tener varios; se usa la entrada más reciente.
+        """
+        self._heredados.setdefault(operacion, []).append(resolver)
+
+    def _leer_heredado(self, operacion: str, parametros: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        entradas = [entrada for entrada in (resolver(parametros) for resolver in self._heredados.get(operacion, []))
+                    if entrada is not None]
+        return max(entradas, key=lambda e: _timestamp(e) or datetime.min, default=None)
+
+    def vigente(self, operacion: str, entrada: Dict[str, Any]) -> bool:
+        timestamp = _timestamp(entrada)
+        return timestamp is not None and datetime.now() - timestamp < self.politica.vigencia(operacion)
+
+    def _recordar(self, clave: str, entrada: Dict[str, Any]) -> None:
+        with self._lock:
+            self._memoria[clave] = entrada
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self.max_memoria:
+                self._memoria.popitem(last=False)
+
+    def _leer_almacen(self, operacion: str, clave: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.ruta(operacion, clave), "r", encoding="utf-8") as f:
+                entrada = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, IOError):
+            return None
+        return entrada if isinstance(entrada, dict) and "data" in entrada else None
+
+    def _contar(self, operacion: str, nivel: Optional[str], estado: str) -> None:
+        with self._lock:
+            if nivel is not None:
+                self.aciertos[nivel] += 1
+            contadores = self.por_operacion.setdefault(operacion, {"hit": 0, "miss": 0, "stale": 0})
+            contadores[estado] += 1
+
+    def _acierto(self, operacion: str, nivel: str, entrada: Dict[str, Any],
+                 vencido: bool = False) -> Dict[str, Any]:
+        self._contar(operacion, nivel, "stale" if vencido else "hit")
+        timestamp = _timestamp(entrada)
+        return {
+            **entrada,
+            "origen": nivel,
+            "vencido": vencido,
+            "edad_s": round((datetime.now() - timestamp).total_seconds(), 1) if timestamp else None,
+            "vigencia_s": self.politica.vigencia(operacion).total_seconds(),
+        }
+
+    def leer(self, operacion: str, parametros: Dict[str, Any],
+             permitir_vencido: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Busca la solicitud en memoria, en el almacén local y en los archivos
+        heredados, sin ir a la red. Con permitir_vencido, si no hay una entrada
+        vigente se entrega la más reciente marcada como vencida.
+
+        Returns:
+            {"data", "timestamp", "origen", "vencido", ...} o None
+        """
+        clave = clave_cache(operacion, parametros)
+        with self._lock:
+            en_memoria = self._memoria.get(clave)
+            if en_memoria is not None:
+                self._memoria.move_to_end(clave)
+        if en_memoria is not None and self.vigente(operacion, en_memoria):
+            return self._acierto(operacion, "memoria", en_memoria)
+
+        en_almacen = self._leer_almacen(operacion, clave)
+        if en_almacen is not None and self.vigente(operacion, en_almacen):
+            self._recordar(clave, en_almacen)
+            try:
+                # La fecha de modificación marca el último uso para el desalojo LRU del almacén
+                os.utime(self.ruta(operacion, clave))
+            except OSError:
+                pass
+            return self._acierto(operacion, "almacen", en_almacen)
+
+        heredado = self._leer_heredado(operacion, parametros)
+        if heredado is not None and self.vigente(operacion, heredado):
+            return self._acierto(operacion, "heredado", heredado)
+
+        if not permitir_vencido:
+            return None
+        candidatos = [(nivel, entrada) for nivel, entrada in
+                      (("memoria", en_memoria), ("almacen", en_almacen), ("heredado", heredado))
+                      if entrada is not None]
+        if not candidatos:
+            return None
+        nivel, entrada = max(candidatos, key=lambda c: _timestamp(c[1]) or datetime.min)
+        print(f"✓ Usando entrada vencida del caché ({nivel}) para {operacion}")
+        return self._acierto(operacion, nivel, entrada, vencido=True)
+
+    def guardar(self, operacion: str, parametros: Dict[str, Any], data: Any) -> Dict[str, Any]:
+        """Guarda una respuesta en memoria y en el almacén local (una sola copia por solicitud)."""
+        clave = clave_cache(operacion, parametros)
+        entrada = {
+            "operacion": operacion,
+            "parametros": parametros,
+            "timestamp": datetime.now().isoformat(),
+            "data": data,
+        }
+        try:
+            escribir_json_atomico(self.ruta(operacion, clave), entrada)
+        except IOError as e:
+            print(f"WARNING: No se pudo guardar {operacion} en el almacén de caché: {e}")
+        self._recordar(clave, entrada)
+        return entrada
+
+    def obtener(self, operacion: str, parametros: Dict[str, Any], cargar: Callable[[], Any],
+                solo_cache: bool = False, forzar: bool = False) -> Dict[str, Any]:
+        """
+        Resuelve una solicitud recorriendo la jerarquía y, si no está, la carga
+        de la red con cargar() y la guarda si la política lo permite. Las cargas
+        concurrentes de una misma clave se hacen una sola vez.
+
+        Args:
+            operacion: Operación de la API (p. ej. "places.details")
+            parametros: Todo lo que determina la respuesta (campos, idioma, cuerpo...)
+            cargar: Función que consulta la red; sus excepciones se propagan
+            solo_cache: Sin red (p. ej. presupuesto agotado); acepta entradas vencidas
+            forzar: Ignora las entradas guardadas y consulta la red
+
+        Raises:
+            SinDatosEnCacheError: Si solo_cache y la solicitud no está en caché
+        """
+        if not forzar or solo_cache:
+            entrada = self.leer(operacion, parametros, permitir_vencido=solo_cache)
+            if entrada is not None:
+                return entrada
+        if solo_cache:
+            self._contar(operacion, None, "miss")
+            raise SinDatosEnCacheError(f"Sin datos en caché para {operacion}")
+
+        clave = clave_cache(operacion, parametros)
+        with self._lock:
+            candado, usuarios = self._en_vuelo.get(clave, (None, 0))
+            candado = candado or threading.Lock()
+            self._en_vuelo[clave] = (candado, usuarios + 1)
+        try:
+            with candado:
+                if not forzar:
+                    # Otro hilo pudo cargarla mientras se esperaba el candado
+                    with self._lock:
+                        en_memoria = self._memoria.get(clave)
+                    if en_memoria is not None and self.vigente(operacion, en_memoria):
+                        return self._acierto(operacion, "memoria", en_memoria)
+                data = cargar()
+                self._contar(operacion, "red", "miss")
+                if self.politica.guardable(operacion, data):
+                    entrada = self.guardar(operacion, parametros, data)
+                else:
+                    entrada = {"operacion": operacion, "parametros": parametros,
+                               "timestamp": datetime.now().isoformat(), "data": data}
+                return {**entrada, "origen": "red", "vencido": False, "edad_s": 0.0,
+                        "vigencia_s": self.politica.vigencia(operacion).total_seconds()}
+        finally:
+            with self._lock:
+                _, usuarios = self._en_vuelo[clave]
+                if usuarios == 1:
+                    del self._en_vuelo[clave]
+                else:
+                    self._en_vuelo[clave] = (candado, usuarios - 1)
+
+    def iter_entradas(self, operacion: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        return iter_entradas_almacen(self.directorio, operacion)
+
+    def entradas_en_memoria(self) -> Dict[str, Dict[str, Any]]:
+        """Copia de la capa de memoria (LRU): clave -> entrada."""
+        with self._lock:
+            return dict(self._memoria)
+
+    def olvidar_memoria(self) -> None:
+        with self._lock:
+            self._memoria.clear()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        archivos = list(self.directorio.glob("*/*.json")) if self.directorio.is_dir() else []
+        por_operacion: Dict[str, int] = {}
+        for path in archivos:
+            por_operacion[path.parent.name] = por_operacion.get(path.parent.name, 0) + 1
+        with self._lock:
+            aciertos = dict(self.aciertos)
+            resultados = {operacion: dict(contadores) for operacion, contadores in self.por_operacion.items()}
+            en_memoria = len(self._memoria)
+        return {
+            "vigencia_horas": self.politica.describir(),
+            "aciertos": aciertos,
+            "por_operacion": resultados,
+            "entradas_memoria": en_memoria,
+            "entradas_almacen": len(archivos),
+            "bytes_almacen": sum(path.stat().st_size for path in archivos if path.exists()),
+            "almacen_por_operacion": por_operacion,
+        }
+
+
+# --- Archivos heredados (solo lectura) ---
+
+def _geocode_heredado(parametros: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """geocode_cache.json: {ubicación en minúsculas: {"data": {"lat", "lng"}, "timestamp"}}"""
+    entrada = leer_json(CACHE_DIR / "geocode_cache.json").get(parametros.get("direccion", ""))
+    if not entrada or not entrada.get("data"):
+        return None
+    return {
+        "timestamp": entrada.get("timestamp", ""),
+        "data": {"status": "OK", "results": [{"geometry": {"location": entrada["data"]}}]},
+    }
+
+
+def _detalles_heredados(parametros: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """raw_place_details_<place_id>.json, si se pidió sin idioma y con todos los campos necesarios."""
+    if parametros.get("idioma"):
+        return None
+    path = CACHE_DIR / f"raw_place_details_{parametros.get('place_id')}.json"
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            contenido = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return None
+    pedidos = contenido.get("fields_requested") or []
+    if "*" not in pedidos and not set(parametros.get("campos", [])) <= set(pedidos):
+        return None
+    return {"timestamp": contenido.get("timestamp", ""), "data": contenido.get("data", {})}
+
+
+# Campos v1 que se pueden reconstruir desde las respuestas legacy (googlemaps.Client)
+CAMPOS_RESENAS_HEREDADAS = {"displayName", "rating", "userRatingCount", "reviews"}
+CAMPOS_BUSQUEDA_HEREDADA = {"id", "displayName", "formattedAddress", "location", "rating",
+                            "userRatingCount", "types", "businessStatus", "priceLevel"}
+NIVELES_PRECIO_V1 = ["PRICE_LEVEL_FREE", "PRICE_LEVEL_INEXPENSIVE", "PRICE_LEVEL_MODERATE",
+                     "PRICE_LEVEL_EXPENSIVE", "PRICE_LEVEL_VERY_EXPENSIVE"]
+
+
+def _sin_vacios(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {campo: valor for campo, valor in data.items() if valor not in (None, "", [], {})}
+
+
+def _resena_legacy_a_v1(review: Dict[str, Any]) -> Dict[str, Any]:
+    idioma = review.get("language", "")
+    publicada = review.get("time")
+    return {
+        "relativePublishTimeDescription": review.get("relative_time_description", ""),
+        "rating": review.get("rating", 0),
+        "text": {"text": review.get("text", ""), "languageCode": idioma},
+        "originalText": {"text": review.get("text", ""), "languageCode": review.get("original_language") or idioma},
+        "authorAttribution": {
+            "displayName": review.get("author_name", ""),
+            "uri": review.get("author_url", ""),
+            "photoUri": review.get("profile_photo_url", ""),
+        },
+        "publishTime": (datetime.fromtimestamp(publicada, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+                        if publicada else ""),
+    }
+
+
+def _lugar_legacy_a_v1(place: Dict[str, Any]) -> Dict[str, Any]:
+    location = place.get("geometry", {}).get("location", {})
+    nivel_precio = place.get("price_level")
+    return _sin_vacios({
+        "id": place.get("place_id"),
+        "displayName": {"text": place["name"]} if place.get("name") else None,
+        "formattedAddress": place.get("formatted_address", place.get("vicinity")),
+        "location": {"latitude": location["lat"], "longitude": location["lng"]} if "lat" in location else None,
+        "rating": place.get("rating"),
+        "userRatingCount": place.get("user_ratings_total"),
+        "types": place.get("types"),
+        "businessStatus": place.get("business_status"),
+        "priceLevel": NIVELES_PRECIO_V1[nivel_precio] if isinstance(nivel_precio, int) and 0 <= nivel_precio < 5 else None,
+    })
+
+
+def _raices(campos: List[str]) -> set:
+    """['places.displayName', 'location'] -> {'displayName', 'location'}"""
+    return {campo.split(".")[1] if campo.startswith("places.") else campo.split(".")[0] for campo in campos}
+
+
+def _resenas_heredadas(parametros: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    reviews_raw_cache.json: {"<place_id>|<idioma>": {"data" v1}} o, en las
+    entradas más antiguas, {"<place_id>": {"data": {"result" legacy}}} (reseñas
+    pedidas en español). Solo responde a máscaras de reseñas (CAMPOS_RESENAS_HEREDADAS).
+    """
+    campos = set(parametros.get("campos", []))
+    if not campos or not campos <= CAMPOS_RESENAS_HEREDADAS:
+        return None
+    place_id, idioma = parametros.get("place_id"), parametros.get("idioma")
+    cache = leer_json(CACHE_DIR / "reviews_raw_cache.json")
+    entrada = cache.get(f"{place_id}|{idioma or 'es'}")
+    if entrada is None and idioma in (None, "es"):
+        entrada = cache.get(place_id)
+    data = entrada.get("data") if isinstance(entrada, dict) else None
+    if not data:
+        return None
+    if "result" in data:
+        resultado = data["result"]
+        data = _sin_vacios({
+            "displayName": {"text": resultado["name"]} if resultado.get("name") else None,
+            "rating": resultado.get("rating"),
+            "userRatingCount": resultado.get("user_ratings_total"),
+            "reviews": [_resena_legacy_a_v1(review) for review in resultado.get("reviews", [])],
+        })
+    return {"timestamp": entrada.get("timestamp", ""), "data": data}
+
+
+def _coordenadas_guardadas(ubicacion: str) -> Optional[Tuple[float, float]]:
+    """Coordenadas de una ubicación según el almacén o geocode_cache.json (sin contar aciertos ni ir a la red)."""
+    parametros = {"direccion": ubicacion.strip().lower(), "idioma": "es"}
+    entrada = (jerarquia_cache._leer_almacen("geocoding.geocode", clave_cache("geocoding.geocode", parametros))
+               or _geocode_heredado(parametros))
+    resultados = entrada["data"].get("results", []) if entrada else []
+    if not resultados:
+        return None
+    location = resultados[0]["geometry"]["location"]
+    return round(location["lat"], 6), round(location["lng"], 6)
+
+
+def _busqueda_heredada(parametros: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    places_raw_cache.json: Text Search guardadas por (query, ubicación, radio).
+    Una entrada responde a la búsqueda v1 con el mismo texto y el mismo círculo
+    de locationBias (centro = geocodificación guardada de su ubicación) si la
+    máscara pide solo campos reconstruibles (CAMPOS_BUSQUEDA_HEREDADA).
+    """
+    cuerpo = parametros.get("cuerpo", {})
+    circulo = cuerpo.get("locationBias", {}).get("circle")
+    if not circulo or cuerpo.get("languageCode") not in (None, "es"):
+        return None
+    if not _raices(parametros.get("campos", [])) <= CAMPOS_BUSQUEDA_HEREDADA:
+        return None
+    centro = (round(circulo["center"]["latitude"], 6), round(circulo["center"]["longitude"], 6))
+    texto = (cuerpo.get("textQuery") or "").strip().lower()
+
+    for entrada in leer_json(CACHE_DIR / "places_raw_cache.json").values():
+        if not isinstance(entrada, dict) or (entrada.get("query") or "").strip().lower() != texto:
+            continue
+        if min((entrada.get("radio_km") or 0) * 1000, 50000) != circulo.get("radius"):
+            continue
+        if _coordenadas_guardadas(entrada.get("ubicacion", "")) != centro:
+            continue
+        data = entrada.get("data", {})
+        lugares = data.get("places") if "places" in data else [_lugar_legacy_a_v1(p) for p in data.get("results", [])]
+        if lugares:
+            return {"timestamp": entrada.get("timestamp", ""), "data": {"places": lugares[:cuerpo.get("maxResultCount", 20)]}}
+    return None
+
+
+# Jerarquía compartida del proceso
+jerarquia_cache = JerarquiaCache()
+jerarquia_cache.registrar_heredado("geocoding.geocode", _geocode_heredado)
+jerarquia_cache.registrar_heredado("places.details", _detalles_heredados)
+jerarquia_cache.registrar_heredado("places.details", _resenas_heredadas)
+jerarquia_cache.registrar_heredado("places.searchText", _busqueda_heredada)
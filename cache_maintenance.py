@@ -0,0 +1,333 @@
+"""
+Compactación del caché: elimina las entradas que superan la retención de
+vencidos, aplica presupuestos de tamaño por archivo con desalojo LRU/LFU,
+deduplica los respaldos raw_*.json y acota el almacén de respuestas de la
+jerarquía de caché (cache/api/). Mantiene acotado el costo de cada consulta a
+medida que el despliegue envejece.
+
+Los archivos heredados (ARCHIVOS_HEREDADOS y raw_*.json) ya no se escriben:
+son niveles de solo lectura de la jerarquía y la fuente del modo offline. Lo
+que se borre de ellos no se puede volver a crear, así que no se purgan ni se
+desalojan; de los respaldos raw_*.json solo se eliminan copias idénticas.
+
+Vencido no es lo mismo que inútil: cuando no se puede consultar la API
+(presupuesto agotado, plazo vencido, modo offline) las herramientas sirven la
+entrada vencida. Por eso una entrada solo se purga por antigüedad si la API
+puede volver a traerla (api_puede_rellenar: hay clave, queda presupuesto del
+día y no se está en modo offline) y si nadie la usó durante
+CACHE_STALE_RETENTION_H, contado desde que se obtuvo o se sirvió por última
+vez. Si no, solo se aplican los presupuestos de tamaño.
+"""
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+from cache_store import actualizar_json, bloqueo_archivo, consumir_accesos, fusionar_accesos
+from cache_hierarchy import CACHE_API_DIR
+from cost_ledger import presupuesto_agotado
+from negative_cache import NEGATIVE_CACHE_TTL_MIN, NEGATIVE_CACHE_TTL_LUGAR_H
+import offline_mode
+
+
+MB = 1024 * 1024
+# Horas que se conserva una entrada sin usar (desde que se obtuvo o se sirvió), vigente o vencida
+CACHE_STALE_RETENTION_H = float(os.getenv("CACHE_STALE_RETENTION_H", str(24 * 30)))
+
+# Presupuesto por archivo de caché. retencion_horas=None usa la retención de
+# vencidos (CACHE_STALE_RETENTION_H); el caché negativo no se sirve vencido y
+# se retiene solo lo que dura su vigencia más larga.
+PRESUPUESTOS_CACHE: Dict[str, Dict[str, Any]] = {
+    "places_cache.json": {"max_entradas": 500, "max_bytes": 10 * MB, "politica": "lru", "retencion_horas": None},
+    "reviews_cache.json": {"max_entradas": 2000, "max_bytes": 20 * MB, "politica": "lru", "retencion_horas": None},
+    "negative_cache.json": {"max_entradas": 5000, "max_bytes": 2 * MB, "politica": "lru", "retencion_horas": max(NEGATIVE_CACHE_TTL_MIN / 60, NEGATIVE_CACHE_TTL_LUGAR_H)},
+}
+
+# Cachés heredados de solo lectura: la compactación nunca los modifica
+ARCHIVOS_HEREDADOS = ("geocode_cache.json", "places_raw_cache.json", "reviews_raw_cache.json")
+
+# Presupuesto del almacén de la jerarquía de caché
+PRESUPUESTO_ALMACEN_API = {"max_bytes": 200 * MB, "retencion_horas": None}
+
+
+def _parse_timestamp(timestamp: Any) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(timestamp)
+    except (ValueError, TypeError):
+        return None
+
+
+def _tamano_archivo(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+def api_puede_rellenar() -> bool:
+    """True si la API puede volver a traer lo que se purgue: hay clave, queda presupuesto del día y no hay modo offline."""
+    return bool(os.getenv("GOOGLE_API_KEY")) and not offline_mode.activo() and not presupuesto_agotado()
+
+
+def _ultimo_uso(entrada: Dict[str, Any]) -> datetime:
+    """Fecha en que la entrada se obtuvo o se sirvió por última vez."""
+    fechas = [_parse_timestamp(entrada.get(campo)) for campo in ("timestamp", "ultimo_acceso")]
+    return max((fecha for fecha in fechas if fecha), default=datetime.min)
+
+
+def _limite_retencion(presupuesto: Dict[str, Any], retencion_vencidos_horas: Optional[float]) -> Optional[datetime]:
+    """Fecha antes de la cual se purga una entrada, o None si no se purga por antigüedad."""
+    if retencion_vencidos_horas is None:
+        return None
+    return datetime.now() - timedelta(hours=presupuesto.get("retencion_horas") or retencion_vencidos_horas)
+
+
+def _puntaje_desalojo(entrada: Dict[str, Any], politica: str) -> tuple:
+    """Orden de desalojo: las entradas con menor puntaje se eliminan primero."""
+    ultimo_acceso = entrada.get("ultimo_acceso") or entrada.get("timestamp") or ""
+    accesos = entrada.get("accesos", 0)
+    if politica == "lfu":
+        return (accesos, ultimo_acceso)
+    return (ultimo_acceso, accesos)
+
+
+def compactar_cache_json(cache_file: Path, presupuesto: Dict[str, Any],
+                         retencion_vencidos_horas: Optional[float] = CACHE_STALE_RETENTION_H,
+                         dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Compacta un archivo de caché JSON.
+
+    Incorpora a cada entrada las estadísticas de acceso registradas en este
+    proceso (ultimo_acceso, accesos), elimina las entradas más antiguas que la
+    retención sin uso (la del presupuesto o retencion_vencidos_horas; con None
+    no se purga por antigüedad) y desaloja por LRU/LFU hasta cumplir el presupuesto.
+
+    Returns:
+        Reporte con entradas eliminadas y bytes recuperados
+    """
+    bytes_antes = _tamano_archivo(cache_file)
+    reporte = {
+        "archivo": cache_file.name,
+        "bytes_antes": bytes_antes,
+        "entradas_antes": 0,
+        "vencidas": 0,
+        "desalojadas": 0,
+    }
+    if not cache_file.exists():
+        reporte.update({"bytes_despues": 0, "entradas_despues": 0, "bytes_recuperados": 0})
+        return reporte
+
+    limite = _limite_retencion(presupuesto, retencion_vencidos_horas)
+    politica = presupuesto.get("politica", "lru")
+    accesos = consumir_accesos(cache_file) if not dry_run else {}
+
+    def _compactar(data: Dict[str, Any]) -> None:
+        reporte["entradas_antes"] = len(data)
+
+        fusionar_accesos(data, accesos)
+
+        vencidas = [
+            clave for clave, entrada in data.items()
+            if not isinstance(entrada, dict)
+            or (limite is not None and _ultimo_uso(entrada) < limite)
+        ]
+        for clave in vencidas:
+            del data[clave]
+        reporte["vencidas"] = len(vencidas)
+
+        tamanos = {clave: len(json.dumps(entrada, ensure_ascii=False)) for clave, entrada in data.items()}
+        total_bytes = sum(tamanos.values())
+        max_entradas = presupuesto.get("max_entradas")
+        max_bytes = presupuesto.get("max_bytes")
+
+        orden = sorted(data, key=lambda clave: _puntaje_desalojo(data[clave], politica))
+        desalojadas = 0
+        for clave in orden:
+            sobre_entradas = max_entradas is not None and len(data) > max_entradas
+            sobre_bytes = max_bytes is not None and total_bytes > max_bytes
+            if not (sobre_entradas or sobre_bytes):
+                break
+            total_bytes -= tamanos[clave]
+            del data[clave]
+            desalojadas += 1
+        reporte["desalojadas"] = desalojadas
+        reporte["entradas_despues"] = len(data)
+
+    if dry_run:
+        with bloqueo_archivo(cache_file):
+            with open(cache_file, "r", encoding="utf-8") as f:
+                try:
+                    data = json.load(f)
+                except json.JSONDecodeError:
+                    data = {}
+        _compactar(data)
+        # Estimación del tamaño que tendría el archivo tras compactar
+        reporte["bytes_despues"] = len(json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8"))
+    else:
+        actualizar_json(cache_file, _compactar)
+        reporte["bytes_despues"] = _tamano_archivo(cache_file)
+
+    reporte["bytes_recuperados"] = max(bytes_antes - reporte["bytes_despues"], 0)
+    return reporte
+
+
+def _hash_contenido_raw(path: Path) -> Optional[str]:
+    """Hash del campo 'data' de un respaldo raw (ignora timestamp y metadatos)."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            contenido = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        return None
+    data = contenido.get("data", contenido) if isinstance(contenido, dict) else contenido
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def _eliminar_archivos(archivos: List[Path], dry_run: bool) -> int:
+    recuperados = 0
+    for path in archivos:
+        recuperados += _tamano_archivo(path)
+        if not dry_run:
+            try:
+                path.unlink()
+            except OSError as e:
+                print(f"WARNING: No se pudo eliminar {path}: {e}")
+    return recuperados
+
+
+def _aplicar_presupuesto_archivos(archivos: List[Path], presupuesto: Dict[str, Any],
+                                  retencion_vencidos_horas: Optional[float]) -> Dict[str, List[Path]]:
+    """Separa archivos vencidos por retención y los que exceden el presupuesto (más antiguos primero)."""
+    limite = _limite_retencion(presupuesto, retencion_vencidos_horas)
+    limite = limite.timestamp() if limite else float("-inf")
+    vigentes = []
+    vencidos = []
+    for path in archivos:
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            continue
+        (vencidos if mtime < limite else vigentes).append((mtime, path))
+
+    vigentes.sort()
+    total = sum(_tamano_archivo(path) for _, path in vigentes)
+    excedentes = []
+    while vigentes and total > presupuesto["max_bytes"]:
+        _, path = vigentes.pop(0)
+        total -= _tamano_archivo(path)
+        excedentes.append(path)
+
+    return {"vencidos": [path for _, path in vencidos], "excedentes": excedentes}
+
+
+def compactar_archivos_raw(cache_dir: Path, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Deduplica los respaldos raw_*.json heredados: entre archivos con el mismo
+    contenido de 'data' se conserva el más reciente. No se purgan por
+    antigüedad ni se desalojan por tamaño (no se pueden volver a crear).
+    """
+    archivos = sorted(cache_dir.glob("raw_*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+    vistos = set()
+    duplicados = []
+    for path in archivos:
+        digest = _hash_contenido_raw(path)
+        if digest is not None and digest in vistos:
+            duplicados.append(path)
+            continue
+        vistos.add(digest)
+
+    return {
+        "archivos_antes": len(archivos),
+        "duplicados": len(duplicados),
+        "bytes_recuperados": _eliminar_archivos(duplicados, dry_run),
+    }
+
+
+def compactar_almacen_api(base_path: Path = CACHE_API_DIR, dry_run: bool = False,
+                          retencion_vencidos_horas: Optional[float] = CACHE_STALE_RETENTION_H) -> Dict[str, Any]:
+    """
+    Elimina respuestas sin uso reciente del almacén de la jerarquía de caché y
+    aplica su presupuesto (la fecha de modificación marca el último acceso).
+    """
+    if not base_path.is_dir():
+        return {"archivos_antes": 0, "vencidos": 0, "desalojados": 0, "bytes_recuperados": 0}
+
+    archivos = [p for p in base_path.glob("*/*.json") if p.is_file()]
+    seleccion = _aplicar_presupuesto_archivos(archivos, PRESUPUESTO_ALMACEN_API, retencion_vencidos_horas)
+    return {
+        "archivos_antes": len(archivos),
+        "vencidos": len(seleccion["vencidos"]),
+        "desalojados": len(seleccion["excedentes"]),
+        "bytes_recuperados": (
+            _eliminar_archivos(seleccion["vencidos"], dry_run)
+            + _eliminar_archivos(seleccion["excedentes"], dry_run)
+        ),
+    }
+
+
+def compactar_todo(cache_dir: Path, retencion_vencidos_horas: Optional[float] = CACHE_STALE_RETENTION_H,
+                   dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Ejecuta la compactación completa: cachés JSON, respaldos raw y almacén de la jerarquía.
+
+    Args:
+        cache_dir: Directorio de los cachés JSON
+        retencion_vencidos_horas: Horas sin uso desde las que se elimina una entrada (CACHE_STALE_RETENTION_H);
+                                  si la API no puede volver a traerla no se purga por antigüedad
+        dry_run: Si es True solo reporta lo que se eliminaría
+
+    Returns:
+        Reporte consolidado con el total de bytes recuperados
+    """
+    inicio = datetime.now()
+    if not api_puede_rellenar():
+        retencion_vencidos_horas = None
+    reporte_json = [
+        compactar_cache_json(cache_dir / nombre, presupuesto, retencion_vencidos_horas, dry_run)
+        for nombre, presupuesto in PRESUPUESTOS_CACHE.items()
+    ]
+    reporte_raw = compactar_archivos_raw(cache_dir, dry_run)
+    reporte_almacen = compactar_almacen_api(dry_run=dry_run, retencion_vencidos_horas=retencion_vencidos_horas)
+
+    total = (
+        sum(r["bytes_recuperados"] for r in reporte_json)
+        + reporte_raw["bytes_recuperados"]
+        + reporte_almacen["bytes_recuperados"]
+    )
+    return {
+        "dry_run": dry_run,
+        "purga_por_antiguedad": retencion_vencidos_horas is not None,
+        "caches_json": reporte_json,
+        "archivos_raw": reporte_raw,
+        "almacen_api": reporte_almacen,
+        "bytes_recuperados": total,
+        "duracion_ms": round((datetime.now() - inicio).total_seconds() * 1000, 1),
+        "timestamp": inicio.isoformat(),
+    }
+
+
+_hilo_compactacion: Optional[threading.Thread] = None
+
+
+def iniciar_compactacion_periodica(cache_dir: Path, intervalo_minutos: float,
+                                   retencion_vencidos_horas: float = CACHE_STALE_RETENTION_H) -> None:
+    """Lanza (una sola vez por proceso) un hilo daemon que compacta el caché periódicamente."""
+    global _hilo_compactacion
+    if intervalo_minutos <= 0 or (_hilo_compactacion is not None and _hilo_compactacion.is_alive()):
+        return
+
+    detener = threading.Event()
+
+    def _ciclo() -> None:
+        while not detener.wait(intervalo_minutos * 60):
+            try:
+                reporte = compactar_todo(cache_dir, retencion_vencidos_horas)
+                print(f"✓ Compactación periódica: {reporte['bytes_recuperados']} bytes recuperados")
+            except Exception as e:
+                print(f"WARNING: Falló la compactación periódica: {e}")
+
+    _hilo_compactacion = threading.Thread(target=_ciclo, name="compactacion-cache", daemon=True)
+    _hilo_compactacion.start()
+    print(f"✓ Compactación periódica del caché cada {intervalo_minutos} minutos (pid {os.getpid()})")
@@ -0,0 +1,246 @@
+"""
+Almacenamiento JSON del caché seguro entre procesos.
+Permite que varios workers del servidor compartan los archivos de cache/*.json
+sin corromperlos y sin volver a parsearlos en cada consulta.
+"""
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+from typing import Dict, Any, Callable, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Copia en memoria de cada archivo, validada por su firma en disco:
+# ruta -> (firma, datos)
+_memoria: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {}
+_memoria_lock = threading.Lock()
+
+# Accesos registrados en este proceso, pendientes de volcarse a disco
+# (volcar_accesos o la compactación): ruta -> clave -> (ultimo_acceso_iso, cantidad)
+_accesos: Dict[str, Dict[str, Tuple[str, int]]] = {}
+_accesos_lock = threading.Lock()
+
+
+def _firma_archivo(path: Path) -> Optional[Tuple[int, int, int]]:
+    """
+    Firma (inodo, mtime, tamaño) de un archivo.
+
+    Cada escritura reemplaza el archivo de forma atómica, por lo que la firma
+    cambia siempre que otro proceso actualiza el caché. Esta comparación es el
+    canal de invalidación entre workers: basta un stat() por consulta.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+@contextmanager
+def bloqueo_archivo(path: Path):
+    """Bloqueo exclusivo entre procesos asociado a un archivo de caché."""
+    lock_path = Path(f"{path}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a+b") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def intentar_bloqueo_exclusivo(path: Path):
+    """
+    Intenta tomar sin esperar un bloqueo exclusivo entre procesos.
+    Retorna el archivo de bloqueo abierto (el bloqueo dura mientras siga abierto)
+    o None si otro proceso ya lo tiene.
+    """
+    lock_path = Path(f"{path}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    lock_file = open(lock_path, "a+b")
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def escribir_json_atomico(path: Path, data: Any) -> None:
+    """
+    Escribe un archivo JSON de forma atómica (archivo temporal + os.replace).
+    Un lector concurrente ve siempre la versión anterior completa o la nueva.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+
+def _leer_desde_disco(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (json.JSONDecodeError, IOError):
+        return {}
+
+
+def leer_json(path: Path) -> Dict[str, Any]:
+    """
+    Lee un archivo JSON de caché reutilizando la copia en memoria mientras el
+    archivo no haya cambiado en disco.
+
+    El diccionario devuelto es compartido: debe tratarse como solo lectura.
+    Para modificarlo usar actualizar_json().
+    """
+    path = Path(path)
+    firma = _firma_archivo(path)
+    if firma is None:
+        return {}
+
+    clave = str(path)
+    with _memoria_lock:
+        en_memoria = _memoria.get(clave)
+    if en_memoria and en_memoria[0] == firma:
+        return en_memoria[1]
+
+    data = _leer_desde_disco(path)
+    with _memoria_lock:
+        _memoria[clave] = (firma, data)
+    return data
+
+
+def actualizar_json(path: Path, mutador: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """
+    Lectura-modificación-escritura de un archivo JSON bajo bloqueo exclusivo.
+
+    El mutador recibe una copia fresca leída de disco (nunca la compartida en
+    memoria), de modo que las escrituras concurrentes de otros workers no se
+    pierden.
+
+    Returns:
+        Los datos tal como quedaron escritos
+    """
+    path = Path(path)
+    with bloqueo_archivo(path):
+        data = _leer_desde_disco(path) if path.exists() else {}
+        mutador(data)
+        escribir_json_atomico(path, data)
+        firma = _firma_archivo(path)
+    if firma is not None:
+        with _memoria_lock:
+            _memoria[str(path)] = (firma, data)
+    return data
+
+
+def copias_en_memoria() -> Dict[str, Dict[str, Any]]:
+    """Copias en memoria vigentes por ruta (compartidas: solo lectura)."""
+    with _memoria_lock:
+        return {ruta: data for ruta, (_, data) in _memoria.items()}
+
+
+def olvidar_memoria(path: Optional[Path] = None) -> None:
+    """Descarta la copia en memoria de un archivo (o de todos); se relee de disco al pedirla."""
+    with _memoria_lock:
+        if path is None:
+            _memoria.clear()
+        else:
+            _memoria.pop(str(path), None)
+
+
+def guardar_entrada(path: Path, clave: str, entrada: Dict[str, Any]) -> None:
+    """Inserta o reemplaza una entrada de un caché JSON de forma segura entre procesos."""
+    def _mutar(data: Dict[str, Any]) -> None:
+        data[clave] = entrada
+
+    actualizar_json(path, _mutar)
+
+
+def registrar_acceso(path: Path, clave: str) -> None:
+    """Registra un acierto de caché; alimenta el desalojo LRU/LFU de la compactación."""
+    ahora = datetime.now().isoformat()
+    with _accesos_lock:
+        por_archivo = _accesos.setdefault(str(path), {})
+        _, cantidad = por_archivo.get(clave, ("", 0))
+        por_archivo[clave] = (ahora, cantidad + 1)
+
+
+def consumir_accesos(path: Path) -> Dict[str, Tuple[str, int]]:
+    """Devuelve y reinicia los accesos registrados para un archivo de caché."""
+    with _accesos_lock:
+        return _accesos.pop(str(path), {})
+
+
+def fusionar_accesos(data: Dict[str, Any], accesos: Dict[str, Tuple[str, int]]) -> int:
+    """Suma accesos a las entradas de un caché JSON (ultimo_acceso, accesos); retorna las entradas tocadas."""
+    tocadas = 0
+    for clave, (ultimo_acceso, cantidad) in accesos.items():
+        entrada = data.get(clave)
+        if isinstance(entrada, dict):
+            entrada["ultimo_acceso"] = max(entrada.get("ultimo_acceso", ""), ultimo_acceso)
+            entrada["accesos"] = entrada.get("accesos", 0) + cantidad
+            tocadas += 1
+    return tocadas
+
+
+def volcar_accesos() -> int:
+    """
+    Escribe en disco los accesos registrados en este proceso, sumados a los de
+    los demás workers bajo el bloqueo de cada archivo, para que el desalojo
+    LRU/LFU de la compactación vea el tráfico de todos los procesos.
+
+    Returns:
+        Cantidad de claves volcadas
+    """
+    with _accesos_lock:
+        pendientes = dict(_accesos)
+        _accesos.clear()
+    actualizadas = 0
+    for ruta, accesos in pendientes.items():
+        path = Path(ruta)
+        if not path.exists():
+            continue
+        try:
+            actualizar_json(path, lambda data, accesos=accesos: fusionar_accesos(data, accesos))
+        except (IOError, OSError) as e:
+            print(f"WARNING: No se pudieron volcar los accesos de {path.name}: {e}")
+            continue
+        actualizadas += len(accesos)
+    return actualizadas
+
+
+def accesos_pendientes(path: Path, clave: str) -> Tuple[str, int]:
+    """Accesos de este proceso a una clave aún no volcados por la compactación (sin consumirlos)."""
+    with _accesos_lock:
+        return _accesos.get(str(path), {}).get(clave, ("", 0))
@@ -0,0 +1,231 @@
+"""
+Lectura unificada de los lugares y reseñas ya presentes en el caché local.
+Recorre el almacén de la jerarquía de caché (cache/api/), los cachés JSON del
+servidor y los archivos heredados raw_*.json, y entrega un registro normalizado
+por place_id, sin llamar a la API.
+"""
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Iterator, Optional
+
+from cache_store import leer_json
+from cache_hierarchy import iter_entradas_almacen
+
+
+CACHE_DIR = Path("cache")
+
+
+def _registro(place_id: str, name: str = "", lat: Optional[float] = None, lng: Optional[float] = None,
+              types: Optional[List[str]] = None, rating: Any = None, user_ratings_total: Any = None,
+              address: str = "", category: Optional[str] = None, fuente: str = "",
+              timestamp: str = "", query: str = "", ubicacion: str = "") -> Dict[str, Any]:
+    return {
+        "place_id": place_id,
+        "name": name,
+        "address": address,
+        "lat": lat,
+        "lng": lng,
+        "types": types or [],
+        "rating": rating if isinstance(rating, (int, float)) else None,
+        "user_ratings_total": user_ratings_total if isinstance(user_ratings_total, int) else None,
+        "category": category,
+        "fuente": fuente,
+        "timestamp": timestamp,
+        "query": query,
+        "ubicacion": ubicacion,
+    }
+
+
+def registro_desde_legacy(place: Dict[str, Any], entrada: Dict[str, Any]) -> Dict[str, Any]:
+    location = place.get("geometry", {}).get("location", {})
+    return _registro(
+        place_id=place.get("place_id"),
+        name=place.get("name", ""),
+        lat=location.get("lat"),
+        lng=location.get("lng"),
+        types=place.get("types", []),
+        rating=place.get("rating"),
+        user_ratings_total=place.get("user_ratings_total"),
+        address=place.get("vicinity", place.get("formatted_address", "")),
+        fuente="places_raw_cache",
+        timestamp=entrada.get("timestamp", ""),
+        query=entrada.get("query", ""),
+        ubicacion=entrada.get("ubicacion", ""),
+    )
+
+
+def registro_desde_v1(place: Dict[str, Any], fuente: str, timestamp: str, query: str = "") -> Dict[str, Any]:
+    location = place.get("location", {})
+    return _registro(
+        place_id=place.get("id"),
+        name=place.get("displayName", {}).get("text", ""),
+        lat=location.get("latitude"),
+        lng=location.get("longitude"),
+        types=place.get("types", []),
+        rating=place.get("rating"),
+        user_ratings_total=place.get("userRatingCount"),
+        address=place.get("formattedAddress", ""),
+        fuente=fuente,
+        timestamp=timestamp,
+        query=query,
+    )
+
+
+def _epoch_desde_rfc3339(fecha: str) -> int:
+    """'2024-08-15T10:30:00.123456789Z' -> segundos desde epoch (0 si no se puede leer)"""
+    try:
+        return int(datetime.fromisoformat(fecha[:19] + "+00:00").timestamp())
+    except (TypeError, ValueError):
+        return 0
+
+
+def detalles_a_formato_legacy(details: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convierte los detalles de un lugar de la API v1 al formato 'result' de la API
+    legacy que consume el análisis de reseñas. Las entradas RAW antiguas, que ya
+    vienen en formato legacy, se devuelven tal cual.
+    """
+    if "result" in details:
+        return details["result"]
+    if not details:
+        return {}
+    
+    reviews = []
+    for review in details.get("reviews", []):
+        texto = review.get("text", {})
+        original = review.get("originalText", texto)
+        autor = review.get("authorAttribution", {})
+        reviews.append({
+            "author_name": autor.get("displayName", "Usuario anónimo"),
+            "author_url": autor.get("uri", ""),
+            "profile_photo_url": autor.get("photoUri", ""),
+            "language": texto.get("languageCode", original.get("languageCode", "")),
+            "original_language": original.get("languageCode", ""),
+            "translated": texto.get("languageCode") != original.get("languageCode"),
+            "rating": review.get("rating", 0),
+            "relative_time_description": review.get("relativePublishTimeDescription", ""),
+            "text": texto.get("text", ""),
+            "time": _epoch_desde_rfc3339(review.get("publishTime", ""))
+        })
+    
+    return {
+        "name": details.get("displayName", {}).get("text", "Nombre no disponible"),
+        "rating": details.get("rating", 0),
+        "user_ratings_total": details.get("userRatingCount", 0),
+        "reviews": reviews
+    }
+
+
+def _leer_archivo(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            contenido = json.load(f)
+        return contenido if isinstance(contenido, dict) else {}
+    except (json.JSONDecodeError, IOError):
+        return {}
+
+
+def iter_registros_en_cache(cache_dir: Path = CACHE_DIR) -> Iterator[Dict[str, Any]]:
+    """
+    Genera un registro normalizado por cada aparición de un lugar en el caché
+    (un mismo place_id puede aparecer en varias fuentes).
+    """
+    for entrada in leer_json(cache_dir / "places_raw_cache.json").values():
+        data = entrada.get("data", {})
+        # Entradas antiguas de la API legacy ("results") o de Text Search v1 ("places")
+        for place in data.get("results", []):
+            if place.get("place_id"):
+                yield registro_desde_legacy(place, entrada)
+        for place in data.get("places", []):
+            if place.get("id"):
+                registro = registro_desde_v1(place, "places_raw_cache", entrada.get("timestamp", ""), entrada.get("query", ""))
+                registro["ubicacion"] = entrada.get("ubicacion", "")
+                yield registro
+
+    for entrada in leer_json(cache_dir / "places_cache.json").values():
+        data = entrada.get("data", {})
+        for categoria, places in data.get("clasificacion", {}).items():
+            for place in places:
+                if place.get("place_id"):
+                    yield _registro(
+                        place_id=place["place_id"],
+                        name=place.get("name", ""),
+                        types=place.get("types", []),
+                        rating=place.get("rating"),
+                        address=place.get("address", ""),
+                        category=categoria,
+                        fuente="places_cache",
+                        timestamp=entrada.get("timestamp", ""),
+                        query=data.get("query", entrada.get("query", "")),
+                        ubicacion=data.get("ubicacion", entrada.get("ubicacion", "")),
+                    )
+
+    for path in sorted(cache_dir.glob("raw_place_details_*.json")):
+        contenido = _leer_archivo(path)
+        data = contenido.get("data", {})
+        if data.get("id"):
+            yield registro_desde_v1(data, "raw_place_details", contenido.get("timestamp", ""))
+
+    for patron, fuente in (("raw_text_search_*.json", "raw_text_search"),
+                           ("raw_nearby_search_*.json", "raw_nearby_search")):
+        for path in sorted(cache_dir.glob(patron)):
+            contenido = _leer_archivo(path)
+            for place in contenido.get("data", {}).get("places", []):
+                if place.get("id"):
+                    yield registro_desde_v1(place, fuente, contenido.get("timestamp", ""), contenido.get("query", ""))
+
+    # Almacén de la jerarquía de caché: búsquedas y detalles v1
+    for operacion in ("places.searchText", "places.searchNearby"):
+        for entrada in iter_entradas_almacen(cache_dir / "api", operacion):
+            query = entrada.get("parametros", {}).get("cuerpo", {}).get("textQuery", "")
+            for place in entrada["data"].get("places", []):
+                if place.get("id"):
+                    yield registro_desde_v1(place, operacion, entrada.get("timestamp", ""), query)
+    for entrada in iter_entradas_almacen(cache_dir / "api", "places.details"):
+        place_id = entrada.get("parametros", {}).get("place_id")
+        if place_id:
+            yield registro_desde_v1({**entrada["data"], "id": place_id}, "places.details", entrada.get("timestamp", ""))
+
+
+def iter_resenas_en_cache(cache_dir: Path = CACHE_DIR) -> Iterator[Dict[str, Any]]:
+    """
+    Genera, por cada entrada de reseñas en caché (reviews_raw_cache.json,
+    respaldos raw_place_details_*.json y detalles del almacén de la jerarquía),
+    el place_id, los datos del lugar en formato legacy (con "reviews"), el
+    timestamp y la fuente. Los archivos se leen de a uno.
+    """
+    for entrada in leer_json(cache_dir / "reviews_raw_cache.json").values():
+        place_data = detalles_a_formato_legacy(entrada.get("data", {}))
+        if entrada.get("place_id") and place_data.get("reviews"):
+            yield {"place_id": entrada["place_id"], "place_data": place_data,
+                   "timestamp": entrada.get("timestamp", ""), "fuente": "reviews_raw_cache"}
+
+    for path in sorted(cache_dir.glob("raw_place_details_*.json")):
+        contenido = _leer_archivo(path)
+        place_data = detalles_a_formato_legacy(contenido.get("data", {}))
+        if contenido.get("place_id") and place_data.get("reviews"):
+            yield {"place_id": contenido["place_id"], "place_data": place_data,
+                   "timestamp": contenido.get("timestamp", ""), "fuente": "raw_place_details"}
+
+    for entrada in iter_entradas_almacen(cache_dir / "api", "places.details"):
+        place_id = entrada.get("parametros", {}).get("place_id")
+        place_data = detalles_a_formato_legacy(entrada["data"])
+        if place_id and place_data.get("reviews"):
+            yield {"place_id": place_id, "place_data": place_data,
+                   "timestamp": entrada.get("timestamp", ""), "fuente": "places.details"}
+
+
+def lugares_en_cache(cache_dir: Path = CACHE_DIR) -> Dict[str, Dict[str, Any]]:
+    """
+    Consolida los registros del caché en uno por place_id.
+    Para cada campo gana el valor no vacío más reciente.
+    """
+    consolidados: Dict[str, Dict[str, Any]] = {}
+    registros = sorted(iter_registros_en_cache(cache_dir), key=lambda r: r["timestamp"] or "")
+    for registro in registros:
+        actual = consolidados.setdefault(registro["place_id"], dict(registro))
+        for campo, valor in registro.items():
+            if valor not in (None, "", []):
+                actual[campo] = valor
+    return consolidados
@@ -0,0 +1,202 @@
+"""
+Contabilidad de costos de la API de Google Places.
+Registra cada llamada facturable por herramienta y SKU, planifica la máscara de
+campos más barata para lo que una herramienta realmente lee y aplica un
+presupuesto diario que, al agotarse, obliga a servir solo desde caché.
+"""
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Iterable, Optional
+
+from cache_store import leer_json, actualizar_json
+from tool_context import herramienta_actual
+
+
+COST_LEDGER_FILE = Path("cache") / "cost_ledger.json"
+COST_LEDGER_RETENTION_DAYS = 90
+
+# Presupuesto diario en USD; vacío o no configurado significa sin límite
+PLACES_DAILY_BUDGET_USD = os.getenv("PLACES_DAILY_BUDGET_USD")
+
+# Niveles de SKU de Places API (New), de menor a mayor costo
+SKU_IDS_ONLY = "essentials_ids_only"
+SKU_ESSENTIALS = "essentials"
+SKU_PRO = "pro"
+SKU_ENTERPRISE = "enterprise"
+SKU_ENTERPRISE_ATMOSPHERE = "enterprise_atmosphere"
+ORDEN_SKU = [SKU_IDS_ONLY, SKU_ESSENTIALS, SKU_PRO, SKU_ENTERPRISE, SKU_ENTERPRISE_ATMOSPHERE]
+
+# Nivel de SKU que activa cada campo de Place (API v1)
+CAMPOS_POR_SKU = {
+    SKU_IDS_ONLY: ["id", "name", "attributions", "photos"],
+    SKU_ESSENTIALS: [
+        "addressComponents", "adrFormatAddress", "formattedAddress", "location",
+        "plusCode", "postalAddress", "shortFormattedAddress", "types", "viewport",
+    ],
+    SKU_PRO: [
+        "accessibilityOptions", "businessStatus", "containingPlaces", "displayName",
+        "googleMapsLinks", "googleMapsUri", "iconBackgroundColor", "iconMaskBaseUri",
+        "primaryType", "primaryTypeDisplayName", "pureServiceAreaBusiness",
+        "subDestinations", "utcOffsetMinutes",
+    ],
+    SKU_ENTERPRISE: [
+        "currentOpeningHours", "currentSecondaryOpeningHours", "internationalPhoneNumber",
+        "nationalPhoneNumber", "priceLevel", "priceRange", "rating", "regularOpeningHours",
+        "regularSecondaryOpeningHours", "userRatingCount", "websiteUri",
+    ],
+    SKU_ENTERPRISE_ATMOSPHERE: [
+        "allowsDogs", "curbsidePickup", "delivery", "dineIn", "editorialSummary",
+        "evChargeAmenitySummary", "evChargeOptions", "fuelOptions", "generativeSummary",
+        "goodForChildren", "goodForGroups", "goodForWatchingSports", "liveMusic",
+        "menuForChildren", "neighborhoodSummary", "outdoorSeating", "parkingOptions",
+        "paymentOptions", "reservable", "restroom", "reviews", "reviewSummary",
+        "servesBeer", "servesBreakfast", "servesBrunch", "servesCocktails", "servesCoffee",
+        "servesDessert", "servesDinner", "servesLunch", "servesVegetarianFood",
+        "servesWine", "takeout",
+    ],
+}
+SKU_POR_CAMPO = {campo: sku for sku, campos in CAMPOS_POR_SKU.items() for campo in campos}
+
+# Precio aproximado en USD por cada 1000 llamadas (lista pública de Google;
+# ajustar aquí si cambia el contrato). Text Search y Nearby Search no tienen
+# nivel Essentials: esos campos se facturan como Pro.
+PRECIO_POR_MIL_USD = {
+    "places.details": {
+        SKU_IDS_ONLY: 0.0, SKU_ESSENTIALS: 5.0, SKU_PRO: 17.0,
+        SKU_ENTERPRISE: 20.0, SKU_ENTERPRISE_ATMOSPHERE: 25.0,
+    },
+    "places.searchText": {
+        SKU_IDS_ONLY: 0.0, SKU_ESSENTIALS: 32.0, SKU_PRO: 32.0,
+        SKU_ENTERPRISE: 35.0, SKU_ENTERPRISE_ATMOSPHERE: 40.0,
+    },
+    "places.searchNearby": {
+        SKU_IDS_ONLY: 32.0, SKU_ESSENTIALS: 32.0, SKU_PRO: 32.0,
+        SKU_ENTERPRISE: 35.0, SKU_ENTERPRISE_ATMOSPHERE: 40.0,
+    },
+    "places.photo": {"photo": 7.0},
+    "geocoding.geocode": {"geocode": 5.0},
+}
+
+
+def _campo_raiz(campo: str) -> str:
+    """'places.displayName.text' -> 'displayName'"""
+    if campo.startswith("places."):
+        campo = campo[len("places."):]
+    return campo.split(".")[0]
+
+
+def sku_para_campos(campos: Iterable[str]) -> str:
+    """Nivel de SKU que factura una máscara de campos ('*' cobra el nivel más alto)."""
+    nivel = 0
+    for campo in campos:
+        if campo in ("*", "places.*"):
+            return SKU_ENTERPRISE_ATMOSPHERE
+        sku = SKU_POR_CAMPO.get(_campo_raiz(campo), SKU_ENTERPRISE_ATMOSPHERE)
+        nivel = max(nivel, ORDEN_SKU.index(sku))
+    return ORDEN_SKU[nivel]
+
+
+def costo_estimado(operacion: str, sku: str) -> float:
+    """Costo en USD de una llamada de la operación y SKU indicados."""
+    precios = PRECIO_POR_MIL_USD.get(operacion, {})
+    return precios.get(sku, max(precios.values(), default=0.0)) / 1000
+
+
+def planificar_field_mask(campos_leidos: Iterable[str], operacion: str = "places.details") -> Dict[str, Any]:
+    """
+    Calcula la máscara de campos más barata que satisface lo que lee una herramienta.
+
+    Args:
+        campos_leidos: Campos que la herramienta consume (ej: ["displayName.text", "rating"])
+        operacion: "places.details", "places.searchText" o "places.searchNearby"
+
+    Returns:
+        Diccionario con la máscara ("campos"), su SKU y el costo estimado frente a '*'
+    """
+    prefijo = "places." if operacion in ("places.searchText", "places.searchNearby") else ""
+    raices = sorted({_campo_raiz(c) for c in campos_leidos})
+    campos = [f"{prefijo}{campo}" for campo in raices]
+    sku = sku_para_campos(raices)
+    return {
+        "operacion": operacion,
+        "campos": campos,
+        "sku": sku,
+        "costo_estimado_usd": costo_estimado(operacion, sku),
+        "costo_comodin_usd": costo_estimado(operacion, SKU_ENTERPRISE_ATMOSPHERE),
+    }
+
+
+def _hoy() -> str:
+    return datetime.now().date().isoformat()
+
+
+def registrar_llamada(operacion: str, sku: str, herramienta: Optional[str] = None) -> None:
+    """
+    Registra una llamada facturable en el libro de costos del día.
+    Solo debe invocarse cuando la respuesta vino de la red (no de caché).
+    """
+    herramienta = herramienta or herramienta_actual.get()
+    costo = costo_estimado(operacion, sku)
+    dia = _hoy()
+
+    def _sumar(ledger: Dict[str, Any]) -> None:
+        registro_dia = ledger.setdefault(dia, {"llamadas": 0, "costo_usd": 0.0, "por_herramienta": {}})
+        registro_dia["llamadas"] += 1
+        registro_dia["costo_usd"] = round(registro_dia["costo_usd"] + costo, 6)
+        por_operacion = registro_dia["por_herramienta"].setdefault(herramienta, {})
+        clave = f"{operacion}:{sku}"
+        detalle = por_operacion.setdefault(clave, {"llamadas": 0, "costo_usd": 0.0})
+        detalle["llamadas"] += 1
+        detalle["costo_usd"] = round(detalle["costo_usd"] + costo, 6)
+
+        # Conservar solo los últimos COST_LEDGER_RETENTION_DAYS días
+        for dia_antiguo in sorted(ledger)[:-COST_LEDGER_RETENTION_DAYS]:
+            del ledger[dia_antiguo]
+
+    try:
+        actualizar_json(COST_LEDGER_FILE, _sumar)
+    except IOError as e:
+        print(f"WARNING: No se pudo registrar el costo de la llamada: {e}")
+
+
+def _presupuesto_diario() -> Optional[float]:
+    try:
+        return float(PLACES_DAILY_BUDGET_USD) if PLACES_DAILY_BUDGET_USD else None
+    except ValueError:
+        return None
+
+
+def gasto_del_dia(dia: Optional[str] = None) -> float:
+    """Costo acumulado en USD del día indicado (hoy por defecto)."""
+    return leer_json(COST_LEDGER_FILE).get(dia or _hoy(), {}).get("costo_usd", 0.0)
+
+
+def presupuesto_disponible(operacion: str, sku: str) -> bool:
+    """True si la llamada cabe en el presupuesto diario restante."""
+    presupuesto = _presupuesto_diario()
+    if presupuesto is None:
+        return True
+    return gasto_del_dia() + costo_estimado(operacion, sku) <= presupuesto
+
+
+def presupuesto_agotado() -> bool:
+    """True si el gasto del día alcanzó el presupuesto diario (solo se sirve desde caché)."""
+    presupuesto = _presupuesto_diario()
+    return presupuesto is not None and gasto_del_dia() >= presupuesto
+
+
+def resumen_costos(dias: int = 7) -> Dict[str, Any]:
+    """Resumen del libro de costos de los últimos días y estado del presupuesto."""
+    ledger = leer_json(COST_LEDGER_FILE)
+    ultimos = {dia: ledger[dia] for dia in sorted(ledger)[-dias:]}
+    presupuesto = _presupuesto_diario()
+    gasto_hoy = gasto_del_dia()
+    return {
+        "presupuesto_diario_usd": presupuesto,
+        "gasto_hoy_usd": round(gasto_hoy, 4),
+        "restante_hoy_usd": round(max(presupuesto - gasto_hoy, 0.0), 4) if presupuesto is not None else None,
+        "solo_cache": presupuesto_agotado(),
+        "dias": ultimos,
+        "total_periodo_usd": round(sum(d.get("costo_usd", 0.0) for d in ultimos.values()), 4),
+    }
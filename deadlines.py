@@ -0,0 +1,242 @@
+"""
+Plazos y cancelación de las llamadas a herramientas MCP.
+Cada llamada recibe un presupuesto de tiempo repartido entre las etapas que
+consultan a Google (geocodificación, búsqueda y detalles). El cliente de
+Places lee el plazo vigente para acotar el timeout de cada petición y deja de
+salir a la red cuando el plazo se agota o el cliente MCP cancela la petición;
+las herramientas responden entonces con lo que haya en caché.
+"""
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from contextvars import ContextVar
+from typing import Dict, Any, Optional
+
+from fastmcp.server.middleware import Middleware
+from fastmcp.tools.tool import ToolResult
+
+
+PLAZO_PREDETERMINADO_S = float(os.getenv("PLAZO_HERRAMIENTA_S", "60"))  # 0 = sin plazo
+PLAZO_GRACIA_S = float(os.getenv("PLAZO_GRACIA_S", "5"))  # Margen para armar la respuesta parcial desde caché
+HERRAMIENTAS_MAX_HILOS = int(os.getenv("HERRAMIENTAS_MAX_HILOS", "32"))  # Herramientas simultáneas por proceso
+
+# Plazo total por herramienta (se sobrescribe con PLAZO_<HERRAMIENTA>_S)
+PLAZOS_HERRAMIENTA = {
+    "mapeo_competencia_y_colaboradores": 30,
+    "analizador_de_opiniones": 30,
+    "obtener_detalles_lugar_v1": 20,
+    "analisis_de_mercado": 120,
+    "fotos_de_lugar": 60,
+    "mapa_densidad_competencia": 45,
+    "colaboradores_cercanos": 45,
+}
+
+# Hitos acumulados: fracción del plazo en la que debe haber terminado cada
+# etapa. El tiempo que una etapa no usa queda para las siguientes.
+REPARTO_ETAPAS = {"geocode": 0.2, "search": 0.6, "details": 1.0}
+REPARTO_HERRAMIENTA = {
+    "mapeo_competencia_y_colaboradores": {"geocode": 0.3, "search": 1.0},
+    "mapa_densidad_competencia": {"geocode": 0.3, "search": 1.0},
+}
+
+ETAPA_POR_OPERACION = {
+    "geocoding.geocode": "geocode",
+    "places.searchText": "search",
+    "places.searchNearby": "search",
+    "places.details": "details",
+    "places.photo": "details",
+}
+
+
+class PlazoAgotadoError(Exception):
+    """Se agotó el plazo de la herramienta o el cliente MCP canceló la petición."""
+
+    def __init__(self, mensaje: str, motivo: str = "timeout"):
+        super().__init__(mensaje)
+        self.motivo = motivo
+
+
+class Plazo:
+    """
+    Presupuesto de tiempo de una llamada a herramienta. Se comparte entre los
+    hilos de la llamada (copian el contexto) y se cancela desde el bucle de
+    eventos cuando el cliente MCP abandona la petición.
+    """
+
+    def __init__(self, herramienta: str, total_s: Optional[float], reparto: Optional[Dict[str, float]] = None):
+        self.herramienta = herramienta
+        self.total_s = total_s or None
+        self.reparto = reparto or REPARTO_ETAPAS
+        self.inicio = time.monotonic()
+        self.fin = self.inicio + self.total_s if self.total_s else None
+        self.motivo: Optional[str] = None
+        self._cancelado = threading.Event()
+
+    @property
+    def cancelado(self) -> bool:
+        return self._cancelado.is_set()
+
+    def cancelar(self, motivo: str = "cancelado") -> None:
+        if not self._cancelado.is_set():
+            self.motivo = motivo
+            self._cancelado.set()
+
+    def restante(self) -> Optional[float]:
+        """Segundos que quedan del plazo total (None si no hay plazo)."""
+        if self.fin is None:
+            return None
+        return max(self.fin - time.monotonic(), 0.0)
+
+    def timeout_para(self, etapa: str) -> Optional[float]:
+        """
+        Segundos disponibles para una petición de la etapa indicada (None si
+        no hay plazo).
+
+        Raises:
+            PlazoAgotadoError: Si la llamada fue cancelada o la etapa ya no tiene tiempo
+        """
+        if self.cancelado:
+            motivo = self.motivo or "cancelado"
+            raise PlazoAgotadoError(f"Llamada a {self.herramienta} abandonada ({motivo})", motivo)
+        if self.fin is None:
+            return None
+        limite = min(self.inicio + self.total_s * self.reparto.get(etapa, 1.0), self.fin)
+        disponible = limite - time.monotonic()
+        if disponible <= 0:
+            raise PlazoAgotadoError(
+                f"Plazo de {self.herramienta} agotado en la etapa {etapa} ({self.total_s:.0f} s)"
+            )
+        return disponible
+
+    def agotado(self, etapa: str) -> bool:
+        try:
+            self.timeout_para(etapa)
+            return False
+        except PlazoAgotadoError:
+            return True
+
+    def describir(self) -> Dict[str, Any]:
+        return {
+            "herramienta": self.herramienta,
+            "plazo_s": self.total_s,
+            "transcurrido_s": round(time.monotonic() - self.inicio, 2),
+            "cancelado": self.cancelado,
+            "motivo": self.motivo,
+        }
+
+
+# Plazo de la llamada a herramienta en curso (None fuera de una llamada MCP)
+plazo_actual: ContextVar[Optional[Plazo]] = ContextVar("plazo_actual", default=None)
+
+
+def plazo_para(herramienta: str) -> Plazo:
+    """Plazo configurado para una herramienta."""
+    total = float(os.getenv(f"PLAZO_{herramienta.upper()}_S",
+                            PLAZOS_HERRAMIENTA.get(herramienta, PLAZO_PREDETERMINADO_S)))
+    return Plazo(herramienta, total, REPARTO_HERRAMIENTA.get(herramienta))
+
+
+def timeout_para_operacion(operacion: str) -> Optional[float]:
+    """
+    Timeout de una petición a la API según el plazo vigente, o None si no hay plazo.
+
+    Raises:
+        PlazoAgotadoError: Si ya no queda tiempo o la llamada fue cancelada
+    """
+    plazo = plazo_actual.get()
+    if plazo is None:
+        return None
+    return plazo.timeout_para(ETAPA_POR_OPERACION.get(operacion, "details"))
+
+
+def sin_tiempo_para(operacion: str) -> bool:
+    """True si la llamada en curso ya no puede salir a la red para esta operación."""
+    plazo = plazo_actual.get()
+    return plazo is not None and plazo.agotado(ETAPA_POR_OPERACION.get(operacion, "details"))
+
+
+def _fijar_resultado(futuro: asyncio.Future, resultado: Any, error: Optional[BaseException]) -> None:
+    if futuro.done():
+        return
+    if error is not None:
+        futuro.set_exception(error)
+    else:
+        futuro.set_result(resultado)
+
+
+class PlazoMiddleware(Middleware):
+    """
+    Middleware de FastMCP que fija el plazo de cada llamada a herramienta y la
+    ejecuta en un hilo propio, de modo que el bucle de eventos sigue atendiendo
+    cancelaciones mientras la herramienta espera a Google. Si el cliente cancela
+    la petición el plazo se marca como cancelado y el hilo deja de salir a la
+    red; si la herramienta no responde dentro de su plazo más PLAZO_GRACIA_S se
+    entrega un error PLAZO_AGOTADO y el hilo se abandona (ya no hará peticiones).
+
+    Debe registrarse después de los demás middlewares para que la herramienta
+    sea lo único que corre en el hilo.
+    """
+
+    def __init__(self, max_hilos: int = HERRAMIENTAS_MAX_HILOS):
+        self.max_hilos = max_hilos
+        self._cupos: Optional[asyncio.Semaphore] = None
+
+    async def on_call_tool(self, context, call_next):
+        herramienta = context.message.name
+        plazo = plazo_para(herramienta)
+        if self._cupos is None:
+            self._cupos = asyncio.Semaphore(self.max_hilos)
+        loop = asyncio.get_running_loop()
+        token = plazo_actual.set(plazo)
+        try:
+            # Sin hilo libre dentro del plazo no se empieza el trabajo
+            try:
+                await asyncio.wait_for(self._cupos.acquire(), plazo.restante())
+            except TimeoutError:
+                plazo.cancelar("timeout")
+                return self._sin_plazo(plazo, "sin hilos disponibles")
+
+            futuro = loop.create_future()
+            corrutina = call_next(context)
+            contexto = contextvars.copy_context()
+
+            def _ejecutar() -> None:
+                resultado, error = None, None
+                try:
+                    resultado = contexto.run(asyncio.run, corrutina)
+                except BaseException as e:
+                    error = e
+                try:
+                    loop.call_soon_threadsafe(_fijar_resultado, futuro, resultado, error)
+                    loop.call_soon_threadsafe(self._cupos.release)
+                except RuntimeError:
+                    pass  # El bucle de eventos ya se cerró
+
+            threading.Thread(target=_ejecutar, name=f"herramienta-{herramienta}", daemon=True).start()
+
+            restante = plazo.restante()
+            try:
+                return await asyncio.wait_for(
+                    asyncio.shield(futuro), None if restante is None else restante + PLAZO_GRACIA_S
+                )
+            except TimeoutError:
+                plazo.cancelar("timeout")
+                return self._sin_plazo(plazo, "la herramienta no respondió a tiempo")
+            except asyncio.CancelledError:
+                plazo.cancelar("cancelado")
+                print(f"WARNING: Llamada a {herramienta} cancelada por el cliente MCP; se detienen sus peticiones")
+                raise
+        finally:
+            plazo_actual.reset(token)
+
+    @staticmethod
+    def _sin_plazo(plazo: Plazo, detalle: str) -> ToolResult:
+        print(f"WARNING: {plazo.herramienta} excedió su plazo de {plazo.total_s:.0f} s ({detalle})")
+        return ToolResult(structured_content={
+            "error": f"Plazo de {plazo.herramienta} agotado: {detalle}",
+            "error_code": "PLAZO_AGOTADO",
+            "plazo": plazo.describir(),
+            "fuente": "plazo",
+        })
@@ -0,0 +1,275 @@
+"""
+Cálculos geoespaciales vectorizados con NumPy para el análisis de mercado.
+Todas las operaciones trabajan sobre arreglos completos de coordenadas, de modo
+que miles de lugares se procesan en milisegundos.
+"""
+import math
+from typing import Dict, List, Any, Sequence
+
+import numpy as np
+
+
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO_LAT = 111.32
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Distancia de gran círculo en km; acepta escalares o arreglos (con broadcasting)."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lng1, lat2, lng2))
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def grilla_de_densidad(
+    lat: np.ndarray,
+    lng: np.ndarray,
+    categoria: np.ndarray,
+    rating: np.ndarray,
+    centro: Dict[str, float],
+    radio_km: float,
+    celda_km: float,
+    categorias: Sequence[str],
+) -> Dict[str, Any]:
+    """
+    Agrupa lugares en una grilla regular centrada en `centro`.
+
+    Args:
+        lat, lng: Coordenadas de los lugares
+        categoria: Índice de categoría de cada lugar (posición en `categorias`)
+        rating: Rating de cada lugar (NaN si no tiene)
+        centro: {"lat": float, "lng": float}
+        radio_km: Radio de la región; se descartan los lugares fuera de él
+        celda_km: Lado de cada celda en km
+        categorias: Nombres de las categorías
+
+    Returns:
+        Grilla compacta: solo las celdas con lugares, con conteo y densidad por
+        categoría y rating promedio
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    categoria = np.asarray(categoria, dtype=np.int64)
+    rating = np.asarray(rating, dtype=np.float64)
+    lat0, lng0 = centro["lat"], centro["lng"]
+
+    dentro = haversine_km(lat0, lng0, lat, lng) <= radio_km
+    lat, lng, categoria, rating = lat[dentro], lng[dentro], categoria[dentro], rating[dentro]
+
+    # Proyección equirectangular local (suficiente para regiones de pocos cientos de km)
+    km_por_grado_lng = KM_POR_GRADO_LAT * math.cos(math.radians(lat0))
+    y = (lat - lat0) * KM_POR_GRADO_LAT
+    x = (lng - lng0) * km_por_grado_lng
+
+    n = max(1, int(math.ceil(2 * radio_km / celda_km)))
+    fila = np.clip(np.floor((y + radio_km) / celda_km).astype(np.int64), 0, n - 1)
+    col = np.clip(np.floor((x + radio_km) / celda_km).astype(np.int64), 0, n - 1)
+    celda = fila * n + col
+
+    n_cat = len(categorias)
+    conteo = np.bincount(celda * n_cat + categoria, minlength=n * n * n_cat).reshape(n * n, n_cat)
+    con_rating = ~np.isnan(rating)
+    suma_rating = np.bincount(celda[con_rating], weights=rating[con_rating], minlength=n * n)
+    n_rating = np.bincount(celda[con_rating], minlength=n * n)
+
+    total = conteo.sum(axis=1)
+    ocupadas = np.nonzero(total)[0]
+    area_celda = celda_km * celda_km
+
+    # Atributos de las celdas ocupadas, calculados en bloque
+    filas_oc, cols_oc = np.divmod(ocupadas, n)
+    lat_celda = np.round(lat0 + (-radio_km + (filas_oc + 0.5) * celda_km) / KM_POR_GRADO_LAT, 5).tolist()
+    lng_celda = np.round(lng0 + (-radio_km + (cols_oc + 0.5) * celda_km) / km_por_grado_lng, 5).tolist()
+    total_oc = total[ocupadas].tolist()
+    conteo_oc = conteo[ocupadas].tolist()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rating_oc = np.round(suma_rating[ocupadas] / n_rating[ocupadas], 2).tolist()
+    n_rating_oc = n_rating[ocupadas].tolist()
+
+    celdas: List[Dict[str, Any]] = []
+    for i, (f, c) in enumerate(zip(filas_oc.tolist(), cols_oc.tolist())):
+        celdas.append({
+            "fila": f,
+            "col": c,
+            "lat": lat_celda[i],
+            "lng": lng_celda[i],
+            "total": total_oc[i],
+            "densidad_km2": round(total_oc[i] / area_celda, 4),
+            "por_categoria": {
+                categorias[k]: conteo_oc[i][k] for k in range(n_cat) if conteo_oc[i][k]
+            },
+            "rating_promedio": rating_oc[i] if n_rating_oc[i] else None,
+        })
+
+    celdas.sort(key=lambda celda_info: celda_info["total"], reverse=True)
+    return {
+        "centro": {"lat": lat0, "lng": lng0},
+        "radio_km": radio_km,
+        "celda_km": celda_km,
+        "dimensiones": {"filas": n, "columnas": n},
+        "total_lugares": int(dentro.sum()),
+        "celdas_ocupadas": len(celdas),
+        "totales_por_categoria": {
+            categorias[k]: int(conteo[:, k].sum()) for k in range(n_cat)
+        },
+        "celdas": celdas,
+    }
+
+
+def a_cartesianas(lat, lng) -> np.ndarray:
+    """Convierte coordenadas geográficas a puntos 3D (km) sobre la esfera terrestre."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return RADIO_TIERRA_KM * np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def _cuerda_km(distancia_km: float) -> float:
+    """Distancia de cuerda 3D equivalente a una distancia de gran círculo."""
+    return 2 * RADIO_TIERRA_KM * math.sin(min(distancia_km / (2 * RADIO_TIERRA_KM), math.pi / 2))
+
+
+class ArbolKD:
+    """
+    KD-tree sobre coordenadas geográficas (convertidas a 3D), con hojas de
+    varios puntos. Las consultas se resuelven en lote: cada nodo filtra de una
+    vez todas las consultas cuya esfera de búsqueda intersecta su caja, y cada
+    hoja calcula con NumPy la matriz de distancias consultas x puntos.
+
+    Las búsquedas usan distancia de cuerda, que es monótona con la distancia
+    de gran círculo; los resultados se devuelven en km de gran círculo.
+    """
+
+    TAMANO_HOJA = 64
+
+    def __init__(self, lat, lng):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.puntos = a_cartesianas(self.lat, self.lng) if len(self.lat) else np.empty((0, 3))
+        # Nodo: ("hoja", indices, min, max) o ("nodo", izquierdo, derecho, min, max)
+        self._raiz = self._construir(np.arange(len(self.puntos))) if len(self.puntos) else None
+
+    def _construir(self, indices: np.ndarray):
+        puntos = self.puntos[indices]
+        minimo, maximo = puntos.min(axis=0), puntos.max(axis=0)
+        if len(indices) <= self.TAMANO_HOJA:
+            return ("hoja", indices, minimo, maximo)
+        dimension = int(np.argmax(maximo - minimo))
+        orden = np.argsort(puntos[:, dimension], kind="stable")
+        mitad = len(indices) // 2
+        return (
+            "nodo",
+            self._construir(indices[orden[:mitad]]),
+            self._construir(indices[orden[mitad:]]),
+            minimo,
+            maximo,
+        )
+
+    def pares_en_radio(self, lat, lng, radio_km: float) -> tuple:
+        """
+        Todos los pares (consulta, punto) a no más de radio_km, en lote.
+
+        Returns:
+            (indices_consulta, indices_punto, distancias_cuerda) como arreglos
+        """
+        consultas = a_cartesianas(lat, lng) if len(np.atleast_1d(lat)) else np.empty((0, 3))
+        cuerda_max = _cuerda_km(radio_km)
+        bloques_q, bloques_p, bloques_d = [], [], []
+        if self._raiz is None or not len(consultas):
+            vacio = np.empty(0, dtype=np.int64)
+            return vacio, vacio, np.empty(0)
+
+        pila = [(self._raiz, np.arange(len(consultas)))]
+        while pila:
+            nodo, activas = pila.pop()
+            minimo, maximo = nodo[-2], nodo[-1]
+            q = consultas[activas]
+            exceso = np.maximum(np.maximum(minimo - q, q - maximo), 0.0)
+            activas = activas[np.einsum("ij,ij->i", exceso, exceso) <= cuerda_max * cuerda_max]
+            if not len(activas):
+                continue
+            if nodo[0] == "hoja":
+                indices = nodo[1]
+                diferencia = consultas[activas][:, None, :] - self.puntos[indices][None, :, :]
+                distancias = np.sqrt(np.einsum("ijk,ijk->ij", diferencia, diferencia))
+                fila, col = np.nonzero(distancias <= cuerda_max)
+                bloques_q.append(activas[fila])
+                bloques_p.append(indices[col])
+                bloques_d.append(distancias[fila, col])
+            else:
+                pila.append((nodo[1], activas))
+                pila.append((nodo[2], activas))
+
+        if not bloques_q:
+            vacio = np.empty(0, dtype=np.int64)
+            return vacio, vacio, np.empty(0)
+        return np.concatenate(bloques_q), np.concatenate(bloques_p), np.concatenate(bloques_d)
+
+    def k_vecinos(self, lat, lng, k: int, radio_km: float) -> List[List[tuple]]:
+        """
+        Los k puntos más cercanos dentro de radio_km para cada consulta.
+
+        Returns:
+            Por cada consulta, lista de (indice_punto, distancia_km) ordenada por distancia
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lng = np.atleast_1d(np.asarray(lng, dtype=np.float64))
+        q, p, d = self.pares_en_radio(lat, lng, radio_km)
+        resultado: List[List[tuple]] = [[] for _ in range(len(lat))]
+        if not len(q):
+            return resultado
+
+        # Ordenar por (consulta, distancia) y quedarse con los k primeros de cada consulta
+        orden = np.lexsort((d, q))
+        q, p = q[orden], p[orden]
+        inicio_grupo = np.searchsorted(q, q, side="left")
+        rango = np.arange(len(q)) - inicio_grupo
+        seleccion = rango < k
+        q, p = q[seleccion], p[seleccion]
+        km = np.round(haversine_km(lat[q], lng[q], self.lat[p], self.lng[p]), 3)
+        for consulta, punto, distancia in zip(q.tolist(), p.tolist(), km.tolist()):
+            resultado[consulta].append((punto, distancia))
+        return resultado
+
+
+def dbscan(arbol: ArbolKD, eps_km: float, min_puntos: int) -> np.ndarray:
+    """
+    Agrupamiento DBSCAN vectorizado sobre los puntos de un ArbolKD.
+
+    Los vecindarios se obtienen en un solo lote de pares; los grupos son las
+    componentes conexas entre puntos núcleo (propagación de la etiqueta mínima)
+    y cada punto borde se asigna al grupo de un núcleo vecino.
+
+    Returns:
+        Etiqueta de grupo por punto (-1 = ruido)
+    """
+    n = len(arbol.puntos)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    i, j, _ = arbol.pares_en_radio(arbol.lat, arbol.lng, eps_km)
+    es_nucleo = np.bincount(i, minlength=n) >= min_puntos
+
+    # Componentes conexas entre núcleos
+    enlace = es_nucleo[i] & es_nucleo[j]
+    ni, nj = i[enlace], j[enlace]
+    etiqueta = np.arange(n)
+    while True:
+        nueva = etiqueta.copy()
+        np.minimum.at(nueva, ni, etiqueta[nj])
+        nueva = nueva[nueva]
+        if np.array_equal(nueva, etiqueta):
+            break
+        etiqueta = nueva
+
+    etiquetas = np.full(n, -1, dtype=np.int64)
+    etiquetas[es_nucleo] = etiqueta[es_nucleo]
+
+    # Puntos borde: toman la etiqueta de algún núcleo vecino
+    borde = ~es_nucleo[i] & es_nucleo[j]
+    etiquetas[i[borde]] = etiqueta[j[borde]]
+
+    # Renumerar grupos como 0..k-1
+    asignados = etiquetas >= 0
+    _, etiquetas[asignados] = np.unique(etiquetas[asignados], return_inverse=True)
+    return etiquetas
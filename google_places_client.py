@@ -1,19 +1,67 @@
 """
-Cliente para la nueva API de Google Places utilizando httpx y hishel para caché automático.
+Cliente para la nueva API de Google Places utilizando httpx y la jerarquía de caché
+(memoria → almacén local → red) compartida con el resto del servidor.
 Este cliente reduce costos de API y mejora la velocidad mediante caché inteligente.
 """
 import os
 import json
 import httpx
-from hishel import CacheClient
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, BinaryIO
 from dotenv import load_dotenv
 from pathlib import Path
 from datetime import datetime
+from cache_store import escribir_json_atomico
+from cache_hierarchy import JerarquiaCache, SinDatosEnCacheError, jerarquia_cache
+from cost_ledger import sku_para_campos, presupuesto_disponible, registrar_llamada
+from rating_history import registrar_lugares_v1
+from place_model import Place, clasificar, clasificar_dicts, clasificacion_a_dicts
+from negative_cache import cache_negativo, es_place_id_invalido
+from deadlines import PlazoAgotadoError, timeout_para_operacion, sin_tiempo_para
+from offline_mode import ModoOfflineError, activo as modo_offline_activo
 
 # Cargar variables de entorno
 load_dotenv()
 
+TIMEOUT_HTTP_S = 30.0  # Timeout de las peticiones fuera de una llamada con plazo
+
+
+class PresupuestoAgotadoError(Exception):
+    """El presupuesto diario de API está agotado y la respuesta no está en caché."""
+
+
+def parametros_detalles(place_id: str, fields: List[str], language_code: Optional[str] = None) -> Dict[str, Any]:
+    """Parámetros que identifican una consulta de detalles en la jerarquía de caché."""
+    return {"place_id": place_id, "campos": sorted(set(fields)), "idioma": language_code}
+
+
+def parametros_geocode(address: str, language_code: str = "es") -> Dict[str, Any]:
+    """Parámetros que identifican una geocodificación en la jerarquía de caché."""
+    return {"direccion": address.strip().lower(), "idioma": language_code}
+
+
+def metadatos_cache(entrada: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Estado de caché de una respuesta: MISS (vino de la red), HIT (entrada
+    vigente) o STALE (entrada vencida servida sin presupuesto), con su origen,
+    edad y la vigencia del endpoint.
+    """
+    if entrada["origen"] == "red":
+        estado = "MISS"
+    else:
+        estado = "STALE" if entrada["vencido"] else "HIT"
+    return {
+        "estado": estado,
+        "origen": entrada["origen"],
+        "edad_s": entrada.get("edad_s"),
+        "vigencia_s": entrada.get("vigencia_s"),
+    }
+
+
+def _estado_cache(entrada: Dict[str, Any]) -> str:
+    if entrada["origen"] == "red":
+        return "API CALL"
+    return f"CACHE HIT ({entrada['origen']}{', vencido' if entrada['vencido'] else ''})"
+
 
 class GooglePlacesClient:
     """
@@ -22,13 +70,15 @@ class GooglePlacesClient:
     
     Características:
     - Usa la nueva API de Google Places v1
-    - Caché automático con hishel (compatible con RFC 9111)
+    - Caché en la jerarquía compartida memoria → almacén local → red
     - Soporte para todos los campos disponibles con comodín '*'
     - Manejo de errores robusto
     - Configuración flexible de almacenamiento de caché
     """
     
-    BASE_URL = "https://places.googleapis.com/v1"
+    # Sobrescribibles para apuntar a un backend simulado (ver load_test.py)
+    BASE_URL = os.getenv("GOOGLE_PLACES_BASE_URL", "https://places.googleapis.com/v1")
+    GEOCODE_URL = os.getenv("GOOGLE_GEOCODING_URL", "https://maps.googleapis.com/maps/api/geocode/json")
     
     def __init__(self, api_key: str, cache_storage: Optional[Any] = None):
         """
@@ -36,8 +86,8 @@ class GooglePlacesClient:
         
         Args:
             api_key: Clave de API de Google Places
-            cache_storage: Almacenamiento de caché personalizado (opcional)
-                          Por defecto usa FileStorage en directorio ./cache_google_places/
+            cache_storage: Jerarquía de caché o directorio de su almacén local (opcional).
+                          Por defecto usa la jerarquía compartida en ./cache/api/
         """
         if not api_key:
             raise ValueError("La clave de API de Google no puede estar vacía.")
@@ -46,24 +96,122 @@ class GooglePlacesClient:
         
         # Configurar almacenamiento de caché
         if cache_storage is None:
-            # Usar FileStorage por defecto en directorio específico
-            import hishel
-            cache_dir = Path("./cache_google_places")
-            cache_dir.mkdir(exist_ok=True)
-            cache_storage = hishel.FileStorage(base_path=cache_dir)
-        
-        # Inicializar cliente HTTP con caché automático
-        self.client = CacheClient(
-            storage=cache_storage,
+            cache_storage = jerarquia_cache
+        elif not isinstance(cache_storage, JerarquiaCache):
+            cache_storage = JerarquiaCache(directorio=Path(cache_storage))
+        self.cache = cache_storage
+        
+        # Cliente HTTP con pool de conexiones (el caché lo resuelve la jerarquía)
+        self.client = httpx.Client(
             headers={
                 "Content-Type": "application/json",
                 "X-Goog-Api-Key": self.api_key,
-            }
+            },
+            timeout=TIMEOUT_HTTP_S
         )
         
-        print(f"✓ GooglePlacesClient inicializado con caché en: {cache_storage}")
+        # Cliente sin API key para descargar bytes de imágenes desde la URI
+        # temporal que entrega el endpoint de media (el almacén de fotos local es
+        # el caché de esos bytes)
+        self.descargas = httpx.Client(follow_redirects=True, timeout=TIMEOUT_HTTP_S)
+        
+        print(f"✓ GooglePlacesClient inicializado con caché en: {self.cache.directorio}")
+    
+    def _consultar(self, operacion: str, parametros: Dict[str, Any], sku: str,
+                   method: str, url: str, forzar: bool = False, **kwargs) -> Dict[str, Any]:
+        """
+        Resuelve una consulta en la jerarquía de caché y, si no está, la envía a
+        la API registrando su costo en el libro de costos. Qué se guarda y por
+        cuánto tiempo lo decide la política de caché por endpoint (los POST de
+        búsqueda se guardan bajo el hash del cuerpo y la máscara de campos).
+        
+        Si el presupuesto diario está agotado, o la llamada a herramienta en curso
+        ya no tiene plazo para esta etapa, se sirve solo desde caché (aunque la
+        entrada esté vencida). Lo mismo si el plazo se agota durante la petición
+        y, siempre, con el modo offline activo.
+        
+        Returns:
+            Entrada de la jerarquía {"data", "origen", "vencido", "timestamp", ...}
+        
+        Raises:
+            PresupuestoAgotadoError: Si no hay presupuesto y la respuesta no está en caché
+            PlazoAgotadoError: Si no queda plazo (o se canceló la llamada) y la respuesta no está en caché
+            ModoOfflineError: Si el modo offline está activo y la respuesta no está en caché
+            httpx.HTTPStatusError: Si la API responde con error
+        """
+        def cargar() -> Any:
+            response = self._request(operacion, method, url, **kwargs)
+            response.raise_for_status()
+            registrar_llamada(operacion, sku)
+            return response.json()
+        
+        offline = modo_offline_activo()
+        sin_tiempo = sin_tiempo_para(operacion)
+        try:
+            return self.cache.obtener(
+                operacion, parametros, cargar,
+                solo_cache=offline or sin_tiempo or not presupuesto_disponible(operacion, sku),
+                forzar=forzar
+            )
+        except SinDatosEnCacheError:
+            if offline:
+                raise ModoOfflineError(f"Modo offline activo y sin datos en caché para {operacion}")
+            if sin_tiempo:
+                timeout_para_operacion(operacion)  # Lanza PlazoAgotadoError con el motivo
+            raise PresupuestoAgotadoError(
+                f"Presupuesto diario de API agotado y sin datos en caché para {operacion}"
+            )
+        except PlazoAgotadoError:
+            # El plazo se agotó esperando a la API: respuesta parcial desde caché
+            entrada = self.cache.leer(operacion, parametros, permitir_vencido=True)
+            if entrada is None:
+                raise
+            print(f"WARNING: Plazo agotado en {operacion}, sirviendo desde caché ({entrada['origen']})")
+            return entrada
+    
+    def _request(self, operacion: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Envía una petición acotando su timeout al plazo de la llamada a herramienta en curso.
+        
+        Raises:
+            PlazoAgotadoError: Si no queda plazo, la llamada fue cancelada o el timeout se debió al plazo
+            ModoOfflineError: Si el modo offline está activo (nunca se sale a la red)
+        """
+        if modo_offline_activo():
+            raise ModoOfflineError(f"Modo offline activo: no se consulta {operacion}")
+        timeout = timeout_para_operacion(operacion)
+        if timeout is None:
+            return self.client.request(method, url, **kwargs)
+        try:
+            return self.client.request(method, url, timeout=min(timeout, TIMEOUT_HTTP_S), **kwargs)
+        except httpx.TimeoutException as e:
+            if timeout >= TIMEOUT_HTTP_S:
+                raise
+            raise PlazoAgotadoError(f"Plazo agotado esperando a {operacion} ({timeout:.1f} s)") from e
     
-    def get_place_details(self, place_id: str, fields: List[str] = None) -> Dict[str, Any]:
+    def _enviar(self, method: str, url: str, operacion: str, field_mask: str,
+                sku: Optional[str] = None, **kwargs) -> httpx.Response:
+        """
+        Envía una petición que no pasa por la jerarquía de caché (URIs de fotos,
+        que caducan) registrando su costo en el libro de costos.
+        El SKU se deduce de la máscara de campos salvo que se indique explícitamente.
+        
+        Raises:
+            PresupuestoAgotadoError: Si el presupuesto diario está agotado
+            PlazoAgotadoError: Si no queda plazo o la llamada fue cancelada
+        """
+        sku = sku or sku_para_campos(field_mask.split(","))
+        if not presupuesto_disponible(operacion, sku):
+            raise PresupuestoAgotadoError(f"Presupuesto diario de API agotado para {operacion}")
+        
+        response = self._request(operacion, method, url, **kwargs)
+        if response.is_success:
+            registrar_llamada(operacion, sku)
+        return response
+    
+    def get_place_details(self, place_id: str, fields: List[str] = None,
+                          language_code: Optional[str] = None,
+                          forzar_actualizacion: bool = False) -> Dict[str, Any]:
         """
         Obtiene los detalles de un lugar específico.
         La respuesta se guarda automáticamente en caché para futuras consultas.
@@ -72,6 +220,8 @@ class GooglePlacesClient:
             place_id: ID único del lugar de Google Places
             fields: Lista de campos específicos a solicitar. 
                    Si no se especifica, usa ['*'] para obtener todos los campos
+            language_code: Idioma de la respuesta (ej: "es"); por defecto el de la API
+            forzar_actualizacion: Si es True ignora el caché y consulta la API
         
         Returns:
             Diccionario con los datos del lugar o error si falla la consulta
@@ -79,29 +229,70 @@ class GooglePlacesClient:
         if fields is None:
             fields = ["*"]  # Solicitar todos los campos disponibles
         
+        # Un place_id que ya resultó inválido u obsoleto no vuelve a la API
+        invalido = cache_negativo.lugar_invalido(place_id)
+        if invalido:
+            return {
+                "status": "error",
+                "place_id": place_id,
+                "error": f"place_id inválido (caché negativo): {invalido['error']}",
+                "error_code": invalido["error_code"],
+                "cache_negativo": True
+            }
+        
         url = f"{self.BASE_URL}/places/{place_id}"
-        headers = self.client.headers.copy()
         
         # La máscara de campos se envía como header específico
-        headers["X-Goog-FieldMask"] = ",".join(fields)
+        field_mask = ",".join(fields)
+        params = {"languageCode": language_code} if language_code else None
         
         try:
-            response = self.client.get(url, headers=headers)
-            response.raise_for_status()
+            entrada = self._consultar(
+                "places.details", parametros_detalles(place_id, fields, language_code),
+                sku_para_campos(fields), "GET", url, forzar=forzar_actualizacion,
+                headers={"X-Goog-FieldMask": field_mask}, params=params
+            )
+            from_cache = entrada["origen"] != "red"
             
-            # Verificar si la respuesta vino del caché
-            from_cache = response.extensions.get('from_cache', False)
-            cache_status = "CACHE HIT" if from_cache else "API CALL"
+            print(f"DEBUG: get_place_details para '{place_id}' - {_estado_cache(entrada)}")
             
-            print(f"DEBUG: get_place_details para '{place_id}' - {cache_status}")
+            data = entrada["data"]
+            if not from_cache:
+                registrar_lugares_v1([{**data, "id": place_id}])
             
             return {
                 "status": "success",
                 "place_id": place_id,
                 "from_cache": from_cache,
-                "data": response.json()
+                "origen_cache": entrada["origen"],
+                "cache": metadatos_cache(entrada),
+                "data": data
             }
             
+        except PresupuestoAgotadoError as e:
+            return {
+                "status": "error",
+                "place_id": place_id,
+                "error": str(e),
+                "error_code": "PRESUPUESTO_AGOTADO"
+            }
+        
+        except PlazoAgotadoError as e:
+            return {
+                "status": "error",
+                "place_id": place_id,
+                "error": str(e),
+                "error_code": "PLAZO_AGOTADO"
+            }
+        
+        except ModoOfflineError as e:
+            return {
+                "status": "error",
+                "place_id": place_id,
+                "error": str(e),
+                "error_code": "MODO_OFFLINE"
+            }
+        
         except httpx.HTTPStatusError as e:
             error_detail = f"Error HTTP {e.response.status_code}"
             try:
@@ -110,6 +301,9 @@ class GooglePlacesClient:
             except:
                 error_detail += f": {e.response.text}"
             
+            if es_place_id_invalido(e.response.status_code, e.response.text):
+                cache_negativo.registrar_lugar_invalido(place_id, error_detail, e.response.status_code)
+            
             return {
                 "status": "error",
                 "place_id": place_id,
@@ -125,7 +319,8 @@ class GooglePlacesClient:
             }
     
     def search_places_text(self, query: str, location_bias: Dict[str, Any] = None, 
-                          language_code: str = "es", max_results: int = 20) -> Dict[str, Any]:
+                          language_code: str = "es", max_results: int = 20,
+                          fields: List[str] = None, forzar_actualizacion: bool = False) -> Dict[str, Any]:
         """
         Realiza búsqueda de lugares usando texto (Text Search).
         
@@ -134,15 +329,17 @@ class GooglePlacesClient:
             location_bias: Sesgo de ubicación para resultados más relevantes
             language_code: Código de idioma para resultados (default: "es")
             max_results: Número máximo de resultados (default: 20, máximo: 20)
+            fields: Máscara de campos (ej: ["places.id", "places.location"]);
+                   por defecto los campos generales de búsqueda
+            forzar_actualizacion: Si es True ignora el caché y consulta la API
         
         Returns:
             Diccionario con resultados de búsqueda o error
         """
         url = f"{self.BASE_URL}/places:searchText"
         
-        # Configurar headers con FieldMask requerido
-        headers = self.client.headers.copy()
-        headers["X-Goog-FieldMask"] = "places.displayName,places.id,places.rating,places.types,places.priceLevel,places.userRatingCount,places.businessStatus,places.formattedAddress"
+        # FieldMask requerido
+        field_mask = ",".join(fields) if fields else "places.displayName,places.id,places.rating,places.types,places.priceLevel,places.userRatingCount,places.businessStatus,places.formattedAddress,places.location"
         
         payload = {
             "textQuery": query,
@@ -154,51 +351,54 @@ class GooglePlacesClient:
             payload["locationBias"] = location_bias
         
         try:
-            response = self.client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            
-            from_cache = response.extensions.get('from_cache', False)
-            cache_status = "CACHE HIT" if from_cache else "API CALL"
-            
-            print(f"DEBUG: search_places_text para '{query}' - {cache_status}")
+            # La clave incluye el cuerpo y la máscara; las búsquedas vacías no se guardan (caché negativo)
+            entrada = self._consultar(
+                "places.searchText", {"cuerpo": payload, "campos": sorted(field_mask.split(","))},
+                sku_para_campos(field_mask.split(",")), "POST", url, forzar=forzar_actualizacion,
+                json=payload, headers={"X-Goog-FieldMask": field_mask}
+            )
+            from_cache = entrada["origen"] != "red"
             
-            result = response.json()
+            print(f"DEBUG: search_places_text para '{query}' - {_estado_cache(entrada)}")
             
-            # Guardar respuesta cruda en archivo JSON
-            try:
-                cache_dir = Path("./cache")
-                cache_dir.mkdir(exist_ok=True)
-                
-                # Crear nombre de archivo único basado en query
-                safe_query = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in query)[:50]
-                raw_data_with_meta = {
-                    "query": query,
-                    "language_code": language_code,
-                    "max_results": max_results,
-                    "timestamp": datetime.now().isoformat(),
-                    "api_source": "google_places_text_search_v1",
-                    "from_cache": from_cache,
-                    "total_results": len(result.get("places", [])),
-                    "data": result
-                }
-                
-                raw_file = cache_dir / f"raw_text_search_{safe_query.replace(' ', '_')}.json"
-                with open(raw_file, "w", encoding="utf-8") as f:
-                    json.dump(raw_data_with_meta, f, ensure_ascii=False, indent=2)
-                
-                print(f"✓ Búsqueda por texto guardada en: {raw_file}")
-                
-            except Exception as e:
-                print(f"WARNING: No se pudo guardar búsqueda por texto: {e}")
+            result = entrada["data"]
+            if not from_cache:
+                registrar_lugares_v1(result.get("places", []))
             
             return {
                 "status": "success",
                 "query": query,
                 "from_cache": from_cache,
+                "origen_cache": entrada["origen"],
+                "cache": metadatos_cache(entrada),
                 "total_results": len(result.get("places", [])),
                 "data": result
             }
             
+        except PresupuestoAgotadoError as e:
+            return {
+                "status": "error",
+                "query": query,
+                "error": str(e),
+                "error_code": "PRESUPUESTO_AGOTADO"
+            }
+        
+        except PlazoAgotadoError as e:
+            return {
+                "status": "error",
+                "query": query,
+                "error": str(e),
+                "error_code": "PLAZO_AGOTADO"
+            }
+        
+        except ModoOfflineError as e:
+            return {
+                "status": "error",
+                "query": query,
+                "error": str(e),
+                "error_code": "MODO_OFFLINE"
+            }
+        
         except httpx.HTTPStatusError as e:
             error_detail = f"Error HTTP {e.response.status_code}"
             try:
@@ -223,7 +423,7 @@ class GooglePlacesClient:
     
     def search_places_nearby(self, center: Dict[str, float], radius: float, 
                            included_types: List[str] = None, language_code: str = "es",
-                           max_results: int = 20) -> Dict[str, Any]:
+                           max_results: int = 20, forzar_actualizacion: bool = False) -> Dict[str, Any]:
         """
         Realiza búsqueda de lugares cercanos (Nearby Search).
         
@@ -233,15 +433,15 @@ class GooglePlacesClient:
             included_types: Tipos de lugares a incluir (opcional)
             language_code: Código de idioma (default: "es")
             max_results: Número máximo de resultados (default: 20)
+            forzar_actualizacion: Si es True ignora el caché y consulta la API
         
         Returns:
             Diccionario con resultados de búsqueda o error
         """
         url = f"{self.BASE_URL}/places:searchNearby"
         
-        # Configurar headers con FieldMask requerido
-        headers = self.client.headers.copy()
-        headers["X-Goog-FieldMask"] = "places.displayName,places.id,places.rating,places.types,places.priceLevel,places.userRatingCount,places.businessStatus,places.formattedAddress"
+        # FieldMask requerido
+        field_mask = "places.displayName,places.id,places.rating,places.types,places.priceLevel,places.userRatingCount,places.businessStatus,places.formattedAddress,places.location"
         
         payload = {
             "locationRestriction": {
@@ -258,54 +458,57 @@ class GooglePlacesClient:
             payload["includedTypes"] = included_types
         
         try:
-            response = self.client.post(url, json=payload, headers=headers)
-            response.raise_for_status()
-            
-            from_cache = response.extensions.get('from_cache', False)
-            cache_status = "CACHE HIT" if from_cache else "API CALL"
+            entrada = self._consultar(
+                "places.searchNearby", {"cuerpo": payload, "campos": sorted(field_mask.split(","))},
+                sku_para_campos(field_mask.split(",")), "POST", url, forzar=forzar_actualizacion,
+                json=payload, headers={"X-Goog-FieldMask": field_mask}
+            )
+            from_cache = entrada["origen"] != "red"
             
-            print(f"DEBUG: search_places_nearby - {cache_status}")
+            print(f"DEBUG: search_places_nearby - {_estado_cache(entrada)}")
             
-            result = response.json()
-            
-            # Guardar respuesta cruda en archivo JSON
-            try:
-                cache_dir = Path("./cache")
-                cache_dir.mkdir(exist_ok=True)
-                
-                # Crear identificador único para la búsqueda cercana
-                lat_lng = f"{center['latitude']:.4f}_{center['longitude']:.4f}"
-                raw_data_with_meta = {
-                    "center": center,
-                    "radius": radius,
-                    "included_types": included_types,
-                    "language_code": language_code,
-                    "max_results": max_results,
-                    "timestamp": datetime.now().isoformat(),
-                    "api_source": "google_places_nearby_search_v1",
-                    "from_cache": from_cache,
-                    "total_results": len(result.get("places", [])),
-                    "data": result
-                }
-                
-                raw_file = cache_dir / f"raw_nearby_search_{lat_lng}_r{int(radius)}.json"
-                with open(raw_file, "w", encoding="utf-8") as f:
-                    json.dump(raw_data_with_meta, f, ensure_ascii=False, indent=2)
-                
-                print(f"✓ Búsqueda cercana guardada en: {raw_file}")
-                
-            except Exception as e:
-                print(f"WARNING: No se pudo guardar búsqueda cercana: {e}")
+            result = entrada["data"]
+            if not from_cache:
+                registrar_lugares_v1(result.get("places", []))
             
             return {
                 "status": "success",
                 "center": center,
                 "radius": radius,
                 "from_cache": from_cache,
+                "origen_cache": entrada["origen"],
+                "cache": metadatos_cache(entrada),
                 "total_results": len(result.get("places", [])),
                 "data": result
             }
             
+        except PresupuestoAgotadoError as e:
+            return {
+                "status": "error",
+                "center": center,
+                "radius": radius,
+                "error": str(e),
+                "error_code": "PRESUPUESTO_AGOTADO"
+            }
+        
+        except PlazoAgotadoError as e:
+            return {
+                "status": "error",
+                "center": center,
+                "radius": radius,
+                "error": str(e),
+                "error_code": "PLAZO_AGOTADO"
+            }
+        
+        except ModoOfflineError as e:
+            return {
+                "status": "error",
+                "center": center,
+                "radius": radius,
+                "error": str(e),
+                "error_code": "MODO_OFFLINE"
+            }
+        
         except httpx.HTTPStatusError as e:
             error_detail = f"Error HTTP {e.response.status_code}"
             try:
@@ -330,9 +533,200 @@ class GooglePlacesClient:
                 "error": f"Error inesperado: {str(e)}"
             }
     
+    def geocode(self, address: str, language_code: str = "es",
+                forzar_actualizacion: bool = False) -> Dict[str, Any]:
+        """
+        Geocodifica una dirección con la Geocoding API usando el mismo cliente HTTP
+        (jerarquía de caché, pool de conexiones y libro de costos compartidos).
+        
+        Args:
+            address: Dirección o nombre de ubicación (ej: "Valle del Elqui")
+            language_code: Código de idioma para resultados (default: "es")
+            forzar_actualizacion: Si es True ignora el caché y consulta la API
+        
+        Returns:
+            Diccionario con la ubicación {"lat", "lng"} (vacía si no hay resultados) o error
+        """
+        url = self.GEOCODE_URL
+        params = {"address": address, "language": language_code, "key": self.api_key}
+        
+        try:
+            # Solo se guardan las respuestas OK (política de caché); ZERO_RESULTS lo recuerda el caché negativo
+            entrada = self._consultar(
+                "geocoding.geocode", parametros_geocode(address, language_code), "geocode",
+                "GET", url, forzar=forzar_actualizacion,
+                params=params
+            )
+            from_cache = entrada["origen"] != "red"
+            print(f"DEBUG: geocode para '{address}' - {_estado_cache(entrada)}")
+            
+            result = entrada["data"]
+            if result.get("status") not in ("OK", "ZERO_RESULTS"):
+                return {
+                    "status": "error",
+                    "address": address,
+                    "error": f"Geocoding API: {result.get('status')} {result.get('error_message', '')}".strip(),
+                    "error_code": result.get("status")
+                }
+            
+            resultados = result.get("results", [])
+            return {
+                "status": "success",
+                "address": address,
+                "from_cache": from_cache,
+                "origen_cache": entrada["origen"],
+                "cache": metadatos_cache(entrada),
+                "location": resultados[0]["geometry"]["location"] if resultados else {}
+            }
+            
+        except PresupuestoAgotadoError as e:
+            return {
+                "status": "error",
+                "address": address,
+                "error": str(e),
+                "error_code": "PRESUPUESTO_AGOTADO"
+            }
+        
+        except PlazoAgotadoError as e:
+            return {
+                "status": "error",
+                "address": address,
+                "error": str(e),
+                "error_code": "PLAZO_AGOTADO"
+            }
+        
+        except ModoOfflineError as e:
+            return {
+                "status": "error",
+                "address": address,
+                "error": str(e),
+                "error_code": "MODO_OFFLINE"
+            }
+        
+        except httpx.HTTPStatusError as e:
+            return {
+                "status": "error",
+                "address": address,
+                "error": f"Error HTTP {e.response.status_code}: {e.response.text}",
+                "error_code": e.response.status_code
+            }
+        
+        except Exception as e:
+            return {
+                "status": "error",
+                "address": address,
+                "error": f"Error inesperado: {str(e)}"
+            }
+    
+    def download_photo_media(self, photo_name: str, destino: BinaryIO,
+                             max_width_px: Optional[int] = None, max_height_px: Optional[int] = None,
+                             reservar_bytes: Optional[Callable[[int], bool]] = None,
+                             chunk_size: int = 64 * 1024) -> Dict[str, Any]:
+        """
+        Descarga una foto de un lugar con el endpoint de media (API v1), escribiendo
+        los bytes en 'destino' a medida que llegan (sin cargar la imagen en memoria).
+        
+        Args:
+            photo_name: Nombre de la foto (ej: "places/ChIJ.../photos/AUc...")
+            destino: Archivo binario abierto donde escribir la imagen
+            max_width_px: Ancho máximo solicitado (1-4800)
+            max_height_px: Alto máximo solicitado (1-4800)
+            reservar_bytes: Función llamada con el tamaño de cada bloque; si retorna
+                           False la descarga se interrumpe (presupuesto de bytes)
+            chunk_size: Tamaño de los bloques leídos del stream
+        
+        Returns:
+            Diccionario con bytes escritos y content_type, o error
+        """
+        url = f"{self.BASE_URL}/{photo_name}/media"
+        headers = self.client.headers.copy()
+        params = {"skipHttpRedirect": "true"}
+        if max_width_px:
+            params["maxWidthPx"] = min(int(max_width_px), 4800)
+        if max_height_px:
+            params["maxHeightPx"] = min(int(max_height_px), 4800)
+        if "maxWidthPx" not in params and "maxHeightPx" not in params:
+            params["maxWidthPx"] = 4800  # La API exige al menos una dimensión
+        
+        try:
+            # 1. Resolver la URI temporal de la imagen (llamada facturable)
+            response = self._enviar("GET", url, "places.photo", "", sku="photo", headers=headers, params=params)
+            response.raise_for_status()
+            photo_uri = response.json().get("photoUri")
+            if not photo_uri:
+                return {"status": "error", "photo_name": photo_name, "error": "La API no entregó photoUri"}
+            
+            # 2. Descargar los bytes en streaming
+            total = 0
+            timeout = timeout_para_operacion("places.photo")
+            with self.descargas.stream("GET", photo_uri, timeout=min(timeout or TIMEOUT_HTTP_S, TIMEOUT_HTTP_S)) as imagen:
+                imagen.raise_for_status()
+                content_type = imagen.headers.get("content-type", "application/octet-stream").split(";")[0]
+                for bloque in imagen.iter_bytes(chunk_size):
+                    timeout_para_operacion("places.photo")  # Corta la descarga si se agotó el plazo o se canceló
+                    if reservar_bytes is not None and not reservar_bytes(len(bloque)):
+                        return {
+                            "status": "error",
+                            "photo_name": photo_name,
+                            "error": "Descarga interrumpida: presupuesto de bytes agotado",
+                            "error_code": "PRESUPUESTO_BYTES",
+                            "bytes": total
+                        }
+                    destino.write(bloque)
+                    total += len(bloque)
+            
+            print(f"DEBUG: download_photo_media para '{photo_name}' - {total} bytes")
+            
+            return {
+                "status": "success",
+                "photo_name": photo_name,
+                "bytes": total,
+                "content_type": content_type
+            }
+            
+        except PresupuestoAgotadoError as e:
+            return {
+                "status": "error",
+                "photo_name": photo_name,
+                "error": str(e),
+                "error_code": "PRESUPUESTO_AGOTADO"
+            }
+        
+        except PlazoAgotadoError as e:
+            return {
+                "status": "error",
+                "photo_name": photo_name,
+                "error": str(e),
+                "error_code": "PLAZO_AGOTADO"
+            }
+        
+        except ModoOfflineError as e:
+            return {
+                "status": "error",
+                "photo_name": photo_name,
+                "error": str(e),
+                "error_code": "MODO_OFFLINE"
+            }
+        
+        except httpx.HTTPStatusError as e:
+            return {
+                "status": "error",
+                "photo_name": photo_name,
+                "error": f"Error HTTP {e.response.status_code}",
+                "error_code": e.response.status_code
+            }
+        
+        except Exception as e:
+            return {
+                "status": "error",
+                "photo_name": photo_name,
+                "error": f"Error inesperado: {str(e)}"
+            }
+    
     def close(self):
         """Cierra el cliente HTTP y limpia recursos."""
         self.client.close()
+        self.descargas.close()
     
     def __enter__(self):
         """Soporte para context manager."""
@@ -361,85 +755,33 @@ def obtener_resumen_reviews_lugar(
     # Usar solo reviewSummary para obtener resumen de reseñas generado por IA
     fields = ["reviewSummary"]
     
-    result = places_client.get_place_details(place_id, fields)
-    
-    if result["status"] == "error":
-        return result
-
-    # Guardar respuesta cruda en archivo JSON para inspección y respaldo
-    try:
-        cache_dir = Path("./cache")
-        cache_dir.mkdir(exist_ok=True)
-        
-        # Guardar datos completos con timestamp
-        raw_data_with_meta = {
-            "place_id": place_id,
-            "timestamp": datetime.now().isoformat(),
-            "api_source": "google_places_api_v1_reviewSummary",
-            "from_cache": result["from_cache"],
-            "fields_requested": fields,
-            "data": result["data"]
-        }
-        
-        raw_file = cache_dir / f"raw_review_summary_{place_id}.json"
-        with open(raw_file, "w", encoding="utf-8") as f:
-            json.dump(raw_data_with_meta, f, ensure_ascii=False, indent=2)
-        
-        print(f"✓ Resumen de reseñas guardado en: {raw_file}")
-        
-    except Exception as e:
-        print(f"WARNING: No se pudo guardar el archivo de respaldo: {e}")
-    
-    return result
+    return places_client.get_place_details(place_id, fields)
 
 
 def obtener_detalles_completos_de_lugar(
     place_id: str,
-    places_client: GooglePlacesClient
+    places_client: GooglePlacesClient,
+    fields: List[str] = None
 ) -> Dict[str, Any]:
     """
-    Obtiene TODOS los detalles disponibles de un lugar usando el comodín '*'.
-    Los datos se devuelven directamente desde el caché en llamadas posteriores.
+    Obtiene los detalles de un lugar; por defecto TODOS usando el comodín '*'.
+    Los datos se devuelven desde la jerarquía de caché en llamadas posteriores
+    (la respuesta queda una sola vez en cache/api/, sin respaldos aparte).
     
     Args:
         place_id: ID único del lugar de Google Places
         places_client: Instancia del cliente GooglePlacesClient
+        fields: Máscara de campos (ver cost_ledger.planificar_field_mask).
+               Si no se especifica, usa ['*'] (el SKU más caro)
     
     Returns:
-        Diccionario con todos los detalles del lugar o información de error
+        Diccionario con los detalles del lugar o información de error
     """
-    # Usar comodín '*' para solicitar todos los campos disponibles
-    fields = ["*"]
-    
-    result = places_client.get_place_details(place_id, fields)
-    
-    if result["status"] == "error":
-        return result
+    if fields is None:
+        # Usar comodín '*' para solicitar todos los campos disponibles
+        fields = ["*"]
     
-    # Guardar respuesta cruda en archivo JSON para inspección y respaldo
-    try:
-        cache_dir = Path("./cache")
-        cache_dir.mkdir(exist_ok=True)
-        
-        # Guardar datos completos con timestamp
-        raw_data_with_meta = {
-            "place_id": place_id,
-            "timestamp": datetime.now().isoformat(),
-            "api_source": "google_places_api_v1",
-            "from_cache": result["from_cache"],
-            "data": result["data"]
-        }
-        
-        raw_file = cache_dir / f"raw_place_details_{place_id}.json"
-        with open(raw_file, "w", encoding="utf-8") as f:
-            json.dump(raw_data_with_meta, f, ensure_ascii=False, indent=2)
-        
-        print(f"✓ Detalles completos guardados en: {raw_file}")
-        
-    except Exception as e:
-        print(f"WARNING: No se pudo guardar el archivo de respaldo: {e}")
-    
-    return result
+    return places_client.get_place_details(place_id, fields)
 
 
 def clasificar_lugares(places: List[Dict], query: str) -> Dict[str, List[Dict]]:
@@ -453,37 +795,7 @@ def clasificar_lugares(places: List[Dict], query: str) -> Dict[str, List[Dict]]:
     Returns:
         Diccionario con lugares clasificados por categoría
     """
-    clasificados = {
-        "competencia_directa": [],
-        "competencia_indirecta": [],
-        "colaboradores_potenciales": []
-    }
-    
-    query_keywords = query.lower().split()
-    
-    for place in places:
-        types = place.get("types", [])
-        name = place.get("displayName", {}).get("text", "")
-        name_lower = name.lower()
-        
-        # Lógica de clasificación mejorada
-        if any(t in ["tourist_attraction", "travel_agency", "point_of_interest"] for t in types):
-            # Verificar si es competencia directa por keywords
-            if any(keyword in name_lower for keyword in ["observatorio", "astronomic", "astro", "tour", "observatory"]) or \
-               any(q_word in name_lower for q_word in query_keywords):
-                place["category"] = "competencia_directa"
-                clasificados["competencia_directa"].append(place)
-            else:
-                place["category"] = "competencia_indirecta"
-                clasificados["competencia_indirecta"].append(place)
-        elif any(t in ["lodging", "hotel", "restaurant", "food", "bar", "store", "winery"] for t in types):
-            place["category"] = "colaboradores_potenciales"
-            clasificados["colaboradores_potenciales"].append(place)
-        else:
-            place["category"] = "competencia_indirecta"
-            clasificados["competencia_indirecta"].append(place)
-    
-    return clasificados
+    return clasificar_dicts(places, query)
 
 
 def buscar_lugares_con_nueva_api(query: str, ubicacion: str, radio_km: int = 50, 
@@ -528,22 +840,10 @@ def buscar_lugares_con_nueva_api(query: str, ubicacion: str, radio_km: int = 50,
             
             # Convertir formato de nueva API al formato esperado por el servidor MCP
             places_data = result["data"].get("places", [])
-            formatted_places = []
-            
-            for place in places_data:
-                formatted_place = {
-                    "place_id": place.get("id"),
-                    "name": place.get("displayName", {}).get("text", "Nombre no disponible"),
-                    "address": place.get("formattedAddress", "Dirección no disponible"),
-                    "website": "No disponible",  # Requiere details API para obtener
-                    "rating": place.get("rating", "N/A"),
-                    "types": place.get("types", []),
-                    "user_ratings_total": place.get("userRatingCount", 0)
-                }
-                formatted_places.append(formatted_place)
+            lugares = [Place.desde_v1(place, con_total_resenas=True) for place in places_data]
             
-            # Clasificar lugares usando la función existente
-            clasificados = clasificar_lugares(formatted_places, query)
+            # Clasificar lugares (a dict solo para la respuesta)
+            clasificados = clasificacion_a_dicts(clasificar(lugares, query))
             
             # Guardar resultado en formato JSON compatible
             try:
@@ -554,7 +854,7 @@ def buscar_lugares_con_nueva_api(query: str, ubicacion: str, radio_km: int = 50,
                     "query": query,
                     "ubicacion": ubicacion,
                     "radio_km": radio_km,
-                    "total_encontrados": len(formatted_places),
+                    "total_encontrados": len(lugares),
                     "clasificacion": clasificados,
                     "resumen": {
                         "competencia_directa": len(clasificados["competencia_directa"]),
@@ -572,8 +872,7 @@ def buscar_lugares_con_nueva_api(query: str, ubicacion: str, radio_km: int = 50,
                 cache_key = hashlib.md5(f"{query.lower()}_{ubicacion.lower()}_{radio_km}".encode()).hexdigest()
                 result_file = cache_dir / f"places_search_v1_{cache_key}.json"
                 
-                with open(result_file, "w", encoding="utf-8") as f:
-                    json.dump(resultado_completo, f, ensure_ascii=False, indent=2)
+                escribir_json_atomico(result_file, resultado_completo)
                 
                 print(f"✓ Resultado completo guardado en: {result_file}")
                 
@@ -586,7 +885,7 @@ def buscar_lugares_con_nueva_api(query: str, ubicacion: str, radio_km: int = 50,
                     "query": query,
                     "ubicacion": ubicacion,
                     "radio_km": radio_km,
-                    "total_encontrados": len(formatted_places),
+                    "total_encontrados": len(lugares),
                     "clasificacion": clasificados,
                     "resumen": {
                         "competencia_directa": len(clasificados["competencia_directa"]),
@@ -0,0 +1,610 @@
+"""
+Generador de carga de extremo a extremo para el transporte HTTP del servidor MCP.
+Levanta un backend simulado de Google (Places v1 y Geocoding) y el servidor en
+un directorio de trabajo temporal, abre N sesiones MCP concurrentes que repiten
+una mezcla configurable de llamadas a herramientas y reporta throughput,
+percentiles de latencia, tasas de error y consumo de recursos del servidor.
+
+Uso por línea de comandos:
+    python load_test.py --sesiones 20 --duracion 60
+    python load_test.py --sesiones 50 --llamadas 40 --workers 4 --mezcla mezcla.json --salida reporte.json
+
+La mezcla es una lista JSON de {"herramienta", "peso", "argumentos"}; en los
+argumentos, "{place_id}", "{ubicacion}" y "{query}" se reemplazan en cada
+llamada por valores del catálogo simulado.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from fastmcp import Client
+
+try:
+    import psutil
+except ImportError:  # Sin psutil los recursos se leen de /proc (solo Linux)
+    psutil = None
+
+
+REPO_DIR = Path(__file__).resolve().parent
+
+# Catálogo del backend simulado
+LUGARES_SIMULADOS = 60
+TIPOS_SIMULADOS = [
+    ["tourist_attraction", "point_of_interest"],
+    ["lodging", "establishment"],
+    ["restaurant", "food"],
+    ["museum", "tourist_attraction"],
+    ["travel_agency", "point_of_interest"],
+]
+UBICACIONES_SIMULADAS = ["Valle del Elqui", "Vicuña", "La Serena", "Pisco Elqui", "Coquimbo"]
+QUERIES_SIMULADAS = ["tour astronómico", "observatorio", "hotel", "restaurante"]
+TEXTOS_RESENAS = [
+    "Excelente experiencia, el guía muy conocedor y el equipo profesional.",
+    "Mucho frío en la noche y un poco caro para lo que ofrecen.",
+    "Perfecto para ir en familia, los niños quedaron fascinados.",
+]
+
+MEZCLA_PREDETERMINADA = [
+    {"herramienta": "mapeo_competencia_y_colaboradores", "peso": 3,
+     "argumentos": {"query": "{query}", "ubicacion": "{ubicacion}", "radio_km": 30}},
+    {"herramienta": "analizador_de_opiniones", "peso": 3,
+     "argumentos": {"place_id": "{place_id}", "idiomas": ["es", "en"]}},
+    {"herramienta": "obtener_detalles_lugar_v1", "peso": 2, "argumentos": {"place_id": "{place_id}"}},
+    {"herramienta": "buscar_en_resenas", "peso": 1, "argumentos": {"consulta": "frío precio guía"}},
+    {"herramienta": "mapa_densidad_competencia", "peso": 1, "argumentos": {"ubicacion": "{ubicacion}"}},
+]
+
+
+def _entero_de(texto: str, modulo: int) -> int:
+    return int(hashlib.blake2b(texto.encode("utf-8"), digest_size=4).hexdigest(), 16) % modulo
+
+
+def lugar_simulado(indice: int, idioma: str = "es") -> Dict[str, Any]:
+    """Lugar v1 determinista del catálogo simulado, con reseñas y una foto."""
+    place_id = f"SIM{indice:04d}"
+    return {
+        "id": place_id,
+        "displayName": {"text": f"Lugar simulado {indice}", "languageCode": idioma},
+        "formattedAddress": f"Calle {indice}, {UBICACIONES_SIMULADAS[indice % len(UBICACIONES_SIMULADAS)]}",
+        "location": {"latitude": -30.0 - (indice % 10) * 0.02, "longitude": -70.7 + (indice // 10) * 0.02},
+        "rating": round(3.5 + (indice % 15) / 10, 1),
+        "userRatingCount": 10 + indice * 7,
+        "types": TIPOS_SIMULADOS[indice % len(TIPOS_SIMULADOS)],
+        "websiteUri": f"https://lugar{indice}.example",
+        "photos": [{"name": f"places/{place_id}/photos/F0", "widthPx": 800, "heightPx": 600}],
+        "reviews": [
+            {
+                "rating": 5 - (i + indice) % 3,
+                "text": {"text": texto, "languageCode": idioma},
+                "originalText": {"text": texto, "languageCode": "es"},
+                "authorAttribution": {"displayName": f"Autor {indice}-{i}"},
+                "publishTime": f"2024-0{i + 1}-15T12:00:00Z",
+                "relativePublishTimeDescription": "hace un año",
+            }
+            for i, texto in enumerate(TEXTOS_RESENAS)
+        ],
+    }
+
+
+class BackendGoogleSimulado:
+    """
+    Servidor HTTP local que imita Places API v1, el endpoint de media de fotos y
+    la Geocoding API, con latencia y tasa de errores 503 configurables.
+    """
+
+    def __init__(self, latencia_ms: float = 50.0, tasa_error: float = 0.0):
+        self.latencia_ms = latencia_ms
+        self.tasa_error = tasa_error
+        self.llamadas: Counter = Counter()
+        self._lock = threading.Lock()
+        self._rng = random.Random(0)
+        backend = self
+
+        class _Manejador(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _atender(self, metodo: str) -> None:
+                largo = int(self.headers.get("Content-Length") or 0)
+                cuerpo = self.rfile.read(largo) if largo else b""
+                status, contenido, tipo = backend.responder(metodo, self.path, cuerpo)
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", tipo)
+                    self.send_header("Content-Length", str(len(contenido)))
+                    self.end_headers()
+                    self.wfile.write(contenido)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # El servidor abandonó la petición (timeout por plazo)
+
+            def do_GET(self):
+                self._atender("GET")
+
+            def do_POST(self):
+                self._atender("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self.servidor = ThreadingHTTPServer(("127.0.0.1", 0), _Manejador)
+        self.servidor.daemon_threads = True
+        self._hilo: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.servidor.server_address[1]}"
+
+    def iniciar(self) -> "BackendGoogleSimulado":
+        self._hilo = threading.Thread(target=self.servidor.serve_forever, name="backend-google-simulado", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self) -> None:
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def _contar(self, operacion: str) -> None:
+        with self._lock:
+            self.llamadas[operacion] += 1
+
+    def responder(self, metodo: str, ruta: str, cuerpo: bytes) -> Tuple[int, bytes, str]:
+        url = urlparse(ruta)
+        params = {clave: valores[0] for clave, valores in parse_qs(url.query).items()}
+        if url.path.startswith("/imagenes/"):
+            self._contar("imagen")
+            return 200, b"\xff\xd8\xff" + b"\x00" * 2048, "image/jpeg"
+
+        time.sleep(self.latencia_ms / 1000)
+        with self._lock:
+            falla = self._rng.random() < self.tasa_error
+        if falla:
+            self._contar("error_503")
+            return 503, b'{"error": {"code": 503, "status": "UNAVAILABLE"}}', "application/json"
+
+        if url.path.endswith("/geocode/json"):
+            self._contar("geocoding.geocode")
+            direccion = params.get("address", "")
+            desplazamiento = _entero_de(direccion.lower(), 100) / 1000
+            data = {"status": "OK", "results": [{"geometry": {"location": {
+                "lat": -30.0 - desplazamiento, "lng": -70.7 + desplazamiento}}}]}
+        elif url.path.endswith(":searchText") or url.path.endswith(":searchNearby"):
+            operacion = "places.searchText" if url.path.endswith(":searchText") else "places.searchNearby"
+            self._contar(operacion)
+            peticion = json.loads(cuerpo or b"{}")
+            idioma = peticion.get("languageCode", "es")
+            cantidad = min(int(peticion.get("maxResultCount", 20)), 20)
+            inicio = _entero_de(json.dumps(peticion, sort_keys=True), LUGARES_SIMULADOS)
+            data = {"places": [lugar_simulado((inicio + i) % LUGARES_SIMULADOS, idioma) for i in range(cantidad)]}
+        elif url.path.endswith("/media"):
+            self._contar("places.photo")
+            data = {"photoUri": f"{self.url}/imagenes/{_entero_de(url.path, 10 ** 6)}.jpg"}
+        elif "/places/" in url.path:
+            self._contar("places.details")
+            place_id = url.path.rsplit("/", 1)[-1]
+            if not place_id.startswith("SIM") or not place_id[3:].isdigit():
+                return 404, b'{"error": {"code": 404, "message": "Place ID not found", "status": "NOT_FOUND"}}', "application/json"
+            data = lugar_simulado(int(place_id[3:]) % LUGARES_SIMULADOS, params.get("languageCode", "es"))
+        else:
+            self._contar("desconocida")
+            return 404, b'{"error": {"code": 404}}', "application/json"
+        return 200, json.dumps(data).encode("utf-8"), "application/json"
+
+
+# --- Recursos del servidor ---
+
+def _hijos_proc(pid: int) -> List[int]:
+    """Procesos descendientes de pid leyendo /proc (workers de uvicorn)."""
+    padres: Dict[int, List[int]] = {}
+    for entrada in os.listdir("/proc"):
+        if not entrada.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entrada}/stat", "r") as f:
+                campos = f.read().rsplit(")", 1)[1].split()
+            padres.setdefault(int(campos[1]), []).append(int(entrada))
+        except (OSError, IndexError, ValueError):
+            continue
+    descendientes, pendientes = [], [pid]
+    while pendientes:
+        hijos = padres.get(pendientes.pop(), [])
+        descendientes.extend(hijos)
+        pendientes.extend(hijos)
+    return descendientes
+
+
+def _muestra_proc(pids: List[int]) -> Dict[str, float]:
+    tick = os.sysconf("SC_CLK_TCK")
+    pagina = os.sysconf("SC_PAGE_SIZE")
+    muestra = {"cpu_s": 0.0, "rss_bytes": 0, "hilos": 0, "descriptores": 0}
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                campos = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/statm", "r") as f:
+                residentes = int(f.read().split()[1])
+            muestra["cpu_s"] += (int(campos[11]) + int(campos[12])) / tick
+            muestra["hilos"] += int(campos[17])
+            muestra["rss_bytes"] += residentes * pagina
+            muestra["descriptores"] += len(os.listdir(f"/proc/{pid}/fd"))
+        except (OSError, IndexError, ValueError):
+            continue
+    return muestra
+
+
+def muestra_recursos(pid: int) -> Dict[str, float]:
+    """CPU acumulada, memoria residente, hilos y descriptores del servidor y sus workers."""
+    if psutil is not None:
+        try:
+            raiz = psutil.Process(pid)
+            procesos = [raiz] + raiz.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return {"cpu_s": 0.0, "rss_bytes": 0, "hilos": 0, "descriptores": 0}
+        muestra = {"cpu_s": 0.0, "rss_bytes": 0, "hilos": 0, "descriptores": 0}
+        for proceso in procesos:
+            try:
+                with proceso.oneshot():
+                    tiempos = proceso.cpu_times()
+                    muestra["cpu_s"] += tiempos.user + tiempos.system
+                    muestra["rss_bytes"] += proceso.memory_info().rss
+                    muestra["hilos"] += proceso.num_threads()
+                    muestra["descriptores"] += proceso.num_fds()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return muestra
+    if not Path("/proc").is_dir():
+        return {}
+    return _muestra_proc([pid] + _hijos_proc(pid))
+
+
+class MonitorRecursos:
+    """Muestrea los recursos del servidor en un hilo mientras dura la carga."""
+
+    def __init__(self, pid: int, intervalo_s: float = 0.5):
+        self.pid = pid
+        self.intervalo_s = intervalo_s
+        self.muestras: List[Tuple[float, Dict[str, float]]] = []
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, name="monitor-recursos", daemon=True)
+
+    def _muestrear(self) -> None:
+        while not self._detener.is_set():
+            muestra = muestra_recursos(self.pid)
+            if muestra:
+                self.muestras.append((time.monotonic(), muestra))
+            self._detener.wait(self.intervalo_s)
+
+    def iniciar(self) -> "MonitorRecursos":
+        self._hilo.start()
+        return self
+
+    def detener(self) -> Dict[str, Any]:
+        self._detener.set()
+        self._hilo.join()
+        if len(self.muestras) < 2:
+            return {"disponible": False}
+        cpu_pct = [
+            100 * (b["cpu_s"] - a["cpu_s"]) / (tb - ta)
+            for (ta, a), (tb, b) in zip(self.muestras, self.muestras[1:]) if tb > ta
+        ]
+        (t0, inicial), (t1, final) = self.muestras[0], self.muestras[-1]
+        return {
+            "disponible": True,
+            "fuente": "psutil" if psutil is not None else "/proc",
+            "muestras": len(self.muestras),
+            "cpu_promedio_pct": round(100 * (final["cpu_s"] - inicial["cpu_s"]) / max(t1 - t0, 1e-9), 1),
+            "cpu_max_pct": round(max(cpu_pct), 1) if cpu_pct else 0.0,
+            "rss_inicial_mb": round(inicial["rss_bytes"] / 1024 / 1024, 1),
+            "rss_max_mb": round(max(m["rss_bytes"] for _, m in self.muestras) / 1024 / 1024, 1),
+            "rss_final_mb": round(final["rss_bytes"] / 1024 / 1024, 1),
+            "hilos_max": max(m["hilos"] for _, m in self.muestras),
+            "descriptores_max": max(m["descriptores"] for _, m in self.muestras),
+        }
+
+
+# --- Servidor bajo prueba ---
+
+def _puerto_libre() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def iniciar_servidor(backend_url: str, directorio: Path, puerto: int, workers: int = 1,
+                     entorno: Optional[Dict[str, str]] = None, espera_s: float = 60.0) -> subprocess.Popen:
+    """
+    Levanta server.py con transporte HTTP en 'directorio' (su caché queda ahí),
+    apuntando el cliente de Google al backend simulado, y espera a que el puerto
+    acepte conexiones.
+
+    Raises:
+        RuntimeError: Si el servidor termina o no abre el puerto a tiempo
+    """
+    env = {
+        **os.environ,
+        "GOOGLE_API_KEY": "AIzaSIMULADA",
+        "GOOGLE_PLACES_BASE_URL": f"{backend_url}/v1",
+        "GOOGLE_GEOCODING_URL": f"{backend_url}/maps/api/geocode/json",
+        "MCP_HOST": "127.0.0.1",
+        "MCP_PORT": str(puerto),
+        "MCP_WORKERS": str(workers),
+        "REFRESH_INTERVAL_MIN": "0",
+        "CACHE_COMPACTION_INTERVAL_MIN": "0",
+        "PYTHONUNBUFFERED": "1",
+        "PYTHONPATH": os.pathsep.join(filter(None, [str(REPO_DIR), os.environ.get("PYTHONPATH")])),
+        **(entorno or {}),
+    }
+    log = open(directorio / "servidor.log", "w", encoding="utf-8")
+    proceso = subprocess.Popen([sys.executable, str(REPO_DIR / "server.py")], cwd=directorio, env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    limite = time.monotonic() + espera_s
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            log.close()
+            cola = (directorio / "servidor.log").read_text(encoding="utf-8", errors="replace")[-2000:]
+            raise RuntimeError(f"El servidor terminó con código {proceso.returncode}:\n{cola}")
+        try:
+            with socket.create_connection(("127.0.0.1", puerto), timeout=0.5):
+                return proceso
+        except OSError:
+            time.sleep(0.2)
+    proceso.kill()
+    raise RuntimeError(f"El servidor no abrió el puerto {puerto} en {espera_s:.0f} s")
+
+
+def detener_servidor(proceso: subprocess.Popen) -> None:
+    proceso.terminate()
+    try:
+        proceso.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proceso.kill()
+        proceso.wait()
+
+
+# --- Sesiones de carga ---
+
+def _resolver_argumentos(valor: Any, variables: Dict[str, Any]) -> Any:
+    if isinstance(valor, str) and "{" in valor:
+        return valor.format(**variables)
+    if isinstance(valor, list):
+        return [_resolver_argumentos(v, variables) for v in valor]
+    if isinstance(valor, dict):
+        return {k: _resolver_argumentos(v, variables) for k, v in valor.items()}
+    return valor
+
+
+def _clasificar_resultado(resultado: Any) -> str:
+    if resultado.is_error:
+        return "error_mcp"
+    contenido = resultado.structured_content
+    if isinstance(contenido, dict) and contenido.get("error"):
+        return "error_herramienta"
+    return "ok"
+
+
+async def _sesion(url: str, mezcla: List[Dict[str, Any]], fin: float, max_llamadas: Optional[int],
+                  rng: random.Random, timeout_s: float, registros: List[Dict[str, Any]],
+                  errores_conexion: List[str]) -> None:
+    pesos = [llamada.get("peso", 1) for llamada in mezcla]
+    try:
+        async with Client(url, timeout=timeout_s) as cliente:
+            hechas = 0
+            while time.monotonic() < fin and (max_llamadas is None or hechas < max_llamadas):
+                llamada = rng.choices(mezcla, weights=pesos)[0]
+                variables = {
+                    "place_id": f"SIM{rng.randrange(LUGARES_SIMULADOS):04d}",
+                    "ubicacion": rng.choice(UBICACIONES_SIMULADAS),
+                    "query": rng.choice(QUERIES_SIMULADAS),
+                }
+                argumentos = _resolver_argumentos(llamada.get("argumentos", {}), variables)
+                inicio = time.perf_counter()
+                try:
+                    resultado = await cliente.call_tool(llamada["herramienta"], argumentos, raise_on_error=False)
+                    estado, detalle = _clasificar_resultado(resultado), None
+                except Exception as e:
+                    estado, detalle = "error_transporte", f"{type(e).__name__}: {e}"
+                registros.append({
+                    "herramienta": llamada["herramienta"],
+                    "latencia_ms": (time.perf_counter() - inicio) * 1000,
+                    "estado": estado,
+                    "detalle": detalle,
+                })
+                hechas += 1
+    except Exception as e:
+        errores_conexion.append(f"{type(e).__name__}: {e}")
+
+
+async def generar_carga(url: str, sesiones: int, mezcla: List[Dict[str, Any]], duracion_s: Optional[float],
+                        llamadas_por_sesion: Optional[int], semilla: int = 0, timeout_s: float = 120.0,
+                        rampa_s: float = 0.0) -> Tuple[List[Dict[str, Any]], List[str], float]:
+    """N sesiones MCP concurrentes; retorna (registros por llamada, errores de conexión, duración)."""
+    registros: List[Dict[str, Any]] = []
+    errores_conexion: List[str] = []
+    inicio = time.monotonic()
+    fin = inicio + duracion_s if duracion_s else float("inf")
+
+    async def _con_rampa(indice: int) -> None:
+        if rampa_s:
+            await asyncio.sleep(rampa_s * indice / sesiones)
+        await _sesion(url, mezcla, fin, llamadas_por_sesion, random.Random(semilla + indice),
+                      timeout_s, registros, errores_conexion)
+
+    await asyncio.gather(*(_con_rampa(i) for i in range(sesiones)))
+    return registros, errores_conexion, time.monotonic() - inicio
+
+
+async def leer_metricas_transporte(url: str, timeout_s: float = 30.0) -> Dict[str, Any]:
+    """Bytes y serialización que reporta el servidor (con varios workers, solo del que atiende)."""
+    try:
+        async with Client(url, timeout=timeout_s) as cliente:
+            resultado = await cliente.call_tool("metricas_transporte", {}, raise_on_error=False)
+            return resultado.structured_content or {}
+    except Exception as e:
+        return {"error": f"{type(e).__name__}: {e}"}
+
+
+def _percentiles(latencias: List[float]) -> Dict[str, float]:
+    if not latencias:
+        return {}
+    valores = np.asarray(latencias)
+    p50, p90, p95, p99 = np.percentile(valores, [50, 90, 95, 99])
+    return {
+        "p50": round(float(p50), 1), "p90": round(float(p90), 1), "p95": round(float(p95), 1),
+        "p99": round(float(p99), 1), "max": round(float(valores.max()), 1),
+        "promedio": round(float(valores.mean()), 1),
+    }
+
+
+def resumir(registros: List[Dict[str, Any]], errores_conexion: List[str], duracion_s: float,
+            sesiones: int) -> Dict[str, Any]:
+    """Throughput, percentiles y tasas de error globales y por herramienta."""
+    total = len(registros)
+    estados = Counter(r["estado"] for r in registros)
+    fallidas = estados["error_mcp"] + estados["error_transporte"]
+    por_herramienta = {}
+    for herramienta in sorted({r["herramienta"] for r in registros}):
+        propios = [r for r in registros if r["herramienta"] == herramienta]
+        propios_estados = Counter(r["estado"] for r in propios)
+        por_herramienta[herramienta] = {
+            "llamadas": len(propios),
+            "latencia_ms": _percentiles([r["latencia_ms"] for r in propios]),
+            "errores": {estado: n for estado, n in propios_estados.items() if estado != "ok"},
+        }
+    detalles = Counter(r["detalle"] for r in registros if r["detalle"])
+    return {
+        "llamadas_totales": total,
+        "duracion_s": round(duracion_s, 2),
+        "throughput_rps": round(total / duracion_s, 2) if duracion_s else 0.0,
+        "latencia_ms": _percentiles([r["latencia_ms"] for r in registros]),
+        "errores": {
+            "transporte": estados["error_transporte"],
+            "mcp": estados["error_mcp"],
+            "herramienta": estados["error_herramienta"],
+            "sesiones_fallidas": len(errores_conexion),
+        },
+        "tasa_error": round(fallidas / total, 4) if total else 0.0,
+        "tasa_error_herramienta": round(estados["error_herramienta"] / total, 4) if total else 0.0,
+        "sesiones_completadas": sesiones - len(errores_conexion),
+        "por_herramienta": por_herramienta,
+        "errores_frecuentes": [{"error": e, "veces": n} for e, n in detalles.most_common(5)]
+                              + [{"error": e, "veces": 1} for e in errores_conexion[:3]],
+    }
+
+
+def ejecutar_prueba_carga(sesiones: int = 10, duracion_s: Optional[float] = 30.0,
+                          llamadas_por_sesion: Optional[int] = None,
+                          mezcla: Optional[List[Dict[str, Any]]] = None, workers: int = 1,
+                          latencia_backend_ms: float = 50.0, tasa_error_backend: float = 0.0,
+                          cache_inicial: Optional[Path] = None, semilla: int = 0, timeout_s: float = 120.0,
+                          rampa_s: float = 0.0, conservar_directorio: bool = False) -> Dict[str, Any]:
+    """
+    Ejecuta una prueba de carga completa: backend simulado, servidor en un
+    directorio temporal (con una copia de cache_inicial si se indica), sesiones
+    concurrentes y reporte.
+
+    Raises:
+        ValueError: Si los parámetros no son válidos
+        RuntimeError: Si el servidor no arranca
+    """
+    mezcla = mezcla or MEZCLA_PREDETERMINADA
+    if sesiones < 1:
+        raise ValueError("sesiones debe ser al menos 1")
+    if not duracion_s and not llamadas_por_sesion:
+        raise ValueError("Indica duracion_s o llamadas_por_sesion")
+    if any("herramienta" not in llamada for llamada in mezcla):
+        raise ValueError("Cada elemento de la mezcla necesita 'herramienta'")
+
+    directorio = Path(tempfile.mkdtemp(prefix="kay_carga_"))
+    if cache_inicial:
+        shutil.copytree(cache_inicial, directorio / "cache")
+    backend = BackendGoogleSimulado(latencia_backend_ms, tasa_error_backend).iniciar()
+    puerto = _puerto_libre()
+    try:
+        proceso = iniciar_servidor(backend.url, directorio, puerto, workers)
+        try:
+            monitor = MonitorRecursos(proceso.pid).iniciar()
+            registros, errores_conexion, duracion = asyncio.run(generar_carga(
+                f"http://127.0.0.1:{puerto}/mcp", sesiones, mezcla, duracion_s,
+                llamadas_por_sesion, semilla, timeout_s, rampa_s
+            ))
+            recursos = monitor.detener()
+            transporte = asyncio.run(leer_metricas_transporte(f"http://127.0.0.1:{puerto}/mcp"))
+        finally:
+            detener_servidor(proceso)
+    finally:
+        backend.detener()
+
+    reporte = {
+        "configuracion": {
+            "sesiones": sesiones,
+            "duracion_s": duracion_s,
+            "llamadas_por_sesion": llamadas_por_sesion,
+            "workers": workers,
+            "latencia_backend_ms": latencia_backend_ms,
+            "tasa_error_backend": tasa_error_backend,
+            "cache_inicial": str(cache_inicial) if cache_inicial else None,
+            "mezcla": mezcla,
+        },
+        **resumir(registros, errores_conexion, duracion, sesiones),
+        "backend_simulado": dict(backend.llamadas),
+        "recursos_servidor": recursos,
+        "transporte_servidor": transporte,
+        "timestamp": datetime.now().isoformat(),
+    }
+    if conservar_directorio:
+        reporte["directorio_trabajo"] = str(directorio)
+    else:
+        shutil.rmtree(directorio, ignore_errors=True)
+    return reporte
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga del servidor MCP sobre HTTP con Google simulado")
+    parser.add_argument("--sesiones", type=int, default=10, help="Sesiones MCP concurrentes")
+    parser.add_argument("--duracion", type=float, default=30.0, help="Segundos de carga (0 = usar --llamadas)")
+    parser.add_argument("--llamadas", type=int, help="Llamadas por sesión (detiene la sesión al completarlas)")
+    parser.add_argument("--mezcla", help="Archivo JSON con la mezcla de llamadas")
+    parser.add_argument("--workers", type=int, default=1, help="MCP_WORKERS del servidor")
+    parser.add_argument("--latencia-backend", type=float, default=50.0, help="Latencia simulada de Google (ms)")
+    parser.add_argument("--tasa-error-backend", type=float, default=0.0, help="Fracción de respuestas 503 simuladas")
+    parser.add_argument("--cache-inicial", help="Directorio de caché a copiar antes de la prueba (caché tibio)")
+    parser.add_argument("--rampa", type=float, default=0.0, help="Segundos para abrir todas las sesiones")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Timeout por llamada (s)")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="Archivo donde guardar el reporte JSON")
+    parser.add_argument("--conservar", action="store_true", help="No borrar el directorio de trabajo (log y caché)")
+    args = parser.parse_args()
+
+    try:
+        mezcla = json.loads(Path(args.mezcla).read_text(encoding="utf-8")) if args.mezcla else None
+        reporte = ejecutar_prueba_carga(
+            sesiones=args.sesiones, duracion_s=args.duracion or None, llamadas_por_sesion=args.llamadas,
+            mezcla=mezcla, workers=args.workers, latencia_backend_ms=args.latencia_backend,
+            tasa_error_backend=args.tasa_error_backend,
+            cache_inicial=Path(args.cache_inicial) if args.cache_inicial else None,
+            semilla=args.semilla, timeout_s=args.timeout, rampa_s=args.rampa,
+            conservar_directorio=args.conservar
+        )
+    except (ValueError, OSError, json.JSONDecodeError) as e:
+        parser.error(str(e))
+
+    texto = json.dumps(reporte, indent=2, ensure_ascii=False)
+    if args.salida:
+        Path(args.salida).write_text(texto, encoding="utf-8")
+        print(f"✓ Reporte guardado en: {args.salida}")
+    print(texto)
@@ -0,0 +1,436 @@
+"""
+Seguimiento de memoria del proceso.
+- Por herramienta: pico de asignaciones durante la llamada (tracemalloc),
+  memoria retenida al terminar y variación del RSS.
+- Por caché en memoria: tamaño retenido (recorrido profundo con
+  sys.getsizeof) y cantidad de entradas.
+- Snapshots de tracemalloc con nombre, comparables entre sí por línea,
+  archivo o traza.
+- Presupuesto de memoria opcional (MEMORIA_PRESUPUESTO_MB): al superarlo tras
+  una llamada se liberan los cachés en memoria en orden de prioridad hasta
+  volver bajo el límite. Los datos siguen en disco y se recargan al pedirlos.
+
+tracemalloc mide todo el proceso: con llamadas simultáneas el pico de una
+herramienta incluye lo que asignan las demás (se marca como "concurrentes").
+"""
+import os
+import gc
+import sys
+import time
+import threading
+import tracemalloc
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+from fastmcp.server.middleware import Middleware
+
+try:
+    import psutil
+except ImportError:  # psutil es opcional; sin él el RSS se lee de /proc
+    psutil = None
+
+
+MB = 1024 * 1024
+MAX_SNAPSHOTS = 5  # Snapshots conservados en memoria (se descartan los más antiguos)
+AGRUPACIONES = ("lineno", "filename", "traceback")
+# Marcos de tracemalloc y del sistema de importación: ruido en los snapshots
+FILTROS_SNAPSHOT = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _numero_entorno(variable: str, defecto: float) -> float:
+    try:
+        return float(os.getenv(variable, str(defecto)))
+    except ValueError:
+        return defecto
+
+
+config = {
+    # Presupuesto de memoria en MB (0 = sin límite); se mide con tracemalloc si está activo, si no con el RSS
+    "presupuesto_mb": max(_numero_entorno("MEMORIA_PRESUPUESTO_MB", 0), 0.0),
+    # Segundos mínimos entre dos liberaciones por presupuesto
+    "enfriamiento_s": max(_numero_entorno("MEMORIA_ENFRIAMIENTO_S", 30), 0.0),
+}
+_lock = threading.Lock()
+
+# Cachés registrados: nombre -> {"objeto", "liberar", "prioridad", "desglose", "contar"}
+_caches: Dict[str, Dict[str, Any]] = {}
+_snapshots: "OrderedDict[str, Tuple[float, tracemalloc.Snapshot]]" = OrderedDict()
+
+
+def _metricas_vacias() -> Dict[str, Any]:
+    return {
+        "herramientas": defaultdict(lambda: {
+            "llamadas": 0, "llamadas_medidas": 0, "concurrentes": 0,
+            "pico_max_bytes": 0, "pico_total_bytes": 0, "retenido_total_bytes": 0,
+            "rss_delta_total_bytes": 0, "ultima": None,
+        }),
+        "liberaciones": [],
+        "desde": time.time(),
+    }
+
+
+_metricas = _metricas_vacias()
+_en_curso = 0
+_inicios = 0  # Llamadas iniciadas desde el arranque; detecta llamadas que se solapan
+_ultima_liberacion = 0.0
+
+
+def rss_bytes() -> Optional[int]:
+    """Memoria residente del proceso, o None si no se puede medir."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def tamano_retenido(objeto: Any, vistos: Optional[set] = None) -> int:
+    """
+    Tamaño profundo aproximado de un objeto (sys.getsizeof de todo lo que
+    alcanza). Los objetos ya presentes en vistos no se vuelven a contar.
+    """
+    vistos = set() if vistos is None else vistos
+    total = 0
+    pendientes = [objeto]
+    while pendientes:
+        actual = pendientes.pop()
+        if id(actual) in vistos or isinstance(actual, (type, type(sys), type(tamano_retenido))):
+            continue
+        vistos.add(id(actual))
+        total += sys.getsizeof(actual)
+        if isinstance(actual, dict):
+            pendientes.extend(actual.keys())
+            pendientes.extend(actual.values())
+        elif isinstance(actual, (list, tuple, set, frozenset)):
+            pendientes.extend(actual)
+        elif hasattr(actual, "__dict__"):
+            pendientes.append(vars(actual))
+    return total
+
+
+def registrar_cache(nombre: str, objeto: Callable[[], Any], liberar: Callable[[], None],
+                    prioridad: int = 0, desglose: bool = False,
+                    contar: Optional[Callable[[Any], int]] = None) -> None:
+    """
+    Registra un caché en memoria para medirlo y liberarlo.
+
+    Args:
+        nombre: Nombre con que aparece en el estado
+        objeto: Función que retorna lo que el caché retiene (o None si no está cargado)
+        liberar: Función que descarta el contenido en memoria
+        prioridad: Orden de liberación por presupuesto (menor = se libera antes)
+        desglose: Si objeto() es un dict, informar también el tamaño de cada clave
+        contar: Entradas del objeto retenido (por defecto len)
+    """
+    with _lock:
+        _caches[nombre] = {"objeto": objeto, "liberar": liberar, "prioridad": prioridad,
+                           "desglose": desglose, "contar": contar or len}
+
+
+def medir_caches(limite_desglose: int = 10) -> Dict[str, Any]:
+    """
+    Tamaño retenido y entradas de cada caché registrado. Los objetos
+    compartidos entre cachés se cuentan una vez, en el primero (por prioridad
+    de liberación descendente: el que los conserva más tiempo).
+    """
+    with _lock:
+        registrados = sorted(_caches.items(), key=lambda c: -c[1]["prioridad"])
+    vistos = set()
+    resultado = {}
+    for nombre, cache in registrados:
+        objeto = cache["objeto"]()
+        medida = {"prioridad": cache["prioridad"], "cargado": objeto is not None,
+                  "entradas": cache["contar"](objeto) if objeto is not None else 0}
+        if cache["desglose"] and isinstance(objeto, dict):
+            partes = {clave: tamano_retenido(valor, vistos) for clave, valor in objeto.items()}
+            medida["tamano_mb"] = round((tamano_retenido(objeto, vistos) + sum(partes.values())) / MB, 3)
+            mayores = sorted(partes.items(), key=lambda p: -p[1])[:limite_desglose]
+            medida["mayores"] = {clave: round(tamano / MB, 3) for clave, tamano in mayores}
+        else:
+            medida["tamano_mb"] = round(tamano_retenido(objeto, vistos) / MB, 3) if objeto is not None else 0.0
+        resultado[nombre] = medida
+    return resultado
+
+
+def liberar_caches(nombres: Optional[List[str]] = None) -> List[str]:
+    """Libera los cachés indicados (todos si es None) y fuerza una recolección."""
+    with _lock:
+        elegidos = [(n, c) for n, c in _caches.items() if nombres is None or n in nombres]
+    for _, cache in elegidos:
+        cache["liberar"]()
+    gc.collect()
+    return [nombre for nombre, _ in elegidos]
+
+
+def uso_actual() -> Tuple[Optional[int], str]:
+    """Memoria que se compara con el presupuesto: (bytes, "tracemalloc" | "rss")."""
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0], "tracemalloc"
+    return rss_bytes(), "rss"
+
+
+def verificar_presupuesto(forzar: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Si el uso supera el presupuesto, libera cachés en orden de prioridad hasta
+    volver bajo el límite. Respeta el enfriamiento entre liberaciones salvo con
+    forzar. Retorna el registro de la liberación, o None si no hizo falta.
+    """
+    global _ultima_liberacion
+    presupuesto = config["presupuesto_mb"] * MB
+    if presupuesto <= 0:
+        return None
+    uso, medida = uso_actual()
+    if uso is None or uso <= presupuesto:
+        return None
+    with _lock:
+        if not forzar and time.time() - _ultima_liberacion < config["enfriamiento_s"]:
+            return None
+        _ultima_liberacion = time.time()
+        orden = sorted(_caches, key=lambda n: _caches[n]["prioridad"])
+
+    antes = uso
+    liberados = []
+    for nombre in orden:
+        liberados += liberar_caches([nombre])
+        uso, _ = uso_actual()
+        if uso is not None and uso <= presupuesto:
+            break
+    registro = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "medida": medida,
+        "antes_mb": round(antes / MB, 1),
+        "despues_mb": round(uso / MB, 1) if uso is not None else None,
+        "presupuesto_mb": config["presupuesto_mb"],
+        "liberados": liberados,
+    }
+    with _lock:
+        _metricas["liberaciones"] = (_metricas["liberaciones"] + [registro])[-20:]
+    if uso is not None and uso > presupuesto:
+        print(f"WARNING: Memoria sobre el presupuesto tras liberar todos los cachés: "
+              f"{registro['despues_mb']} MB > {config['presupuesto_mb']} MB")
+    else:
+        print(f"✓ Presupuesto de memoria: liberados {liberados} ({registro['antes_mb']} → {registro['despues_mb']} MB)")
+    return registro
+
+
+def configurar(presupuesto_mb: Optional[float] = None, enfriamiento_s: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Actualiza la configuración en caliente; los argumentos en None no cambian.
+
+    Raises:
+        ValueError: Si algún valor es negativo
+    """
+    with _lock:
+        if presupuesto_mb is not None:
+            if presupuesto_mb < 0:
+                raise ValueError("presupuesto_mb no puede ser negativo (0 = sin límite)")
+            config["presupuesto_mb"] = float(presupuesto_mb)
+        if enfriamiento_s is not None:
+            if enfriamiento_s < 0:
+                raise ValueError("enfriamiento_s no puede ser negativo")
+            config["enfriamiento_s"] = float(enfriamiento_s)
+        return dict(config)
+
+
+def iniciar_tracemalloc(marcos: int = 1) -> None:
+    """Activa tracemalloc (marcos = profundidad de la traza guardada por asignación)."""
+    if marcos < 1:
+        raise ValueError("marcos debe ser al menos 1")
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(marcos)
+
+
+def detener_tracemalloc() -> None:
+    """Desactiva tracemalloc y descarta los snapshots (no son comparables con los siguientes)."""
+    tracemalloc.stop()
+    with _lock:
+        _snapshots.clear()
+
+
+def _estadistica(stat: Any, agrupar_por: str) -> Dict[str, Any]:
+    marcos = list(stat.traceback)
+    ubicacion = f"{marcos[0].filename}:{marcos[0].lineno}" if marcos else "?"
+    if agrupar_por == "filename" and marcos:
+        ubicacion = marcos[0].filename
+    resultado = {"ubicacion": ubicacion, "tamano_kb": round(stat.size / 1024, 1), "cantidad": stat.count}
+    if hasattr(stat, "size_diff"):
+        resultado["diferencia_kb"] = round(stat.size_diff / 1024, 1)
+        resultado["diferencia_cantidad"] = stat.count_diff
+    if agrupar_por == "traceback":
+        resultado["traza"] = [f"{m.filename}:{m.lineno}" for m in marcos]
+    return resultado
+
+
+def tomar_snapshot(nombre: Optional[str] = None, agrupar_por: str = "lineno", limite: int = 15) -> Dict[str, Any]:
+    """
+    Toma un snapshot de tracemalloc y lo guarda con nombre para compararlo después.
+
+    Raises:
+        ValueError: Si tracemalloc no está activo o la agrupación no es válida
+    """
+    if not tracemalloc.is_tracing():
+        raise ValueError("tracemalloc no está activo (accion='iniciar' o MEMORIA_TRACEMALLOC=1)")
+    if agrupar_por not in AGRUPACIONES:
+        raise ValueError(f"agrupar_por debe ser uno de {list(AGRUPACIONES)}")
+    snapshot = tracemalloc.take_snapshot().filter_traces(FILTROS_SNAPSHOT)
+    ahora = time.time()
+    nombre = nombre or time.strftime("snapshot_%H%M%S", time.localtime(ahora))
+    with _lock:
+        _snapshots.pop(nombre, None)
+        _snapshots[nombre] = (ahora, snapshot)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    estadisticas = snapshot.statistics(agrupar_por)
+    return {
+        "nombre": nombre,
+        "total_mb": round(sum(s.size for s in estadisticas) / MB, 3),
+        "mayores": [_estadistica(s, agrupar_por) for s in estadisticas[:limite]],
+    }
+
+
+def comparar_snapshots(nombre: Optional[str] = None, base: Optional[str] = None,
+                       agrupar_por: str = "lineno", limite: int = 15) -> Dict[str, Any]:
+    """
+    Compara el snapshot nombre (sin nombre: uno nuevo tomado ahora) con base
+    (sin base: el más reciente guardado). Las diferencias van de mayor a menor
+    crecimiento absoluto.
+
+    Raises:
+        ValueError: Si falta algún snapshot, tracemalloc no está activo o la agrupación no es válida
+    """
+    if agrupar_por not in AGRUPACIONES:
+        raise ValueError(f"agrupar_por debe ser uno de {list(AGRUPACIONES)}")
+    with _lock:
+        guardados = dict(_snapshots)
+        if base is None and guardados:
+            base = next(reversed(_snapshots))
+    if base is None or base not in guardados:
+        raise ValueError(f"No existe el snapshot base '{base}'; disponibles: {list(guardados)}")
+    t_base, snap_base = guardados[base]  # Se toma antes: un snapshot nuevo puede desplazarlo
+    if nombre is None:
+        nombre = tomar_snapshot(agrupar_por=agrupar_por, limite=0)["nombre"]
+        with _lock:
+            guardados = dict(_snapshots)
+    if nombre not in guardados:
+        raise ValueError(f"No existe el snapshot '{nombre}'; disponibles: {list(guardados)}")
+
+    t_actual, snap_actual = guardados[nombre]
+    diferencias = snap_actual.compare_to(snap_base, agrupar_por)
+    return {
+        "nombre": nombre,
+        "base": base,
+        "segundos_entre": round(t_actual - t_base, 1),
+        "diferencia_total_mb": round(sum(d.size_diff for d in diferencias) / MB, 3),
+        "mayores": [_estadistica(d, agrupar_por) for d in diferencias[:limite]],
+    }
+
+
+def estado(incluir_caches: bool = True) -> Dict[str, Any]:
+    """Configuración, uso actual, métricas por herramienta, cachés, liberaciones y snapshots."""
+    actual, pico = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+    rss = rss_bytes()
+    with _lock:
+        herramientas = {
+            herramienta: {
+                "llamadas": m["llamadas"],
+                "llamadas_medidas": m["llamadas_medidas"],
+                "concurrentes": m["concurrentes"],
+                "pico_max_mb": round(m["pico_max_bytes"] / MB, 3),
+                "pico_promedio_mb": round(m["pico_total_bytes"] / m["llamadas_medidas"] / MB, 3) if m["llamadas_medidas"] else None,
+                "retenido_total_mb": round(m["retenido_total_bytes"] / MB, 3),
+                "rss_delta_total_mb": round(m["rss_delta_total_bytes"] / MB, 3),
+                "ultima": m["ultima"],
+            }
+            for herramienta, m in _metricas["herramientas"].items()
+        }
+        resultado = {
+            "configuracion": dict(config),
+            "tracemalloc": {
+                "activo": tracemalloc.is_tracing(),
+                "marcos": tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else None,
+                "actual_mb": round(actual / MB, 3) if actual is not None else None,
+                "pico_mb": round(pico / MB, 3) if pico is not None else None,
+            },
+            "rss_mb": round(rss / MB, 1) if rss is not None else None,
+            "desde": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_metricas["desde"])),
+            "herramientas": herramientas,
+            "liberaciones": list(_metricas["liberaciones"]),
+            "snapshots": [{"nombre": n, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(t))}
+                          for n, (t, _) in _snapshots.items()],
+        }
+    if incluir_caches:
+        resultado["caches"] = medir_caches()
+    return resultado
+
+
+def reiniciar_metricas() -> None:
+    global _metricas
+    with _lock:
+        _metricas = _metricas_vacias()
+
+
+def _inicio_llamada() -> Dict[str, Any]:
+    global _en_curso, _inicios
+    with _lock:
+        sola = _en_curso == 0
+        _en_curso += 1
+        _inicios += 1
+        midiendo = tracemalloc.is_tracing()
+        # El pico es global: solo se reinicia si no hay otra llamada midiéndose
+        if midiendo and sola:
+            tracemalloc.reset_peak()
+        return {
+            "inicio": _inicios,
+            "sola": sola,
+            "actual": tracemalloc.get_traced_memory()[0] if midiendo else None,
+            "rss": rss_bytes(),
+        }
+
+
+def _fin_llamada(herramienta: str, inicio: Dict[str, Any]) -> None:
+    global _en_curso
+    rss = rss_bytes()
+    with _lock:
+        _en_curso -= 1
+        concurrente = not inicio["sola"] or _inicios != inicio["inicio"]
+        m = _metricas["herramientas"][herramienta]
+        m["llamadas"] += 1
+        m["concurrentes"] += 1 if concurrente else 0
+        ultima = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "concurrente": concurrente}
+        if inicio["actual"] is not None and tracemalloc.is_tracing():
+            actual, pico = tracemalloc.get_traced_memory()
+            pico_llamada = max(pico - inicio["actual"], 0)
+            retenido = actual - inicio["actual"]
+            m["llamadas_medidas"] += 1
+            m["pico_max_bytes"] = max(m["pico_max_bytes"], pico_llamada)
+            m["pico_total_bytes"] += pico_llamada
+            m["retenido_total_bytes"] += retenido
+            ultima.update(pico_mb=round(pico_llamada / MB, 3), retenido_mb=round(retenido / MB, 3))
+        if rss is not None and inicio["rss"] is not None:
+            m["rss_delta_total_bytes"] += rss - inicio["rss"]
+            ultima["rss_delta_mb"] = round((rss - inicio["rss"]) / MB, 3)
+        m["ultima"] = ultima
+
+
+class MemoriaMiddleware(Middleware):
+    """Middleware de FastMCP que mide la memoria de cada llamada y aplica el presupuesto."""
+
+    async def on_call_tool(self, context, call_next):
+        herramienta = context.message.name
+        inicio = _inicio_llamada()
+        try:
+            return await call_next(context)
+        finally:
+            _fin_llamada(herramienta, inicio)
+            verificar_presupuesto()
+
+
+if os.getenv("MEMORIA_TRACEMALLOC", "0") == "1":
+    iniciar_tracemalloc(max(int(_numero_entorno("MEMORIA_TRACEMALLOC_MARCOS", 1)), 1))
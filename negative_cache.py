@@ -0,0 +1,168 @@
+"""
+Caché negativo: recuerda por poco tiempo las búsquedas sin resultados y los
+errores que no se arreglan reintentando (ubicación inexistente, place_id
+inválido u obsoleto), para no volver a consultar la API con la misma entrada.
+Las entradas viven en cache/negative_cache.json (compartido entre workers) con
+las mismas claves que los cachés positivos; los place_id inválidos se cargan
+además en un filtro de Bloom en memoria que descarta sin más consultas los
+place_id que nunca fallaron.
+"""
+import os
+import math
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+from cache_store import leer_json, actualizar_json
+
+
+NEGATIVE_CACHE_FILE = Path("cache") / "negative_cache.json"
+
+# Vigencia de las entradas negativas
+NEGATIVE_CACHE_TTL_MIN = float(os.getenv("NEGATIVE_CACHE_TTL_MIN", "30"))  # Sin resultados y errores
+NEGATIVE_CACHE_TTL_LUGAR_H = float(os.getenv("NEGATIVE_CACHE_TTL_LUGAR_H", "24"))  # place_id inválidos
+
+# Errores que no cambian al reintentar (429, 5xx y fallas de red sí se reintentan)
+CODIGOS_NO_REINTENTABLES = {400, 404, "INVALID_REQUEST", "NOT_FOUND", "INVALID_ARGUMENT"}
+
+# Dimensionamiento del filtro de Bloom
+BLOOM_CAPACIDAD = 10000
+BLOOM_FALSOS_POSITIVOS = 0.001
+
+
+def es_no_reintentable(error_code: Any) -> bool:
+    return error_code in CODIGOS_NO_REINTENTABLES
+
+
+def es_place_id_invalido(status_code: int, cuerpo: str) -> bool:
+    """
+    404 de Place Details, o 400 que se refiere al place_id (un 400 por una
+    máscara de campos inválida no dice nada del lugar).
+    """
+    return status_code == 404 or (status_code == 400 and "place id" in cuerpo.lower())
+
+
+class FiltroBloom:
+    """Conjunto probabilístico: sin falsos negativos, falsos positivos acotados."""
+
+    def __init__(self, capacidad: int = BLOOM_CAPACIDAD, falsos_positivos: float = BLOOM_FALSOS_POSITIVOS):
+        self.bits_total = max(8, int(-capacidad * math.log(falsos_positivos) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits_total / capacidad * math.log(2)))
+        self.bits = bytearray((self.bits_total + 7) // 8)
+
+    def _posiciones(self, valor: str):
+        # Doble hashing: h1 + i*h2 con las dos mitades de un blake2b de 128 bits
+        digest = hashlib.blake2b(valor.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.bits_total
+
+    def agregar(self, valor: str) -> None:
+        for posicion in self._posiciones(valor):
+            self.bits[posicion >> 3] |= 1 << (posicion & 7)
+
+    def __contains__(self, valor: str) -> bool:
+        return all(self.bits[posicion >> 3] & (1 << (posicion & 7)) for posicion in self._posiciones(valor))
+
+
+def _clave(tipo: str, clave: str) -> str:
+    return f"{tipo}|{clave}"
+
+
+def _vigente(entrada: Dict[str, Any], ahora: datetime) -> bool:
+    try:
+        return datetime.fromisoformat(entrada["expira"]) > ahora
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+class CacheNegativo:
+    """Acceso al archivo del caché negativo con el filtro de Bloom de place_id inválidos."""
+
+    def __init__(self, archivo: Path = NEGATIVE_CACHE_FILE):
+        self.archivo = archivo
+        self._bloom = FiltroBloom()
+        self._origen = None
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.descartes_bloom = 0
+
+    def _sincronizar_bloom(self) -> None:
+        """Reconstruye el filtro cuando el archivo cambió (entradas de otros workers o vencidas)."""
+        datos = leer_json(self.archivo)
+        if datos is self._origen:
+            return
+        ahora = datetime.now()
+        bloom = FiltroBloom()
+        for clave, entrada in datos.items():
+            if clave.startswith("lugar|") and _vigente(entrada, ahora):
+                bloom.agregar(clave)
+        self._bloom, self._origen = bloom, datos
+
+    def consultar(self, tipo: str, clave: str) -> Optional[Dict[str, Any]]:
+        """Entrada negativa vigente para (tipo, clave), o None."""
+        entrada = leer_json(self.archivo).get(_clave(tipo, clave))
+        if entrada and _vigente(entrada, datetime.now()):
+            with self._lock:
+                self.aciertos += 1
+            print(f"✓ Caché negativo ({entrada['motivo']}) para {tipo}: {clave}")
+            return entrada
+        return None
+
+    def registrar(self, tipo: str, clave: str, motivo: str, error: str = "",
+                  error_code: Any = None, ttl: Optional[timedelta] = None) -> None:
+        """
+        Guarda una entrada negativa ("sin_resultados" o "error") y de paso elimina
+        las vencidas, de modo que el archivo no crece sin límite.
+        """
+        ahora = datetime.now()
+        ttl = ttl or timedelta(minutes=NEGATIVE_CACHE_TTL_MIN)
+        entrada = {
+            "motivo": motivo,
+            "error": error,
+            "error_code": error_code,
+            "timestamp": ahora.isoformat(),
+            "expira": (ahora + ttl).isoformat(),
+        }
+
+        def _mutar(datos: Dict[str, Any]) -> None:
+            for vencida in [c for c, e in datos.items() if not _vigente(e, ahora)]:
+                del datos[vencida]
+            datos[_clave(tipo, clave)] = entrada
+
+        actualizar_json(self.archivo, _mutar)
+        print(f"✓ Caché negativo guardado ({motivo}) para {tipo}: {clave}")
+
+    def lugar_invalido(self, place_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Entrada vigente si el place_id ya falló como inválido. El filtro de Bloom
+        responde sin buscar en el caché para los place_id que nunca fallaron.
+        """
+        with self._lock:
+            self._sincronizar_bloom()
+            if _clave("lugar", place_id) not in self._bloom:
+                self.descartes_bloom += 1
+                return None
+        return self.consultar("lugar", place_id)
+
+    def registrar_lugar_invalido(self, place_id: str, error: str, error_code: Any) -> None:
+        self.registrar("lugar", place_id, "error", error, error_code, timedelta(hours=NEGATIVE_CACHE_TTL_LUGAR_H))
+        with self._lock:
+            self._bloom.agregar(_clave("lugar", place_id))
+
+    def estadisticas(self) -> Dict[str, Any]:
+        ahora = datetime.now()
+        vigentes = [c for c, e in leer_json(self.archivo).items() if _vigente(e, ahora)]
+        return {
+            "entradas_vigentes": len(vigentes),
+            "por_tipo": {tipo: sum(1 for c in vigentes if c.startswith(tipo + "|")) for tipo in ("geocode", "busqueda", "lugar")},
+            "aciertos": self.aciertos,
+            "descartes_bloom": self.descartes_bloom,
+        }
+
+
+# Caché negativo compartido del proceso
+cache_negativo = CacheNegativo()
@@ -0,0 +1,201 @@
+"""
+Modo offline: las herramientas responden solo con los datos locales (cachés
+procesados, almacén de la jerarquía de caché y respaldos raw_*.json) y nunca
+salen a la red. Se usa la mejor coincidencia disponible aunque esté vencida
+(otro radio, una query parecida, otros idiomas u otra máscara de campos), y
+cada respuesta lleva "modo_offline" con la coincidencia usada, su fecha y si
+está vencida. Se activa con MODO_OFFLINE=1 o en caliente con la herramienta
+modo_offline.
+"""
+import os
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from cache_store import leer_json
+from cache_hierarchy import jerarquia_cache, CACHE_DIR, CACHE_EXPIRY_HOURS
+from review_index import plegar, terminos
+
+
+SIMILITUD_MINIMA = 0.5  # Jaccard mínimo entre términos de queries (o ubicaciones) para aceptarlas como equivalentes
+
+config = {"activo": os.getenv("MODO_OFFLINE", "0") == "1"}
+_lock = threading.Lock()
+_indice_detalles = {"firma": None, "lugares": {}}
+
+
+class ModoOfflineError(Exception):
+    """Se intentó salir a la red con el modo offline activo y la respuesta no está en caché."""
+
+
+def activo() -> bool:
+    return config["activo"]
+
+
+def configurar(activo: bool) -> Dict[str, Any]:
+    """Activa o desactiva el modo offline en este proceso."""
+    config["activo"] = bool(activo)
+    return dict(config)
+
+
+def normalizar(texto: str) -> str:
+    return " ".join(plegar((texto or "").lower()).split())
+
+
+def similitud(a: str, b: str) -> float:
+    """1.0 si los textos coinciden al normalizarlos; si no, Jaccard entre sus términos."""
+    if normalizar(a) == normalizar(b):
+        return 1.0
+    ta, tb = set(terminos(a)), set(terminos(b))
+    return len(ta & tb) / len(ta | tb) if ta and tb else 0.0
+
+
+def marca(coincidencia: str, origen: str, timestamp: Optional[str], **extra: Any) -> Dict[str, Any]:
+    """Bloque "modo_offline" de una respuesta: coincidencia usada, origen, fecha y obsolescencia."""
+    try:
+        edad = datetime.now() - datetime.fromisoformat(timestamp)
+    except (TypeError, ValueError):
+        edad = None
+    return {
+        "coincidencia": coincidencia,
+        "origen": origen,
+        "timestamp": timestamp or None,
+        "edad_horas": round(edad.total_seconds() / 3600, 1) if edad is not None else None,
+        "vencido": edad is None or edad >= timedelta(hours=CACHE_EXPIRY_HOURS),
+        **extra,
+    }
+
+
+def mejor_mapeo(cache: Dict[str, Any], query: str, ubicacion: str,
+                radio_km: float) -> Optional[Tuple[Dict[str, Any], str]]:
+    """
+    Entrada de places_cache.json más parecida a la búsqueda pedida, vigente o no:
+    misma ubicación y query (normalizadas) con el radio más cercano, y si no la
+    ubicación o query más parecidas. Retorna (entrada, "exacta" | "aproximada").
+    """
+    candidatos = []
+    for entrada in cache.values():
+        if not isinstance(entrada, dict) or not entrada.get("data", {}).get("clasificacion"):
+            continue
+        sim_ubicacion = similitud(ubicacion, entrada.get("ubicacion", ""))
+        sim_query = similitud(query, entrada.get("query", ""))
+        if sim_ubicacion < SIMILITUD_MINIMA or sim_query < SIMILITUD_MINIMA:
+            continue
+        radio = entrada.get("radio_km") or 0
+        # A igual diferencia, un radio mayor cubre la región pedida
+        candidatos.append(((sim_ubicacion, sim_query, -abs(radio - radio_km), radio >= radio_km,
+                            entrada.get("timestamp", "")), entrada))
+    if not candidatos:
+        return None
+    (sim_ubicacion, sim_query, diferencia, _, _), entrada = max(candidatos, key=lambda c: c[0])
+    exacta = sim_ubicacion == 1.0 and sim_query == 1.0 and diferencia == 0
+    return entrada, "exacta" if exacta else "aproximada"
+
+
+def mejor_analisis(cache: Dict[str, Any], place_id: str,
+                   idiomas: List[str]) -> Optional[Tuple[Dict[str, Any], str]]:
+    """
+    Análisis de reseñas guardado del lugar, vigente o no: el del mismo conjunto
+    de idiomas y si no el que más idiomas comparte (el más reciente a igualdad).
+    Retorna (entrada, "exacta" | "otros_idiomas").
+    """
+    pedidos = set(idiomas)
+    candidatos = []
+    for clave, entrada in cache.items():
+        if not isinstance(entrada, dict) or (entrada.get("place_id") or clave.split("|")[0]) != place_id:
+            continue
+        # Las entradas antiguas sin idiomas son análisis en español
+        guardados = set(entrada.get("idiomas") or entrada.get("data", {}).get("idiomas") or ["es"])
+        candidatos.append(((guardados == pedidos, len(guardados & pedidos), entrada.get("timestamp", "")), entrada))
+    if not candidatos:
+        return None
+    (igual, _, _), entrada = max(candidatos, key=lambda c: c[0])
+    return entrada, "exacta" if igual else "otros_idiomas"
+
+
+def _leer(path: Path) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            contenido = json.load(f)
+        return contenido if isinstance(contenido, dict) else {}
+    except (json.JSONDecodeError, IOError):
+        return {}
+
+
+def _rutas_detalles(place_id: str) -> List[Path]:
+    """
+    Archivos de detalles del almacén de la jerarquía de un lugar. El índice
+    place_id → archivos se reconstruye solo cuando cambia el directorio.
+    """
+    directorio = jerarquia_cache.directorio / "places.details"
+    try:
+        firma = directorio.stat().st_mtime_ns
+    except OSError:
+        return []
+    with _lock:
+        if _indice_detalles["firma"] != firma:
+            lugares = defaultdict(list)
+            for path in sorted(directorio.glob("*.json")):
+                pid = _leer(path).get("parametros", {}).get("place_id")
+                if pid:
+                    lugares[pid].append(path)
+            _indice_detalles.update(firma=firma, lugares=dict(lugares))
+        return list(_indice_detalles["lugares"].get(place_id, []))
+
+
+def detalles_guardados(place_id: str) -> List[Dict[str, Any]]:
+    """
+    Todas las respuestas de detalles de un lugar en caché, con cualquier máscara
+    de campos o idioma: almacén de la jerarquía y respaldo raw_place_details_<id>.json.
+
+    Returns:
+        [{"data", "timestamp", "campos", "idioma", "origen"}, ...]
+    """
+    guardados = []
+    for path in _rutas_detalles(place_id):
+        entrada = leer_json(path)
+        if isinstance(entrada.get("data"), dict):
+            parametros = entrada.get("parametros", {})
+            guardados.append({"data": entrada["data"], "timestamp": entrada.get("timestamp", ""),
+                              "campos": parametros.get("campos") or [], "idioma": parametros.get("idioma"),
+                              "origen": "almacen"})
+    respaldo = _leer(CACHE_DIR / f"raw_place_details_{place_id}.json")
+    if isinstance(respaldo.get("data"), dict) and respaldo["data"]:
+        guardados.append({"data": respaldo["data"], "timestamp": respaldo.get("timestamp", ""),
+                          "campos": respaldo.get("fields_requested") or ["*"], "idioma": None,
+                          "origen": "raw_place_details"})
+    return guardados
+
+
+def mejor_detalle(guardados: List[Dict[str, Any]], campos: List[str]) -> Optional[Dict[str, Any]]:
+    """La respuesta guardada que cubre más campos pedidos (la más reciente a igualdad)."""
+    pedidos = set(campos)
+
+    def cobertura(guardado: Dict[str, Any]) -> int:
+        if "*" in guardado["campos"]:
+            return len(pedidos) + 1
+        return len(pedidos & set(guardado["campos"]))
+
+    if not guardados:
+        return None
+    return max(guardados, key=lambda g: (cobertura(g), g["timestamp"] or ""))
+
+
+def resenas_guardadas(place_id: str) -> List[Dict[str, Any]]:
+    """
+    Detalles con reseñas de un lugar en caché: almacén de la jerarquía (por
+    idioma), respaldo raw_place_details_<id>.json y reviews_raw_cache.json.
+
+    Returns:
+        [{"data", "timestamp", "idioma", "origen"}, ...] con data en formato v1 o legacy
+    """
+    guardados = [g for g in detalles_guardados(place_id) if g["data"].get("reviews")]
+    heredado = leer_json(CACHE_DIR / "reviews_raw_cache.json").get(place_id)
+    if heredado and heredado.get("data", {}).get("result", {}).get("reviews"):
+        guardados.append({"data": heredado["data"], "timestamp": heredado.get("timestamp", ""),
+                          "idioma": heredado["data"]["result"].get("reviews", [{}])[0].get("language"),
+                          "origen": "reviews_raw_cache"})
+    return guardados
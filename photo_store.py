@@ -0,0 +1,162 @@
+"""
+Almacén local de fotos de lugares direccionado por contenido.
+Cada imagen se guarda una sola vez bajo el SHA-256 de sus bytes y un índice
+JSON asocia (foto, variante de tamaño) con ese objeto, de modo que las
+consultas repetidas se sirven desde disco sin llamar a la API.
+"""
+import os
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Callable, BinaryIO
+
+from cache_store import leer_json, actualizar_json
+
+
+PHOTOS_DIR = Path("cache") / "photos"
+OBJETOS_DIR = PHOTOS_DIR / "objetos"
+INDICE_FOTOS_FILE = PHOTOS_DIR / "index.json"
+
+# La lista de fotos de un lugar se vuelve a pedir pasado este plazo
+FOTOS_LUGAR_EXPIRY_HOURS = 24 * 30
+
+# Variantes de tamaño que se conservan en disco (parámetros del endpoint de media)
+VARIANTES_FOTO = {
+    "miniatura": {"max_width_px": 200},
+    "mediana": {"max_width_px": 800},
+    "grande": {"max_width_px": 1600},
+}
+
+EXTENSIONES = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "image/gif": ".gif"}
+
+
+class PresupuestoBytes:
+    """Contador de bytes compartido por descargas concurrentes."""
+
+    def __init__(self, maximo_bytes: int):
+        self.maximo_bytes = maximo_bytes
+        self.usados = 0
+        self._lock = threading.Lock()
+
+    def reservar(self, cantidad: int) -> bool:
+        """Reserva 'cantidad' bytes; retorna False si excede el presupuesto."""
+        with self._lock:
+            if self.usados + cantidad > self.maximo_bytes:
+                return False
+            self.usados += cantidad
+            return True
+
+
+class _EscritorConHash:
+    """Archivo de escritura que calcula el SHA-256 de lo escrito."""
+
+    def __init__(self, archivo: BinaryIO):
+        self.archivo = archivo
+        self.sha256 = hashlib.sha256()
+
+    def write(self, bloque: bytes) -> int:
+        self.sha256.update(bloque)
+        return self.archivo.write(bloque)
+
+
+def _clave_variante(photo_name: str, variante: str) -> str:
+    return f"{photo_name}|{variante}"
+
+
+def ruta_objeto(sha256: str, content_type: str) -> Path:
+    """cache/photos/objetos/ab/abcdef....jpg"""
+    return OBJETOS_DIR / sha256[:2] / f"{sha256}{EXTENSIONES.get(content_type, '.bin')}"
+
+
+def _handle(entrada: Dict[str, Any], desde_disco: bool) -> Dict[str, Any]:
+    ruta = Path(entrada["ruta"])
+    return {
+        "sha256": entrada["sha256"],
+        "ruta": str(ruta),
+        "uri": ruta.resolve().as_uri(),
+        "bytes": entrada["bytes"],
+        "content_type": entrada["content_type"],
+        "desde_disco": desde_disco,
+    }
+
+
+def buscar_variante(photo_name: str, variante: str) -> Optional[Dict[str, Any]]:
+    """Handle de una variante ya descargada, o None si no está en disco."""
+    entrada = leer_json(INDICE_FOTOS_FILE).get("variantes", {}).get(_clave_variante(photo_name, variante))
+    if not entrada or not Path(entrada["ruta"]).exists():
+        return None
+    return _handle(entrada, desde_disco=True)
+
+
+def descargar_variante(photo_name: str, variante: str,
+                       descargar: Callable[[BinaryIO], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Descarga una variante a un archivo temporal y la mueve a su ruta por contenido.
+    Si otra foto o variante ya produjo los mismos bytes, se reutiliza ese objeto.
+
+    Args:
+        photo_name: Nombre de la foto en la API v1
+        variante: Nombre de la variante de tamaño (ver VARIANTES_FOTO)
+        descargar: Función que escribe la imagen en el archivo recibido y retorna
+                   el resultado de GooglePlacesClient.download_photo_media
+
+    Returns:
+        Handle local de la imagen, o el diccionario de error de la descarga
+    """
+    OBJETOS_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=OBJETOS_DIR, prefix=".descarga.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as archivo:
+            escritor = _EscritorConHash(archivo)
+            resultado = descargar(escritor)
+        if resultado["status"] != "success":
+            return resultado
+
+        sha256 = escritor.sha256.hexdigest()
+        destino = ruta_objeto(sha256, resultado["content_type"])
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        if destino.exists():
+            os.remove(tmp_name)
+        else:
+            os.replace(tmp_name, destino)
+    finally:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+
+    entrada = {
+        "sha256": sha256,
+        "ruta": str(destino),
+        "bytes": resultado["bytes"],
+        "content_type": resultado["content_type"],
+        "timestamp": datetime.now().isoformat(),
+    }
+
+    def _registrar(indice: Dict[str, Any]) -> None:
+        indice.setdefault("variantes", {})[_clave_variante(photo_name, variante)] = entrada
+
+    actualizar_json(INDICE_FOTOS_FILE, _registrar)
+    return _handle(entrada, desde_disco=False)
+
+
+def fotos_de_lugar_en_indice(place_id: str) -> Optional[List[Dict[str, Any]]]:
+    """Lista de fotos de un lugar registrada en el índice, o None si no existe o venció."""
+    entrada = leer_json(INDICE_FOTOS_FILE).get("lugares", {}).get(place_id)
+    if not entrada:
+        return None
+    try:
+        vigente = datetime.now() - datetime.fromisoformat(entrada["timestamp"]) < timedelta(hours=FOTOS_LUGAR_EXPIRY_HOURS)
+    except (KeyError, ValueError):
+        return None
+    return entrada["fotos"] if vigente else None
+
+
+def guardar_fotos_de_lugar(place_id: str, fotos: List[Dict[str, Any]]) -> None:
+    """Registra en el índice la lista de fotos (nombre, dimensiones y autores) de un lugar."""
+    entrada = {"fotos": fotos, "timestamp": datetime.now().isoformat()}
+
+    def _registrar(indice: Dict[str, Any]) -> None:
+        indice.setdefault("lugares", {})[place_id] = entrada
+
+    actualizar_json(INDICE_FOTOS_FILE, _registrar)
@@ -0,0 +1,189 @@
+"""
+Representación compacta de lugares para búsquedas y barridos regionales.
+Place usa __slots__ en lugar de un dict por lugar, comparte una única tupla
+de tipos internados entre los lugares con los mismos tipos y resume los tipos
+en una máscara de bits, de modo que clasificar es una operación entre enteros.
+La conversión a dict ocurre solo al armar la respuesta MCP (Place.a_dict).
+"""
+import enum
+import sys
+import threading
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+
+class Categoria(enum.IntFlag):
+    COMPETENCIA_DIRECTA = 1
+    COMPETENCIA_INDIRECTA = 2
+    COLABORADORES_POTENCIALES = 4
+
+
+NOMBRES_CATEGORIA = {
+    Categoria.COMPETENCIA_DIRECTA: "competencia_directa",
+    Categoria.COMPETENCIA_INDIRECTA: "competencia_indirecta",
+    Categoria.COLABORADORES_POTENCIALES: "colaboradores_potenciales",
+}
+CATEGORIA_POR_NOMBRE = {nombre: categoria for categoria, nombre in NOMBRES_CATEGORIA.items()}
+
+
+# Un bit por tipo de lugar de Google, asignado la primera vez que aparece
+_bits_tipo: Dict[str, int] = {}
+# Tuplas de tipos compartidas: los lugares con los mismos tipos apuntan a la misma tupla
+_tuplas_tipos: Dict[Tuple[str, ...], Tuple[Tuple[str, ...], int]] = {}
+_tipos_lock = threading.Lock()
+
+
+def bit_tipo(tipo: str) -> int:
+    bit = _bits_tipo.get(tipo)
+    if bit is None:
+        with _tipos_lock:
+            bit = _bits_tipo.setdefault(sys.intern(tipo), 1 << len(_bits_tipo))
+    return bit
+
+
+def mascara_tipos(tipos: Iterable[str]) -> int:
+    mascara = 0
+    for tipo in tipos:
+        mascara |= bit_tipo(tipo)
+    return mascara
+
+
+def _tipos_internados(tipos: Iterable[str]) -> Tuple[Tuple[str, ...], int]:
+    """(tupla compartida de tipos internados, máscara de bits)"""
+    clave = tuple(tipos)
+    compartida = _tuplas_tipos.get(clave)
+    if compartida is None:
+        tupla = tuple(sys.intern(t) for t in clave)
+        compartida = _tuplas_tipos.setdefault(tupla, (tupla, mascara_tipos(tupla)))
+    return compartida
+
+
+# Grupos de tipos que usa la clasificación
+MASCARA_ATRACCION = mascara_tipos(["tourist_attraction", "travel_agency", "point_of_interest"])
+MASCARA_COLABORADOR = mascara_tipos(["lodging", "hotel", "restaurant", "food", "bar", "store", "winery"])
+PALABRAS_COMPETENCIA_DIRECTA = ("observatorio", "astronomic", "astro", "tour", "observatory")
+
+
+class Place:
+    """Lugar de Google Places con los campos que usan el mapeo y la clasificación."""
+
+    __slots__ = ("place_id", "name", "address", "website", "rating", "types", "mascara",
+                 "user_ratings_total", "lat", "lng", "categoria")
+
+    def __init__(self, place_id: str, name: str, address: str, website: str = "No disponible",
+                 rating: Any = "N/A", types: Iterable[str] = (), user_ratings_total: Optional[int] = None,
+                 lat: Optional[float] = None, lng: Optional[float] = None,
+                 categoria: Optional[Categoria] = None):
+        self.place_id = place_id
+        self.name = name
+        self.address = address
+        self.website = website
+        self.rating = rating
+        self.types, self.mascara = _tipos_internados(types)
+        self.user_ratings_total = user_ratings_total
+        self.lat = lat
+        self.lng = lng
+        self.categoria = categoria
+
+    @classmethod
+    def desde_v1(cls, place: Dict[str, Any], con_total_resenas: bool = False) -> "Place":
+        """Lugar desde una respuesta de la API v1 (Text Search / Nearby Search)."""
+        location = place.get("location", {})
+        return cls(
+            place_id=place.get("id"),
+            name=place.get("displayName", {}).get("text", "Nombre no disponible"),
+            address=place.get("formattedAddress", "Dirección no disponible"),
+            rating=place.get("rating", "N/A"),
+            types=place.get("types", []),
+            user_ratings_total=place.get("userRatingCount", 0) if con_total_resenas else None,
+            lat=location.get("latitude"),
+            lng=location.get("longitude"),
+        )
+
+    @classmethod
+    def desde_dict(cls, place: Dict[str, Any]) -> "Place":
+        """Lugar desde el formato de respuesta del mapeo (caché procesado o placeholder)."""
+        return cls(
+            place_id=place.get("place_id"),
+            name=place.get("name", ""),
+            address=place.get("address", ""),
+            website=place.get("website", "No disponible"),
+            rating=place.get("rating", "N/A"),
+            types=place.get("types", []),
+            user_ratings_total=place.get("user_ratings_total"),
+            categoria=CATEGORIA_POR_NOMBRE.get(place.get("category")),
+        )
+
+    def tiene_tipo(self, mascara: int) -> bool:
+        return bool(self.mascara & mascara)
+
+    def a_dict(self, incluir_coordenadas: bool = False) -> Dict[str, Any]:
+        """Formato de la respuesta MCP del mapeo."""
+        resultado = {
+            "place_id": self.place_id,
+            "name": self.name,
+            "address": self.address,
+            "website": self.website,
+            "rating": self.rating,
+            "types": list(self.types),
+        }
+        if self.user_ratings_total is not None:
+            resultado["user_ratings_total"] = self.user_ratings_total
+        if incluir_coordenadas:
+            resultado["lat"] = self.lat
+            resultado["lng"] = self.lng
+        if self.categoria is not None:
+            resultado["category"] = NOMBRES_CATEGORIA[self.categoria]
+        return resultado
+
+
+def _palabras_directas(query: str) -> Tuple[str, ...]:
+    return PALABRAS_COMPETENCIA_DIRECTA + tuple(query.lower().split())
+
+
+def _categoria(mascara: int, name: str, palabras: Tuple[str, ...]) -> Categoria:
+    if mascara & MASCARA_ATRACCION:
+        name_lower = name.lower()
+        if any(palabra in name_lower for palabra in palabras):
+            return Categoria.COMPETENCIA_DIRECTA
+        return Categoria.COMPETENCIA_INDIRECTA
+    if mascara & MASCARA_COLABORADOR:
+        return Categoria.COLABORADORES_POTENCIALES
+    return Categoria.COMPETENCIA_INDIRECTA
+
+
+def clasificar(places: Iterable[Place], query: str) -> Dict[str, List[Place]]:
+    """
+    Clasifica lugares en competencia directa, indirecta y colaboradores
+    potenciales según sus tipos y nombre; fija la categoría de cada lugar.
+    """
+    clasificados: Dict[str, List[Place]] = {nombre: [] for nombre in NOMBRES_CATEGORIA.values()}
+    palabras = _palabras_directas(query)
+    for place in places:
+        place.categoria = _categoria(place.mascara, place.name, palabras)
+        clasificados[NOMBRES_CATEGORIA[place.categoria]].append(place)
+    return clasificados
+
+
+def clasificar_dicts(places: Iterable[Dict[str, Any]], query: str) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Misma clasificación para lugares que ya son dicts (placeholder, registros del
+    caché o respuestas v1); fija place["category"] en cada uno.
+    """
+    clasificados: Dict[str, List[Dict[str, Any]]] = {nombre: [] for nombre in NOMBRES_CATEGORIA.values()}
+    palabras = _palabras_directas(query)
+    for place in places:
+        name = place.get("name") or place.get("displayName", {}).get("text", "")
+        _, mascara = _tipos_internados(place.get("types") or ())
+        place["category"] = NOMBRES_CATEGORIA[_categoria(mascara, name, palabras)]
+        clasificados[place["category"]].append(place)
+    return clasificados
+
+
+def filtrar(places: Iterable[Place], categorias: Categoria) -> List[Place]:
+    """Lugares cuya categoría está en la máscara (p. ej. DIRECTA | INDIRECTA)."""
+    return [place for place in places if place.categoria is not None and place.categoria & categorias]
+
+
+def clasificacion_a_dicts(clasificados: Dict[str, List[Place]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Conversión a dicts en el borde de la respuesta MCP."""
+    return {categoria: [place.a_dict() for place in lugares] for categoria, lugares in clasificados.items()}
@@ -0,0 +1,340 @@
+"""
+Perfilado de herramientas MCP bajo demanda.
+Envuelve las llamadas a herramientas seleccionadas (o una fracción muestreada
+de ellas) en un perfilador y guarda el resultado en cache/profiles como pilas
+colapsadas (flamegraph.pl, speedscope) y como JSON de speedscope.
+
+Modos:
+- "muestreo": un hilo toma la pila de los hilos de la llamada cada N ms
+  (bajo costo, apto para producción)
+- "determinista": sys.setprofile registra cada llamada y retorno (tiempos
+  exactos por pila, con mayor sobrecosto)
+"""
+import os
+import sys
+import json
+import time
+import random
+import threading
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+from fastmcp.server.middleware import Middleware
+
+
+PROFILES_DIR = Path("cache") / "profiles"
+PROFILING_MAX_ARCHIVOS = 200  # Perfiles conservados (se borran los más antiguos)
+
+HERRAMIENTAS_PERFILABLES = [
+    "mapeo_competencia_y_colaboradores",
+    "analizador_de_opiniones",
+    "obtener_detalles_lugar_v1",
+]
+MODOS_PROFILING = ["muestreo", "determinista"]
+
+
+def _config_desde_entorno() -> Dict[str, Any]:
+    herramientas = os.getenv("PROFILING_TOOLS", "")
+    try:
+        fraccion = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+    except ValueError:
+        fraccion = 0.0
+    try:
+        intervalo_ms = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+    except ValueError:
+        intervalo_ms = 5.0
+    modo = os.getenv("PROFILING_MODE", "muestreo")
+    return {
+        # Herramientas perfiladas siempre ("*" = todas)
+        "herramientas": sorted({h.strip() for h in herramientas.split(",") if h.strip()}),
+        # Fracción de las llamadas a HERRAMIENTAS_PERFILABLES que se perfila al azar
+        "fraccion": min(max(fraccion, 0.0), 1.0),
+        "modo": modo if modo in MODOS_PROFILING else "muestreo",
+        "intervalo_ms": max(intervalo_ms, 0.5),
+    }
+
+
+# Configuración vigente del proceso; la herramienta administrativa la modifica en caliente
+config = _config_desde_entorno()
+_config_lock = threading.Lock()
+
+
+def configurar(herramientas: Optional[List[str]] = None, fraccion: Optional[float] = None,
+               modo: Optional[str] = None, intervalo_ms: Optional[float] = None) -> Dict[str, Any]:
+    """Actualiza la configuración de perfilado; los argumentos en None no cambian."""
+    with _config_lock:
+        if herramientas is not None:
+            config["herramientas"] = sorted(set(herramientas))
+        if fraccion is not None:
+            config["fraccion"] = min(max(fraccion, 0.0), 1.0)
+        if modo is not None:
+            if modo not in MODOS_PROFILING:
+                raise ValueError(f"modo debe ser uno de {MODOS_PROFILING}")
+            config["modo"] = modo
+        if intervalo_ms is not None:
+            config["intervalo_ms"] = max(intervalo_ms, 0.5)
+        return dict(config)
+
+
+def debe_perfilar(herramienta: str) -> bool:
+    herramientas = config["herramientas"]
+    if "*" in herramientas or herramienta in herramientas:
+        return True
+    return herramienta in HERRAMIENTAS_PERFILABLES and random.random() < config["fraccion"]
+
+
+def _etiqueta(code) -> str:
+    nombre = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return nombre.replace(";", ":")
+
+
+def _etiqueta_c(funcion) -> str:
+    modulo = getattr(funcion, "__module__", None) or ""
+    nombre = getattr(funcion, "__qualname__", None) or repr(funcion)
+    return f"{modulo}.{nombre} [c]".replace(";", ":")
+
+
+class PerfiladorMuestreo:
+    """
+    Toma periódicamente la pila del hilo que inició la llamada y de los hilos
+    creados durante ella (p. ej. los de un ThreadPoolExecutor de la herramienta).
+    """
+
+    def __init__(self, intervalo_ms: float):
+        self.intervalo = intervalo_ms / 1000
+        self.muestras: Dict[int, Counter] = {}
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    def iniciar(self) -> None:
+        self._hilo_objetivo = threading.get_ident()
+        self._hilos_previos = {t.ident for t in threading.enumerate()} - {self._hilo_objetivo}
+        self.inicio = time.perf_counter()
+        self._hilo = threading.Thread(target=self._muestrear, name="perfilador-muestreo", daemon=True)
+        self._hilo.start()
+
+    def _muestrear(self) -> None:
+        propio = threading.get_ident()
+        while not self._detener.wait(self.intervalo):
+            for ident, frame in sys._current_frames().items():
+                if ident == propio or ident in self._hilos_previos:
+                    continue
+                pila = []
+                while frame is not None:
+                    pila.append(_etiqueta(frame.f_code))
+                    frame = frame.f_back
+                self.muestras.setdefault(ident, Counter())[tuple(reversed(pila))] += 1
+
+    def detener(self) -> Dict[str, Any]:
+        self._detener.set()
+        self._hilo.join()
+        duracion_ms = (time.perf_counter() - self.inicio) * 1000
+        intervalo_ms = self.intervalo * 1000
+        return {
+            "unidad": "milliseconds",
+            "duracion_ms": duracion_ms,
+            # Pilas colapsadas por hilo con su peso en ms
+            "pilas": {
+                ident: {pila: cantidad * intervalo_ms for pila, cantidad in contador.items()}
+                for ident, contador in self.muestras.items()
+            },
+            "eventos": None,
+        }
+
+
+class PerfiladorDeterminista:
+    """
+    Registra cada llamada y retorno con sys.setprofile en el hilo de la llamada
+    y en los hilos que se inicien mientras está activo.
+    """
+
+    def __init__(self):
+        self.activo = False
+        self._hilos: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _estado_hilo(self) -> Dict[str, Any]:
+        ident = threading.get_ident()
+        estado = self._hilos.get(ident)
+        if estado is None:
+            estado = {"pila": [], "ultimo": time.perf_counter_ns(), "pilas": Counter(), "eventos": []}
+            with self._lock:
+                self._hilos[ident] = estado
+        return estado
+
+    def _callback(self, frame, evento: str, arg) -> None:
+        if not self.activo:
+            sys.setprofile(None)
+            return
+        ahora = time.perf_counter_ns()
+        estado = self._estado_hilo()
+        pila = estado["pila"]
+        if pila:
+            estado["pilas"][tuple(pila)] += ahora - estado["ultimo"]
+        estado["ultimo"] = ahora
+
+        if evento == "call":
+            etiqueta = _etiqueta(frame.f_code)
+        elif evento == "c_call":
+            etiqueta = _etiqueta_c(arg)
+        elif pila:
+            # return / c_return / c_exception: cerrar el marco abierto más reciente
+            estado["eventos"].append(("C", ahora, pila.pop()))
+            return
+        else:
+            # Retorno de un marco abierto antes de activar el perfilador
+            return
+        pila.append(etiqueta)
+        estado["eventos"].append(("O", ahora, etiqueta))
+
+    def iniciar(self) -> None:
+        self.activo = True
+        self.inicio = time.perf_counter_ns()
+        threading.setprofile(self._callback)
+        sys.setprofile(self._callback)
+
+    def detener(self) -> Dict[str, Any]:
+        sys.setprofile(None)
+        threading.setprofile(None)
+        self.activo = False
+        fin = time.perf_counter_ns()
+        for estado in self._hilos.values():
+            # Cerrar los marcos que seguían abiertos al detener
+            while estado["pila"]:
+                estado["eventos"].append(("C", fin, estado["pila"].pop()))
+        return {
+            "unidad": "milliseconds",
+            "duracion_ms": (fin - self.inicio) / 1e6,
+            "pilas": {
+                ident: {pila: ns / 1e6 for pila, ns in estado["pilas"].items()}
+                for ident, estado in self._hilos.items()
+            },
+            "eventos": {ident: estado["eventos"] for ident, estado in self._hilos.items()},
+            "inicio_ns": self.inicio,
+        }
+
+
+def _speedscope(herramienta: str, resultado: Dict[str, Any]) -> Dict[str, Any]:
+    """Documento speedscope (https://www.speedscope.app/file-format-schema.json)."""
+    frames: List[Dict[str, str]] = []
+    indices: Dict[str, int] = {}
+
+    def _indice(etiqueta: str) -> int:
+        if etiqueta not in indices:
+            indices[etiqueta] = len(frames)
+            frames.append({"name": etiqueta})
+        return indices[etiqueta]
+
+    perfiles = []
+    if resultado["eventos"] is not None:
+        for ident, eventos in resultado["eventos"].items():
+            if not eventos:
+                continue
+            inicio = resultado["inicio_ns"]
+            perfiles.append({
+                "type": "evented",
+                "name": f"{herramienta} (hilo {ident})",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": (eventos[-1][1] - inicio) / 1e6,
+                "events": [
+                    {"type": tipo, "at": (ns - inicio) / 1e6, "frame": _indice(etiqueta)}
+                    for tipo, ns, etiqueta in eventos
+                ],
+            })
+    else:
+        for ident, pilas in resultado["pilas"].items():
+            muestras = [[_indice(etiqueta) for etiqueta in pila] for pila in pilas]
+            pesos = list(pilas.values())
+            perfiles.append({
+                "type": "sampled",
+                "name": f"{herramienta} (hilo {ident})",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(pesos),
+                "samples": muestras,
+                "weights": pesos,
+            })
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": herramienta,
+        "exporter": "kay-mcp-server",
+        "shared": {"frames": frames},
+        "profiles": perfiles,
+    }
+
+
+def _podar_perfiles() -> None:
+    archivos = sorted(PROFILES_DIR.glob("*.collapsed"))
+    for collapsed in archivos[:-PROFILING_MAX_ARCHIVOS]:
+        for path in (collapsed, collapsed.with_suffix(".speedscope.json")):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def guardar_perfil(herramienta: str, modo: str, resultado: Dict[str, Any]) -> Path:
+    """Escribe <fecha>_<herramienta>_<modo>.collapsed y .speedscope.json; retorna la ruta base."""
+    PROFILES_DIR.mkdir(parents=True, exist_ok=True)
+    base = PROFILES_DIR / f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{herramienta}_{modo}"
+
+    # Pilas colapsadas: "marco;marco;marco peso" (peso entero en microsegundos)
+    totales: Counter = Counter()
+    for pilas in resultado["pilas"].values():
+        for pila, ms in pilas.items():
+            totales[";".join(pila)] += ms
+    with open(base.with_suffix(".collapsed"), "w", encoding="utf-8") as f:
+        for pila, ms in sorted(totales.items()):
+            microsegundos = int(round(ms * 1000))
+            if microsegundos > 0:
+                f.write(f"{pila} {microsegundos}\n")
+
+    with open(base.with_suffix(".speedscope.json"), "w", encoding="utf-8") as f:
+        json.dump(_speedscope(herramienta, resultado), f, ensure_ascii=False)
+
+    _podar_perfiles()
+    return base
+
+
+def listar_perfiles(limite: int = 20) -> List[Dict[str, Any]]:
+    """Perfiles guardados más recientes."""
+    if not PROFILES_DIR.exists():
+        return []
+    perfiles = []
+    for collapsed in sorted(PROFILES_DIR.glob("*.collapsed"), reverse=True)[:limite]:
+        fecha, _, resto = collapsed.stem.partition("_")
+        herramienta, _, modo = resto.rpartition("_")
+        perfiles.append({
+            "herramienta": herramienta,
+            "modo": modo,
+            "fecha": datetime.strptime(fecha, "%Y%m%dT%H%M%S%f").isoformat(),
+            "collapsed": str(collapsed),
+            "speedscope": str(collapsed.with_suffix(".speedscope.json")),
+        })
+    return perfiles
+
+
+class ProfilingMiddleware(Middleware):
+    """Middleware de FastMCP que perfila las llamadas a herramientas seleccionadas."""
+
+    async def on_call_tool(self, context, call_next):
+        herramienta = context.message.name
+        if not debe_perfilar(herramienta):
+            return await call_next(context)
+
+        modo = config["modo"]
+        perfilador = PerfiladorDeterminista() if modo == "determinista" else PerfiladorMuestreo(config["intervalo_ms"])
+        perfilador.iniciar()
+        try:
+            return await call_next(context)
+        finally:
+            resultado = perfilador.detener()
+            try:
+                base = guardar_perfil(herramienta, modo, resultado)
+                print(f"✓ Perfil de {herramienta} ({modo}, {resultado['duracion_ms']:.1f} ms) guardado en: {base}.*")
+            except (IOError, ValueError) as e:
+                print(f"WARNING: No se pudo guardar el perfil de {herramienta}: {e}")
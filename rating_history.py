@@ -0,0 +1,314 @@
+"""
+Historial compacto de rating y cantidad de reseñas por lugar.
+Cada observación es un registro binario de tamaño fijo que se agrega al final
+de cache/rating_history.bin; las consultas cargan el archivo como arreglo de
+NumPy y agregan por lugar de forma vectorizada, sin recorrer JSON.
+"""
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Optional
+
+import numpy as np
+
+from cache_store import bloqueo_archivo, leer_json, actualizar_json
+
+
+HISTORY_FILE = Path("cache") / "rating_history.bin"
+HISTORY_IDS_FILE = Path("cache") / "rating_history_ids.json"
+
+# Registro empaquetado de 21 bytes; los valores ausentes se guardan como
+# NaN (rating) o -1 (reseñas, nivel de precio)
+DTYPE_OBSERVACION = np.dtype([
+    ("lugar", "<u4"),     # índice en rating_history_ids.json
+    ("ts", "<i8"),        # segundos desde epoch
+    ("rating", "<f4"),
+    ("resenas", "<i4"),
+    ("precio", "<i1"),
+])
+
+# priceLevel de la API v1 -> price_level numérico de la API legacy
+NIVELES_PRECIO = {
+    "PRICE_LEVEL_FREE": 0,
+    "PRICE_LEVEL_INEXPENSIVE": 1,
+    "PRICE_LEVEL_MODERATE": 2,
+    "PRICE_LEVEL_EXPENSIVE": 3,
+    "PRICE_LEVEL_VERY_EXPENSIVE": 4,
+}
+
+
+def _nivel_precio(valor: Any) -> int:
+    if isinstance(valor, int) and 0 <= valor <= 4:
+        return valor
+    return NIVELES_PRECIO.get(valor, -1)
+
+
+def _epoch(timestamp: Optional[str]) -> Optional[int]:
+    if not timestamp:
+        return int(datetime.now().timestamp())
+    try:
+        return int(datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp())
+    except ValueError:
+        return None
+
+
+def observacion_desde_v1(place: Dict[str, Any], timestamp: Optional[str] = None) -> Dict[str, Any]:
+    """Observación a partir de un Place de la API v1 (detalles o búsquedas)."""
+    return {
+        "place_id": place.get("id"),
+        "nombre": place.get("displayName", {}).get("text", ""),
+        "rating": place.get("rating"),
+        "resenas": place.get("userRatingCount"),
+        "precio": place.get("priceLevel"),
+        "timestamp": timestamp,
+    }
+
+
+def _indices_de_lugares(observaciones: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Asigna (o recupera) el índice numérico de cada place_id."""
+    indices: Dict[str, int] = {}
+
+    def _asignar(ids: Dict[str, Any]) -> None:
+        place_ids = ids.setdefault("place_ids", [])
+        nombres = ids.setdefault("nombres", [])
+        posiciones = {place_id: i for i, place_id in enumerate(place_ids)}
+        for obs in observaciones:
+            place_id = obs["place_id"]
+            if place_id not in posiciones:
+                posiciones[place_id] = len(place_ids)
+                place_ids.append(place_id)
+                nombres.append("")
+            if obs.get("nombre"):
+                nombres[posiciones[place_id]] = obs["nombre"]
+            indices[place_id] = posiciones[place_id]
+
+    actualizar_json(HISTORY_IDS_FILE, _asignar)
+    return indices
+
+
+def registrar_observaciones(observaciones: Iterable[Dict[str, Any]]) -> int:
+    """
+    Agrega observaciones al historial. Cada una es un diccionario con place_id,
+    rating, resenas, precio, nombre y timestamp ISO (opcionales salvo place_id).
+    Las que no traen rating ni cantidad de reseñas se descartan.
+
+    Returns:
+        Cantidad de registros agregados
+    """
+    observaciones = [
+        obs for obs in observaciones
+        if obs.get("place_id") and (isinstance(obs.get("rating"), (int, float)) or isinstance(obs.get("resenas"), int))
+    ]
+    if not observaciones:
+        return 0
+
+    indices = _indices_de_lugares(observaciones)
+    registros = np.zeros(len(observaciones), dtype=DTYPE_OBSERVACION)
+    validos = np.ones(len(observaciones), dtype=bool)
+    for i, obs in enumerate(observaciones):
+        ts = _epoch(obs.get("timestamp"))
+        if ts is None:
+            validos[i] = False
+            continue
+        rating = obs.get("rating")
+        resenas = obs.get("resenas")
+        registros[i] = (
+            indices[obs["place_id"]],
+            ts,
+            rating if isinstance(rating, (int, float)) else np.nan,
+            resenas if isinstance(resenas, int) else -1,
+            _nivel_precio(obs.get("precio")),
+        )
+    registros = registros[validos]
+
+    HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with bloqueo_archivo(HISTORY_FILE):
+        with open(HISTORY_FILE, "ab") as f:
+            # Descartar un registro incompleto que haya dejado una escritura interrumpida
+            sobrante = f.tell() % DTYPE_OBSERVACION.itemsize
+            if sobrante:
+                f.truncate(f.tell() - sobrante)
+                f.seek(0, os.SEEK_END)
+            f.write(registros.tobytes())
+    return len(registros)
+
+
+def registrar_lugares_v1(places: Iterable[Dict[str, Any]]) -> None:
+    """Gancho para las respuestas de la API v1: registra cada lugar sin interrumpir al llamador."""
+    try:
+        registrar_observaciones(observacion_desde_v1(place) for place in places)
+    except (IOError, ValueError) as e:
+        print(f"WARNING: No se pudo registrar el historial de ratings: {e}")
+
+
+def cargar_historial() -> np.ndarray:
+    """Historial completo como arreglo estructurado (solo lectura, mapeado a memoria)."""
+    try:
+        tamano = os.path.getsize(HISTORY_FILE)
+    except OSError:
+        return np.zeros(0, dtype=DTYPE_OBSERVACION)
+    cantidad = tamano // DTYPE_OBSERVACION.itemsize
+    if cantidad == 0:
+        return np.zeros(0, dtype=DTYPE_OBSERVACION)
+    return np.memmap(HISTORY_FILE, dtype=DTYPE_OBSERVACION, mode="r", shape=(cantidad,))
+
+
+def importar_desde_cache(registros: Iterable[Dict[str, Any]]) -> int:
+    """
+    Siembra el historial con los registros normalizados del caché local
+    (cached_places.iter_registros_en_cache), omitiendo los (lugar, timestamp)
+    que ya están en el historial.
+    """
+    ids = leer_json(HISTORY_IDS_FILE).get("place_ids", [])
+    posiciones = {place_id: i for i, place_id in enumerate(ids)}
+    historial = cargar_historial()
+    existentes = set(zip(historial["lugar"].tolist(), historial["ts"].tolist()))
+
+    nuevas = {}
+    for registro in registros:
+        ts = _epoch(registro.get("timestamp")) if registro.get("timestamp") else None
+        if ts is None:
+            continue
+        clave = (registro["place_id"], ts)
+        if clave in nuevas or (posiciones.get(registro["place_id"]), ts) in existentes:
+            continue
+        nuevas[clave] = {
+            "place_id": registro["place_id"],
+            "nombre": registro.get("name", ""),
+            "rating": registro.get("rating"),
+            "resenas": registro.get("user_ratings_total"),
+            "precio": None,
+            "timestamp": registro["timestamp"],
+        }
+    return registrar_observaciones(nuevas.values())
+
+
+def tendencias(place_ids: Optional[List[str]] = None, dias: int = 90,
+               ordenar_por: Optional[str] = None, limite: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Tendencia por lugar en la ventana de los últimos 'dias': valores inicial y
+    actual, deltas, pendiente del rating (mínimos cuadrados) y reseñas por día.
+    Toda la agregación y el orden son vectorizados sobre el arreglo del historial;
+    solo se construyen diccionarios para los 'limite' lugares entregados.
+
+    Returns:
+        {"total_lugares": int, "lugares": [...]} ordenados de mayor a menor por
+        'ordenar_por' (los lugares sin valor quedan al final)
+    """
+    vacio = {"total_lugares": 0, "lugares": []}
+    ids_info = leer_json(HISTORY_IDS_FILE)
+    ids = ids_info.get("place_ids", [])
+    nombres = ids_info.get("nombres", [])
+    historial = cargar_historial()
+    if len(historial) == 0 or not ids:
+        return vacio
+
+    desde = int((datetime.now() - timedelta(days=dias)).timestamp())
+    mascara = historial["ts"] >= desde
+    if place_ids:
+        posiciones = {place_id: i for i, place_id in enumerate(ids)}
+        pedidos = np.array([posiciones[p] for p in place_ids if p in posiciones], dtype=np.uint32)
+        mascara &= np.isin(historial["lugar"], pedidos)
+    obs = np.asarray(historial[mascara])
+    if len(obs) == 0:
+        return vacio
+
+    # Ordenar por (lugar, ts) y ubicar el inicio de cada grupo
+    obs = obs[np.lexsort((obs["ts"], obs["lugar"]))]
+    lugar = obs["lugar"].astype(np.int64)
+    inicios = np.flatnonzero(np.r_[True, lugar[1:] != lugar[:-1]])
+    finales = np.r_[inicios[1:], len(obs)] - 1
+    grupo = np.repeat(np.arange(len(inicios)), np.diff(np.r_[inicios, len(obs)]))
+    n_grupos = len(inicios)
+
+    def _primero_ultimo(valido: np.ndarray, valores: np.ndarray):
+        # Primera y última posición válida de cada grupo (-1 si no hay)
+        posiciones = np.arange(len(obs))
+        primero = np.full(n_grupos, len(obs), dtype=np.int64)
+        ultimo = np.full(n_grupos, -1, dtype=np.int64)
+        np.minimum.at(primero, grupo[valido], posiciones[valido])
+        np.maximum.at(ultimo, grupo[valido], posiciones[valido])
+        hay = ultimo >= 0
+        inicial = np.where(hay, valores[np.minimum(primero, len(obs) - 1)], np.nan)
+        actual = np.where(hay, valores[np.maximum(ultimo, 0)], np.nan)
+        return inicial, actual, primero, ultimo, hay
+
+    rating = obs["rating"].astype(np.float64)
+    resenas = obs["resenas"].astype(np.float64)
+    dias_obs = (obs["ts"] - obs["ts"][inicios][grupo]) / 86400.0
+
+    con_rating = ~np.isnan(rating)
+    rating_inicial, rating_actual, _, _, hay_rating = _primero_ultimo(con_rating, rating)
+    con_resenas = resenas >= 0
+    resenas_inicial, resenas_actual, pr_primero, pr_ultimo, hay_resenas = _primero_ultimo(con_resenas, resenas)
+
+    # Pendiente del rating por grupo: regresión lineal con sumas por bincount
+    x = dias_obs[con_rating]
+    y = rating[con_rating]
+    g = grupo[con_rating]
+    n = np.bincount(g, minlength=n_grupos).astype(np.float64)
+    sx = np.bincount(g, x, minlength=n_grupos)
+    sy = np.bincount(g, y, minlength=n_grupos)
+    sxx = np.bincount(g, x * x, minlength=n_grupos)
+    sxy = np.bincount(g, x * y, minlength=n_grupos)
+    denominador = n * sxx - sx * sx
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pendiente = np.where(denominador > 0, (n * sxy - sx * sy) / denominador, np.nan)
+    rating_min = np.full(n_grupos, np.inf)
+    rating_max = np.full(n_grupos, -np.inf)
+    np.minimum.at(rating_min, g, y)
+    np.maximum.at(rating_max, g, y)
+
+    # Reseñas por día entre la primera y la última observación con conteo
+    idx_primero = np.minimum(pr_primero, len(obs) - 1)
+    idx_ultimo = np.maximum(pr_ultimo, 0)
+    dias_resenas = (obs["ts"][idx_ultimo] - obs["ts"][idx_primero]) / 86400.0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        resenas_por_dia = np.where(hay_resenas & (dias_resenas > 0),
+                                   (resenas_actual - resenas_inicial) / dias_resenas, np.nan)
+
+    precio = obs["precio"][finales]
+    columnas = {
+        "delta_rating": np.where(hay_rating, rating_actual - rating_inicial, np.nan),
+        "pendiente_rating_30d": pendiente * 30,
+        "delta_resenas": np.where(hay_resenas, resenas_actual - resenas_inicial, np.nan),
+        "resenas_por_dia": resenas_por_dia,
+        "rating_actual": rating_actual,
+    }
+
+    # Orden descendente estable; NaN al final
+    orden = np.arange(n_grupos)
+    if ordenar_por in columnas:
+        clave = columnas[ordenar_por]
+        orden = np.argsort(np.where(np.isnan(clave), np.inf, -clave), kind="stable")
+    if limite is not None:
+        orden = orden[:limite]
+
+    def _num(valor: float, decimales: int = 3):
+        return None if np.isnan(valor) or np.isinf(valor) else round(float(valor), decimales)
+
+    def _entero(valor: float):
+        return None if np.isnan(valor) else int(valor)
+
+    lugares = []
+    for i in orden.tolist():
+        indice = int(lugar[inicios[i]])
+        lugares.append({
+            "place_id": ids[indice],
+            "nombre": nombres[indice] if indice < len(nombres) else "",
+            "observaciones": int(finales[i] - inicios[i] + 1),
+            "desde": datetime.fromtimestamp(int(obs["ts"][inicios[i]])).isoformat(),
+            "hasta": datetime.fromtimestamp(int(obs["ts"][finales[i]])).isoformat(),
+            "rating_inicial": _num(rating_inicial[i], 2),
+            "rating_actual": _num(rating_actual[i], 2),
+            "delta_rating": _num(columnas["delta_rating"][i], 2),
+            "rating_min": _num(rating_min[i], 2),
+            "rating_max": _num(rating_max[i], 2),
+            "pendiente_rating_30d": _num(columnas["pendiente_rating_30d"][i]),
+            "resenas_inicial": _entero(resenas_inicial[i]),
+            "resenas_actual": _entero(resenas_actual[i]),
+            "delta_resenas": _entero(columnas["delta_resenas"][i]),
+            "resenas_por_dia": _num(resenas_por_dia[i], 2),
+            "nivel_precio": int(precio[i]) if precio[i] >= 0 else None,
+        })
+    return {"total_lugares": n_grupos, "lugares": lugares}
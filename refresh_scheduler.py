@@ -0,0 +1,214 @@
+"""
+Actualización en segundo plano de los competidores seguidos.
+Mantiene una cola de prioridad de búsquedas y lugares seguidos y los refresca
+antes de que su entrada de caché venza, dentro de un límite de llamadas por
+hora, para que las consultas interactivas casi nunca encuentren el caché frío.
+"""
+import os
+import json
+import math
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Any, Callable, Optional, Tuple
+
+from cache_store import leer_json, actualizar_json, intentar_bloqueo_exclusivo
+from tool_context import herramienta_actual
+from offline_mode import activo as modo_offline_activo
+
+
+TRACKED_FILE = Path("cache") / "refresh_tracked.json"
+
+# Una entrada se vuelve candidata cuando su edad supera esta fracción de la expiración
+REFRESH_ANTICIPACION = 0.8
+# Tope de la edad relativa en la prioridad (entradas ausentes o muy vencidas)
+REFRESH_EDAD_MAXIMA = 2.0
+# Las entradas seguidas automáticamente sin accesos en este plazo dejan de seguirse
+REFRESH_AUTO_RETENCION_DIAS = 7
+
+# Estado de una entrada seguida: (timestamp ISO del caché o None, accesos, último acceso ISO)
+EstadoEntrada = Tuple[Optional[str], int, str]
+
+
+def clave_seguimiento(tipo: str, params: Dict[str, Any]) -> str:
+    return f"{tipo}:{json.dumps(params, sort_keys=True, ensure_ascii=False)}"
+
+
+class LimiteDeTasa:
+    """Cubeta de fichas: como máximo 'por_hora' refrescos por hora, con ráfagas de hasta ese mismo valor."""
+
+    def __init__(self, por_hora: float):
+        self.capacidad = max(por_hora, 0.0)
+        self.fichas = self.capacidad
+        self.por_segundo = self.capacidad / 3600
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def tomar(self) -> bool:
+        with self._lock:
+            ahora = time.monotonic()
+            self.fichas = min(self.capacidad, self.fichas + (ahora - self._ultimo) * self.por_segundo)
+            self._ultimo = ahora
+            if self.fichas < 1:
+                return False
+            self.fichas -= 1
+            return True
+
+
+class ProgramadorActualizaciones:
+    """
+    Cola de prioridad de entradas seguidas.
+
+    Cada tipo de entrada ("busqueda", "resenas", ...) se registra con dos funciones:
+    estado(params) -> EstadoEntrada y refrescar(params), que vuelve a consultar la
+    API y guarda el resultado en caché. La prioridad combina antigüedad relativa
+    a la expiración, frecuencia de acceso e importancia asignada.
+    """
+
+    def __init__(self, expiry_hours: float, max_por_hora: float, archivo: Path = TRACKED_FILE):
+        self.expiry_hours = expiry_hours
+        self.archivo = archivo
+        self.limite = LimiteDeTasa(max_por_hora)
+        self._tipos: Dict[str, Tuple[Callable[[Dict[str, Any]], EstadoEntrada], Callable[[Dict[str, Any]], Any]]] = {}
+        self._hilo: Optional[threading.Thread] = None
+        self._detener = threading.Event()
+        self._bloqueo_lider = None
+
+    def registrar_tipo(self, tipo: str, estado: Callable[[Dict[str, Any]], EstadoEntrada],
+                       refrescar: Callable[[Dict[str, Any]], Any]) -> None:
+        self._tipos[tipo] = (estado, refrescar)
+
+    def seguir(self, tipo: str, params: Dict[str, Any], importancia: float = 1.0, auto: bool = False) -> str:
+        """
+        Agrega (o actualiza) una entrada seguida. Una entrada automática nunca
+        rebaja la importancia de una agregada explícitamente.
+        """
+        clave = clave_seguimiento(tipo, params)
+        actual = leer_json(self.archivo).get(clave)
+        if auto and actual and (not actual.get("auto") or actual.get("importancia", 0) >= importancia):
+            return clave
+
+        def _agregar(seguidas: Dict[str, Any]) -> None:
+            previa = seguidas.get(clave, {})
+            seguidas[clave] = {
+                "tipo": tipo,
+                "params": params,
+                "importancia": importancia,
+                "auto": auto and previa.get("auto", True),
+                "agregado": previa.get("agregado", datetime.now().isoformat()),
+            }
+
+        actualizar_json(self.archivo, _agregar)
+        return clave
+
+    def dejar_de_seguir(self, clave: str) -> bool:
+        eliminada = []
+
+        def _quitar(seguidas: Dict[str, Any]) -> None:
+            if seguidas.pop(clave, None) is not None:
+                eliminada.append(clave)
+
+        actualizar_json(self.archivo, _quitar)
+        return bool(eliminada)
+
+    def _prioridad(self, entrada: Dict[str, Any]) -> Dict[str, Any]:
+        estado, _ = self._tipos[entrada["tipo"]]
+        timestamp, accesos, ultimo_acceso = estado(entrada["params"])
+        if timestamp:
+            try:
+                edad_horas = (datetime.now() - datetime.fromisoformat(timestamp)).total_seconds() / 3600
+                edad_relativa = min(edad_horas / self.expiry_hours, REFRESH_EDAD_MAXIMA)
+            except ValueError:
+                edad_relativa = REFRESH_EDAD_MAXIMA
+        else:
+            edad_relativa = REFRESH_EDAD_MAXIMA
+        prioridad = entrada.get("importancia", 1.0) * edad_relativa * (1 + math.log1p(accesos))
+        return {
+            "edad_relativa": round(edad_relativa, 3),
+            "accesos": accesos,
+            "ultimo_acceso": ultimo_acceso or entrada.get("agregado", ""),
+            "prioridad": round(prioridad, 4),
+            "candidata": edad_relativa >= REFRESH_ANTICIPACION,
+        }
+
+    def listar(self) -> List[Dict[str, Any]]:
+        """Entradas seguidas con su prioridad actual, de mayor a menor."""
+        filas = []
+        for clave, entrada in leer_json(self.archivo).items():
+            if entrada.get("tipo") not in self._tipos:
+                continue
+            filas.append({"clave": clave, **entrada, **self._prioridad(entrada)})
+        filas.sort(key=lambda f: f["prioridad"], reverse=True)
+        return filas
+
+    def _podar_automaticas(self, filas: List[Dict[str, Any]]) -> None:
+        limite = (datetime.now() - timedelta(days=REFRESH_AUTO_RETENCION_DIAS)).isoformat()
+        viejas = [f["clave"] for f in filas if f.get("auto") and f["ultimo_acceso"] < limite]
+        if not viejas:
+            return
+
+        def _quitar(seguidas: Dict[str, Any]) -> None:
+            for clave in viejas:
+                seguidas.pop(clave, None)
+
+        actualizar_json(self.archivo, _quitar)
+        print(f"✓ Actualización programada: {len(viejas)} entradas automáticas sin uso dejaron de seguirse")
+
+    def ejecutar_ciclo(self) -> Dict[str, Any]:
+        """Refresca las entradas candidatas de mayor prioridad mientras haya fichas disponibles."""
+        filas = self.listar()
+        self._podar_automaticas(filas)
+
+        cola = [(-f["prioridad"], f["clave"], f) for f in filas if f["candidata"]]
+        heapq.heapify(cola)
+        refrescadas, errores = [], []
+        token = herramienta_actual.set("actualizacion_programada")
+        try:
+            while cola and self.limite.tomar():
+                _, clave, fila = heapq.heappop(cola)
+                _, refrescar = self._tipos[fila["tipo"]]
+                try:
+                    refrescar(fila["params"])
+                    refrescadas.append(clave)
+                except Exception as e:
+                    errores.append(f"{clave}: {e}")
+        finally:
+            herramienta_actual.reset(token)
+
+        if refrescadas or errores:
+            print(f"✓ Actualización programada: {len(refrescadas)} refrescadas, {len(cola)} pendientes, {len(errores)} errores")
+        return {
+            "seguidas": len(filas),
+            "refrescadas": refrescadas,
+            "pendientes": len(cola),
+            "errores": errores,
+            "fichas_disponibles": round(self.limite.fichas, 2),
+        }
+
+    def iniciar(self, intervalo_minutos: float) -> None:
+        """
+        Lanza el hilo daemon del programador. Con varios workers solo el proceso
+        que obtiene el bloqueo del archivo de seguimiento refresca, para no
+        repetir llamadas a la API.
+        """
+        if intervalo_minutos <= 0 or (self._hilo is not None and self._hilo.is_alive()):
+            return
+
+        def _ciclo() -> None:
+            while not self._detener.wait(intervalo_minutos * 60):
+                if modo_offline_activo():
+                    continue  # Sin red no hay nada que refrescar
+                if self._bloqueo_lider is None:
+                    self._bloqueo_lider = intentar_bloqueo_exclusivo(Path(f"{self.archivo}.lider"))
+                    if self._bloqueo_lider is None:
+                        continue
+                try:
+                    self.ejecutar_ciclo()
+                except Exception as e:
+                    print(f"WARNING: Falló la actualización programada: {e}")
+
+        self._hilo = threading.Thread(target=_ciclo, name="actualizacion-programada", daemon=True)
+        self._hilo.start()
+        print(f"✓ Actualización programada cada {intervalo_minutos} minutos (pid {os.getpid()})")
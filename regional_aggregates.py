@@ -0,0 +1,262 @@
+"""
+Vistas materializadas de agregados regionales por (región, categoría, query).
+Cada vez que se guarda un mapeo o un análisis de reseñas, los lugares que
+trae actualizan de forma incremental las sumas de su vista: cantidad de
+lugares, suma y suma de cuadrados del rating (promedio y varianza), un
+histograma de ratings en pasos de 0.1 (proporción sobre un umbral), volumen de
+reseñas y mezcla de sentimientos. Consultar una vista es una búsqueda en un
+diccionario, sin recorrer los cachés.
+
+Cada lugar aporta una sola vez a cada vista: la vista recuerda su contribución
+y, si el lugar vuelve en otro mapeo o con un análisis nuevo, la reemplaza. Los
+lugares se acumulan entre búsquedas de la misma región y query (con distinto
+radio, por ejemplo); además de la query exacta se mantiene la vista "*" que
+reúne todas las queries de la región, y la categoría "*" con todas las
+categorías. Vive en cache/regional_aggregates.json (compartido entre workers).
+"""
+import math
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+from cache_store import leer_json, actualizar_json
+
+
+AGGREGATES_FILE = Path("cache") / "regional_aggregates.json"
+
+TODAS = "*"  # Comodín de query y de categoría
+RATING_MIN, RATING_MAX = 1.0, 5.0
+CUBETAS_RATING = int(round((RATING_MAX - RATING_MIN) * 10)) + 1  # Pasos de 0.1
+SENTIMIENTOS = ("positivo", "negativo", "neutro")
+
+
+def normalizar(texto: str) -> str:
+    return " ".join((texto or "").lower().split())
+
+
+def clave_familia(region: str, query: str) -> str:
+    return f"{normalizar(region)}|{normalizar(query) if query != TODAS else TODAS}"
+
+
+def clave_vista(region: str, categoria: str, query: str) -> str:
+    return f"{normalizar(region)}|{categoria}|{normalizar(query) if query != TODAS else TODAS}"
+
+
+def _rating_numerico(valor: Any) -> Optional[float]:
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)) or math.isnan(valor):
+        return None
+    return min(max(float(valor), RATING_MIN), RATING_MAX)
+
+
+def _cubeta(rating: float) -> int:
+    return int(round((rating - RATING_MIN) * 10))
+
+
+def _vista_vacia(region: str, categoria: str, query: str) -> Dict[str, Any]:
+    return {
+        "region": normalizar(region),
+        "categoria": categoria,
+        "query": query,
+        "lugares": 0,
+        "con_rating": 0,
+        "suma_rating": 0.0,
+        "suma_cuadrados": 0.0,
+        "histograma": [0] * CUBETAS_RATING,
+        "resenas_totales": 0,
+        "resenas_analizadas": 0,
+        "con_sentimiento": 0,
+        "sentimiento": {s: 0 for s in SENTIMIENTOS},
+        "actualizado": None,
+    }
+
+
+def _aplicar(vista: Dict[str, Any], miembro: Dict[str, Any], signo: int) -> None:
+    """Suma (signo=1) o resta (signo=-1) la contribución de un lugar a una vista."""
+    vista["lugares"] += signo
+    rating = miembro.get("rating")
+    if rating is not None:
+        vista["con_rating"] += signo
+        vista["suma_rating"] += signo * rating
+        vista["suma_cuadrados"] += signo * rating * rating
+        vista["histograma"][_cubeta(rating)] += signo
+    vista["resenas_totales"] += signo * (miembro.get("resenas") or 0)
+    sentimiento = miembro.get("sentimiento")
+    if sentimiento:
+        vista["con_sentimiento"] += signo
+        vista["resenas_analizadas"] += signo * (miembro.get("resenas_analizadas") or 0)
+        for s in SENTIMIENTOS:
+            vista["sentimiento"][s] += signo * sentimiento.get(s, 0)
+
+
+def resumir_vista(vista: Dict[str, Any], umbral_rating: Optional[float] = None) -> Dict[str, Any]:
+    """Estadísticos de una vista a partir de sus sumas (tiempo constante)."""
+    n = vista["con_rating"]
+    promedio = vista["suma_rating"] / n if n else None
+    varianza = max(vista["suma_cuadrados"] / n - promedio * promedio, 0.0) if n else None
+    total_sentimiento = sum(vista["sentimiento"].values())
+    resumen = {
+        "region": vista["region"],
+        "categoria": vista["categoria"],
+        "query": vista["query"],
+        "lugares": vista["lugares"],
+        "lugares_con_rating": n,
+        "rating_promedio": round(promedio, 3) if promedio is not None else None,
+        "rating_varianza": round(varianza, 4) if varianza is not None else None,
+        "rating_desviacion": round(math.sqrt(varianza), 4) if varianza is not None else None,
+        "resenas_totales": vista["resenas_totales"],
+        "lugares_con_resenas_analizadas": vista["con_sentimiento"],
+        "resenas_analizadas": vista["resenas_analizadas"],
+        "sentimiento": dict(vista["sentimiento"]),
+        "mezcla_sentimiento": {
+            s: round(c / total_sentimiento, 3) for s, c in vista["sentimiento"].items()
+        } if total_sentimiento else None,
+        "actualizado": vista["actualizado"],
+    }
+    if umbral_rating is not None:
+        # Estrictamente mayor que el umbral (con la resolución de 0.1 del histograma)
+        desde = max(int(math.floor((umbral_rating - RATING_MIN) * 10 + 1e-9)) + 1, 0)
+        sobre = sum(vista["histograma"][desde:])
+        resumen["umbral_rating"] = umbral_rating
+        resumen["lugares_sobre_umbral"] = sobre
+        resumen["proporcion_sobre_umbral"] = round(sobre / n, 4) if n else None
+    return resumen
+
+
+class VistasRegionales:
+    """Agregados por (región, categoría, query) mantenidos de forma incremental."""
+
+    def __init__(self, path: Path = AGGREGATES_FILE):
+        self.path = Path(path)
+
+    def _reemplazar_miembro(self, data: Dict[str, Any], familia: str, region: str, query: str,
+                            place_id: str, nuevo: Dict[str, Any], ahora: str) -> None:
+        """Reemplaza la contribución de un lugar en una familia (región, query) y sus vistas."""
+        familias = data.setdefault("familias", {})
+        vistas = data.setdefault("vistas", {})
+        miembros = familias.setdefault(familia, {"region": normalizar(region), "query": query, "miembros": {}})["miembros"]
+
+        anterior = miembros.get(place_id)
+        for categoria in {anterior["categoria"], TODAS} if anterior else ():
+            vista = vistas.get(clave_vista(region, categoria, query))
+            if vista is not None:
+                _aplicar(vista, anterior, -1)
+                vista["actualizado"] = ahora
+        for categoria in (nuevo["categoria"], TODAS):
+            clave = clave_vista(region, categoria, query)
+            vista = vistas.get(clave)
+            if vista is None:
+                vista = vistas[clave] = _vista_vacia(region, categoria, query)
+            _aplicar(vista, nuevo, 1)
+            vista["actualizado"] = ahora
+        miembros[place_id] = nuevo
+
+        indice = data.setdefault("lugares", {}).setdefault(place_id, [])
+        if familia not in indice:
+            indice.append(familia)
+
+    def _registrar_mapeo(self, data: Dict[str, Any], query: str, ubicacion: str,
+                         clasificacion: Dict[str, List[Dict[str, Any]]]) -> int:
+        ahora = datetime.now().isoformat()
+        resenas_por_lugar = data.setdefault("resenas", {})
+        registrados = 0
+        for consulta in (query, TODAS):
+            familia = clave_familia(ubicacion, consulta)
+            miembros = data.get("familias", {}).get(familia, {}).get("miembros", {})
+            for categoria, lugares in clasificacion.items():
+                for lugar in lugares:
+                    place_id = lugar.get("place_id")
+                    if not place_id:
+                        continue
+                    anterior = miembros.get(place_id, {})
+                    resenas = resenas_por_lugar.get(place_id, {})
+                    total = lugar.get("user_ratings_total")
+                    nuevo = {
+                        "categoria": categoria,
+                        "rating": _rating_numerico(lugar.get("rating")),
+                        "resenas": total if total is not None else anterior.get("resenas", resenas.get("total_ratings")),
+                        "sentimiento": resenas.get("sentimiento"),
+                        "resenas_analizadas": resenas.get("resenas_analizadas"),
+                    }
+                    self._reemplazar_miembro(data, familia, ubicacion, consulta if consulta == TODAS else normalizar(consulta),
+                                             place_id, nuevo, ahora)
+                    registrados += 1
+        return registrados
+
+    def _registrar_resenas(self, data: Dict[str, Any], place_id: str, analisis: Dict[str, Any]) -> int:
+        contribucion = {
+            "sentimiento": {s: analisis["sentimiento_general"]["distribucion"].get(s, 0) for s in SENTIMIENTOS},
+            "resenas_analizadas": analisis.get("total_reviews", 0),
+            "total_ratings": analisis.get("total_ratings") or None,
+        }
+        data.setdefault("resenas", {})[place_id] = contribucion
+        ahora = datetime.now().isoformat()
+        actualizadas = 0
+        for familia in data.get("lugares", {}).get(place_id, []):
+            info = data["familias"][familia]
+            anterior = info["miembros"][place_id]
+            nuevo = {
+                **anterior,
+                "sentimiento": contribucion["sentimiento"],
+                "resenas_analizadas": contribucion["resenas_analizadas"],
+                "resenas": anterior.get("resenas") or contribucion["total_ratings"],
+            }
+            self._reemplazar_miembro(data, familia, info["region"], info["query"], place_id, nuevo, ahora)
+            actualizadas += 1
+        return actualizadas
+
+    def registrar_mapeo(self, query: str, ubicacion: str, clasificacion: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Incorpora los lugares clasificados de un mapeo a las vistas de su región y query."""
+        if not clasificacion:
+            return
+        actualizar_json(self.path, lambda data: self._registrar_mapeo(data, query, ubicacion, clasificacion))
+
+    def registrar_resenas(self, place_id: str, analisis: Dict[str, Any]) -> None:
+        """Actualiza el volumen de reseñas y la mezcla de sentimientos del lugar en todas sus vistas."""
+        if not analisis.get("sentimiento_general") or analisis.get("fuente") == "datos_placeholder":
+            return
+        actualizar_json(self.path, lambda data: self._registrar_resenas(data, place_id, analisis))
+
+    def consultar(self, ubicacion: str, categoria: str = TODAS, query: str = TODAS,
+                  umbral_rating: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Estadísticos de una vista, o None si la región, categoría y query no tienen datos."""
+        vista = leer_json(self.path).get("vistas", {}).get(clave_vista(ubicacion, categoria, query))
+        return resumir_vista(vista, umbral_rating) if vista is not None else None
+
+    def disponibles(self, ubicacion: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Regiones y queries con vistas (filtradas por región si se indica)."""
+        region = normalizar(ubicacion) if ubicacion else None
+        return [
+            {"region": info["region"], "query": info["query"], "lugares": len(info["miembros"])}
+            for info in leer_json(self.path).get("familias", {}).values()
+            if region is None or info["region"] == region
+        ]
+
+    def reconstruir(self, mapeos: Iterable[Tuple[str, str, Dict[str, List[Dict[str, Any]]]]],
+                    analisis: Iterable[Tuple[str, str, Dict[str, Any]]]) -> Dict[str, int]:
+        """
+        Recalcula todas las vistas desde cero.
+
+        Args:
+            mapeos: (query, ubicacion, clasificacion) de los mapeos guardados
+            analisis: (place_id, timestamp, análisis) de los análisis de reseñas guardados;
+                     por lugar se usa el más reciente
+        """
+        recientes: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        for place_id, timestamp, resultado in analisis:
+            if resultado.get("sentimiento_general") and resultado.get("fuente") != "datos_placeholder":
+                if place_id not in recientes or (timestamp or "") >= recientes[place_id][0]:
+                    recientes[place_id] = (timestamp or "", resultado)
+        mapeos = list(mapeos)
+
+        def _reconstruir(data: Dict[str, Any]) -> None:
+            data.clear()
+            for place_id, (_, resultado) in recientes.items():
+                self._registrar_resenas(data, place_id, resultado)
+            for query, ubicacion, clasificacion in mapeos:
+                self._registrar_mapeo(data, query, ubicacion, clasificacion)
+
+        data = actualizar_json(self.path, _reconstruir)
+        return {"mapeos": len(mapeos), "analisis": len(recientes), "vistas": len(data.get("vistas", {}))}
+
+
+vistas_regionales = VistasRegionales()
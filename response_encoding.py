@@ -0,0 +1,269 @@
+"""
+Codificación de las respuestas del servidor MCP sobre HTTP.
+- Compresión gzip/zstd negociada con Accept-Encoding, a partir de un tamaño
+  mínimo. Los flujos SSE del transporte HTTP se comprimen bloque a bloque con
+  vaciado (flush) en cada evento, de modo que siguen llegando en streaming.
+- Modo JSON "compacto" opcional para el texto de los resultados: las listas de
+  objetos con las mismas claves se envían como tabla ({"_columnas", "_filas"})
+  en lugar de repetir las claves en cada elemento.
+- Métricas de bytes (originales y enviados por codificación) y de tiempo de
+  serialización por herramienta.
+"""
+import os
+import time
+import zlib
+import threading
+from collections import defaultdict
+from typing import Dict, List, Any, Optional, Tuple
+
+import pydantic_core
+
+from tool_context import herramienta_actual
+
+try:
+    import zstandard
+except ImportError:  # zstd es opcional; sin él solo se ofrece gzip
+    zstandard = None
+
+
+MODOS_JSON = ("estandar", "compacto")
+MIN_FILAS_TABLA = 2  # Listas más cortas no se convierten en tabla
+NIVEL_GZIP = 6
+NIVEL_ZSTD = 3
+# Ya comprimidos o binarios: no se vuelven a comprimir
+TIPOS_EXCLUIDOS = ("image/", "video/", "audio/", "application/zip", "application/gzip")
+
+config = {
+    "modo_json": os.getenv("MCP_JSON_MODO", "estandar"),
+    "compresion": os.getenv("HTTP_COMPRESION", "1") != "0",
+    "compresion_min_bytes": int(os.getenv("HTTP_COMPRESION_MIN_BYTES", "1024")),
+}
+_lock = threading.Lock()
+
+
+def _metricas_vacias() -> Dict[str, Any]:
+    return {
+        "compresion": defaultdict(lambda: {"respuestas": 0, "bytes_originales": 0, "bytes_enviados": 0, "ms_compresion": 0.0}),
+        "serializacion": defaultdict(lambda: {"llamadas": 0, "bytes_texto": 0, "ms_serializacion": 0.0}),
+        "desde": time.time(),
+    }
+
+
+_metricas = _metricas_vacias()
+
+
+def codificaciones_disponibles() -> List[str]:
+    """Codificaciones que el servidor puede ofrecer, en orden de preferencia."""
+    return (["zstd"] if zstandard is not None else []) + ["gzip"]
+
+
+def configurar(modo_json: Optional[str] = None, compresion: Optional[bool] = None,
+               compresion_min_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Actualiza la configuración en caliente.
+
+    Raises:
+        ValueError: Si algún valor no es válido
+    """
+    with _lock:
+        if modo_json is not None:
+            if modo_json not in MODOS_JSON:
+                raise ValueError(f"modo_json debe ser uno de {list(MODOS_JSON)}")
+            config["modo_json"] = modo_json
+        if compresion is not None:
+            config["compresion"] = bool(compresion)
+        if compresion_min_bytes is not None:
+            if compresion_min_bytes < 0:
+                raise ValueError("compresion_min_bytes no puede ser negativo")
+            config["compresion_min_bytes"] = int(compresion_min_bytes)
+        return dict(config)
+
+
+def tabular(valor: Any) -> Any:
+    """
+    Convierte recursivamente las listas de objetos con las mismas claves en
+    {"_columnas": [...], "_filas": [[...], ...]}.
+    """
+    if isinstance(valor, dict):
+        return {clave: tabular(v) for clave, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        if (len(valor) >= MIN_FILAS_TABLA and all(isinstance(v, dict) for v in valor)
+                and all(v.keys() == valor[0].keys() for v in valor)):
+            columnas = list(valor[0].keys())
+            return {"_columnas": columnas, "_filas": [[tabular(v[c]) for c in columnas] for v in valor]}
+        return [tabular(v) for v in valor]
+    return valor
+
+
+def serializar_respuesta(data: Any) -> str:
+    """
+    Serializador de resultados de herramientas para FastMCP (texto del
+    resultado). Registra bytes y tiempo de serialización por herramienta.
+    """
+    inicio = time.perf_counter()
+    if config["modo_json"] == "compacto":
+        data = tabular(pydantic_core.to_jsonable_python(data, fallback=str))
+    texto = pydantic_core.to_json(data, fallback=str).decode()
+    duracion_ms = (time.perf_counter() - inicio) * 1000
+    with _lock:
+        m = _metricas["serializacion"][herramienta_actual.get()]
+        m["llamadas"] += 1
+        m["bytes_texto"] += len(texto.encode("utf-8"))
+        m["ms_serializacion"] += duracion_ms
+    return texto
+
+
+def _registrar_compresion(codificacion: str, originales: int, enviados: int, ms: float, nueva: bool) -> None:
+    with _lock:
+        m = _metricas["compresion"][codificacion]
+        m["respuestas"] += 1 if nueva else 0
+        m["bytes_originales"] += originales
+        m["bytes_enviados"] += enviados
+        m["ms_compresion"] += ms
+
+
+def metricas() -> Dict[str, Any]:
+    """Configuración, bytes por codificación y serialización por herramienta (de este proceso)."""
+    with _lock:
+        compresion = {}
+        for codificacion, m in _metricas["compresion"].items():
+            compresion[codificacion] = {
+                **m,
+                "ms_compresion": round(m["ms_compresion"], 1),
+                "ratio": round(m["bytes_enviados"] / m["bytes_originales"], 3) if m["bytes_originales"] else None,
+            }
+        serializacion = {
+            herramienta: {
+                **m,
+                "ms_serializacion": round(m["ms_serializacion"], 1),
+                "bytes_promedio": round(m["bytes_texto"] / m["llamadas"]) if m["llamadas"] else 0,
+            }
+            for herramienta, m in _metricas["serializacion"].items()
+        }
+        originales = sum(m["bytes_originales"] for m in _metricas["compresion"].values())
+        enviados = sum(m["bytes_enviados"] for m in _metricas["compresion"].values())
+        return {
+            "configuracion": dict(config),
+            "codificaciones_disponibles": codificaciones_disponibles(),
+            "desde": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_metricas["desde"])),
+            "bytes_originales": originales,
+            "bytes_enviados": enviados,
+            "bytes_ahorrados": originales - enviados,
+            "compresion": compresion,
+            "serializacion": serializacion,
+        }
+
+
+def reiniciar_metricas() -> None:
+    global _metricas
+    with _lock:
+        _metricas = _metricas_vacias()
+
+
+def elegir_codificacion(accept_encoding: str) -> Optional[str]:
+    """Mejor codificación aceptada por el cliente (respeta q=0), o None."""
+    aceptadas = {}
+    for parte in accept_encoding.lower().split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        q = 1.0
+        if parametros.strip().startswith("q="):
+            try:
+                q = float(parametros.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if nombre:
+            aceptadas[nombre] = q
+    for codificacion in codificaciones_disponibles():
+        if aceptadas.get(codificacion, aceptadas.get("*", 0.0)) > 0:
+            return codificacion
+    return None
+
+
+class _Compresor:
+    """Compresión incremental con vaciado por bloque (válida para streaming)."""
+
+    def __init__(self, codificacion: str):
+        if codificacion == "zstd":
+            self._objeto = zstandard.ZstdCompressor(level=NIVEL_ZSTD).compressobj()
+            self._vaciar = lambda: self._objeto.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            self._terminar = lambda: self._objeto.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        else:
+            self._objeto = zlib.compressobj(NIVEL_GZIP, zlib.DEFLATED, 31)  # 31 = formato gzip
+            self._vaciar = lambda: self._objeto.flush(zlib.Z_SYNC_FLUSH)
+            self._terminar = lambda: self._objeto.flush(zlib.Z_FINISH)
+
+    def comprimir(self, bloque: bytes, final: bool) -> bytes:
+        return self._objeto.compress(bloque) + (self._terminar() if final else self._vaciar())
+
+
+def _cabecera(cabeceras: List[Tuple[bytes, bytes]], nombre: bytes) -> Optional[str]:
+    for clave, valor in cabeceras:
+        if clave.lower() == nombre:
+            return valor.decode("latin-1")
+    return None
+
+
+class CompresionMiddleware:
+    """
+    Middleware ASGI que comprime las respuestas HTTP según Accept-Encoding.
+    La decisión se toma con el primer bloque del cuerpo: se comprime si la
+    respuesta declara (o ese bloque alcanza) compresion_min_bytes. Todas las
+    respuestas cuentan en las métricas, comprimidas o no ("identidad").
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        codificacion = None
+        if config["compresion"]:
+            codificacion = elegir_codificacion(_cabecera(scope.get("headers", []), b"accept-encoding") or "")
+        estado = {"inicio": None, "compresor": None, "decidido": False, "codificacion": "identidad"}
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado["inicio"] = mensaje
+                return
+            if mensaje["type"] != "http.response.body":
+                await send(mensaje)
+                return
+
+            cuerpo = mensaje.get("body", b"")
+            final = not mensaje.get("more_body", False)
+            if not estado["decidido"]:
+                estado["decidido"] = True
+                inicio = estado["inicio"]
+                cabeceras = list(inicio.get("headers", []))
+                largo = _cabecera(cabeceras, b"content-length")
+                tipo = _cabecera(cabeceras, b"content-type") or ""
+                tamano = int(largo) if largo and largo.isdigit() else len(cuerpo)
+                if (codificacion and tamano >= config["compresion_min_bytes"]
+                        and _cabecera(cabeceras, b"content-encoding") is None
+                        and not tipo.startswith(TIPOS_EXCLUIDOS)):
+                    estado["compresor"] = _Compresor(codificacion)
+                    estado["codificacion"] = codificacion
+                    cabeceras = [(k, v) for k, v in cabeceras if k.lower() != b"content-length"]
+                    cabeceras += [(b"content-encoding", codificacion.encode()), (b"vary", b"accept-encoding")]
+                await send({**inicio, "headers": cabeceras})
+                nueva = True
+            else:
+                nueva = False
+
+            if estado["compresor"] is None:
+                _registrar_compresion("identidad", len(cuerpo), len(cuerpo), 0.0, nueva)
+                await send(mensaje)
+                return
+            t0 = time.perf_counter()
+            comprimido = estado["compresor"].comprimir(cuerpo, final)
+            _registrar_compresion(estado["codificacion"], len(cuerpo), len(comprimido),
+                                  (time.perf_counter() - t0) * 1000, nueva)
+            await send({**mensaje, "body": comprimido})
+
+        await self.app(scope, receive, enviar)
+        # Respuesta sin cuerpo (p. ej. 202 Accepted de una notificación)
+        if estado["inicio"] is not None and not estado["decidido"]:
+            await send(estado["inicio"])
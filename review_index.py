@@ -0,0 +1,301 @@
+"""
+Índice de texto completo sobre las reseñas en caché.
+Cada reseña se guarda en cache/review_index.json con sus frecuencias de
+términos (plegado de acentos + stemmer ligero para español); cada proceso
+mantiene en memoria un índice invertido que se actualiza de forma incremental
+cuando cambia el archivo y responde consultas con ranking BM25.
+"""
+import re
+import math
+import heapq
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+from cache_store import leer_json, actualizar_json
+
+
+INDICE_RESENAS_FILE = Path("cache") / "review_index.json"
+
+# Parámetros de BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el ella
+ellas ellos en entre era eran es esa esas ese eso esos esta estaba estan estas este esto estos fue fueron
+ha habia han hay la las le les lo los me mi mis mucho muy nos o os otra otro para pero por porque que
+se ser si sin sobre su sus tambien te tiene todo tu un una uno unos y ya yo
+the and of to is was it in for on with at this that we our you are be
+""".split())
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def _tabla_plegado() -> Dict[int, str]:
+    """Minúsculas sin diacríticos, carácter por carácter (conserva las posiciones del texto)."""
+    tabla = {}
+    for codigo in range(0x250):
+        caracter = chr(codigo)
+        base = unicodedata.normalize("NFKD", caracter.lower())[:1] or caracter
+        if base != caracter:
+            tabla[codigo] = base
+    return tabla
+
+
+_PLEGADO = _tabla_plegado()
+
+
+def plegar(texto: str) -> str:
+    return texto.translate(_PLEGADO)
+
+
+@lru_cache(maxsize=50000)
+def raiz(palabra: str) -> str:
+    """
+    Stemmer ligero para español (plurales, -mente y vocal final), aplicado sobre
+    palabras ya plegadas: "frío", "fríos" y "fria" -> "fri"; "precios" -> "preci".
+    """
+    if len(palabra) <= 3 or palabra.isdigit():
+        return palabra
+    if palabra.endswith("mente") and len(palabra) > 7:
+        palabra = palabra[:-5]
+    if palabra.endswith("ces") and len(palabra) > 4:
+        palabra = palabra[:-3] + "z"
+    elif palabra.endswith("es") and len(palabra) > 4:
+        palabra = palabra[:-2]
+    elif palabra.endswith("s") and len(palabra) > 3:
+        palabra = palabra[:-1]
+    if palabra[-1] in "aeo" and len(palabra) > 3:
+        palabra = palabra[:-1]
+    return palabra
+
+
+def terminos(texto: str) -> List[str]:
+    """Raíces de las palabras del texto, sin stopwords."""
+    return [raiz(t) for t in _TOKEN.findall(plegar(texto)) if t not in STOPWORDS]
+
+
+def fragmento(texto: str, buscados: Iterable[str], ancho: int = 120) -> str:
+    """Extracto del texto alrededor de la primera palabra que coincide con la consulta."""
+    buscados = set(buscados)
+    for m in _TOKEN.finditer(plegar(texto)):
+        if raiz(m.group()) in buscados:
+            inicio = max(0, m.start() - ancho // 3)
+            fin = min(len(texto), inicio + ancho)
+            return ("..." if inicio > 0 else "") + texto[inicio:fin].strip() + ("..." if fin < len(texto) else "")
+    return texto[:ancho] + ("..." if len(texto) > ancho else "")
+
+
+def id_documento(place_id: str, review: Dict[str, Any]) -> str:
+    """Una reseña por lugar, autor, fecha e idioma (la misma reseña traducida es otro documento)."""
+    autor = review.get("author_url") or review.get("author_name", "")
+    return f"{place_id}|{autor}|{review.get('time', 0)}|{review.get('language', '')}"
+
+
+def documentos_de_lugar(place_id: str, nombre: str, reviews: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Documentos del índice para las reseñas (formato legacy) de un lugar."""
+    indexado = datetime.now().isoformat()
+    documentos = {}
+    for review in reviews:
+        texto = review.get("text", "")
+        tf = Counter(terminos(texto))
+        if not tf:
+            continue
+        documentos[id_documento(place_id, review)] = {
+            "place_id": place_id,
+            "nombre": nombre,
+            "autor": review.get("author_name", "Usuario anónimo"),
+            "clave_resena": f"{review.get('author_url') or review.get('author_name', '')}|{review.get('time', 0)}",
+            "rating": review.get("rating", 0),
+            "time": review.get("time", 0),
+            "idioma": review.get("language", ""),
+            "texto": texto,
+            "tf": dict(tf),
+            "largo": sum(tf.values()),
+            "indexado": indexado,
+        }
+    return documentos
+
+
+def indexar_lugares(lugares: Iterable[Tuple[str, str, List[Dict[str, Any]]]],
+                    reemplazar: bool = False, archivo: Path = INDICE_RESENAS_FILE) -> int:
+    """
+    Agrega (o actualiza) en el índice las reseñas de uno o más lugares.
+    Las reseñas indexadas antes se conservan aunque la API ya no las devuelva.
+
+    Args:
+        lugares: Tuplas (place_id, nombre, reseñas en formato legacy)
+        reemplazar: Si es True descarta el índice anterior (reconstrucción completa)
+
+    Returns:
+        Cantidad de documentos escritos
+    """
+    nuevos: Dict[str, Dict[str, Any]] = {}
+    for place_id, nombre, reviews in lugares:
+        nuevos.update(documentos_de_lugar(place_id, nombre, reviews))
+
+    def _sin_cambios(indice: Dict[str, Any], doc_id: str) -> bool:
+        actual = indice.get(doc_id)
+        return bool(actual) and actual["texto"] == nuevos[doc_id]["texto"] and actual["rating"] == nuevos[doc_id]["rating"]
+
+    def _escribir(indice: Dict[str, Any]) -> None:
+        if reemplazar:
+            indice.clear()
+        for doc_id, doc in nuevos.items():
+            # Una reseña sin cambios conserva su versión y no se vuelve a indexar
+            if not _sin_cambios(indice, doc_id):
+                indice[doc_id] = doc
+
+    vigente = leer_json(archivo)
+    if reemplazar or any(not _sin_cambios(vigente, doc_id) for doc_id in nuevos):
+        actualizar_json(archivo, _escribir)
+    return len(nuevos)
+
+
+class IndiceResenas:
+    """Índice invertido en memoria sincronizado con el archivo del índice."""
+
+    def __init__(self, archivo: Path = INDICE_RESENAS_FILE):
+        self.archivo = archivo
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.largo_total = 0
+        self._origen = None
+        self._lock = threading.Lock()
+
+    def _quitar(self, doc_id: str) -> None:
+        doc = self.docs.pop(doc_id)
+        self.largo_total -= doc["largo"]
+        for termino in doc["tf"]:
+            lista = self.postings[termino]
+            lista.pop(doc_id, None)
+            if not lista:
+                del self.postings[termino]
+
+    def _agregar(self, doc_id: str, doc: Dict[str, Any]) -> None:
+        self.docs[doc_id] = doc
+        self.largo_total += doc["largo"]
+        for termino, frecuencia in doc["tf"].items():
+            self.postings[termino][doc_id] = frecuencia
+
+    def _sincronizar(self) -> None:
+        """Aplica solo las diferencias entre el archivo y el índice en memoria."""
+        datos = leer_json(self.archivo)
+        if datos is self._origen:
+            return
+        for doc_id in self.docs.keys() - datos.keys():
+            self._quitar(doc_id)
+        for doc_id, doc in datos.items():
+            actual = self.docs.get(doc_id)
+            if actual is not None and actual["indexado"] == doc["indexado"]:
+                continue
+            if actual is not None:
+                self._quitar(doc_id)
+            self._agregar(doc_id, doc)
+        self._origen = datos
+
+    def liberar(self) -> None:
+        """Descarta el índice en memoria; se reconstruye desde el archivo en la próxima consulta."""
+        with self._lock:
+            self.docs = {}
+            self.postings = defaultdict(dict)
+            self.largo_total = 0
+            self._origen = None
+
+    def total_documentos(self) -> int:
+        with self._lock:
+            self._sincronizar()
+            return len(self.docs)
+
+    def buscar(self, consulta: str, place_ids: Optional[List[str]] = None,
+               rating_min: Optional[float] = None, rating_max: Optional[float] = None,
+               idiomas: Optional[List[str]] = None, limite: int = 20) -> Dict[str, Any]:
+        """
+        Ranking BM25 de las reseñas que contienen algún término de la consulta.
+        Las traducciones de una misma reseña cuentan una vez (la de mayor puntaje).
+        """
+        buscados = list(dict.fromkeys(terminos(consulta)))
+        lugares = set(place_ids) if place_ids else None
+        idiomas = set(idiomas) if idiomas else None
+
+        with self._lock:
+            self._sincronizar()
+            total = len(self.docs)
+            largo_promedio = self.largo_total / total if total else 0.0
+            admitidos: Dict[str, bool] = {}
+            puntajes: Dict[str, float] = defaultdict(float)
+
+            for termino in buscados:
+                lista = self.postings.get(termino)
+                if not lista:
+                    continue
+                idf = math.log(1 + (total - len(lista) + 0.5) / (len(lista) + 0.5))
+                for doc_id, frecuencia in lista.items():
+                    admitido = admitidos.get(doc_id)
+                    if admitido is None:
+                        doc = self.docs[doc_id]
+                        admitido = admitidos[doc_id] = (
+                            (lugares is None or doc["place_id"] in lugares)
+                            and (idiomas is None or doc["idioma"] in idiomas)
+                            and (rating_min is None or doc["rating"] >= rating_min)
+                            and (rating_max is None or doc["rating"] <= rating_max)
+                        )
+                    if not admitido:
+                        continue
+                    normalizacion = BM25_K1 * (1 - BM25_B + BM25_B * self.docs[doc_id]["largo"] / largo_promedio)
+                    puntajes[doc_id] += idf * frecuencia * (BM25_K1 + 1) / (frecuencia + normalizacion)
+
+            # Una entrada por reseña (la traducción con mayor puntaje)
+            mejores: Dict[Tuple[str, str], Tuple[float, str]] = {}
+            for doc_id, puntaje in puntajes.items():
+                doc = self.docs[doc_id]
+                clave = (doc["place_id"], doc["clave_resena"])
+                if clave not in mejores or puntaje > mejores[clave][0]:
+                    mejores[clave] = (puntaje, doc_id)
+
+            por_lugar: Dict[str, Dict[str, Any]] = {}
+            for puntaje, doc_id in mejores.values():
+                doc = self.docs[doc_id]
+                lugar = por_lugar.setdefault(doc["place_id"], {
+                    "place_id": doc["place_id"], "nombre": doc["nombre"],
+                    "coincidencias": 0, "puntaje_total": 0.0, "suma_rating": 0
+                })
+                lugar["coincidencias"] += 1
+                lugar["puntaje_total"] += puntaje
+                lugar["suma_rating"] += doc["rating"] or 0
+
+            resultados = []
+            for puntaje, doc_id in heapq.nlargest(limite, mejores.values()):
+                doc = self.docs[doc_id]
+                resultados.append({
+                    "place_id": doc["place_id"],
+                    "nombre": doc["nombre"],
+                    "puntaje": round(puntaje, 4),
+                    "rating": doc["rating"],
+                    "autor": doc["autor"],
+                    "idioma": doc["idioma"],
+                    "fecha": datetime.fromtimestamp(doc["time"]).date().isoformat() if doc["time"] else None,
+                    "fragmento": fragmento(doc["texto"], buscados),
+                })
+
+        lugares_ordenados = sorted(por_lugar.values(), key=lambda l: l["puntaje_total"], reverse=True)
+        for lugar in lugares_ordenados:
+            lugar["puntaje_total"] = round(lugar["puntaje_total"], 4)
+            lugar["rating_promedio_coincidencias"] = round(lugar.pop("suma_rating") / lugar["coincidencias"], 2)
+
+        return {
+            "terminos": buscados,
+            "total_documentos": total,
+            "total_coincidencias": len(mejores),
+            "resultados": resultados,
+            "por_lugar": lugares_ordenados,
+        }
+
+
+# Índice compartido del proceso
+indice_resenas = IndiceResenas()
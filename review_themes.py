@@ -0,0 +1,349 @@
+"""
+Extracción de temas sobre el corpus completo de reseñas en caché.
+A partir de los documentos del índice de reseñas (review_index.py) construye
+una matriz dispersa documento × n-grama (pares COO en arreglos NumPy) y
+calcula por lugar los temas más distintivos frente al resto del corpus
+regional, con log-odds con prior de Dirichlet o TF-IDF.
+
+Las estadísticas se guardan en cache/review_themes.npz y se actualizan de
+forma incremental: solo se tokenizan los documentos nuevos o modificados.
+"""
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+from cache_store import leer_json
+from review_index import INDICE_RESENAS_FILE, STOPWORDS, plegar, raiz
+
+
+TEMAS_FILE = Path("cache") / "review_themes.npz"
+
+# Cambiar al modificar la tokenización: un archivo de otra versión se reconstruye
+VERSION_CORPUS = 1
+NGRAMA_MAX = 2  # Unigramas y bigramas
+# Peso total del prior de Dirichlet en log-odds (proporcional a la frecuencia en el corpus)
+LOG_ODDS_ALPHA0 = 100.0
+METODOS_TEMAS = ["log_odds", "tfidf"]
+
+# Palabras funcionales que no forman temas por sí solas (además de las STOPWORDS del índice)
+STOPWORDS_TEMAS = STOPWORDS | frozenset("""
+fue fuimos era ser estar estuvo hace hizo hay habia tiene tienen muy mas menos bien asi solo todos todas
+cada nada algo vez veces ir vamos quieres puedes puede pueden hacer ver
+so very were they there have had has my all can will one if from an as or by your he she his her them
+their us me just but not no also would could when what which who out about get got
+""".split())
+
+# Los n-gramas no cruzan signos de puntuación
+_SEGMENTO = re.compile(r"[.,;:!?¡¿()\[\]\n\"]+")
+_PALABRA = re.compile(r"[a-z0-9]+")
+
+
+def ngramas(texto: str) -> Dict[str, str]:
+    """
+    N-gramas de raíces de una reseña, con la forma en que aparecen en el texto.
+    Se omiten stopwords, números y palabras de una letra.
+
+    Returns:
+        {"fri noch": "frío noche", ...}
+    """
+    plegado = plegar(texto)
+    encontrados: Dict[str, str] = {}
+    inicio_segmento = 0
+    for corte in [*(m.start() for m in _SEGMENTO.finditer(plegado)), len(plegado)]:
+        palabras = [
+            (raiz(m.group()), texto[inicio_segmento + m.start():inicio_segmento + m.end()].lower())
+            for m in _PALABRA.finditer(plegado[inicio_segmento:corte])
+            if len(m.group()) > 1 and not m.group().isdigit() and m.group() not in STOPWORDS_TEMAS
+        ]
+        for n in range(1, NGRAMA_MAX + 1):
+            for i in range(len(palabras) - n + 1):
+                grupo = palabras[i:i + n]
+                encontrados.setdefault(" ".join(p[0] for p in grupo), " ".join(p[1] for p in grupo))
+        inicio_segmento = corte
+    return encontrados
+
+
+def documentos_del_corpus(indice: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Una versión por reseña: las traducciones del índice se descartan,
+    prefiriendo el texto en español.
+    """
+    elegidos: Dict[Tuple[str, str], Tuple[str, Dict[str, Any]]] = {}
+    for doc_id, doc in indice.items():
+        clave = (doc["place_id"], doc["clave_resena"])
+        actual = elegidos.get(clave)
+        if actual is None or (doc["idioma"] == "es" and actual[1]["idioma"] != "es"):
+            elegidos[clave] = (doc_id, doc)
+    return {doc_id: doc for doc_id, doc in elegidos.values()}
+
+
+class CorpusTemas:
+    """Matriz documento × n-grama del corpus de reseñas, con agregados por lugar."""
+
+    def __init__(self, archivo: Path = TEMAS_FILE, indice: Path = INDICE_RESENAS_FILE):
+        self.archivo = archivo
+        self.indice = indice
+        self._origen = None
+        self._lock = threading.Lock()
+        self._vaciar()
+        self._cargar()
+
+    def _vaciar(self) -> None:
+        self.vocabulario: Dict[str, int] = {}
+        self.etiquetas: List[str] = []
+        self.lugares: Dict[str, int] = {}
+        self.nombres: List[str] = []
+        # Documentos: id, versión y lugar (-1 = eliminado)
+        self.doc_ids: List[Optional[str]] = []
+        self.doc_version: List[str] = []
+        self.doc_lugar = np.empty(0, dtype=np.int32)
+        self.posicion: Dict[str, int] = {}
+        # Pares (documento, n-grama) presentes: matriz binaria en formato COO
+        self.coo_doc = np.empty(0, dtype=np.int32)
+        self.coo_termino = np.empty(0, dtype=np.int32)
+        self._agregados = None
+
+    def _cargar(self) -> None:
+        if not self.archivo.exists():
+            return
+        try:
+            with np.load(self.archivo) as datos:
+                if int(datos["version"]) != VERSION_CORPUS:
+                    print(f"✓ {self.archivo} es de otra versión del corpus, se reconstruirá")
+                    return
+                self.etiquetas = datos["etiquetas"].tolist()
+                self.vocabulario = {clave: i for i, clave in enumerate(datos["vocabulario"].tolist())}
+                self.nombres = datos["nombres"].tolist()
+                self.lugares = {place_id: i for i, place_id in enumerate(datos["lugares"].tolist())}
+                self.doc_ids = datos["doc_ids"].tolist()
+                self.doc_version = datos["doc_version"].tolist()
+                self.doc_lugar = datos["doc_lugar"]
+                self.coo_doc = datos["coo_doc"]
+                self.coo_termino = datos["coo_termino"]
+            self.posicion = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        except (IOError, KeyError, ValueError) as e:
+            print(f"WARNING: No se pudo leer {self.archivo}, se reconstruirá: {e}")
+            self._vaciar()
+
+    def _guardar(self) -> None:
+        """Compacta los documentos eliminados y escribe el archivo de forma atómica."""
+        activos = self.doc_lugar >= 0
+        nuevo_indice = np.cumsum(activos) - 1
+        mascara = activos[self.coo_doc]
+        self.coo_doc = nuevo_indice[self.coo_doc[mascara]].astype(np.int32)
+        self.coo_termino = self.coo_termino[mascara]
+        self.doc_ids = [d for d, activo in zip(self.doc_ids, activos) if activo]
+        self.doc_version = [v for v, activo in zip(self.doc_version, activos) if activo]
+        self.doc_lugar = self.doc_lugar[activos]
+        self.posicion = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+
+        self.archivo.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.archivo.parent, prefix=f".{self.archivo.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    version=np.array(VERSION_CORPUS),
+                    vocabulario=np.array(list(self.vocabulario), dtype=str),
+                    etiquetas=np.array(self.etiquetas, dtype=str),
+                    lugares=np.array(list(self.lugares), dtype=str),
+                    nombres=np.array(self.nombres, dtype=str),
+                    doc_ids=np.array(self.doc_ids, dtype=str),
+                    doc_version=np.array(self.doc_version, dtype=str),
+                    doc_lugar=self.doc_lugar,
+                    coo_doc=self.coo_doc,
+                    coo_termino=self.coo_termino,
+                )
+            os.replace(tmp_name, self.archivo)
+        finally:
+            if os.path.exists(tmp_name):
+                os.remove(tmp_name)
+
+    def _sincronizar(self) -> None:
+        """Incorpora los documentos nuevos o modificados del índice de reseñas y retira los eliminados."""
+        indice = leer_json(self.indice)
+        if indice is self._origen:
+            return
+        objetivo = documentos_del_corpus(indice)
+
+        retirados = [
+            i for doc_id, i in self.posicion.items()
+            if self.doc_lugar[i] >= 0 and (doc_id not in objetivo or objetivo[doc_id]["indexado"] != self.doc_version[i])
+        ]
+        nuevos = [
+            (doc_id, doc) for doc_id, doc in objetivo.items()
+            if doc_id not in self.posicion or self.doc_lugar[self.posicion[doc_id]] < 0
+            or self.doc_version[self.posicion[doc_id]] != doc["indexado"]
+        ]
+
+        if retirados:
+            self.doc_lugar[retirados] = -1
+            mascara = ~np.isin(self.coo_doc, retirados)
+            self.coo_doc, self.coo_termino = self.coo_doc[mascara], self.coo_termino[mascara]
+
+        if nuevos:
+            docs_coo, terminos_coo, lugares_doc = [], [], []
+            for doc_id, doc in nuevos:
+                posicion = len(self.doc_ids)
+                self.doc_ids.append(doc_id)
+                self.doc_version.append(doc["indexado"])
+                self.posicion[doc_id] = posicion
+                lugar = self.lugares.setdefault(doc["place_id"], len(self.lugares))
+                if lugar == len(self.nombres):
+                    self.nombres.append(doc["nombre"])
+                elif doc["nombre"]:
+                    self.nombres[lugar] = doc["nombre"]
+                lugares_doc.append(lugar)
+                for clave, etiqueta in ngramas(doc["texto"]).items():
+                    termino = self.vocabulario.setdefault(clave, len(self.vocabulario))
+                    if termino == len(self.etiquetas):
+                        self.etiquetas.append(etiqueta)
+                    docs_coo.append(posicion)
+                    terminos_coo.append(termino)
+            self.doc_lugar = np.concatenate([self.doc_lugar, np.array(lugares_doc, dtype=np.int32)])
+            self.coo_doc = np.concatenate([self.coo_doc, np.array(docs_coo, dtype=np.int32)])
+            self.coo_termino = np.concatenate([self.coo_termino, np.array(terminos_coo, dtype=np.int32)])
+
+        self._origen = indice
+        if retirados or nuevos:
+            self._agregados = None
+            try:
+                self._guardar()
+            except IOError as e:
+                print(f"WARNING: No se pudo guardar {self.archivo}: {e}")
+            print(f"✓ Corpus de temas actualizado: {len(nuevos)} reseñas nuevas, {len(retirados)} retiradas")
+
+    def _agregar(self) -> Dict[str, np.ndarray]:
+        """Conteo de reseñas por (lugar, n-grama), ordenado por lugar, y totales del corpus."""
+        if self._agregados is None:
+            total_terminos = len(self.vocabulario)
+            lugar = self.doc_lugar[self.coo_doc].astype(np.int64)
+            claves, cuentas = np.unique(lugar * total_terminos + self.coo_termino, return_counts=True)
+            lugar_de_clave = claves // total_terminos
+            activos = self.doc_lugar[self.doc_lugar >= 0]
+            self._agregados = {
+                "termino": (claves % total_terminos).astype(np.int32),
+                "cuenta": cuentas,
+                "inicio": np.searchsorted(lugar_de_clave, np.arange(len(self.lugares) + 1)),
+                "total_por_termino": np.bincount(self.coo_termino, minlength=total_terminos),
+                "resenas_por_lugar": np.bincount(activos, minlength=len(self.lugares)),
+            }
+        return self._agregados
+
+    def _conteos_lugar(self, agregados: Dict[str, np.ndarray], lugar: int) -> Tuple[np.ndarray, np.ndarray]:
+        inicio, fin = agregados["inicio"][lugar], agregados["inicio"][lugar + 1]
+        return agregados["termino"][inicio:fin], agregados["cuenta"][inicio:fin]
+
+    def temas(self, place_id: str, comparar_con: Optional[List[str]] = None, metodo: str = "log_odds",
+              max_temas: int = 10, min_menciones: int = 2) -> Optional[Dict[str, Any]]:
+        """
+        Temas más distintivos de un lugar frente a los demás lugares del corpus
+        (o frente a 'comparar_con'). Retorna None si el lugar no tiene reseñas en el corpus.
+        """
+        if metodo not in METODOS_TEMAS:
+            raise ValueError(f"metodo debe ser uno de {METODOS_TEMAS}")
+
+        with self._lock:
+            self._sincronizar()
+            lugar = self.lugares.get(place_id)
+            if lugar is None:
+                return None
+            agregados = self._agregar()
+            resenas_lugar = int(agregados["resenas_por_lugar"][lugar])
+            if resenas_lugar == 0:
+                return None
+            terminos, cuentas = self._conteos_lugar(agregados, lugar)
+
+            # Conteos del fondo regional, densos sobre el vocabulario
+            if comparar_con:
+                otros = [self.lugares[p] for p in set(comparar_con) if p in self.lugares and p != place_id]
+                fondo = np.zeros(len(self.vocabulario), dtype=np.int64)
+                for otro in otros:
+                    t, c = self._conteos_lugar(agregados, otro)
+                    fondo[t] += c
+                resenas_fondo = int(agregados["resenas_por_lugar"][otros].sum()) if otros else 0
+                lugares_fondo = len(otros)
+            else:
+                fondo = agregados["total_por_termino"].astype(np.int64)
+                fondo[terminos] -= cuentas
+                resenas_fondo = int(agregados["resenas_por_lugar"].sum()) - resenas_lugar
+                lugares_fondo = int((agregados["resenas_por_lugar"] > 0).sum()) - 1
+
+            seleccion = cuentas >= min_menciones
+            terminos, y_lugar = terminos[seleccion], cuentas[seleccion].astype(np.float64)
+            y_fondo = fondo[terminos].astype(np.float64)
+
+            if metodo == "log_odds":
+                # Log-odds con prior de Dirichlet informativo (Monroe et al., 2008), z-score
+                n_lugar, n_fondo = float(cuentas.sum()), float(fondo.sum())
+                alfa = LOG_ODDS_ALPHA0 * (y_lugar + y_fondo) / max(n_lugar + n_fondo, 1.0)
+                delta = (np.log((y_lugar + alfa) / (n_lugar + LOG_ODDS_ALPHA0 - y_lugar - alfa))
+                         - np.log((y_fondo + alfa) / (n_fondo + LOG_ODDS_ALPHA0 - y_fondo - alfa)))
+                puntajes = delta / np.sqrt(1 / (y_lugar + alfa) + 1 / (y_fondo + alfa))
+            else:
+                total_resenas = resenas_lugar + resenas_fondo
+                puntajes = (y_lugar / resenas_lugar) * np.log((1 + total_resenas) / (1 + y_lugar + y_fondo))
+
+            orden = [i for i in np.argsort(-puntajes, kind="stable") if puntajes[i] > 0]
+            # Un n-grama contenido en otro más largo con las mismas menciones se omite
+            # ("pena" cuando aparece siempre como "vale pena")
+            compuestos = [
+                (set(self.etiquetas[terminos[i]].split()), y_lugar[i])
+                for i in orden if " " in self.etiquetas[terminos[i]]
+            ]
+            temas = []
+            for i in orden:
+                if len(temas) >= max_temas:
+                    break
+                etiqueta = self.etiquetas[terminos[i]]
+                palabras = set(etiqueta.split())
+                if any(palabras < p and y_lugar[i] <= m for p, m in compuestos):
+                    continue
+                temas.append({
+                    "tema": etiqueta,
+                    "menciones": int(y_lugar[i]),
+                    "puntaje": round(float(puntajes[i]), 4),
+                    "frecuencia_lugar": round(float(y_lugar[i]) / resenas_lugar, 4),
+                    "frecuencia_region": round(float(y_fondo[i]) / resenas_fondo, 4) if resenas_fondo else 0.0,
+                })
+
+            return {
+                "place_id": place_id,
+                "nombre": self.nombres[lugar],
+                "metodo": metodo,
+                "total_resenas": resenas_lugar,
+                "total_resenas_region": resenas_fondo,
+                "lugares_region": lugares_fondo,
+                "vocabulario": len(self.vocabulario),
+                "temas": temas,
+            }
+
+
+# Corpus compartido del proceso (se carga al primer uso)
+_corpus: Optional[CorpusTemas] = None
+_corpus_lock = threading.Lock()
+
+
+def obtener_corpus() -> CorpusTemas:
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            _corpus = CorpusTemas()
+        return _corpus
+
+
+def corpus_en_memoria() -> Optional[CorpusTemas]:
+    """El corpus cargado en este proceso, o None si no se ha cargado (o se liberó)."""
+    return _corpus
+
+
+def liberar_corpus() -> None:
+    """Descarta el corpus en memoria; se vuelve a cargar desde disco al pedirlo."""
+    global _corpus
+    with _corpus_lock:
+        _corpus = None
@@ -3,15 +3,54 @@ MCP Server para análisis turístico con Google Places API
 Herramientas para mapeo de competencia y análisis de opiniones
 """
 import os
-import json
+import time
 import hashlib
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-import googlemaps
+import numpy as np
 from fastmcp import FastMCP
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Callable
 from dotenv import load_dotenv
-from google_places_client import GooglePlacesClient, obtener_detalles_completos_de_lugar
+from google_places_client import (
+    GooglePlacesClient, PresupuestoAgotadoError, obtener_detalles_completos_de_lugar,
+    parametros_detalles, parametros_geocode, metadatos_cache
+)
+from cache_hierarchy import jerarquia_cache, CACHE_EXPIRY_HOURS
+from tool_context import ContextoHerramientaMiddleware, herramienta_actual
+from deadlines import PlazoMiddleware, PlazoAgotadoError
+import profiling
+import memory_tracking
+import response_encoding
+import offline_mode
+from starlette.middleware import Middleware as ASGIMiddleware
+from cost_ledger import (
+    presupuesto_disponible, sku_para_campos, planificar_field_mask, resumen_costos
+)
+from cache_store import (
+    leer_json, guardar_entrada, registrar_acceso, accesos_pendientes, volcar_accesos,
+    intentar_bloqueo_exclusivo, copias_en_memoria, olvidar_memoria
+)
+from cache_maintenance import compactar_todo, iniciar_compactacion_periodica
+from refresh_scheduler import ProgramadorActualizaciones, clave_seguimiento
+from cached_places import (
+    lugares_en_cache, iter_registros_en_cache, registro_desde_v1, iter_resenas_en_cache, detalles_a_formato_legacy
+)
+from rating_history import tendencias, importar_desde_cache
+from review_index import indice_resenas, indexar_lugares
+from review_themes import obtener_corpus, corpus_en_memoria, liberar_corpus, METODOS_TEMAS
+from task_graph import GrafoDeEtapas
+from cache_export import exportar
+from negative_cache import cache_negativo, es_no_reintentable
+from regional_aggregates import vistas_regionales, TODAS
+from place_model import Place, clasificar, clasificar_dicts, clasificacion_a_dicts
+from photo_store import (
+    VARIANTES_FOTO, PresupuestoBytes, buscar_variante, descargar_variante,
+    fotos_de_lugar_en_indice, guardar_fotos_de_lugar
+)
+from geo_analysis import grilla_de_densidad, haversine_km, ArbolKD, dbscan
 
 # Cargar variables de entorno desde .env
 load_dotenv()
@@ -23,34 +62,55 @@ mcp = FastMCP(
         "Servidor para el 'Agente Explorador'. Provee herramientas de "
         "inteligencia turística para el análisis de mercado, competencia "
         "y cadena de valor, siguiendo las buenas prácticas de SERNATUR."
-    )
+    ),
+    tool_serializer=response_encoding.serializar_respuesta
 )
+mcp.add_middleware(ContextoHerramientaMiddleware())
+mcp.add_middleware(profiling.ProfilingMiddleware())
+mcp.add_middleware(memory_tracking.MemoriaMiddleware())
+mcp.add_middleware(PlazoMiddleware())  # Último: la herramienta corre en su propio hilo con plazo
 
-# Configuración de caché
+# Configuración de caché. Las respuestas de Google (geocodificación, búsquedas y
+# detalles) viven en la jerarquía de caché del cliente (cache_hierarchy.py, con
+# vigencia CACHE_EXPIRY_HOURS); aquí quedan solo los resultados procesados de las
+# herramientas. geocode_cache.json, places_raw_cache.json y reviews_raw_cache.json
+# ya no se escriben: se leen como archivos heredados.
 CACHE_DIR = Path("cache")
 CACHE_DIR.mkdir(exist_ok=True)
-GEOCODE_CACHE_FILE = CACHE_DIR / "geocode_cache.json"
 PLACES_CACHE_FILE = CACHE_DIR / "places_cache.json"
 REVIEWS_CACHE_FILE = CACHE_DIR / "reviews_cache.json"
-PLACES_RAW_CACHE_FILE = CACHE_DIR / "places_raw_cache.json"
-REVIEWS_RAW_CACHE_FILE = CACHE_DIR / "reviews_raw_cache.json"
-CACHE_EXPIRY_HOURS = 24  # Los datos del caché expiran en 24 horas
+REVIEWS_MAX_WORKERS = 4  # Llamadas simultáneas al pedir reseñas en varios idiomas
+CACHE_COMPACTION_INTERVAL_MIN = float(os.getenv("CACHE_COMPACTION_INTERVAL_MIN", "60"))  # 0 desactiva
+REFRESH_INTERVAL_MIN = float(os.getenv("REFRESH_INTERVAL_MIN", "5"))  # 0 desactiva la actualización programada
+ACCESOS_VOLCADO_MIN = float(os.getenv("ACCESOS_VOLCADO_MIN", "5"))  # Volcado de accesos y reintento del mantenimiento; 0 desactiva
+REFRESH_MAX_POR_HORA = float(os.getenv("REFRESH_MAX_POR_HORA", "20"))  # Refrescos en segundo plano por hora
+REFRESH_IMPORTANCIA_AUTO = float(os.getenv("REFRESH_IMPORTANCIA_AUTO", "0.5"))  # 0 desactiva el seguimiento automático
+MCP_HOST = os.getenv("MCP_HOST", "0.0.0.0")
+MCP_PORT = int(os.getenv("MCP_PORT", "8000"))
+
+# Cachés en memoria medidos por memoria_proceso; con MEMORIA_PRESUPUESTO_MB se
+# liberan en este orden (menor prioridad primero) y se recargan desde disco
+memory_tracking.registrar_cache("jerarquia_memoria", jerarquia_cache.entradas_en_memoria,
+                                jerarquia_cache.olvidar_memoria, prioridad=1)
+memory_tracking.registrar_cache("corpus_temas", corpus_en_memoria, liberar_corpus, prioridad=2,
+                                contar=lambda corpus: len(corpus.doc_ids))
+memory_tracking.registrar_cache("indice_resenas", lambda: indice_resenas if indice_resenas.docs else None,
+                                indice_resenas.liberar, prioridad=3, contar=lambda indice: len(indice.docs))
+memory_tracking.registrar_cache("json_en_memoria", copias_en_memoria, olvidar_memoria,
+                                prioridad=4, desglose=True)
 
 def load_cache(cache_file: Path) -> Dict[str, Any]:
-    """Carga el caché desde un archivo JSON"""
-    if cache_file.exists():
-        try:
-            with open(cache_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {}
-    return {}
+    """
+    Carga el caché desde un archivo JSON.
+    Reutiliza la copia en memoria mientras el archivo no cambie en disco;
+    el resultado es compartido y debe tratarse como solo lectura.
+    """
+    return leer_json(cache_file)
 
-def save_cache(cache_file: Path, cache_data: Dict[str, Any]) -> None:
-    """Guarda el caché en un archivo JSON"""
+def save_cache_entry(cache_file: Path, key: str, entry: Dict[str, Any]) -> None:
+    """Guarda una sola entrada del caché sin pisar las escritas por otros workers"""
     try:
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, indent=2, ensure_ascii=False)
+        guardar_entrada(cache_file, key, entry)
     except IOError as e:
         print(f"Warning: No se pudo guardar el caché: {e}")
 
@@ -62,36 +122,68 @@ def is_cache_valid(timestamp: str) -> bool:
     except (ValueError, TypeError):
         return False
 
+def get_stale_from_cache(cache_file: Path, key: str) -> Dict[str, Any]:
+    """
+    Obtiene una entrada del caché aunque esté vencida.
+    Se usa cuando no se puede consultar la API (p. ej. presupuesto diario agotado).
+    """
+    cached_data = load_cache(cache_file).get(key)
+    if not cached_data:
+        return {}
+    # Servirla cuenta como uso: la compactación no purga lo que sigue en uso
+    registrar_acceso(cache_file, key)
+    print(f"✓ Usando entrada vencida del caché ({cache_file.name}) para: {key}")
+    return cached_data.get("data", {})
+
+# Códigos de error del cliente con los que una herramienta solo puede responder desde caché
+ERRORES_SOLO_CACHE = {
+    "PRESUPUESTO_AGOTADO": PresupuestoAgotadoError,
+    "PLAZO_AGOTADO": PlazoAgotadoError,
+    "MODO_OFFLINE": offline_mode.ModoOfflineError,
+}
+SIN_API = tuple(ERRORES_SOLO_CACHE.values())
+
+def error_de_cliente(resultado: Dict[str, Any]) -> Exception:
+    """Excepción para un resultado con error del cliente: la de ERRORES_SOLO_CACHE según su código o RuntimeError"""
+    return ERRORES_SOLO_CACHE.get(resultado.get("error_code"), RuntimeError)(resultado["error"])
+
+def respuesta_sin_api(error: Exception, cache_file: Path, key: str, placeholder: Callable[[], Dict[str, Any]],
+                      offline: Callable[[], Dict[str, Any]], vigente: Dict[str, Any] = None) -> Dict[str, Any]:
+    """
+    Respuesta de una herramienta que no pudo consultar la API (una excepción de
+    SIN_API). En modo offline, la búsqueda local de la herramienta; si no, el
+    resultado vigente, el vencido del caché o el placeholder, marcado con el motivo.
+    """
+    if isinstance(error, offline_mode.ModoOfflineError):
+        return offline()
+    print(f"WARNING: {error}, sirviendo solo desde caché")
+    if vigente:
+        return vigente
+    stale_result = get_stale_from_cache(cache_file, key)
+    resultado = dict(stale_result) if stale_result else placeholder()
+    if isinstance(error, PlazoAgotadoError):
+        resultado["plazo_agotado"] = {"motivo": error.motivo, "error": str(error)}
+    else:
+        resultado["presupuesto_agotado"] = True
+    return resultado
+
 def get_cache_key(query: str, ubicacion: str, radio_km: int) -> str:
     """Genera una clave única para el caché basada en los parámetros de búsqueda"""
     key_string = f"{query.lower()}_{ubicacion.lower()}_{radio_km}"
     return hashlib.md5(key_string.encode()).hexdigest()
 
-def get_geocode_from_cache(ubicacion: str) -> Dict[str, Any]:
-    """Obtiene resultado de geocodificación desde el caché"""
-    cache = load_cache(GEOCODE_CACHE_FILE)
-    ubicacion_key = ubicacion.lower()
-    
-    if ubicacion_key in cache:
-        cached_data = cache[ubicacion_key]
-        if is_cache_valid(cached_data.get("timestamp", "")):
-            print(f"✓ Usando geocodificación de caché para: {ubicacion}")
-            return cached_data.get("data", {})
-    
-    return {}
-
-def save_geocode_to_cache(ubicacion: str, geocode_result: Dict[str, Any]) -> None:
-    """Guarda resultado de geocodificación en el caché"""
-    cache = load_cache(GEOCODE_CACHE_FILE)
-    ubicacion_key = ubicacion.lower()
-    
-    cache[ubicacion_key] = {
-        "data": geocode_result,
-        "timestamp": datetime.now().isoformat()
-    }
-    
-    save_cache(GEOCODE_CACHE_FILE, cache)
-    print(f"✓ Geocodificación guardada en caché para: {ubicacion}")
+def get_geocode_from_cache(ubicacion: str, permitir_vencido: bool = False) -> Dict[str, Any]:
+    """
+    Obtiene las coordenadas {'lat', 'lng'} de una ubicación desde la jerarquía
+    de caché (memoria, almacén local o geocode_cache.json heredado), sin red.
+    Con permitir_vencido se aceptan entradas vencidas.
+    """
+    entrada = jerarquia_cache.leer("geocoding.geocode", parametros_geocode(ubicacion), permitir_vencido)
+    resultados = entrada["data"].get("results", []) if entrada else []
+    if not resultados:
+        return {}
+    print(f"✓ Usando geocodificación de caché para: {ubicacion}")
+    return resultados[0]["geometry"]["location"]
 
 def get_places_from_cache(query: str, ubicacion: str, radio_km: int) -> Dict[str, Any]:
     """Obtiene resultado de búsqueda de lugares desde el caché"""
@@ -101,6 +193,7 @@ def get_places_from_cache(query: str, ubicacion: str, radio_km: int) -> Dict[str
     if cache_key in cache:
         cached_data = cache[cache_key]
         if is_cache_valid(cached_data.get("timestamp", "")):
+            registrar_acceso(PLACES_CACHE_FILE, cache_key)
             print(f"✓ Usando búsqueda de lugares de caché para: {query} en {ubicacion}")
             return cached_data.get("data", {})
     
@@ -108,100 +201,144 @@ def get_places_from_cache(query: str, ubicacion: str, radio_km: int) -> Dict[str
 
 def save_places_to_cache(query: str, ubicacion: str, radio_km: int, places_result: Dict[str, Any]) -> None:
     """Guarda resultado de búsqueda de lugares en el caché"""
-    cache = load_cache(PLACES_CACHE_FILE)
     cache_key = get_cache_key(query, ubicacion, radio_km)
     
-    cache[cache_key] = {
+    save_cache_entry(PLACES_CACHE_FILE, cache_key, {
         "data": places_result,
         "timestamp": datetime.now().isoformat(),
         "query": query,
         "ubicacion": ubicacion,
         "radio_km": radio_km
-    }
-    
-    save_cache(PLACES_CACHE_FILE, cache)
+    })
     print(f"✓ Búsqueda de lugares guardada en caché para: {query} en {ubicacion}")
+    try:
+        vistas_regionales.registrar_mapeo(query, ubicacion, places_result.get("clasificacion", {}))
+    except IOError as e:
+        print(f"WARNING: No se pudieron actualizar los agregados regionales: {e}")
+
+def get_reviews_cache_key(place_id: str, idiomas: List[str] = None) -> str:
+    """
+    Clave de caché de reseñas por lugar e idioma(s).
+    Las reseñas RAW se guardan por (place_id, idioma) y los análisis por
+    (place_id, conjunto de idiomas analizados).
+    """
+    if not idiomas:
+        return place_id
+    return f"{place_id}|{'+'.join(sorted(set(idiomas)))}"
 
-def get_reviews_from_cache(place_id: str) -> Dict[str, Any]:
+def get_reviews_from_cache(place_id: str, idiomas: List[str] = None) -> Dict[str, Any]:
     """Obtiene análisis de reseñas desde el caché"""
     cache = load_cache(REVIEWS_CACHE_FILE)
+    cache_key = get_reviews_cache_key(place_id, idiomas)
     
-    if place_id in cache:
-        cached_data = cache[place_id]
+    if cache_key in cache:
+        cached_data = cache[cache_key]
         if is_cache_valid(cached_data.get("timestamp", "")):
-            print(f"✓ Usando análisis de reseñas de caché para: {place_id}")
+            registrar_acceso(REVIEWS_CACHE_FILE, cache_key)
+            print(f"✓ Usando análisis de reseñas de caché para: {cache_key}")
             return cached_data.get("data", {})
     
     return {}
 
-def save_reviews_to_cache(place_id: str, reviews_result: Dict[str, Any]) -> None:
+def save_reviews_to_cache(place_id: str, reviews_result: Dict[str, Any], idiomas: List[str] = None) -> None:
     """Guarda análisis de reseñas en el caché"""
-    cache = load_cache(REVIEWS_CACHE_FILE)
-    
-    cache[place_id] = {
+    cache_key = get_reviews_cache_key(place_id, idiomas)
+    save_cache_entry(REVIEWS_CACHE_FILE, cache_key, {
         "data": reviews_result,
         "timestamp": datetime.now().isoformat(),
-        "place_id": place_id
-    }
-    
-    save_cache(REVIEWS_CACHE_FILE, cache)
-    print(f"✓ Análisis de reseñas guardado en caché para: {place_id}")
+        "place_id": place_id,
+        "idiomas": sorted(set(idiomas)) if idiomas else None
+    })
+    print(f"✓ Análisis de reseñas guardado en caché para: {cache_key}")
+    try:
+        vistas_regionales.registrar_resenas(place_id, reviews_result)
+    except IOError as e:
+        print(f"WARNING: No se pudieron actualizar los agregados regionales: {e}")
 
-def get_places_raw_from_cache(query: str, ubicacion: str, radio_km: int) -> Dict[str, Any]:
-    """Obtiene datos RAW de Google Places desde el caché"""
-    cache = load_cache(PLACES_RAW_CACHE_FILE)
-    cache_key = get_cache_key(query, ubicacion, radio_km)
-    
-    if cache_key in cache:
-        cached_data = cache[cache_key]
-        if is_cache_valid(cached_data.get("timestamp", "")):
-            print(f"✓ Usando datos RAW de lugares de caché para: {query} en {ubicacion}")
-            return cached_data.get("data", {})
-    
-    return {}
+# Actualización programada: búsquedas y análisis de reseñas seguidos
+programador = ProgramadorActualizaciones(CACHE_EXPIRY_HOURS, REFRESH_MAX_POR_HORA)
 
-def save_places_raw_to_cache(query: str, ubicacion: str, radio_km: int, raw_data: Dict[str, Any]) -> None:
-    """Guarda datos RAW de Google Places en el caché"""
-    cache = load_cache(PLACES_RAW_CACHE_FILE)
-    cache_key = get_cache_key(query, ubicacion, radio_km)
-    
-    cache[cache_key] = {
-        "data": raw_data,
-        "timestamp": datetime.now().isoformat(),
-        "query": query,
-        "ubicacion": ubicacion,
-        "radio_km": radio_km,
-        "api_source": "google_places_api"
-    }
-    
-    save_cache(PLACES_RAW_CACHE_FILE, cache)
-    print(f"✓ Datos RAW de lugares guardados en caché para: {query} en {ubicacion}")
+def _estado_en_cache(cache_file: Path, cache_key: str):
+    """(timestamp, accesos, último acceso) de una entrada de caché para la prioridad de refresco"""
+    entrada = load_cache(cache_file).get(cache_key, {})
+    ultimo_pendiente, accesos_proceso = accesos_pendientes(cache_file, cache_key)
+    ultimo_acceso = max(entrada.get("ultimo_acceso", ""), ultimo_pendiente)
+    return entrada.get("timestamp"), entrada.get("accesos", 0) + accesos_proceso, ultimo_acceso
 
-def get_reviews_raw_from_cache(place_id: str) -> Dict[str, Any]:
-    """Obtiene datos RAW de Google Places Details desde el caché"""
-    cache = load_cache(REVIEWS_RAW_CACHE_FILE)
-    
-    if place_id in cache:
-        cached_data = cache[place_id]
-        if is_cache_valid(cached_data.get("timestamp", "")):
-            print(f"✓ Usando datos RAW de reseñas de caché para: {place_id}")
-            return cached_data.get("data", {})
-    
-    return {}
+programador.registrar_tipo(
+    "busqueda",
+    lambda p: _estado_en_cache(PLACES_CACHE_FILE, get_cache_key(p["query"], p["ubicacion"], p["radio_km"])),
+    lambda p: mapeo_competencia_y_colaboradores.fn(p["query"], p["ubicacion"], p["radio_km"], forzar_actualizacion=True)
+)
+programador.registrar_tipo(
+    "resenas",
+    lambda p: _estado_en_cache(REVIEWS_CACHE_FILE, get_reviews_cache_key(p["place_id"], p["idiomas"])),
+    lambda p: analizador_de_opiniones.fn(p["place_id"], idiomas=p["idiomas"], forzar_actualizacion=True)
+)
 
-def save_reviews_raw_to_cache(place_id: str, raw_data: Dict[str, Any]) -> None:
-    """Guarda datos RAW de Google Places Details en el caché"""
-    cache = load_cache(REVIEWS_RAW_CACHE_FILE)
-    
-    cache[place_id] = {
-        "data": raw_data,
-        "timestamp": datetime.now().isoformat(),
-        "place_id": place_id,
-        "api_source": "google_places_details_api"
-    }
-    
-    save_cache(REVIEWS_RAW_CACHE_FILE, cache)
-    print(f"✓ Datos RAW de reseñas guardados en caché para: {place_id}")
+def seguir_automaticamente(tipo: str, params: Dict[str, Any]) -> None:
+    """Registra una consulta interactiva en el programador (no interrumpe la herramienta si falla)"""
+    if (REFRESH_IMPORTANCIA_AUTO <= 0 or herramienta_actual.get() == "actualizacion_programada"
+            or offline_mode.activo()):
+        return
+    try:
+        programador.seguir(tipo, params, importancia=REFRESH_IMPORTANCIA_AUTO, auto=True)
+    except IOError as e:
+        print(f"WARNING: No se pudo seguir {tipo} para actualización programada: {e}")
+
+def clave_api_en_linea() -> str:
+    """GOOGLE_API_KEY, o None con el modo offline activo (la herramienta responde solo desde caché)"""
+    return None if offline_mode.activo() else os.getenv("GOOGLE_API_KEY")
+
+_places_client: GooglePlacesClient = None
+_places_client_lock = threading.Lock()
+
+def obtener_places_client(api_key: str) -> GooglePlacesClient:
+    """
+    Cliente v1 compartido por las herramientas del proceso.
+    Reutiliza el pool de conexiones HTTP y la jerarquía de caché entre llamadas e hilos.
+    """
+    global _places_client
+    with _places_client_lock:
+        if _places_client is None or _places_client.api_key != api_key:
+            _places_client = GooglePlacesClient(api_key=api_key)
+        return _places_client
+
+def geocodificar(ubicacion: str, places_client: GooglePlacesClient) -> Dict[str, Any]:
+    """
+    Obtiene las coordenadas {'lat', 'lng'} de una ubicación, primero desde la
+    jerarquía de caché y si no desde la API de geocodificación. Retorna {} si
+    no se encuentra.
+    
+    Raises:
+        PresupuestoAgotadoError: Si el presupuesto diario está agotado y no hay caché
+        PlazoAgotadoError: Si se agotó el plazo de la llamada y no hay caché
+        ModoOfflineError: Si el modo offline se activó durante la llamada y no hay caché
+        RuntimeError: Si la API de geocodificación responde con error
+    """
+    cached_geocode = get_geocode_from_cache(ubicacion)
+    if cached_geocode:
+        return cached_geocode
+    
+    # Ubicaciones que hace poco no se encontraron (o fallaron sin remedio)
+    negativo = cache_negativo.consultar("geocode", ubicacion.lower())
+    if negativo:
+        if negativo["motivo"] == "error":
+            raise RuntimeError(negativo["error"])
+        return {}
+    
+    geocode_result = places_client.geocode(ubicacion)
+    if geocode_result["status"] == "error":
+        if es_no_reintentable(geocode_result.get("error_code")):
+            cache_negativo.registrar("geocode", ubicacion.lower(), "error",
+                                     geocode_result["error"], geocode_result.get("error_code"))
+        raise error_de_cliente(geocode_result)
+    
+    # La respuesta ya quedó en la jerarquía de caché del cliente
+    location = geocode_result["location"]  # {'lat': ..., 'lng': ...}
+    if not location:
+        cache_negativo.registrar("geocode", ubicacion.lower(), "sin_resultados")
+    return location
 
 
 # Datos placeholder para desarrollo inicial
@@ -288,38 +425,11 @@ PLACEHOLDER_REVIEWS = {
 
 def clasificar_lugares(places: List[Dict], query: str) -> Dict[str, List[Dict]]:
     """
-    Clasifica lugares en categorías para análisis de competencia
+    Clasifica lugares en categorías para análisis de competencia.
+    Para lugares que ya son dicts (placeholder y registros del caché); las
+    búsquedas a la API usan Place y place_model.clasificar.
     """
-    clasificados = {
-        "competencia_directa": [],
-        "competencia_indirecta": [],
-        "colaboradores_potenciales": []
-    }
-    
-    query_keywords = query.lower().split()
-    
-    for place in places:
-        types = place.get("types", [])
-        name_lower = place.get("name", "").lower()
-        
-        # Lógica de clasificación mejorada basada en tipos y nombres
-        if any(t in ["tourist_attraction", "travel_agency", "point_of_interest"] for t in types):
-            # Verificar si es competencia directa por keywords específicos
-            if any(keyword in name_lower for keyword in ["observatorio", "astronomic", "astro", "tour", "observatory"]) or \
-               any(q_word in name_lower for q_word in query_keywords):
-                place["category"] = "competencia_directa"
-                clasificados["competencia_directa"].append(place)
-            else:
-                place["category"] = "competencia_indirecta"
-                clasificados["competencia_indirecta"].append(place)
-        elif any(t in ["lodging", "hotel", "restaurant", "food", "bar", "store", "winery"] for t in types):
-            place["category"] = "colaboradores_potenciales"
-            clasificados["colaboradores_potenciales"].append(place)
-        else:
-            place["category"] = "competencia_indirecta"
-            clasificados["competencia_indirecta"].append(place)
-    
-    return clasificados
+    return clasificar_dicts(places, query)
 
 def mapeo_competencia_y_colaboradores_placeholder(query: str, ubicacion: str, radio_km: int) -> Dict[str, Any]:
     """
@@ -466,11 +576,178 @@ def analizador_de_opiniones_placeholder(place_id: str) -> Dict[str, Any]:
         "fuente": "datos_placeholder"
     }
 
+# Campos de Place que lee mapeo_competencia_y_colaboradores (location alimenta
+# los análisis geográficos sobre el caché)
+CAMPOS_MAPEO_V1 = ["id", "displayName", "formattedAddress", "rating", "types", "location"]
+
+def mapeo_sin_api(query: str, ubicacion: str, radio_km: int, error: Exception) -> Dict[str, Any]:
+    """Resultado del mapeo cuando no se puede consultar la API (ver respuesta_sin_api)"""
+    return respuesta_sin_api(
+        error, PLACES_CACHE_FILE, get_cache_key(query, ubicacion, radio_km),
+        placeholder=lambda: mapeo_competencia_y_colaboradores_placeholder(query, ubicacion, radio_km),
+        offline=lambda: mapeo_offline(query, ubicacion, radio_km)
+    )
+
+def mapeo_en_cache_negativo(query: str, ubicacion: str, radio_km: int) -> Dict[str, Any]:
+    """
+    Resultado placeholder marcado con la entrada negativa vigente de la ubicación
+    o la búsqueda, o {} si ninguna de las dos está en el caché negativo.
+    """
+    negativo = None
+    if not get_geocode_from_cache(ubicacion):
+        negativo = cache_negativo.consultar("geocode", ubicacion.lower())
+    negativo = negativo or cache_negativo.consultar("busqueda", get_cache_key(query, ubicacion, radio_km))
+    if not negativo:
+        return {}
+    resultado = mapeo_competencia_y_colaboradores_placeholder(query, ubicacion, radio_km)
+    resultado["cache_negativo"] = {campo: negativo[campo] for campo in ("motivo", "error", "error_code", "expira")}
+    return resultado
+
+def mapeo_offline(query: str, ubicacion: str, radio_km: int) -> Dict[str, Any]:
+    """
+    Mapeo en modo offline, sin red: la búsqueda guardada más parecida (aunque
+    esté vencida) o, si no hay, los lugares del caché dentro del radio de la
+    ubicación (geocodificación en caché). Las coincidencias con otra query se
+    vuelven a clasificar para la query pedida.
+    """
+    coincidencia = offline_mode.mejor_mapeo(load_cache(PLACES_CACHE_FILE), query, ubicacion, radio_km)
+    if coincidencia:
+        entrada, tipo = coincidencia
+        resultado = dict(entrada["data"])
+        if offline_mode.normalizar(entrada.get("query", "")) != offline_mode.normalizar(query):
+            lugares = [dict(place) for places in resultado.get("clasificacion", {}).values() for place in places]
+            resultado["clasificacion"] = clasificar_lugares(lugares, query)
+            resultado["resumen"] = {categoria: len(places) for categoria, places in resultado["clasificacion"].items()}
+        resultado.update(query=query, ubicacion=ubicacion, radio_km=radio_km)
+        resultado["modo_offline"] = offline_mode.marca(
+            tipo, "places_cache", entrada.get("timestamp"),
+            busqueda_usada={campo: entrada.get(campo) for campo in ("query", "ubicacion", "radio_km")}
+        )
+        print(f"✓ Modo offline: mapeo de '{query}' en '{ubicacion}' desde caché ({tipo})")
+        return resultado
+    
+    centro = get_geocode_from_cache(ubicacion, permitir_vencido=True)
+    if centro:
+        lugares = [p for p in lugares_en_cache(CACHE_DIR).values() if p["lat"] is not None and p["lng"] is not None]
+        distancias = haversine_km(centro["lat"], centro["lng"], [p["lat"] for p in lugares], [p["lng"] for p in lugares])
+        cercanos = [p for p, d in zip(lugares, np.atleast_1d(distancias).tolist()) if d <= radio_km]
+        if cercanos:
+            places_data = [
+                {
+                    "place_id": p["place_id"],
+                    "name": p["name"],
+                    "address": p["address"],
+                    "website": "No disponible",
+                    "rating": p["rating"] if p["rating"] is not None else "N/A",
+                    "types": p["types"],
+                    **({"user_ratings_total": p["user_ratings_total"]} if p["user_ratings_total"] is not None else {})
+                }
+                for p in cercanos
+            ]
+            clasificados = clasificar_lugares(places_data, query)
+            print(f"✓ Modo offline: {len(cercanos)} lugares del caché en {radio_km} km de '{ubicacion}'")
+            return {
+                "query": query,
+                "ubicacion": ubicacion,
+                "radio_km": radio_km,
+                "total_encontrados": len(places_data),
+                "clasificacion": clasificados,
+                "resumen": {categoria: len(places) for categoria, places in clasificados.items()},
+                "fuente": "cache_local",
+                "coordenadas_busqueda": {"lat": centro["lat"], "lng": centro["lng"]},
+                "modo_offline": offline_mode.marca(
+                    "lugares_en_radio", "lugares_en_cache", max((p["timestamp"] or "") for p in cercanos)
+                )
+            }
+    
+    print(f"WARNING: Modo offline: sin datos en caché para '{query}' en '{ubicacion}'")
+    return {
+        "query": query,
+        "ubicacion": ubicacion,
+        "radio_km": radio_km,
+        "error": "Modo offline activo y sin búsquedas ni lugares en caché para esta ubicación",
+        "error_code": "MODO_OFFLINE",
+        "fuente": "modo_offline"
+    }
+
+def buscar_lugares_mapeo(query: str, ubicacion: str, radio_km: int, location: Dict[str, float],
+                         places_client: GooglePlacesClient, campos: List[str],
+                         ignorar_cache_negativo: bool = False,
+                         forzar_actualizacion: bool = False) -> List[Place]:
+    """
+    Text Search v1 sesgada al círculo de búsqueda (la respuesta RAW queda en la
+    jerarquía de caché del cliente); retorna los lugares como Place (se
+    convierten a dict al armar la respuesta). Las búsquedas vacías y los
+    errores no reintentables quedan en el caché negativo.
+    
+    Raises:
+        PresupuestoAgotadoError: Si el presupuesto diario está agotado
+        PlazoAgotadoError: Si se agotó el plazo de la llamada y no hay caché
+        ModoOfflineError: Si el modo offline se activó durante la llamada y no hay caché
+        RuntimeError: Si la API responde con error
+    """
+    cache_key = get_cache_key(query, ubicacion, radio_km)
+    negativo = None if ignorar_cache_negativo else cache_negativo.consultar("busqueda", cache_key)
+    if negativo:
+        if negativo["motivo"] == "error":
+            raise RuntimeError(negativo["error"])
+        return []
+    
+    places_result = places_client.search_places_text(
+        query,
+        location_bias={
+            "circle": {
+                "center": {"latitude": location["lat"], "longitude": location["lng"]},
+                "radius": min(radio_km * 1000, 50000)  # La API usa metros (máximo 50 km)
+            }
+        },
+        fields=campos,
+        forzar_actualizacion=forzar_actualizacion
+    )
+    if places_result["status"] == "error":
+        if es_no_reintentable(places_result.get("error_code")):
+            cache_negativo.registrar("busqueda", cache_key, "error", places_result["error"], places_result.get("error_code"))
+        raise error_de_cliente(places_result)
+
+    google_places = places_result["data"].get("places", [])
+    print(f"✓ Encontrados {len(google_places)} lugares para '{query}' en '{ubicacion}'")
+    if not google_places:
+        cache_negativo.registrar("busqueda", cache_key, "sin_resultados")
+    # El website requiere Places Details API (queda "No disponible")
+    return [Place.desde_v1(place) for place in google_places]
+
+def clasificar_y_guardar_mapeo(query: str, ubicacion: str, radio_km: int,
+                               lugares: List[Place], location: Dict[str, float]) -> Dict[str, Any]:
+    """Clasifica los lugares encontrados, arma el resultado del mapeo y lo guarda en caché"""
+    clasificados = clasificacion_a_dicts(clasificar(lugares, query))
+    
+    resultado = {
+        "query": query,
+        "ubicacion": ubicacion,
+        "radio_km": radio_km,
+        "total_encontrados": len(lugares),
+        "clasificacion": clasificados,
+        "resumen": {
+            "competencia_directa": len(clasificados["competencia_directa"]),
+            "competencia_indirecta": len(clasificados["competencia_indirecta"]),
+            "colaboradores_potenciales": len(clasificados["colaboradores_potenciales"])
+        },
+        "fuente": "google_places_api",
+        "coordenadas_busqueda": {
+            "lat": location['lat'],
+            "lng": location['lng']
+        }
+    }
+    
+    save_places_to_cache(query, ubicacion, radio_km, resultado)
+    return resultado
+
 @mcp.tool()
 def mapeo_competencia_y_colaboradores(
     query: str, 
     ubicacion: str, 
-    radio_km: int = 50
+    radio_km: int = 50,
+    forzar_actualizacion: bool = False
 ) -> Dict[str, Any]:
     """
     Realiza búsquedas geolocalizadas para encontrar actores turísticos y los clasifica
@@ -480,12 +757,17 @@ def mapeo_competencia_y_colaboradores(
         query: Tipo de negocio o actividad a buscar (ej: "tour astronómico")
         ubicacion: Ubicación donde buscar (ej: "Valle del Elqui")
         radio_km: Radio de búsqueda en kilómetros (default: 50)
+        forzar_actualizacion: Si es True ignora el caché (procesado y de respuestas de la API) y consulta la API
     
     Returns:
         Objeto JSON con actores clasificados incluyendo nombre, dirección, 
         website y place_id de cada lugar encontrado.
     """
     
+    # 0. Modo offline: solo datos locales, nunca la red
+    if offline_mode.activo():
+        return mapeo_offline(query, ubicacion, radio_km)
+    
     # 1. Verificar configuración de API Key
     api_key = os.getenv("GOOGLE_API_KEY")
     print(f"DEBUG: API Key detectada: {'Sí' if api_key else 'No'}")
@@ -497,178 +779,142 @@ def mapeo_competencia_y_colaboradores(
         print("         Verifica que el archivo .env esté en el directorio correcto")
         return mapeo_competencia_y_colaboradores_placeholder(query, ubicacion, radio_km)
     
+    # 1.1. Seguir la búsqueda para mantenerla fresca en segundo plano
+    seguir_automaticamente("busqueda", {"query": query, "ubicacion": ubicacion, "radio_km": radio_km})
+    
     # 2. Verificar caché de lugares primero
-    cached_places_result = get_places_from_cache(query, ubicacion, radio_km)
+    cached_places_result = {} if forzar_actualizacion else get_places_from_cache(query, ubicacion, radio_km)
     if cached_places_result:
         print('retornó el cache', cached_places_result)
         return cached_places_result
     
+    # 2.1. Una búsqueda o ubicación que hace poco no encontró nada no vuelve a la API
+    negativo = None if forzar_actualizacion else mapeo_en_cache_negativo(query, ubicacion, radio_km)
+    if negativo:
+        return negativo
+    
+    # 2.2. Con el presupuesto diario agotado solo se sirve desde caché
+    plan = planificar_field_mask(CAMPOS_MAPEO_V1, "places.searchText")
+    if not presupuesto_disponible("places.searchText", plan["sku"]):
+        return mapeo_sin_api(query, ubicacion, radio_km, PresupuestoAgotadoError("Presupuesto diario de API agotado"))
+    
     try:
-        # 3. Crear cliente de Google Maps
-        gmaps = googlemaps.Client(key=api_key)
+        # 3. Cliente v1 compartido (jerarquía de caché y conexiones reutilizadas)
+        places_client = obtener_places_client(api_key)
 
         # 4. Geocodificación con caché
-        cached_geocode = get_geocode_from_cache(ubicacion)
-        if cached_geocode:
-            location = cached_geocode
-        else:
-            geocode_result = gmaps.geocode(address=ubicacion)
-            if not geocode_result:
-                print(f"WARNING: No se pudo geocodificar '{ubicacion}', usando datos placeholder")
-                return mapeo_competencia_y_colaboradores_placeholder(query, ubicacion, radio_km)
-            
-            location = geocode_result[0]['geometry']['location']  # {'lat': ..., 'lng': ...}
-            # Guardar en caché
-            save_geocode_to_cache(ubicacion, location)
-
-        # 5. Búsqueda de lugares usando Text Search
-        places_result = gmaps.places(
-            query=query,
-            location=location,
-            radius=radio_km * 1000  # La API usa metros
-        )
+        location = geocodificar(ubicacion, places_client)
+        if not location:
+            print(f"WARNING: No se pudo geocodificar '{ubicacion}', usando datos placeholder")
+            return mapeo_competencia_y_colaboradores_placeholder(query, ubicacion, radio_km)
 
-        # 5.1. Guardar datos RAW completos de la API
-        save_places_raw_to_cache(query, ubicacion, radio_km, places_result)
-
-        google_places = places_result.get("results", [])
-        print(f"✓ Encontrados {len(google_places)} lugares para '{query}' en '{ubicacion}'")
-        # 6. Formatear datos para la función de clasificación
-        formatted_places = []
-        for place in google_places:
-            formatted_place = {
-                "place_id": place.get("place_id"),
-                "name": place.get("name", "Nombre no disponible"),
-                "address": place.get("vicinity", place.get("formatted_address", "Dirección no disponible")),
-                "website": "No disponible",  # Requiere Places Details API para obtener website
-                "rating": place.get("rating", "N/A"),
-                "types": place.get("types", [])
-            }
-            formatted_places.append(formatted_place)
+        # 5. Búsqueda de lugares usando Text Search sesgada al círculo de búsqueda
+        lugares = buscar_lugares_mapeo(query, ubicacion, radio_km, location, places_client, plan["campos"],
+                                       ignorar_cache_negativo=forzar_actualizacion,
+                                       forzar_actualizacion=forzar_actualizacion)
 
-        # 7. Si no se encontraron lugares, usar fallback
-        if not formatted_places:
+        # 6. Si no se encontraron lugares, usar fallback
+        if not lugares:
             print(f"WARNING: No se encontraron lugares para '{query}' en '{ubicacion}', usando datos placeholder")
             return mapeo_competencia_y_colaboradores_placeholder(query, ubicacion, radio_km)
 
-    except googlemaps.exceptions.ApiError as e:
-        print(f"ERROR: API de Google Maps falló: {e}")
+    except SIN_API as e:
+        return mapeo_sin_api(query, ubicacion, radio_km, e)
+    except RuntimeError as e:
+        print(f"ERROR: API de Google Places falló: {e}")
         return mapeo_competencia_y_colaboradores_placeholder(query, ubicacion, radio_km)
     except Exception as e:
         print(f"ERROR: Error inesperado: {e}")
         return mapeo_competencia_y_colaboradores_placeholder(query, ubicacion, radio_km)
 
-    # 8. Clasificar los lugares encontrados
-    clasificados = clasificar_lugares(formatted_places, query)
-    
-    resultado = {
-        "query": query,
-        "ubicacion": ubicacion,
-        "radio_km": radio_km,
-        "total_encontrados": len(formatted_places),
-        "clasificacion": clasificados,
-        "resumen": {
-            "competencia_directa": len(clasificados["competencia_directa"]),
-            "competencia_indirecta": len(clasificados["competencia_indirecta"]),
-            "colaboradores_potenciales": len(clasificados["colaboradores_potenciales"])
-        },
-        "fuente": "google_places_api",
-        "coordenadas_busqueda": {
-            "lat": location['lat'],
-            "lng": location['lng']
-        }
-    }
-    
-    # 9. Guardar resultado completo en caché
-    save_places_to_cache(query, ubicacion, radio_km, resultado)
-    
-    return resultado
+    # 7. Clasificar los lugares encontrados y guardar el resultado en caché
+    return clasificar_y_guardar_mapeo(query, ubicacion, radio_km, lugares, location)
 
-@mcp.tool()
-def analizador_de_opiniones(
-    place_id: str, 
-    idioma: str = "es"
-) -> Dict[str, Any]:
+# Campos de Place que lee analizador_de_opiniones
+CAMPOS_RESENAS_V1 = ["reviews", "rating", "userRatingCount", "displayName"]
+
+def _obtener_resenas_raw(places_client: GooglePlacesClient, place_id: str, idioma: str,
+                         forzar_actualizacion: bool = False) -> Dict[str, Any]:
     """
-    Extrae y analiza reseñas de un lugar específico para identificar sentimientos,
-    temas recurrentes, fortalezas y debilidades.
-    
-    Args:
-        place_id: ID del lugar obtenido de Google Places (de la herramienta 1)
-        idioma: Idioma de las reseñas a analizar (default: "es")
-    
-    Returns:
-        Resumen estructurado con análisis de sentimientos, fortalezas, 
-        debilidades y temas principales extraídos de las reseñas.
+    Obtiene los detalles con reseñas de un lugar en un idioma (la respuesta
+    queda en la jerarquía de caché del cliente) y los agrega al índice.
+    
+    Raises:
+        PresupuestoAgotadoError: Si el presupuesto diario está agotado y no hay caché
+        PlazoAgotadoError: Si se agotó el plazo de la llamada y no hay caché
+        ModoOfflineError: Si el modo offline se activó durante la llamada y no hay caché
+        RuntimeError: Si la API responde con error
     """
-    
-    # 1. Verificar configuración de API Key
-    api_key = os.getenv("GOOGLE_API_KEY")
-    print(f"DEBUG: API Key detectada para reseñas: {'Sí' if api_key else 'No'}")
-    
-    if not api_key:
-        print("WARNING: GOOGLE_API_KEY no configurada, usando datos placeholder para reseñas")
-        return analizador_de_opiniones_placeholder(place_id)
-    
-    # 2. Verificar caché de reseñas procesadas primero
-    cached_reviews_result = get_reviews_from_cache(place_id)
-    
-    # 3. Verificar si tenemos datos RAW, independientemente del caché procesado
-    cached_raw_data = get_reviews_raw_from_cache(place_id)
-    
+    resultado = places_client.get_place_details(place_id, CAMPOS_RESENAS_V1, language_code=idioma,
+                                                forzar_actualizacion=forzar_actualizacion)
+    if resultado["status"] == "error":
+        raise error_de_cliente(resultado)
+    
+    print(f"✓ Datos RAW obtenidos para: {place_id} ({idioma})")
+    indexar_resenas_de_detalles(place_id, resultado["data"])
+    return resultado["data"]
+
+def resenas_raw_en_cache(place_id: str, idioma: str) -> Dict[str, Any]:
+    """Detalles con reseñas de un lugar en un idioma desde la jerarquía de caché (sin red), o {}"""
+    entrada = jerarquia_cache.leer("places.details", parametros_detalles(place_id, CAMPOS_RESENAS_V1, idioma))
+    return entrada["data"] if entrada else {}
+
+def indexar_resenas_de_detalles(place_id: str, details: Dict[str, Any]) -> None:
+    """Agrega al índice de búsqueda las reseñas recién obtenidas de un lugar"""
+    place_data = detalles_a_formato_legacy(details)
+    if not place_data.get("reviews"):
+        return
     try:
-        # 4. Si no tenemos datos RAW, hacer llamada a API
-        if not cached_raw_data:
-            # 4.1. Crear cliente de Google Maps
-            gmaps = googlemaps.Client(key=api_key)
-            
-            # 4.2. Obtener detalles del lugar incluyendo reseñas
-            place_details = gmaps.place(
-                place_id=place_id,
-                fields=['reviews', 'name', 'rating', 'user_ratings_total'],
-                language=idioma
-            )
-            
-            # 4.3. Guardar datos RAW completos de la API
-            save_reviews_raw_to_cache(place_id, place_details)
-            print(f"✓ Datos RAW obtenidos y guardados para: {place_id}")
-        else:
-            place_details = cached_raw_data
-            print(f"✓ Usando datos RAW de caché para: {place_id}")
-        
-        # 5. Si ya tenemos análisis procesado, retornarlo
-        if cached_reviews_result:
-            print(f"✓ Retornando análisis procesado de caché para: {place_id}")
-            return cached_reviews_result
-        
-        if 'result' not in place_details:
-            print(f"WARNING: No se encontraron detalles para place_id {place_id}")
-            return analizador_de_opiniones_placeholder(place_id)
-        
-        place_data = place_details['result']
-        reviews = place_data.get('reviews', [])
-        
-        if not reviews:
-            resultado = {
-                "place_id": place_id,
-                "error": "No se encontraron reseñas para este lugar",
-                "total_reviews": 0,
-                "fuente": "google_places_api"
-            }
-            # Guardar en caché incluso si no hay reseñas
-            save_reviews_to_cache(place_id, resultado)
-            return resultado
-        
-        print(f"✓ Encontradas {len(reviews)} reseñas para place_id: {place_id}")
-        
-    except googlemaps.exceptions.ApiError as e:
-        print(f"ERROR: API de Google Maps falló para reseñas: {e}")
-        return analizador_de_opiniones_placeholder(place_id)
-    except Exception as e:
-        print(f"ERROR: Error inesperado en análisis de reseñas: {e}")
-        return analizador_de_opiniones_placeholder(place_id)
-    
-    # 5. Procesar reseñas de Google Places
+        indexar_lugares([(place_id, place_data.get("name", ""), place_data["reviews"])])
+    except (IOError, ValueError) as e:
+        print(f"WARNING: No se pudieron indexar las reseñas de {place_id}: {e}")
+
+def reconstruir_indice_resenas() -> int:
+    """
+    Reconstruye el índice de búsqueda con todas las reseñas en caché: detalles
+    del almacén de la jerarquía (cache/api/) y archivos heredados
+    (reviews_raw_cache.json y raw_place_details_*.json).
+    """
+    lugares = [(entrada["place_id"], entrada["place_data"].get("name", ""), entrada["place_data"]["reviews"])
+               for entrada in iter_resenas_en_cache(CACHE_DIR)]
+    return indexar_lugares(lugares, reemplazar=True)
+
+def asegurar_indice_resenas(reconstruir: bool = False) -> None:
+    """Construye el índice de reseñas desde el caché si está vacío (o si se pide reconstruir)"""
+    if reconstruir or indice_resenas.total_documentos() == 0:
+        indexados = reconstruir_indice_resenas()
+        print(f"✓ Índice de reseñas reconstruido: {indexados} documentos")
+
+def temas_distintivos_de_lugar(place_id: str, max_temas: int = 6) -> List[Dict[str, Any]]:
+    """Temas del lugar que más lo distinguen del resto del corpus (lista vacía si no hay datos)"""
+    try:
+        asegurar_indice_resenas()
+        temas = obtener_corpus().temas(place_id, max_temas=max_temas)
+        return temas["temas"] if temas else []
+    except (IOError, ValueError) as e:
+        print(f"WARNING: No se pudieron calcular los temas distintivos de {place_id}: {e}")
+        return []
+
+def fusionar_resenas(resenas_por_idioma: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Une las reseñas obtenidas en varios idiomas eliminando duplicados.
+    Google devuelve la misma reseña traducida a cada idioma pedido; se identifica
+    por autor y fecha, y se conserva la versión en su idioma original.
+    """
+    unicas: Dict[tuple, Dict[str, Any]] = {}
+    for idioma, reviews in resenas_por_idioma.items():
+        for review in reviews:
+            clave = (review.get("author_url") or review.get("author_name", ""), review.get("time"))
+            actual = unicas.get(clave)
+            if actual is None:
+                unicas[clave] = review
+            elif (review.get("language") == review.get("original_language")
+                  and actual.get("language") != actual.get("original_language")):
+                unicas[clave] = review
+    return list(unicas.values())
+
+def analizar_resenas(place_id: str, place_data: Dict[str, Any], reviews: List[Dict[str, Any]], idiomas: List[str]) -> Dict[str, Any]:
+    """Construye el análisis estructurado (sentimientos, temas, fortalezas, debilidades) de una lista de reseñas"""
     sentimientos = [analizar_sentimiento_simple(review.get("text", "")) for review in reviews]
     sentimiento_counts = {
         "positivo": sentimientos.count("positivo"),
@@ -676,7 +922,7 @@ def analizador_de_opiniones(
         "neutro": sentimientos.count("neutro")
     }
     
-    # 6. Extracción de temas recurrentes (keywords expandidos)
+    # Extracción de temas recurrentes (keywords expandidos)
     temas_keywords = {
         "guía": 0, "precio": 0, "niños": 0, "frío": 0, "equipo": 0,
         "telescopio": 0, "experiencia": 0, "familia": 0, "caro": 0,
@@ -721,21 +967,21 @@ def analizador_de_opiniones(
                     "aspecto": "precio_expectativas" if any(p in texto_lower for p in ["caro", "elevado", "precio"]) else "experiencia_general"
                 })
     
-    # 7. Calcular métricas
+    # Calcular métricas
     rating_promedio = place_data.get('rating', 0)
     total_ratings = place_data.get('user_ratings_total', 0)
     
-    # 8. Temas principales (top 6)
+    # Temas principales (top 6)
     temas_principales = sorted(
         [(tema, count) for tema, count in temas_keywords.items() if count > 0],
         key=lambda x: x[1],
         reverse=True
     )[:6]
     
-    # 9. Construir resultado
-    resultado = {
+    return {
         "place_id": place_id,
-        "idioma": idioma,
+        "idioma": idiomas[0],
+        "idiomas": idiomas,
         "nombre_lugar": place_data.get('name', 'Nombre no disponible'),
         "total_reviews": len(reviews),
         "total_ratings": total_ratings,
@@ -760,36 +1006,328 @@ def analizador_de_opiniones(
         "fecha_analisis": datetime.now().isoformat()
     }
 
-    # 10. Guardar resultado en caché
-    save_reviews_to_cache(place_id, resultado)
+def opiniones_sin_api(place_id: str, idiomas: List[str], cached_reviews_result: Dict[str, Any],
+                      error: Exception) -> Dict[str, Any]:
+    """Análisis de reseñas cuando no se puede consultar la API (ver respuesta_sin_api)"""
+    return respuesta_sin_api(
+        error, REVIEWS_CACHE_FILE, get_reviews_cache_key(place_id, idiomas),
+        placeholder=lambda: analizador_de_opiniones_placeholder(place_id),
+        offline=lambda: opiniones_offline(place_id, idiomas),
+        vigente=cached_reviews_result
+    )
+
+def opiniones_offline(place_id: str, idiomas: List[str]) -> Dict[str, Any]:
+    """
+    Análisis de reseñas en modo offline, sin red, en este orden: el análisis
+    guardado con los mismos idiomas (aunque esté vencido), un análisis nuevo de
+    las reseñas RAW en caché de los idiomas pedidos, el análisis guardado con
+    otros idiomas y un análisis de las reseñas RAW en cualquier idioma. Los
+    análisis armados en modo offline no se guardan.
+    """
+    guardado = offline_mode.mejor_analisis(load_cache(REVIEWS_CACHE_FILE), place_id, idiomas)
+    if guardado and guardado[1] == "exacta":
+        entrada = guardado[0]
+        print(f"✓ Modo offline: análisis de reseñas de {place_id} desde caché")
+        return {**entrada["data"], "modo_offline": offline_mode.marca("exacta", "reviews_cache", entrada.get("timestamp"))}
+    
+    raw = sorted(offline_mode.resenas_guardadas(place_id), key=lambda g: g["timestamp"] or "", reverse=True)
+    por_idioma = {}
+    for detalle in raw:
+        por_idioma.setdefault(detalle["idioma"], detalle)
+    seleccion = {lang: por_idioma[lang] for lang in idiomas if lang in por_idioma}
+    tipo = "raw_idiomas_pedidos"
+    if not seleccion and guardado:
+        entrada = guardado[0]
+        print(f"✓ Modo offline: análisis de reseñas de {place_id} desde caché (otros idiomas)")
+        return {**entrada["data"], "modo_offline": offline_mode.marca(
+            "otros_idiomas", "reviews_cache", entrada.get("timestamp"),
+            idiomas_usados=entrada.get("idiomas") or entrada["data"].get("idiomas") or ["es"]
+        )}
+    if not seleccion and raw:
+        seleccion = {raw[0]["idioma"] or "desconocido": raw[0]}
+        tipo = "raw_otros_idiomas"
+    if not seleccion:
+        print(f"WARNING: Modo offline: sin reseñas en caché para {place_id}")
+        return {
+            "place_id": place_id,
+            "error": "Modo offline activo y sin reseñas en caché para este lugar",
+            "error_code": "MODO_OFFLINE",
+            "total_reviews": 0,
+            "idiomas": idiomas,
+            "fuente": "modo_offline"
+        }
     
+    detalles_validos = {lang: detalles_a_formato_legacy(detalle["data"]) for lang, detalle in seleccion.items()}
+    resenas_por_idioma = {lang: place_data.get("reviews", []) for lang, place_data in detalles_validos.items()}
+    resultado = analizar_resenas(place_id, next(iter(detalles_validos.values())),
+                                 fusionar_resenas(resenas_por_idioma), list(seleccion))
+    resultado["resenas_por_idioma"] = {lang: len(r) for lang, r in resenas_por_idioma.items()}
+    resultado["temas_distintivos"] = temas_distintivos_de_lugar(place_id)
+    resultado["fuente"] = "cache_local"
+    resultado["modo_offline"] = offline_mode.marca(
+        tipo, ", ".join(sorted({d["origen"] for d in seleccion.values()})),
+        min(d["timestamp"] or "" for d in seleccion.values()),
+        idiomas_usados=list(seleccion)
+    )
+    print(f"✓ Modo offline: reseñas RAW de {place_id} analizadas desde caché ({', '.join(seleccion)})")
     return resultado
 
 @mcp.tool()
-def obtener_detalles_lugar_v1(
-    place_id: str
+def analizador_de_opiniones(
+    place_id: str, 
+    idioma: str = "es",
+    idiomas: List[str] = None,
+    forzar_actualizacion: bool = False
 ) -> Dict[str, Any]:
     """
-    Obtiene detalles completos de un lugar específico usando la nueva API v1 de Google Places.
-    Utiliza caché automático con hishel y guarda respaldos en archivos JSON.
+    Extrae y analiza reseñas de un lugar específico para identificar sentimientos,
+    temas recurrentes, fortalezas y debilidades.
+    
+    Args:
+        place_id: ID del lugar obtenido de Google Places (de la herramienta 1)
+        idioma: Idioma de las reseñas a analizar (default: "es")
+        idiomas: Lista opcional de idiomas (ej: ["es", "en", "pt"]); si se indica,
+                 las reseñas se obtienen en paralelo en cada idioma y se entrega
+                 un único análisis con las reseñas fusionadas y sin duplicados
+        forzar_actualizacion: Si es True ignora el caché (procesado y de respuestas de la API) y consulta la API
+    
+    Returns:
+        Resumen estructurado con análisis de sentimientos, fortalezas, 
+        debilidades y temas principales extraídos de las reseñas.
+    """
+    
+    # 0. Normalizar idiomas (sin duplicados, respetando el orden pedido)
+    idiomas = list(dict.fromkeys(i.strip() for i in (idiomas or [idioma]) if i and i.strip())) or [idioma]
+    
+    # 0.1. Modo offline: solo datos locales, nunca la red
+    if offline_mode.activo():
+        return opiniones_offline(place_id, idiomas)
+    
+    # 1. Verificar configuración de API Key
+    api_key = os.getenv("GOOGLE_API_KEY")
+    print(f"DEBUG: API Key detectada para reseñas: {'Sí' if api_key else 'No'}")
+    
+    if not api_key:
+        print("WARNING: GOOGLE_API_KEY no configurada, usando datos placeholder para reseñas")
+        return analizador_de_opiniones_placeholder(place_id)
+    
+    # 1.1. Seguir el lugar para mantener su análisis fresco en segundo plano
+    seguir_automaticamente("resenas", {"place_id": place_id, "idiomas": idiomas})
+    
+    # 2. Verificar caché de reseñas procesadas primero
+    cached_reviews_result = {} if forzar_actualizacion else get_reviews_from_cache(place_id, idiomas)
+    
+    # 3. Verificar datos RAW por idioma en la jerarquía de caché, independientemente del caché procesado
+    detalles_por_idioma = {}
+    for lang in ([] if forzar_actualizacion else idiomas):
+        cached_raw_data = resenas_raw_en_cache(place_id, lang)
+        if cached_raw_data:
+            detalles_por_idioma[lang] = cached_raw_data
+            print(f"✓ Usando datos RAW de caché para: {place_id} ({lang})")
+    idiomas_faltantes = [lang for lang in idiomas if lang not in detalles_por_idioma]
+    idiomas_sin_plazo = []  # Idiomas que no llegaron dentro del plazo de la llamada
+    
+    try:
+        # 4. Si faltan idiomas en caché RAW, hacer llamadas a API
+        details_sku = sku_para_campos(CAMPOS_RESENAS_V1)
+        if idiomas_faltantes and not presupuesto_disponible("places.details", details_sku):
+            # 4.0. Presupuesto diario agotado: servir solo desde caché
+            return opiniones_sin_api(place_id, idiomas, cached_reviews_result,
+                                     PresupuestoAgotadoError("Presupuesto diario de API agotado"))
+        
+        if idiomas_faltantes:
+            # 4.1. Una llamada por idioma faltante, en paralelo sobre el cliente v1
+            # compartido; cada hilo copia el contexto para que el costo se atribuya
+            # a esta herramienta
+            places_client = obtener_places_client(api_key)
+            with ThreadPoolExecutor(max_workers=min(len(idiomas_faltantes), REVIEWS_MAX_WORKERS)) as executor:
+                futuros = {
+                    lang: executor.submit(
+                        contextvars.copy_context().run, _obtener_resenas_raw,
+                        places_client, place_id, lang, forzar_actualizacion
+                    )
+                    for lang in idiomas_faltantes
+                }
+                for lang, futuro in futuros.items():
+                    try:
+                        detalles_por_idioma[lang] = futuro.result()
+                    except PlazoAgotadoError as e:
+                        idiomas_sin_plazo.append(lang)
+                        error_plazo = e
+            
+            # 4.2. Plazo agotado: análisis parcial con los idiomas que sí llegaron
+            if idiomas_sin_plazo and not detalles_por_idioma:
+                return opiniones_sin_api(place_id, idiomas, cached_reviews_result, error_plazo)
+        
+        # 5. Si ya tenemos análisis procesado, retornarlo
+        if cached_reviews_result:
+            print(f"✓ Retornando análisis procesado de caché para: {place_id}")
+            return cached_reviews_result
+        
+        detalles_validos = {}
+        for lang in idiomas:
+            if lang in idiomas_sin_plazo:
+                continue
+            place_data_idioma = detalles_a_formato_legacy(detalles_por_idioma[lang])
+            if place_data_idioma:
+                detalles_validos[lang] = place_data_idioma
+        if not detalles_validos:
+            print(f"WARNING: No se encontraron detalles para place_id {place_id}")
+            return analizador_de_opiniones_placeholder(place_id)
+        
+        # 5.1. Fusionar reseñas de todos los idiomas sin duplicados
+        place_data = next(iter(detalles_validos.values()))
+        resenas_por_idioma = {
+            lang: place_data_idioma.get('reviews', []) for lang, place_data_idioma in detalles_validos.items()
+        }
+        reviews = fusionar_resenas(resenas_por_idioma)
+        
+        if not reviews:
+            resultado = {
+                "place_id": place_id,
+                "error": "No se encontraron reseñas para este lugar",
+                "total_reviews": 0,
+                "idiomas": idiomas,
+                "fuente": "google_places_api"
+            }
+            # Guardar en caché incluso si no hay reseñas (salvo que falten idiomas por plazo)
+            if not idiomas_sin_plazo:
+                save_reviews_to_cache(place_id, resultado, idiomas)
+            return resultado
+        
+        print(f"✓ Encontradas {len(reviews)} reseñas únicas en {len(detalles_validos)} idioma(s) para place_id: {place_id}")
+        
+    except SIN_API as e:
+        return opiniones_sin_api(place_id, idiomas, cached_reviews_result, e)
+    except RuntimeError as e:
+        print(f"ERROR: API de Google Places falló para reseñas: {e}")
+        return analizador_de_opiniones_placeholder(place_id)
+    except Exception as e:
+        print(f"ERROR: Error inesperado en análisis de reseñas: {e}")
+        return analizador_de_opiniones_placeholder(place_id)
+    
+    # 6. Procesar reseñas fusionadas
+    resultado = analizar_resenas(place_id, place_data, reviews, idiomas)
+    resultado["resenas_por_idioma"] = {lang: len(r) for lang, r in resenas_por_idioma.items()}
+    
+    # 6.1. Temas distintivos frente al corpus de reseñas en caché (las de la API ya se indexaron al llegar)
+    for lang in idiomas:
+        if lang not in idiomas_faltantes:
+            indexar_resenas_de_detalles(place_id, detalles_por_idioma[lang])
+    resultado["temas_distintivos"] = temas_distintivos_de_lugar(place_id)
+
+    # 7. Guardar resultado en caché (un análisis parcial por plazo agotado no se guarda)
+    if idiomas_sin_plazo:
+        print(f"WARNING: Análisis parcial de {place_id}, sin los idiomas {idiomas_sin_plazo} por plazo agotado")
+        resultado["plazo_agotado"] = {"motivo": error_plazo.motivo, "idiomas_omitidos": idiomas_sin_plazo}
+        return resultado
+    save_reviews_to_cache(place_id, resultado, idiomas)
+    
+    return resultado
+
+# Campos de Place que lee la respuesta estructurada de obtener_detalles_lugar_v1;
+# la máscara de campos se planifica a partir de esta lista en lugar de usar '*'.
+# Por defecto se factura como Enterprise; los campos Atmosphere (servicios,
+# reseñas y resumen generativo) suben la llamada al SKU más caro y solo se piden
+# con incluir_atmosfera=True
+CAMPOS_DETALLES_V1 = [
+    "displayName", "formattedAddress", "internationalPhoneNumber", "nationalPhoneNumber",
+    "websiteUri", "googleMapsUri", "rating", "userRatingCount", "priceLevel", "types",
+    "primaryType", "businessStatus", "location", "viewport", "plusCode",
+    "currentOpeningHours", "currentSecondaryOpeningHours", "photos", "utcOffsetMinutes"
+]
+CAMPOS_DETALLES_ATMOSFERA_V1 = [
+    "delivery", "dineIn", "takeout", "reservable", "servesBreakfast", "servesLunch",
+    "servesDinner", "servesBeer", "servesWine", "reviews", "generativeSummary"
+]
+
+def detalles_offline(place_id: str, campos: List[str]) -> Dict[str, Any]:
+    """
+    Detalles de un lugar en modo offline, sin red, con el formato de
+    obtener_detalles_completos_de_lugar: la misma consulta en la jerarquía de
+    caché (aunque esté vencida), la respuesta guardada con otra máscara o idioma
+    que cubra más campos pedidos, o el registro consolidado del lugar en los
+    cachés de búsquedas.
+    """
+    entrada = jerarquia_cache.leer("places.details", parametros_detalles(place_id, campos), permitir_vencido=True)
+    if entrada:
+        return {
+            "status": "success", "place_id": place_id, "from_cache": True,
+            "origen_cache": entrada["origen"], "cache": metadatos_cache(entrada), "data": entrada["data"],
+            "modo_offline": offline_mode.marca("exacta", entrada["origen"], entrada.get("timestamp"))
+        }
+    
+    guardado = offline_mode.mejor_detalle(offline_mode.detalles_guardados(place_id), campos)
+    if guardado:
+        data, tipo, origen, fuente = guardado["data"], "otros_campos", guardado["origen"], None
+        timestamp = guardado["timestamp"]
+        faltantes = [] if "*" in guardado["campos"] else sorted(set(campos) - set(guardado["campos"]))
+    else:
+        registro = lugares_en_cache(CACHE_DIR).get(place_id)
+        if not registro:
+            return {
+                "status": "error",
+                "place_id": place_id,
+                "error": "Modo offline activo y sin detalles en caché para este lugar",
+                "error_code": "MODO_OFFLINE"
+            }
+        data = {
+            "displayName": {"text": registro["name"]},
+            "formattedAddress": registro["address"],
+            "rating": registro["rating"],
+            "userRatingCount": registro["user_ratings_total"],
+            "types": registro["types"],
+            "location": {"latitude": registro["lat"], "longitude": registro["lng"]} if registro["lat"] is not None else None
+        }
+        data = {campo: valor for campo, valor in data.items() if valor not in (None, "", [])}
+        tipo, origen, fuente, timestamp = "registro_consolidado", registro["fuente"], "cache_local", registro["timestamp"]
+        faltantes = sorted(set(campos) - set(data) - {"*"})
+    
+    marca = offline_mode.marca(tipo, origen, timestamp, campos_faltantes=faltantes)
+    return {
+        "status": "success", "place_id": place_id, "from_cache": True, "origen_cache": origen,
+        "cache": {"estado": "STALE" if marca["vencido"] else "HIT", "origen": origen,
+                  "edad_s": marca["edad_horas"] * 3600 if marca["edad_horas"] is not None else None, "vigencia_s": None},
+        "data": data,
+        "modo_offline": marca,
+        **({"fuente": fuente} if fuente else {})
+    }
+
+@mcp.tool()
+def obtener_detalles_lugar_v1(
+    place_id: str,
+    campos: List[str] = None,
+    incluir_atmosfera: bool = False
+) -> Dict[str, Any]:
+    """
+    Obtiene detalles completos de un lugar específico usando la nueva API v1 de Google Places.
+    Utiliza la jerarquía de caché compartida (memoria → almacén local → red), de
+    modo que los detalles que trajo otra herramienta con los mismos campos no se
+    vuelven a pedir.
     
     Args:
         place_id: ID único del lugar de Google Places (ej: "ChIJ123abc...")
+        campos: Máscara de campos a solicitar. Por defecto solo los campos que usa
+               esta respuesta; ["*"] solicita todos (SKU más caro)
+        incluir_atmosfera: Con la máscara por defecto, pedir también servicios
+               (delivery, reservas, comidas), reseñas y resumen generativo; sube la
+               llamada del SKU Enterprise al Enterprise + Atmosphere
     
     Returns:
         Diccionario con todos los detalles disponibles del lugar, incluyendo:
         - Información básica (nombre, dirección, teléfono, rating)
         - Horarios de funcionamiento
-        - Fotos y reviews si están disponibles
+        - Fotos, y servicios y reviews si se pidieron (incluir_atmosfera)
         - Información de contacto completa
         - Metadatos de caché y fuente
     """
     
-    # 1. Verificar configuración de API Key
+    # 1. Verificar configuración de API Key (el modo offline no la necesita)
+    offline = offline_mode.activo()
     api_key = os.getenv("GOOGLE_API_KEY")
     print(f"DEBUG: API Key detectada para v1: {'Sí' if api_key else 'No'}")
     
-    if not api_key:
+    if not api_key and not offline:
         return {
             "place_id": place_id,
             "error": "GOOGLE_API_KEY no configurada",
@@ -797,14 +1335,410 @@ def obtener_detalles_lugar_v1(
             "fuente": "configuracion"
         }
     
+    campos_leidos = CAMPOS_DETALLES_V1 + (CAMPOS_DETALLES_ATMOSFERA_V1 if incluir_atmosfera else [])
     try:
-        # 2. Usar el nuevo cliente GooglePlacesClient
-        with GooglePlacesClient(api_key=api_key) as places_client:
+        if offline:
+            # 2-3. Modo offline: la mejor respuesta guardada, nunca la red
+            resultado = detalles_offline(place_id, campos or planificar_field_mask(campos_leidos)["campos"])
+        else:
+            # 2. Cliente v1 compartido (jerarquía de caché y conexiones reutilizadas)
+            places_client = obtener_places_client(api_key)
             print(f"🔍 Obteniendo detalles para place_id: {place_id}")
             
-            # 3. Obtener detalles completos (incluye guardado automático en JSON)
-            resultado = obtener_detalles_completos_de_lugar(place_id, places_client)
+            # 3. Obtener detalles con la máscara más barata (pasa por la jerarquía de caché)
+            if campos is None:
+                plan = planificar_field_mask(campos_leidos)
+                campos = plan["campos"]
+                print(f"✓ Máscara planificada: SKU {plan['sku']} (US${plan['costo_estimado_usd']:.4f} por llamada)")
+            resultado = obtener_detalles_completos_de_lugar(place_id, places_client, campos)
+        
+        if resultado["status"] == "error":
+            return {
+                "place_id": place_id,
+                "error": resultado["error"],
+                "error_code": resultado.get("error_code"),
+                "cache_negativo": resultado.get("cache_negativo", False),
+                "fuente": "modo_offline" if offline else "google_places_api_v1"
+            }
+        
+        # 4. Extraer datos principales para respuesta estructurada
+        data = resultado["data"]
+        if not resultado["from_cache"]:
+            indexar_resenas_de_detalles(place_id, data)
+        
+        # 5. Construir respuesta estructurada y amigable
+        respuesta_estructurada = {
+            "place_id": place_id,
+            "status": "success",
+            "fuente": resultado.get("fuente", "google_places_api_v1"),
+            "from_cache": resultado["from_cache"],
+            "cache_status": "CACHE HIT" if resultado["from_cache"] else "API CALL",
+            "origen_cache": resultado["origen_cache"],
+            "cache": resultado["cache"],
+            "timestamp": datetime.now().isoformat(),
+            
+            # Información básica
+            "informacion_basica": {
+                "nombre": data.get("displayName", {}).get("text", "N/A"),
+                "direccion": data.get("formattedAddress", "N/A"),
+                "telefono_internacional": data.get("internationalPhoneNumber", "N/A"),
+                "telefono_nacional": data.get("nationalPhoneNumber", "N/A"),
+                "website": data.get("websiteUri", "N/A"),
+                "google_maps_uri": data.get("googleMapsUri", "N/A")
+            },
             
+            # Ratings y reviews
+            "ratings": {
+                "rating_promedio": data.get("rating", "N/A"),
+                "total_reviews": data.get("userRatingCount", 0),
+                "nivel_precio": data.get("priceLevel", "N/A")
+            },
+            
+            # Categorización
+            "categoria": {
+                "tipos": data.get("types", []),
+                "categoria_principal": data.get("primaryType", "N/A"),
+                "estado_negocio": data.get("businessStatus", "N/A")
+            },
+            
+            # Ubicación
+            "ubicacion": {
+                "coordenadas": data.get("location", {}),
+                "viewport": data.get("viewport", {}),
+                "plus_code": data.get("plusCode", {})
+            },
+            
+            # Horarios
+            "horarios": {
+                "horarios_actuales": data.get("currentOpeningHours", {}),
+                "horarios_secundarios": data.get("currentSecondaryOpeningHours", []),
+                "abierto_ahora": data.get("currentOpeningHours", {}).get("openNow", "N/A")
+            },
+            
+            # Información adicional
+            "servicios": {
+                "delivery": data.get("delivery", "N/A"),
+                "dine_in": data.get("dineIn", "N/A"),
+                "takeout": data.get("takeout", "N/A"),
+                "reservable": data.get("reservable", "N/A"),
+                "serves_breakfast": data.get("servesBreakfast", "N/A"),
+                "serves_lunch": data.get("servesLunch", "N/A"),
+                "serves_dinner": data.get("servesDinner", "N/A"),
+                "serves_beer": data.get("servesBeer", "N/A"),
+                "serves_wine": data.get("servesWine", "N/A")
+            },
+            
+            # Metadatos de la API
+            "metadatos": {
+                "total_campos_disponibles": len(data.keys()),
+                "tiene_fotos": "photos" in data,
+                "tiene_reviews": "reviews" in data,
+                "tiene_resumen_ia": "generativeSummary" in data,
+                "ultima_actualizacion": data.get("utcOffsetMinutes", "N/A")
+            },
+            
+            # Datos completos RAW (para análisis avanzado)
+            "datos_completos": data
+        }
+        if "modo_offline" in resultado:
+            respuesta_estructurada["modo_offline"] = resultado["modo_offline"]
+        
+        print(f"✓ Detalles obtenidos exitosamente para: {respuesta_estructurada['informacion_basica']['nombre']}")
+        print(f"✓ Rating: {respuesta_estructurada['ratings']['rating_promedio']} ({respuesta_estructurada['ratings']['total_reviews']} reviews)")
+        print(f"✓ Cache status: {respuesta_estructurada['cache_status']}")
+        
+        return respuesta_estructurada
+        
+    except Exception as e:
+        print(f"ERROR: Error inesperado en obtener_detalles_lugar_v1: {e}")
+        return {
+            "place_id": place_id,
+            "error": f"Error inesperado: {str(e)}",
+            "fuente": "google_places_api_v1"
+        }
+
+PIPELINE_MAX_WORKERS = 8  # Etapas simultáneas del análisis de mercado
+CATEGORIAS_MERCADO = ["competencia_directa", "competencia_indirecta", "colaboradores_potenciales"]
+
+def _resumen_detalles(detalles: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos del detalle v1 que entran en el reporte de mercado"""
+    if "error" in detalles:
+        return {"error": detalles["error"]}
+    return {
+        "website": detalles["informacion_basica"]["website"],
+        "telefono": detalles["informacion_basica"]["telefono_internacional"],
+        "google_maps_uri": detalles["informacion_basica"]["google_maps_uri"],
+        "total_reviews": detalles["ratings"]["total_reviews"],
+        "nivel_precio": detalles["ratings"]["nivel_precio"],
+        "categoria_principal": detalles["categoria"]["categoria_principal"],
+        "estado_negocio": detalles["categoria"]["estado_negocio"],
+        "abierto_ahora": detalles["horarios"]["abierto_ahora"],
+        "from_cache": detalles["from_cache"]
+    }
+
+def _resumen_opiniones(analisis: Dict[str, Any]) -> Dict[str, Any]:
+    """Campos del análisis de reseñas que entran en el reporte de mercado"""
+    if "error" in analisis:
+        return {"error": analisis["error"]}
+    return {
+        "total_reviews": analisis.get("total_reviews", 0),
+        "rating_promedio": analisis.get("rating_promedio"),
+        "sentimiento_predominante": analisis.get("sentimiento_general", {}).get("predominante"),
+        "temas_principales": analisis.get("temas_principales", []),
+        "temas_distintivos": analisis.get("temas_distintivos", []),
+        "fortalezas": analisis.get("fortalezas", []),
+        "debilidades": analisis.get("debilidades", []),
+        "fuente": analisis.get("fuente")
+    }
+
+@mcp.tool()
+def analisis_de_mercado(
+    query: str,
+    ubicacion: str,
+    radio_km: int = 50,
+    categorias: List[str] = None,
+    max_lugares: int = 10,
+    idiomas: List[str] = None,
+    incluir_detalles: bool = True,
+    incluir_opiniones: bool = True,
+    forzar_actualizacion: bool = False
+) -> Dict[str, Any]:
+    """
+    Análisis de mercado completo en una sola llamada: geocodificación, búsqueda,
+    clasificación, detalles y análisis de reseñas de cada lugar seleccionado.
+    Las etapas se ejecutan como un grafo de dependencias: los detalles y las
+    reseñas de cada lugar arrancan apenas se clasifica la búsqueda y corren en
+    paralelo entre sí.
+    
+    Args:
+        query: Tipo de negocio o actividad a buscar (ej: "tour astronómico")
+        ubicacion: Ubicación donde buscar (ej: "Valle del Elqui")
+        radio_km: Radio de búsqueda en kilómetros (default: 50)
+        categorias: Categorías a analizar en detalle (default: competencia directa e indirecta)
+        max_lugares: Cantidad máxima de lugares a analizar en detalle (default: 10)
+        idiomas: Idiomas de las reseñas a analizar (default: ["es"])
+        incluir_detalles: Si es True obtiene los detalles v1 de cada lugar
+        incluir_opiniones: Si es True analiza las reseñas de cada lugar
+        forzar_actualizacion: Si es True ignora el caché (procesado y de respuestas de la API) y consulta la API
+    
+    Returns:
+        Reporte consolidado: resumen del mapeo, ficha por lugar (detalles y
+        opiniones), comparativa y tiempos de cada etapa
+    """
+    inicio = time.perf_counter()
+    offline = offline_mode.activo()
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if not api_key and not offline:
+        return {"error": "GOOGLE_API_KEY no configurada", "fuente": "configuracion"}
+    
+    categorias = categorias or ["competencia_directa", "competencia_indirecta"]
+    invalidas = [c for c in categorias if c not in CATEGORIAS_MERCADO]
+    if invalidas:
+        return {"error": f"Categorías no válidas: {invalidas}. Usa: {CATEGORIAS_MERCADO}"}
+    idiomas = idiomas or ["es"]
+    
+    try:
+        seguir_automaticamente("busqueda", {"query": query, "ubicacion": ubicacion, "radio_km": radio_km})
+        places_client = None if offline else obtener_places_client(api_key)
+        grafo = GrafoDeEtapas(PIPELINE_MAX_WORKERS)
+        
+        def _geocodificacion(_: Dict[str, Any]) -> Dict[str, float]:
+            location = geocodificar(ubicacion, places_client)
+            if not location:
+                raise RuntimeError(f"No se pudo geocodificar '{ubicacion}'")
+            return location
+        
+        def _busqueda(entradas: Dict[str, Any]) -> List[Place]:
+            plan = planificar_field_mask(CAMPOS_MAPEO_V1, "places.searchText")
+            lugares = buscar_lugares_mapeo(query, ubicacion, radio_km, entradas["geocodificacion"], places_client, plan["campos"],
+                                           ignorar_cache_negativo=forzar_actualizacion,
+                                           forzar_actualizacion=forzar_actualizacion)
+            if not lugares:
+                raise RuntimeError(f"No se encontraron lugares para '{query}' en '{ubicacion}'")
+            return lugares
+        
+        def _clasificacion(entradas: Dict[str, Any], mapeo: Dict[str, Any] = None) -> Dict[str, Any]:
+            if mapeo is None:
+                mapeo = clasificar_y_guardar_mapeo(query, ubicacion, radio_km, entradas["busqueda"], entradas["geocodificacion"])
+            # Una etapa de detalles y otra de reseñas por lugar, sin dependencias entre sí
+            seleccion, vistos = [], set()
+            for categoria in categorias:
+                for place in mapeo.get("clasificacion", {}).get(categoria, []):
+                    if len(seleccion) < max_lugares and place.get("place_id") and place["place_id"] not in vistos:
+                        vistos.add(place["place_id"])
+                        seleccion.append(place)
+            for place in seleccion:
+                place_id = place["place_id"]
+                if incluir_detalles:
+                    grafo.agregar(f"detalles:{place_id}", lambda _, pid=place_id: obtener_detalles_lugar_v1.fn(pid))
+                if incluir_opiniones:
+                    grafo.agregar(f"opiniones:{place_id}", lambda _, pid=place_id: analizador_de_opiniones.fn(
+                        pid, idiomas=idiomas, forzar_actualizacion=forzar_actualizacion))
+            return {"mapeo": mapeo, "seleccion": seleccion}
+        
+        # El mapeo en caché (o el de respaldo sin presupuesto o en modo offline) evita geocodificar y buscar
+        if offline:
+            mapeo_previo = mapeo_offline(query, ubicacion, radio_km)
+            if "error" in mapeo_previo:
+                return mapeo_previo
+        else:
+            mapeo_previo = {} if forzar_actualizacion else get_places_from_cache(query, ubicacion, radio_km)
+        if not mapeo_previo and not presupuesto_disponible("places.searchText", planificar_field_mask(CAMPOS_MAPEO_V1, "places.searchText")["sku"]):
+            mapeo_previo = mapeo_sin_api(query, ubicacion, radio_km,
+                                         PresupuestoAgotadoError("Presupuesto diario de API agotado"))
+        if mapeo_previo:
+            grafo.agregar("clasificacion", lambda entradas: _clasificacion(entradas, mapeo_previo))
+        else:
+            grafo.agregar("geocodificacion", _geocodificacion)
+            grafo.agregar("busqueda", _busqueda, depende_de=["geocodificacion"])
+            grafo.agregar("clasificacion", _clasificacion, depende_de=["geocodificacion", "busqueda"])
+        
+        etapas = grafo.ejecutar()
+    except Exception as e:
+        print(f"ERROR: Error inesperado en análisis de mercado: {e}")
+        return {"error": f"Error inesperado: {str(e)}"}
+    
+    resumen_etapas = sorted(
+        [
+            {"etapa": nombre, "estado": etapa["estado"], "inicio_ms": etapa["inicio_ms"],
+             "duracion_ms": etapa["duracion_ms"], **({"error": etapa["error"]} if etapa["error"] else {})}
+            for nombre, etapa in etapas.items()
+        ],
+        key=lambda e: (e["inicio_ms"] is None, e["inicio_ms"] or 0)
+    )
+    tiempos = {
+        "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        # Suma de las etapas: lo que habría tomado ejecutarlas en serie
+        "tiempo_etapas_ms": round(sum(e["duracion_ms"] or 0 for e in resumen_etapas), 1)
+    }
+    
+    if etapas["clasificacion"]["estado"] != "completada":
+        error = next((e["error"] for e in resumen_etapas if e["estado"] == "error"), etapas["clasificacion"]["error"])
+        print(f"ERROR: Análisis de mercado sin resultados para '{query}' en '{ubicacion}': {error}")
+        return {"query": query, "ubicacion": ubicacion, "error": error, "etapas": resumen_etapas, **tiempos}
+    
+    mapeo = etapas["clasificacion"]["resultado"]["mapeo"]
+    lugares = []
+    for place in etapas["clasificacion"]["resultado"]["seleccion"]:
+        ficha = {
+            "place_id": place["place_id"],
+            "nombre": place.get("name"),
+            "categoria": place.get("category"),
+            "direccion": place.get("address"),
+            "rating": place.get("rating"),
+            "tipos": place.get("types", [])
+        }
+        for prefijo, resumir in (("detalles", _resumen_detalles), ("opiniones", _resumen_opiniones)):
+            etapa = etapas.get(f"{prefijo}:{place['place_id']}")
+            if etapa is not None:
+                ficha[prefijo] = resumir(etapa["resultado"]) if etapa["estado"] == "completada" else {"error": etapa["error"]}
+        lugares.append(ficha)
+    
+    ratings = [f["rating"] for f in lugares if isinstance(f["rating"], (int, float))]
+    sentimientos = [f["opiniones"].get("sentimiento_predominante") for f in lugares if "opiniones" in f]
+    
+    reporte = {
+        "query": query,
+        "ubicacion": ubicacion,
+        "radio_km": radio_km,
+        "coordenadas_busqueda": mapeo.get("coordenadas_busqueda"),
+        "total_encontrados": mapeo.get("total_encontrados", 0),
+        "resumen": mapeo.get("resumen", {}),
+        "clasificacion": mapeo.get("clasificacion", {}),
+        "lugares_analizados": lugares,
+        "comparativa": {
+            "rating_promedio": round(sum(ratings) / len(ratings), 2) if ratings else None,
+            "mejor_rating": max(lugares, key=lambda f: f["rating"] if isinstance(f["rating"], (int, float)) else -1)["nombre"] if ratings else None,
+            "sentimiento_predominante": {s: sentimientos.count(s) for s in set(sentimientos) if s}
+        },
+        "etapas": resumen_etapas,
+        "fuente": mapeo.get("fuente", "google_places_api"),
+        **tiempos
+    }
+    if mapeo.get("presupuesto_agotado"):
+        reporte["presupuesto_agotado"] = True
+    if mapeo.get("modo_offline"):
+        reporte["modo_offline"] = mapeo["modo_offline"]
+    
+    print(f"✓ Análisis de mercado '{query}' en '{ubicacion}': {len(lugares)} lugares en {tiempos['tiempo_ms']} ms "
+          f"({tiempos['tiempo_etapas_ms']} ms en serie)")
+    return reporte
+
+FOTOS_MAX_WORKERS = 4  # Descargas simultáneas de fotos por llamada
+
+def fotos_desde_detalles(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Lista de fotos (nombre, tamaño y autores) de una respuesta de detalles v1"""
+    return [
+        {
+            "name": foto["name"],
+            "ancho": foto.get("widthPx"),
+            "alto": foto.get("heightPx"),
+            "autores": [
+                {"nombre": autor.get("displayName", ""), "uri": autor.get("uri", "")}
+                for autor in foto.get("authorAttributions", [])
+            ]
+        }
+        for foto in data.get("photos", [])
+    ]
+
+@mcp.tool()
+def fotos_de_lugar(
+    place_id: str,
+    max_fotos: int = 5,
+    variantes: List[str] = None,
+    presupuesto_mb: float = 20.0
+) -> Dict[str, Any]:
+    """
+    Obtiene las fotos de un lugar con el endpoint de media de la API v1 y las guarda
+    en un almacén local direccionado por contenido (cache/photos). Las consultas
+    repetidas se sirven desde disco sin llamar a la API.
+    
+    Args:
+        place_id: ID único del lugar de Google Places
+        max_fotos: Cantidad máxima de fotos a entregar (default: 5, máximo: 10)
+        variantes: Tamaños a conservar: "miniatura" (200 px), "mediana" (800 px)
+                   y/o "grande" (1600 px) (default: ["miniatura"])
+        presupuesto_mb: Máximo de megabytes a descargar en esta llamada; las
+                        descargas que lo excedan se omiten (default: 20)
+    
+    Returns:
+        Fotos con sus autores (atribución obligatoria) y, por variante, la ruta
+        y URI file:// del archivo local
+    """
+    inicio = time.perf_counter()
+    variantes = list(dict.fromkeys(variantes or ["miniatura"]))
+    desconocidas = [v for v in variantes if v not in VARIANTES_FOTO]
+    if desconocidas:
+        return {
+            "place_id": place_id,
+            "error": f"Variantes no válidas: {desconocidas}. Usa {list(VARIANTES_FOTO)}",
+            "fuente": "configuracion"
+        }
+    max_fotos = max(1, min(max_fotos, 10))
+    
+    api_key = clave_api_en_linea()
+    sin_red = "Modo offline activo" if offline_mode.activo() else "GOOGLE_API_KEY no configurada"
+    
+    try:
+        # 1. Lista de fotos del lugar (índice local o máscara 'photos', SKU IDs Only)
+        fotos = fotos_de_lugar_en_indice(place_id)
+        fuente_lista = "cache_local"
+        if fotos is None and offline_mode.activo():
+            # Modo offline: la lista de fotos de cualquier respuesta de detalles en caché
+            guardado = offline_mode.mejor_detalle(
+                [g for g in offline_mode.detalles_guardados(place_id) if g["data"].get("photos")], ["photos"]
+            )
+            if guardado:
+                fotos = fotos_desde_detalles(guardado["data"])
+        if fotos is None:
+            if not api_key:
+                return {
+                    "place_id": place_id,
+                    "error": f"{sin_red} y las fotos no están en caché",
+                    **({"error_code": "MODO_OFFLINE"} if offline_mode.activo() else {}),
+                    "fuente": "modo_offline" if offline_mode.activo() else "configuracion"
+                }
+            resultado = obtener_places_client(api_key).get_place_details(place_id, ["photos"])
             if resultado["status"] == "error":
                 return {
                     "place_id": place_id,
@@ -812,96 +1746,909 @@ def obtener_detalles_lugar_v1(
                     "error_code": resultado.get("error_code"),
                     "fuente": "google_places_api_v1"
                 }
+            fotos = fotos_desde_detalles(resultado["data"])
+            guardar_fotos_de_lugar(place_id, fotos)
+            fuente_lista = "google_places_api_v1"
+        
+        fotos = fotos[:max_fotos]
+        
+        # 2. Variantes ya en disco y descargas pendientes
+        handles = {(foto["name"], v): buscar_variante(foto["name"], v) for foto in fotos for v in variantes}
+        pendientes = [clave for clave, handle in handles.items() if handle is None]
+        errores = []
+        
+        if pendientes and not api_key:
+            errores.append(f"{sin_red}: solo se entregan fotos en disco")
+            pendientes = []
+        
+        # 3. Descargas concurrentes dentro del presupuesto de bytes
+        presupuesto = PresupuestoBytes(int(presupuesto_mb * 1024 * 1024))
+        if pendientes:
+            places_client = obtener_places_client(api_key)
             
-            # 4. Extraer datos principales para respuesta estructurada
-            data = resultado["data"]
-            
-            # 5. Construir respuesta estructurada y amigable
-            respuesta_estructurada = {
-                "place_id": place_id,
-                "status": "success",
-                "fuente": "google_places_api_v1",
-                "from_cache": resultado["from_cache"],
-                "cache_status": "CACHE HIT" if resultado["from_cache"] else "API CALL",
-                "timestamp": datetime.now().isoformat(),
-                
-                # Información básica
-                "informacion_basica": {
-                    "nombre": data.get("displayName", {}).get("text", "N/A"),
-                    "direccion": data.get("formattedAddress", "N/A"),
-                    "telefono_internacional": data.get("internationalPhoneNumber", "N/A"),
-                    "telefono_nacional": data.get("nationalPhoneNumber", "N/A"),
-                    "website": data.get("websiteUri", "N/A"),
-                    "google_maps_uri": data.get("googleMapsUri", "N/A")
-                },
-                
-                # Ratings y reviews
-                "ratings": {
-                    "rating_promedio": data.get("rating", "N/A"),
-                    "total_reviews": data.get("userRatingCount", 0),
-                    "nivel_precio": data.get("priceLevel", "N/A")
-                },
-                
-                # Categorización
-                "categoria": {
-                    "tipos": data.get("types", []),
-                    "categoria_principal": data.get("primaryType", "N/A"),
-                    "estado_negocio": data.get("businessStatus", "N/A")
-                },
-                
-                # Ubicación
-                "ubicacion": {
-                    "coordenadas": data.get("location", {}),
-                    "viewport": data.get("viewport", {}),
-                    "plus_code": data.get("plusCode", {})
-                },
-                
-                # Horarios
-                "horarios": {
-                    "horarios_actuales": data.get("currentOpeningHours", {}),
-                    "horarios_secundarios": data.get("currentSecondaryOpeningHours", []),
-                    "abierto_ahora": data.get("currentOpeningHours", {}).get("openNow", "N/A")
-                },
-                
-                # Información adicional
-                "servicios": {
-                    "delivery": data.get("delivery", "N/A"),
-                    "dine_in": data.get("dineIn", "N/A"),
-                    "takeout": data.get("takeout", "N/A"),
-                    "reservable": data.get("reservable", "N/A"),
-                    "serves_breakfast": data.get("servesBreakfast", "N/A"),
-                    "serves_lunch": data.get("servesLunch", "N/A"),
-                    "serves_dinner": data.get("servesDinner", "N/A"),
-                    "serves_beer": data.get("servesBeer", "N/A"),
-                    "serves_wine": data.get("servesWine", "N/A")
-                },
-                
-                # Metadatos de la API
-                "metadatos": {
-                    "total_campos_disponibles": len(data.keys()),
-                    "tiene_fotos": "photos" in data,
-                    "tiene_reviews": "reviews" in data,
-                    "tiene_resumen_ia": "generativeSummary" in data,
-                    "ultima_actualizacion": data.get("utcOffsetMinutes", "N/A")
-                },
-                
-                # Datos completos RAW (para análisis avanzado)
-                "datos_completos": data
-            }
-            
-            print(f"✓ Detalles obtenidos exitosamente para: {respuesta_estructurada['informacion_basica']['nombre']}")
-            print(f"✓ Rating: {respuesta_estructurada['ratings']['rating_promedio']} ({respuesta_estructurada['ratings']['total_reviews']} reviews)")
-            print(f"✓ Cache status: {respuesta_estructurada['cache_status']}")
-            
-            return respuesta_estructurada
+            def _descargar(photo_name: str, variante: str) -> Dict[str, Any]:
+                return descargar_variante(
+                    photo_name, variante,
+                    lambda destino: places_client.download_photo_media(
+                        photo_name, destino, reservar_bytes=presupuesto.reservar,
+                        **VARIANTES_FOTO[variante]
+                    )
+                )
             
+            with ThreadPoolExecutor(max_workers=min(len(pendientes), FOTOS_MAX_WORKERS)) as executor:
+                futuros = {
+                    clave: executor.submit(contextvars.copy_context().run, _descargar, *clave)
+                    for clave in pendientes
+                }
+                for clave, futuro in futuros.items():
+                    resultado = futuro.result()
+                    if resultado.get("status") == "error":
+                        errores.append(f"{clave[0]} ({clave[1]}): {resultado['error']}")
+                    else:
+                        handles[clave] = resultado
+        
+        # 4. Construir respuesta
+        respuesta_fotos = []
+        for foto in fotos:
+            respuesta_fotos.append({
+                "name": foto["name"],
+                "ancho": foto["ancho"],
+                "alto": foto["alto"],
+                "autores": foto["autores"],
+                "variantes": {v: handles[(foto["name"], v)] for v in variantes if handles[(foto["name"], v)]}
+            })
+        
+        entregados = [h for h in handles.values() if h]
+        return {
+            "place_id": place_id,
+            "total_fotos": len(respuesta_fotos),
+            "fotos": respuesta_fotos,
+            "desde_disco": sum(1 for h in entregados if h["desde_disco"]),
+            "descargadas": sum(1 for h in entregados if not h["desde_disco"]),
+            "bytes_descargados": presupuesto.usados,
+            "errores": errores,
+            "fuente": fuente_lista,
+            "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
+        }
+    
     except Exception as e:
-        print(f"ERROR: Error inesperado en obtener_detalles_lugar_v1: {e}")
+        print(f"ERROR: Error inesperado en fotos_de_lugar: {e}")
         return {
             "place_id": place_id,
             "error": f"Error inesperado: {str(e)}",
             "fuente": "google_places_api_v1"
         }
 
+def lugares_georreferenciados(lugares: Dict[str, Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+    """
+    Filtra los lugares con coordenadas y clasifica los que aún no tienen categoría
+    (los lugares vistos solo en búsquedas o detalles no pasaron por clasificar_lugares).
+    """
+    con_coordenadas = [p for p in lugares.values() if p["lat"] is not None and p["lng"] is not None]
+    sin_categoria = [p for p in con_coordenadas if p["category"] not in CATEGORIAS_MERCADO]
+    clasificar_lugares(sin_categoria, query)
+    return con_coordenadas
+
+@mcp.tool()
+def mapa_densidad_competencia(
+    ubicacion: str,
+    radio_km: float = 20,
+    celda_km: float = 2.0,
+    query: str = "tour astronómico",
+    incluir_busqueda_cercana: bool = True,
+    tipos_incluidos: List[str] = None
+) -> Dict[str, Any]:
+    """
+    Genera un mapa de calor de la competencia: divide la región en una grilla y
+    calcula por celda la densidad de lugares por categoría y su rating promedio.
+    Usa los lugares ya presentes en el caché y, opcionalmente, una búsqueda
+    cercana (Nearby Search) en el centro de la región.
+    
+    Args:
+        ubicacion: Centro de la región (ej: "Vicuña, Valle del Elqui")
+        radio_km: Radio de la región en kilómetros (default: 20)
+        celda_km: Lado de cada celda de la grilla en kilómetros (default: 2)
+        query: Actividad de referencia para clasificar los lugares (default: "tour astronómico")
+        incluir_busqueda_cercana: Si es True agrega los resultados de una búsqueda cercana
+        tipos_incluidos: Tipos de Google Places para la búsqueda cercana (opcional)
+    
+    Returns:
+        Grilla compacta con solo las celdas ocupadas, ordenadas por cantidad de lugares
+    """
+    inicio = time.perf_counter()
+    
+    if radio_km <= 0 or celda_km <= 0:
+        return {"error": "radio_km y celda_km deben ser positivos"}
+    # Limitar la grilla a 200 x 200 celdas
+    celda_km = max(celda_km, 2 * radio_km / 200)
+    
+    api_key = clave_api_en_linea()
+    
+    try:
+        # 1. Centro de la región (caché de geocodificación o API)
+        if api_key:
+            centro = geocodificar(ubicacion, obtener_places_client(api_key))
+        else:
+            centro = get_geocode_from_cache(ubicacion, permitir_vencido=True)
+        if not centro:
+            return {
+                "ubicacion": ubicacion,
+                "error": f"No se pudo geocodificar '{ubicacion}'",
+                "fuente": "cache_local"
+            }
+        
+        # 2. Lugares del caché local
+        lugares = lugares_en_cache(CACHE_DIR)
+        fuentes = ["cache_local"]
+        
+        # 3. Completar con una búsqueda cercana (API v1)
+        if incluir_busqueda_cercana and api_key:
+            resultado = obtener_places_client(api_key).search_places_nearby(
+                center={"latitude": centro["lat"], "longitude": centro["lng"]},
+                radius=radio_km * 1000,
+                included_types=tipos_incluidos
+            )
+            if resultado["status"] == "success":
+                fuentes.append("google_places_api_v1_nearby")
+                for place in resultado["data"].get("places", []):
+                    registro = registro_desde_v1(place, "nearby_search", datetime.now().isoformat())
+                    if registro["place_id"] and registro["place_id"] not in lugares:
+                        lugares[registro["place_id"]] = registro
+            else:
+                print(f"WARNING: Búsqueda cercana falló: {resultado.get('error')}")
+        
+        # 4. Clasificar los lugares que aún no tienen categoría
+        con_coordenadas = lugares_georreferenciados(lugares, query)
+        
+        # 5. Grilla vectorizada
+        grilla = grilla_de_densidad(
+            lat=[p["lat"] for p in con_coordenadas],
+            lng=[p["lng"] for p in con_coordenadas],
+            categoria=[CATEGORIAS_MERCADO.index(p["category"]) for p in con_coordenadas],
+            rating=[p["rating"] if p["rating"] is not None else float("nan") for p in con_coordenadas],
+            centro=centro,
+            radio_km=radio_km,
+            celda_km=celda_km,
+            categorias=CATEGORIAS_MERCADO
+        )
+    except Exception as e:
+        print(f"ERROR: Error inesperado en mapa de densidad: {e}")
+        return {"ubicacion": ubicacion, "error": f"Error inesperado: {str(e)}"}
+    
+    grilla.update({
+        "ubicacion": ubicacion,
+        "lugares_evaluados": len(con_coordenadas),
+        "fuentes": fuentes,
+        "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 1)
+    })
+    print(f"✓ Mapa de densidad: {grilla['total_lugares']} lugares en {grilla['celdas_ocupadas']} celdas")
+    return grilla
+
+@mcp.tool()
+def colaboradores_cercanos(
+    k: int = 3,
+    distancia_max_km: float = 10.0,
+    eps_km: float = 2.0,
+    min_lugares: int = 3,
+    query: str = "tour astronómico",
+    ubicacion: str = "",
+    radio_km: float = 50
+) -> Dict[str, Any]:
+    """
+    Cruza geográficamente la competencia con los colaboradores potenciales del
+    caché: para cada competidor entrega los k colaboradores (alojamiento,
+    restaurantes, etc.) más cercanos, y detecta polos turísticos mediante
+    agrupamiento por densidad (DBSCAN) sobre un KD-tree.
+    
+    Args:
+        k: Cantidad de colaboradores cercanos por competidor (default: 3)
+        distancia_max_km: Distancia máxima para considerar un colaborador (default: 10)
+        eps_km: Radio de vecindad para formar grupos (default: 2)
+        min_lugares: Lugares mínimos en la vecindad para iniciar un grupo (default: 3)
+        query: Actividad de referencia para clasificar lugares (default: "tour astronómico")
+        ubicacion: Si se indica, limita el análisis a radio_km alrededor de esta ubicación
+        radio_km: Radio de la región cuando se indica ubicacion (default: 50)
+    
+    Returns:
+        Colaboradores cercanos por competidor y grupos (polos) con su composición
+    """
+    inicio = time.perf_counter()
+    
+    try:
+        lugares = lugares_georreferenciados(lugares_en_cache(CACHE_DIR), query)
+        
+        # 1. Limitar a la región indicada
+        if ubicacion:
+            api_key = clave_api_en_linea()
+            if api_key:
+                centro = geocodificar(ubicacion, obtener_places_client(api_key))
+            else:
+                centro = get_geocode_from_cache(ubicacion, permitir_vencido=True)
+            if not centro:
+                return {"ubicacion": ubicacion, "error": f"No se pudo geocodificar '{ubicacion}'"}
+            distancias = haversine_km(centro["lat"], centro["lng"],
+                                      [p["lat"] for p in lugares], [p["lng"] for p in lugares])
+            lugares = [p for p, d in zip(lugares, distancias.tolist()) if d <= radio_km]
+        
+        competidores = [p for p in lugares if p["category"] != "colaboradores_potenciales"]
+        colaboradores = [p for p in lugares if p["category"] == "colaboradores_potenciales"]
+        
+        # 2. k colaboradores más cercanos por competidor (consulta en lote)
+        arbol_colaboradores = ArbolKD([p["lat"] for p in colaboradores], [p["lng"] for p in colaboradores])
+        vecinos = arbol_colaboradores.k_vecinos(
+            [p["lat"] for p in competidores], [p["lng"] for p in competidores], k, distancia_max_km
+        )
+        cercanos = [
+            {
+                "place_id": competidor["place_id"],
+                "name": competidor["name"],
+                "category": competidor["category"],
+                "colaboradores": [
+                    {
+                        "place_id": colaboradores[indice]["place_id"],
+                        "name": colaboradores[indice]["name"],
+                        "types": colaboradores[indice]["types"],
+                        "rating": colaboradores[indice]["rating"],
+                        "distancia_km": distancia
+                    }
+                    for indice, distancia in lista
+                ]
+            }
+            for competidor, lista in zip(competidores, vecinos)
+        ]
+        
+        # 3. Polos turísticos por densidad
+        arbol = ArbolKD([p["lat"] for p in lugares], [p["lng"] for p in lugares])
+        etiquetas = dbscan(arbol, eps_km, min_lugares)
+        grupos = []
+        for grupo in range(int(etiquetas.max()) + 1 if len(etiquetas) else 0):
+            miembros = [lugares[i] for i in np.nonzero(etiquetas == grupo)[0].tolist()]
+            por_categoria = {c: sum(1 for m in miembros if m["category"] == c) for c in CATEGORIAS_MERCADO}
+            ratings = [m["rating"] for m in miembros if m["rating"] is not None]
+            hay_competencia = por_categoria["competencia_directa"] + por_categoria["competencia_indirecta"] > 0
+            grupos.append({
+                "grupo": grupo,
+                "tipo": (
+                    "polo_turistico" if hay_competencia and por_categoria["colaboradores_potenciales"]
+                    else "concentracion_competencia" if hay_competencia
+                    else "concentracion_colaboradores"
+                ),
+                "centro": {
+                    "lat": round(sum(m["lat"] for m in miembros) / len(miembros), 5),
+                    "lng": round(sum(m["lng"] for m in miembros) / len(miembros), 5)
+                },
+                "total_lugares": len(miembros),
+                "por_categoria": por_categoria,
+                "rating_promedio": round(sum(ratings) / len(ratings), 2) if ratings else None,
+                "lugares": [{"place_id": m["place_id"], "name": m["name"], "category": m["category"]} for m in miembros[:10]]
+            })
+        grupos.sort(key=lambda g: g["total_lugares"], reverse=True)
+    except Exception as e:
+        print(f"ERROR: Error inesperado en cruce de colaboradores: {e}")
+        return {"error": f"Error inesperado: {str(e)}"}
+    
+    print(f"✓ Cruce geográfico: {len(competidores)} competidores, {len(colaboradores)} colaboradores, {len(grupos)} grupos")
+    return {
+        "total_lugares": len(lugares),
+        "total_competidores": len(competidores),
+        "total_colaboradores": len(colaboradores),
+        "parametros": {"k": k, "distancia_max_km": distancia_max_km, "eps_km": eps_km, "min_lugares": min_lugares},
+        "colaboradores_por_competidor": cercanos,
+        "grupos": grupos,
+        "sin_grupo": int((etiquetas == -1).sum()),
+        "fuente": "cache_local",
+        "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 1)
+    }
+
+CRITERIOS_TENDENCIA = ["delta_resenas", "resenas_por_dia", "delta_rating", "pendiente_rating_30d", "rating_actual"]
+
+@mcp.tool()
+def tendencias_competidores(
+    place_ids: List[str] = None,
+    dias: int = 90,
+    ordenar_por: str = "delta_resenas",
+    max_lugares: int = 50,
+    importar_cache_existente: bool = False
+) -> Dict[str, Any]:
+    """
+    Muestra la trayectoria de rating y cantidad de reseñas de muchos lugares a la vez,
+    a partir del historial que se llena automáticamente con cada consulta a la API v1.
+    
+    Args:
+        place_ids: Lugares a analizar; por defecto todos los del historial
+        dias: Ventana de análisis en días (default: 90)
+        ordenar_por: Criterio de orden descendente: "delta_resenas", "resenas_por_dia",
+                     "delta_rating", "pendiente_rating_30d" o "rating_actual"
+        max_lugares: Cantidad máxima de lugares en la respuesta (default: 50)
+        importar_cache_existente: Si es True primero siembra el historial con las
+                                  observaciones de los cachés y respaldos raw_*.json
+    
+    Returns:
+        Por lugar: valores inicial y actual, deltas, pendiente del rating (por 30 días)
+        y reseñas nuevas por día, ordenados por el criterio indicado
+    """
+    inicio = time.perf_counter()
+    if ordenar_por not in CRITERIOS_TENDENCIA:
+        return {"error": f"ordenar_por debe ser uno de {CRITERIOS_TENDENCIA}"}
+    
+    try:
+        importadas = importar_desde_cache(iter_registros_en_cache(CACHE_DIR)) if importar_cache_existente else 0
+        resultado = tendencias(place_ids, dias, ordenar_por=ordenar_por, limite=max_lugares)
+    except Exception as e:
+        print(f"ERROR: Error inesperado en tendencias de competidores: {e}")
+        return {"error": f"Error inesperado: {str(e)}"}
+    
+    print(f"✓ Tendencias calculadas para {resultado['total_lugares']} lugares en {dias} días")
+    return {
+        "dias": dias,
+        "total_lugares": resultado["total_lugares"],
+        "ordenado_por": ordenar_por,
+        "observaciones_importadas": importadas,
+        "lugares": resultado["lugares"],
+        "fuente": "historial_local",
+        "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 1)
+    }
+
+@mcp.tool()
+def buscar_en_resenas(
+    consulta: str,
+    place_ids: List[str] = None,
+    rating_min: float = None,
+    rating_max: float = None,
+    idiomas: List[str] = None,
+    max_resultados: int = 20,
+    reconstruir: bool = False
+) -> Dict[str, Any]:
+    """
+    Busca en el texto de todas las reseñas en caché (sin llamar a la API), p. ej.
+    "qué competidores reciben quejas por frío o precio".
+    Usa un índice invertido con plegado de acentos, stemmer para español y
+    ranking BM25; el índice se actualiza a medida que llegan reseñas nuevas.
+    
+    Args:
+        consulta: Palabras a buscar (ej: "frío caro precio")
+        place_ids: Limitar la búsqueda a estos lugares
+        rating_min: Solo reseñas con rating >= este valor (ej: 1)
+        rating_max: Solo reseñas con rating <= este valor (ej: 3 para quejas)
+        idiomas: Solo reseñas en estos idiomas (ej: ["es"])
+        max_resultados: Cantidad máxima de reseñas a retornar (default: 20)
+        reconstruir: Si es True reconstruye el índice desde el caché RAW antes de buscar
+    
+    Returns:
+        Reseñas ordenadas por relevancia con un fragmento del texto, y un
+        resumen por lugar con la cantidad de coincidencias
+    """
+    inicio = time.perf_counter()
+    try:
+        asegurar_indice_resenas(reconstruir)
+        
+        resultado = indice_resenas.buscar(
+            consulta, place_ids=place_ids, rating_min=rating_min, rating_max=rating_max,
+            idiomas=idiomas, limite=max_resultados
+        )
+        if not resultado["terminos"]:
+            return {"error": "La consulta no contiene términos buscables", "fuente": "indice_local"}
+        
+        print(f"✓ Búsqueda en reseñas '{consulta}': {resultado['total_coincidencias']} coincidencias")
+        return {
+            "consulta": consulta,
+            **resultado,
+            "fuente": "indice_local",
+            "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
+        }
+    except Exception as e:
+        print(f"ERROR: Error inesperado en búsqueda de reseñas: {e}")
+        return {"error": f"Error inesperado: {str(e)}", "fuente": "indice_local"}
+
+@mcp.tool()
+def temas_distintivos(
+    place_id: str,
+    comparar_con: List[str] = None,
+    metodo: str = "log_odds",
+    max_temas: int = 10,
+    min_menciones: int = 2
+) -> Dict[str, Any]:
+    """
+    Extrae los temas (palabras y frases de dos palabras) que distinguen las
+    reseñas de un lugar frente al resto de las reseñas en caché, sin una lista
+    fija de palabras clave y sin llamar a la API.
+    
+    Args:
+        place_id: ID del lugar (sus reseñas deben estar en caché, p. ej. vía analizador_de_opiniones)
+        comparar_con: place_ids que forman la región de comparación (default: todo el corpus)
+        metodo: "log_odds" (log-odds con prior de Dirichlet, z-score) o "tfidf"
+        max_temas: Cantidad máxima de temas (default: 10)
+        min_menciones: Reseñas del lugar que deben mencionar un tema (default: 2)
+    
+    Returns:
+        Temas ordenados por distintividad, con menciones y frecuencia en el
+        lugar y en la región
+    """
+    inicio = time.perf_counter()
+    if metodo not in METODOS_TEMAS:
+        return {"error": f"metodo debe ser uno de {METODOS_TEMAS}", "fuente": "indice_local"}
+    try:
+        asegurar_indice_resenas()
+        resultado = obtener_corpus().temas(place_id, comparar_con, metodo, max_temas, max(min_menciones, 1))
+        if resultado is None:
+            return {
+                "place_id": place_id,
+                "error": "No hay reseñas en caché para este lugar; usa analizador_de_opiniones primero",
+                "fuente": "indice_local"
+            }
+        
+        print(f"✓ Temas distintivos de {place_id}: {len(resultado['temas'])} ({metodo})")
+        return {
+            **resultado,
+            "fuente": "indice_local",
+            "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
+        }
+    except Exception as e:
+        print(f"ERROR: Error inesperado en temas distintivos: {e}")
+        return {"error": f"Error inesperado: {str(e)}", "fuente": "indice_local"}
+
+def reconstruir_agregados_regionales() -> Dict[str, int]:
+    """Recalcula los agregados regionales desde los mapeos y análisis de reseñas en caché"""
+    mapeos = [
+        (entrada["query"], entrada["ubicacion"], entrada.get("data", {}).get("clasificacion", {}))
+        for entrada in load_cache(PLACES_CACHE_FILE).values()
+        if isinstance(entrada, dict) and entrada.get("query") and entrada.get("ubicacion")
+    ]
+    analisis = [
+        (entrada.get("place_id") or clave.split("|")[0], entrada.get("timestamp", ""), entrada.get("data", {}))
+        for clave, entrada in load_cache(REVIEWS_CACHE_FILE).items()
+        if isinstance(entrada, dict)
+    ]
+    return vistas_regionales.reconstruir(mapeos, analisis)
+
+@mcp.tool()
+def agregados_regionales(
+    ubicacion: str,
+    categoria: str = TODAS,
+    query: str = TODAS,
+    umbral_rating: float = None,
+    reconstruir: bool = False
+) -> Dict[str, Any]:
+    """
+    Estadísticos precalculados de una región sin recorrer los cachés ni llamar a
+    la API: cantidad de lugares, rating promedio y varianza, proporción de
+    lugares sobre un umbral de rating, volumen de reseñas y mezcla de
+    sentimientos. Se actualizan con cada mapeo y cada análisis de reseñas.
+    
+    Args:
+        ubicacion: Región tal como se usó en mapeo_competencia_y_colaboradores (ej: "Palermo, Buenos Aires")
+        categoria: "competencia_directa", "competencia_indirecta", "colaboradores_potenciales"
+                   o "*" para todas (default)
+        query: Búsqueda del mapeo (ej: "cafetería") o "*" para todas las búsquedas de la región (default)
+        umbral_rating: Si se indica, cuenta los lugares con rating mayor a este valor (ej: 4.5)
+        reconstruir: Si es True primero recalcula todos los agregados desde los cachés
+    
+    Returns:
+        Estadísticos de la vista (región, categoría, query)
+    """
+    inicio = time.perf_counter()
+    try:
+        reconstruidos = reconstruir_agregados_regionales() if reconstruir else None
+        resultado = vistas_regionales.consultar(ubicacion, categoria, query, umbral_rating)
+        if resultado is None:
+            return {
+                "ubicacion": ubicacion,
+                "categoria": categoria,
+                "query": query,
+                "error": "No hay agregados para esta región, categoría y query; usa mapeo_competencia_y_colaboradores primero",
+                "disponibles": vistas_regionales.disponibles(ubicacion) or vistas_regionales.disponibles(),
+                "fuente": "agregados_locales"
+            }
+        
+        print(f"✓ Agregados regionales de {ubicacion} ({categoria}, {query}): {resultado['lugares']} lugares")
+        return {
+            **resultado,
+            **({"reconstruccion": reconstruidos} if reconstruidos else {}),
+            "fuente": "agregados_locales",
+            "tiempo_ms": round((time.perf_counter() - inicio) * 1000, 2)
+        }
+    except Exception as e:
+        print(f"ERROR: Error inesperado en agregados regionales: {e}")
+        return {"error": f"Error inesperado: {str(e)}", "fuente": "agregados_locales"}
+
+@mcp.tool()
+def exportar_cache(
+    conjuntos: List[str] = None,
+    formato: str = "jsonl",
+    region: str = None,
+    query: str = None,
+    desde: str = None,
+    hasta: str = None
+) -> Dict[str, Any]:
+    """
+    Exporta los lugares (con su clasificación) y las reseñas en caché a archivos
+    en cache/exports/, sin llamar a la API. Los registros se procesan de a lotes,
+    sin cargar el resultado completo en memoria.
+    
+    Args:
+        conjuntos: "lugares" y/o "resenas" (default: ambos)
+        formato: "jsonl", "csv" o "parquet" (parquet requiere pyarrow)
+        region: Texto contenido en la ubicación buscada o la dirección (ej: "Elqui")
+        query: Texto contenido en la consulta que encontró el lugar (ej: "tour")
+        desde: Fecha mínima YYYY-MM-DD (fecha del caché para lugares, de publicación para reseñas)
+        hasta: Fecha máxima YYYY-MM-DD
+    
+    Returns:
+        Ruta, cantidad de filas y tamaño de cada archivo generado
+    """
+    try:
+        resultado = exportar(conjuntos, formato, region, query, desde, hasta)
+    except ValueError as e:
+        return {"error": str(e), "fuente": "cache_local"}
+    except Exception as e:
+        print(f"ERROR: Error inesperado al exportar el caché: {e}")
+        return {"error": f"Error inesperado: {str(e)}", "fuente": "cache_local"}
+    
+    for archivo in resultado["archivos"]:
+        print(f"✓ Exportados {archivo['filas']} registros de {archivo['conjunto']} a {archivo['ruta']}")
+    return {**resultado, "fuente": "cache_local"}
+
+@mcp.tool()
+def seguimiento_competidores(
+    accion: str = "listar",
+    query: str = None,
+    ubicacion: str = None,
+    radio_km: int = 50,
+    place_id: str = None,
+    idiomas: List[str] = None,
+    importancia: float = 1.0
+) -> Dict[str, Any]:
+    """
+    Herramienta administrativa: gestiona las búsquedas y lugares que se mantienen
+    frescos en segundo plano. La prioridad de cada entrada combina su antigüedad
+    respecto a la expiración del caché, su frecuencia de acceso y su importancia.
+    
+    Args:
+        accion: "listar", "agregar", "quitar" o "ejecutar" (un ciclo de refresco inmediato)
+        query: Búsqueda a seguir (con ubicacion y radio_km)
+        ubicacion: Ubicación de la búsqueda
+        radio_km: Radio de la búsqueda en kilómetros (default: 50)
+        place_id: Lugar cuyo análisis de reseñas se sigue (alternativa a query)
+        idiomas: Idiomas del análisis de reseñas (default: ["es"])
+        importancia: Peso de la entrada en la prioridad (default: 1.0)
+    
+    Returns:
+        Entradas seguidas con su prioridad, o el resultado de la acción
+    """
+    acciones = ["listar", "agregar", "quitar", "ejecutar"]
+    if accion not in acciones:
+        return {"error": f"accion debe ser una de {acciones}"}
+    
+    try:
+        if accion == "ejecutar":
+            return programador.ejecutar_ciclo()
+        
+        if accion in ("agregar", "quitar"):
+            if query and ubicacion:
+                tipo, params = "busqueda", {"query": query, "ubicacion": ubicacion, "radio_km": radio_km}
+            elif place_id:
+                idiomas = list(dict.fromkeys(idiomas or ["es"]))
+                tipo, params = "resenas", {"place_id": place_id, "idiomas": idiomas}
+            else:
+                return {"error": "Indica query y ubicacion, o place_id"}
+            if accion == "agregar":
+                clave = programador.seguir(tipo, params, importancia=importancia)
+                return {"accion": accion, "clave": clave, "importancia": importancia}
+            clave = clave_seguimiento(tipo, params)
+            return {"accion": accion, "clave": clave, "eliminada": programador.dejar_de_seguir(clave)}
+        
+        seguidas = programador.listar()
+        return {
+            "total_seguidas": len(seguidas),
+            "candidatas": sum(1 for f in seguidas if f["candidata"]),
+            "max_por_hora": REFRESH_MAX_POR_HORA,
+            "intervalo_minutos": REFRESH_INTERVAL_MIN,
+            "seguidas": seguidas
+        }
+    except Exception as e:
+        print(f"ERROR: Error inesperado en seguimiento de competidores: {e}")
+        return {"error": f"Error inesperado: {str(e)}"}
+
+@mcp.tool()
+def compactar_cache(dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Herramienta administrativa: compacta el caché local.
+    Elimina las entradas sin uso durante CACHE_STALE_RETENTION_H, solo si la API
+    puede volver a traerlas (las vencidas se sirven cuando no se puede consultar
+    la API), aplica los presupuestos de tamaño por archivo (desalojo LRU/LFU),
+    deduplica los respaldos raw_*.json heredados y acota el almacén de
+    respuestas de la jerarquía de caché (cache/api/).
+    
+    Args:
+        dry_run: Si es True solo reporta lo que se eliminaría, sin borrar nada
+    
+    Returns:
+        Reporte por caché con entradas eliminadas y bytes recuperados
+    """
+    try:
+        reporte = compactar_todo(CACHE_DIR, dry_run=dry_run)
+        print(f"✓ Compactación {'simulada' if dry_run else 'completada'}: {reporte['bytes_recuperados']} bytes recuperados")
+        return reporte
+    except Exception as e:
+        print(f"ERROR: Error inesperado en compactación de caché: {e}")
+        return {"error": f"Error inesperado: {str(e)}"}
+
+@mcp.tool()
+def resumen_costos_api(dias: int = 7) -> Dict[str, Any]:
+    """
+    Herramienta administrativa: muestra el libro de costos de la API de Google.
+    
+    Args:
+        dias: Cantidad de días recientes a incluir (default: 7)
+    
+    Returns:
+        Llamadas facturables y costo estimado por día, herramienta y SKU,
+        junto con el estado del presupuesto diario (PLACES_DAILY_BUDGET_USD)
+        las consultas que el caché negativo evitó y los aciertos por nivel de
+        la jerarquía de caché
+    """
+    return {
+        **resumen_costos(dias),
+        "cache_negativo": cache_negativo.estadisticas(),
+        "jerarquia_cache": jerarquia_cache.estadisticas()
+    }
+
+@mcp.tool()
+def perfilado_herramientas(
+    accion: str = "estado",
+    herramientas: List[str] = None,
+    fraccion: float = None,
+    modo: str = None,
+    intervalo_ms: float = None,
+    limite: int = 20
+) -> Dict[str, Any]:
+    """
+    Herramienta administrativa: activa el perfilado de herramientas y lista los perfiles capturados.
+    Cada llamada perfilada deja en cache/profiles un archivo .collapsed (pilas
+    colapsadas para flamegraph.pl o speedscope) y un .speedscope.json.
+    
+    Args:
+        accion: "estado", "configurar" o "listar"
+        herramientas: (configurar) Herramientas que se perfilan siempre; ["*"] = todas, [] = ninguna
+        fraccion: (configurar) Fracción 0-1 de llamadas a mapeo, opiniones y detalles v1 que se perfila al azar
+        modo: (configurar) "muestreo" (bajo costo) o "determinista" (cada llamada y retorno)
+        intervalo_ms: (configurar) Intervalo entre muestras en modo muestreo
+        limite: (listar) Cantidad de perfiles recientes a mostrar
+    
+    Returns:
+        Configuración vigente y, al listar, los perfiles más recientes
+    """
+    try:
+        if accion == "configurar":
+            vigente = profiling.configurar(herramientas, fraccion, modo, intervalo_ms)
+            print(f"✓ Perfilado configurado: {vigente}")
+        elif accion in ("estado", "listar"):
+            vigente = dict(profiling.config)
+        else:
+            return {"error": "accion debe ser 'estado', 'configurar' o 'listar'"}
+
+        resultado = {"configuracion": vigente, "perfilables": profiling.HERRAMIENTAS_PERFILABLES}
+        if accion == "listar":
+            resultado["perfiles"] = profiling.listar_perfiles(limite)
+        return resultado
+    except ValueError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        print(f"ERROR: Error inesperado en perfilado de herramientas: {e}")
+        return {"error": f"Error inesperado: {str(e)}"}
+
+@mcp.tool()
+def metricas_transporte(
+    accion: str = "estado",
+    modo_json: str = None,
+    compresion: bool = None,
+    compresion_min_bytes: int = None
+) -> Dict[str, Any]:
+    """
+    Herramienta administrativa: bytes enviados por el transporte HTTP y configuración de su codificación.
+    Muestra, para este proceso, bytes originales y enviados por codificación
+    (gzip, zstd o identidad), ratio y tiempo de compresión, y por herramienta
+    los bytes y el tiempo de serialización del resultado.
+    
+    Args:
+        accion: "estado", "configurar" o "reiniciar" (pone las métricas en cero)
+        modo_json: (configurar) "estandar" o "compacto" (listas de objetos como tabla de columnas y filas)
+        compresion: (configurar) Activa o desactiva la compresión gzip/zstd
+        compresion_min_bytes: (configurar) Tamaño mínimo de respuesta que se comprime
+    
+    Returns:
+        Configuración vigente y métricas de bytes y serialización
+    """
+    try:
+        if accion == "configurar":
+            vigente = response_encoding.configurar(modo_json, compresion, compresion_min_bytes)
+            print(f"✓ Codificación de respuestas configurada: {vigente}")
+        elif accion == "reiniciar":
+            response_encoding.reiniciar_metricas()
+        elif accion != "estado":
+            return {"error": "accion debe ser 'estado', 'configurar' o 'reiniciar'"}
+        return response_encoding.metricas()
+    except ValueError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        print(f"ERROR: Error inesperado en métricas de transporte: {e}")
+        return {"error": f"Error inesperado: {str(e)}"}
+
+@mcp.tool()
+def memoria_proceso(
+    accion: str = "estado",
+    nombre: str = None,
+    base: str = None,
+    agrupar_por: str = "lineno",
+    limite: int = 15,
+    marcos: int = 1,
+    presupuesto_mb: float = None,
+    caches: List[str] = None
+) -> Dict[str, Any]:
+    """
+    Herramienta administrativa: memoria del proceso, snapshots de tracemalloc y presupuesto de memoria.
+    El estado muestra por herramienta el pico de asignaciones de cada llamada,
+    la memoria que retiene al terminar y la variación del RSS, y por caché en
+    memoria (jerarquía, corpus de temas, índice de reseñas y copias de los
+    JSON como reviews_raw_cache.json) su tamaño retenido y sus entradas.
+    Los picos y snapshots requieren tracemalloc (accion="iniciar" o MEMORIA_TRACEMALLOC=1).
+    
+    Args:
+        accion: "estado", "iniciar", "detener", "snapshot", "comparar", "liberar", "configurar" o "reiniciar"
+        nombre: (snapshot) Nombre del snapshot; (comparar) snapshot a comparar, sin valor uno nuevo tomado ahora
+        base: (comparar) Snapshot de referencia; sin valor el más reciente
+        agrupar_por: (snapshot, comparar) "lineno", "filename" o "traceback"
+        limite: (snapshot, comparar) Cantidad de ubicaciones a mostrar
+        marcos: (iniciar) Profundidad de la traza guardada por asignación
+        presupuesto_mb: (configurar) Límite de memoria que dispara la liberación de cachés; 0 = sin límite
+        caches: (liberar) Cachés a liberar; sin valor todos
+    
+    Returns:
+        Estado de la memoria, el snapshot tomado o la comparación entre snapshots
+    """
+    try:
+        if accion == "iniciar":
+            memory_tracking.iniciar_tracemalloc(marcos)
+            print(f"✓ tracemalloc activo ({marcos} marcos)")
+        elif accion == "detener":
+            memory_tracking.detener_tracemalloc()
+            print("✓ tracemalloc detenido")
+        elif accion == "snapshot":
+            return memory_tracking.tomar_snapshot(nombre, agrupar_por, limite)
+        elif accion == "comparar":
+            return memory_tracking.comparar_snapshots(nombre, base, agrupar_por, limite)
+        elif accion == "liberar":
+            liberados = memory_tracking.liberar_caches(caches)
+            print(f"✓ Cachés en memoria liberados: {liberados}")
+        elif accion == "configurar":
+            vigente = memory_tracking.configurar(presupuesto_mb)
+            print(f"✓ Memoria configurada: {vigente}")
+            memory_tracking.verificar_presupuesto(forzar=True)
+        elif accion == "reiniciar":
+            memory_tracking.reiniciar_metricas()
+        elif accion != "estado":
+            return {"error": "accion debe ser 'estado', 'iniciar', 'detener', 'snapshot', 'comparar', "
+                             "'liberar', 'configurar' o 'reiniciar'"}
+        return memory_tracking.estado()
+    except ValueError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        print(f"ERROR: Error inesperado en memoria del proceso: {e}")
+        return {"error": f"Error inesperado: {str(e)}"}
+
+@mcp.tool()
+def modo_offline(activar: bool = None) -> Dict[str, Any]:
+    """
+    Herramienta administrativa: activa, desactiva o consulta el modo offline.
+    Con el modo offline activo las herramientas responden solo con los datos
+    locales (cachés procesados, almacén de la jerarquía y respaldos raw_*.json),
+    usando la mejor coincidencia aunque esté vencida, y nunca llaman a la API:
+    respuestas sin latencia de red ni costo para demos, análisis sin conexión y pruebas.
+    Cada respuesta servida así lleva "modo_offline" con la coincidencia usada,
+    su fecha y si está vencida.
+    
+    Args:
+        activar: True lo activa, False lo desactiva; sin valor solo informa el estado
+    
+    Returns:
+        Estado del modo offline (en este proceso; MODO_OFFLINE=1 lo activa en
+        todos los workers) y datos locales disponibles
+    """
+    try:
+        if activar is not None:
+            offline_mode.configurar(activar)
+            print(f"✓ Modo offline {'activado' if activar else 'desactivado'}")
+        return {
+            "activo": offline_mode.activo(),
+            "datos_locales": {
+                "busquedas": len(load_cache(PLACES_CACHE_FILE)),
+                "analisis_resenas": len(load_cache(REVIEWS_CACHE_FILE)),
+                "respuestas_almacen": jerarquia_cache.estadisticas()["almacen_por_operacion"]
+            }
+        }
+    except Exception as e:
+        print(f"ERROR: Error inesperado en modo offline: {e}")
+        return {"error": f"Error inesperado: {str(e)}"}
+
+# Compresión gzip/zstd de las respuestas HTTP (ver response_encoding.py)
+MIDDLEWARE_HTTP = [ASGIMiddleware(response_encoding.CompresionMiddleware)]
+
+# Bloqueo del proceso dueño del mantenimiento; se mantiene abierto mientras viva el proceso
+_bloqueo_mantenimiento = None
+_mantenimiento_lock = threading.Lock()
+_hilo_trabajador = None
+
+def _tomar_mantenimiento() -> bool:
+    """
+    Toma el bloqueo cache/.maintenance.lock si está libre y, al obtenerlo,
+    inicia la compactación periódica y la actualización programada.
+    
+    Returns:
+        True si este proceso está a cargo del mantenimiento
+    """
+    global _bloqueo_mantenimiento
+    with _mantenimiento_lock:
+        if _bloqueo_mantenimiento is not None:
+            return True
+        _bloqueo_mantenimiento = intentar_bloqueo_exclusivo(CACHE_DIR / ".maintenance")
+        if _bloqueo_mantenimiento is None:
+            return False
+    print(f"✓ Mantenimiento del caché a cargo de este proceso (pid {os.getpid()})")
+    iniciar_compactacion_periodica(CACHE_DIR, CACHE_COMPACTION_INTERVAL_MIN)
+    programador.iniciar(REFRESH_INTERVAL_MIN)
+    return True
+
+def _ciclo_trabajador() -> None:
+    """Cada ACCESOS_VOLCADO_MIN: vuelca los accesos de este proceso y, si no es el dueño, reintenta el mantenimiento."""
+    while True:
+        time.sleep(ACCESOS_VOLCADO_MIN * 60)
+        try:
+            volcar_accesos()
+            _tomar_mantenimiento()
+        except Exception as e:
+            print(f"WARNING: Falló el ciclo de mantenimiento del proceso: {e}")
+
+def iniciar_mantenimiento() -> bool:
+    """
+    Inicia la compactación periódica y la actualización programada solo en el
+    proceso que obtiene el bloqueo cache/.maintenance.lock. Con varios workers
+    (o varios servidores sobre el mismo caché) los demás solo atienden
+    solicitudes, de modo que el presupuesto REFRESH_MAX_POR_HORA no se
+    multiplica ni se reescriben los mismos archivos en paralelo.
+    
+    Todos los procesos vuelcan sus accesos a disco cada ACCESOS_VOLCADO_MIN
+    minutos (el desalojo LRU/LFU ve el tráfico de todos los workers) y los
+    que no son dueños reintentan el bloqueo con la misma frecuencia: si el
+    dueño termina, otro worker en marcha toma el mantenimiento.
+    
+    Returns:
+        True si este proceso quedó a cargo del mantenimiento
+    """
+    global _hilo_trabajador
+    a_cargo = _tomar_mantenimiento()
+    if not a_cargo:
+        print(f"✓ Mantenimiento del caché a cargo de otro proceso (pid {os.getpid()} solo atiende solicitudes)")
+    if ACCESOS_VOLCADO_MIN > 0 and _hilo_trabajador is None:
+        _hilo_trabajador = threading.Thread(target=_ciclo_trabajador, name="mantenimiento-trabajador", daemon=True)
+        _hilo_trabajador.start()
+    return a_cargo
+
+def crear_app_http():
+    """
+    Factory ASGI para el modo multi-worker.
+    Cada worker es un proceso independiente detrás del mismo socket, por lo que
+    las sesiones MCP no pueden vivir en memoria: se usa HTTP sin estado.
+    """
+    iniciar_mantenimiento()
+    return mcp.http_app(stateless_http=True, middleware=MIDDLEWARE_HTTP)
+
 if __name__ == "__main__":
-    mcp.run(transport="http", host="0.0.0.0", port=8000)
\ No newline at end of file
+    # MCP_WORKERS > 1 levanta N procesos que comparten el puerto MCP_PORT (8000).
+    # El caché JSON es seguro entre procesos (ver cache_store.py).
+    workers = int(os.getenv("MCP_WORKERS", "1"))
+    if workers > 1:
+        import uvicorn
+        uvicorn.run("server:crear_app_http", factory=True, host=MCP_HOST, port=MCP_PORT, workers=workers)
+    else:
+        iniciar_mantenimiento()
+        mcp.run(transport="http", host=MCP_HOST, port=MCP_PORT, middleware=MIDDLEWARE_HTTP)
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""
+Ejecución de etapas con dependencias (DAG) sobre un pool de hilos.
+Cada etapa arranca apenas terminan sus dependencias, y una etapa en curso
+puede agregar etapas nuevas al grafo (p. ej. una por lugar encontrado), de
+modo que el trabajo independiente se solapa en lugar de ejecutarse en serie.
+"""
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Dict, List, Any, Callable, Iterable, Tuple
+
+
+class GrafoDeEtapas:
+    """
+    Grafo de etapas con nombre. La función de cada etapa recibe un diccionario
+    con los resultados de sus dependencias. Si una dependencia falla, las
+    etapas que dependen de ella se omiten.
+    """
+
+    def __init__(self, max_workers: int = 8):
+        self.max_workers = max_workers
+        self._etapas: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._inicio = None
+
+    def agregar(self, nombre: str, funcion: Callable[[Dict[str, Any]], Any], depende_de: Iterable[str] = ()) -> None:
+        """Registra una etapa; se puede llamar también desde una etapa en ejecución."""
+        with self._lock:
+            if nombre in self._etapas:
+                raise ValueError(f"La etapa '{nombre}' ya existe")
+            self._etapas[nombre] = {
+                "funcion": funcion,
+                "depende_de": list(depende_de),
+                "estado": "pendiente",
+                "resultado": None,
+                "error": None,
+                "inicio_ms": None,
+                "duracion_ms": None,
+            }
+
+    def _ejecutar_etapa(self, nombre: str, entradas: Dict[str, Any]) -> Any:
+        etapa = self._etapas[nombre]
+        inicio = time.perf_counter()
+        etapa["inicio_ms"] = round((inicio - self._inicio) * 1000, 1)
+        try:
+            return etapa["funcion"](entradas)
+        finally:
+            etapa["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+
+    def _listas(self) -> Tuple[List[str], bool]:
+        """
+        Etapas pendientes cuyas dependencias terminaron. Marca como omitidas las
+        que ya no pueden correr e indica si hubo alguna (puede liberar a otras).
+        """
+        listas, omitidas = [], False
+        with self._lock:
+            for nombre, etapa in self._etapas.items():
+                if etapa["estado"] != "pendiente":
+                    continue
+                dependencias = [self._etapas.get(d) for d in etapa["depende_de"]]
+                if any(d is None for d in dependencias):
+                    continue
+                fallidas = [d for d, dep in zip(etapa["depende_de"], dependencias) if dep["estado"] in ("error", "omitida")]
+                if fallidas:
+                    etapa["estado"] = "omitida"
+                    etapa["error"] = f"Dependencia fallida: {', '.join(fallidas)}"
+                    omitidas = True
+                elif all(dep["estado"] == "completada" for dep in dependencias):
+                    etapa["estado"] = "en_curso"
+                    listas.append(nombre)
+        return listas, omitidas
+
+    def ejecutar(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Ejecuta el grafo hasta que no quedan etapas que puedan correr.
+        Cada hilo copia el contexto del llamador (atribución de costos por herramienta).
+
+        Returns:
+            Por etapa: estado ("completada", "error", "omitida"), resultado, error,
+            inicio_ms (relativo al inicio del grafo) y duracion_ms
+        """
+        self._inicio = time.perf_counter()
+        en_curso: Dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                # Las etapas omitidas pueden liberar a otras (que también se omiten)
+                omitidas = True
+                while omitidas:
+                    listas, omitidas = self._listas()
+                    for nombre in listas:
+                        entradas = {d: self._etapas[d]["resultado"] for d in self._etapas[nombre]["depende_de"]}
+                        futuro = executor.submit(contextvars.copy_context().run, self._ejecutar_etapa, nombre, entradas)
+                        en_curso[futuro] = nombre
+                if not en_curso:
+                    break
+
+                terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    etapa = self._etapas[en_curso.pop(futuro)]
+                    try:
+                        etapa["resultado"] = futuro.result()
+                        etapa["estado"] = "completada"
+                    except Exception as e:
+                        etapa["error"] = str(e)
+                        etapa["estado"] = "error"
+
+        with self._lock:
+            for etapa in self._etapas.values():
+                if etapa["estado"] == "pendiente":
+                    etapa["estado"] = "omitida"
+                    etapa["error"] = "Dependencia inexistente"
+            return {
+                nombre: {campo: etapa[campo] for campo in ("estado", "resultado", "error", "inicio_ms", "duracion_ms")}
+                for nombre, etapa in self._etapas.items()
+            }
@@ -0,0 +1,28 @@
+"""
+Configuración común de las pruebas.
+Los módulos del servidor usan rutas relativas (cache/...), así que cada prueba
+corre en un directorio temporal propio y nunca toca el caché del repositorio.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+
+# Clave falsa: ninguna prueba sale a la red
+os.environ.setdefault("GOOGLE_API_KEY", "AIzaPRUEBAS")
+os.environ.setdefault("REFRESH_IMPORTANCIA_AUTO", "0")
+os.environ.setdefault("CACHE_COMPACTION_INTERVAL_MIN", "0")
+os.environ.setdefault("REFRESH_INTERVAL_MIN", "0")
+
+
+@pytest.fixture
+def directorio_cache(tmp_path, monkeypatch):
+    """Directorio de trabajo temporal con un cache/ vacío; retorna la ruta de cache/."""
+    monkeypatch.chdir(tmp_path)
+    cache = tmp_path / "cache"
+    cache.mkdir()
+    return cache
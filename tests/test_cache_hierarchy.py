@@ -0,0 +1,85 @@
+import json
+import threading
+import time
+from datetime import datetime
+
+from cache_hierarchy import JerarquiaCache, jerarquia_cache
+from cached_places import detalles_a_formato_legacy
+from google_places_client import parametros_detalles, parametros_geocode
+
+PLACE_ID = "ChIJlegado"
+RESENA_LEGACY = {
+    "author_name": "Ana", "author_url": "https://maps.google.com/contrib/1", "language": "es",
+    "original_language": "es", "profile_photo_url": "", "rating": 4,
+    "relative_time_description": "hace un mes", "text": "Cielo espectacular", "time": 1745036303,
+    "translated": False,
+}
+
+
+def _escribir(ruta, contenido):
+    ruta.write_text(json.dumps(contenido, ensure_ascii=False), encoding="utf-8")
+
+
+def test_resenas_heredadas_en_formato_legacy_se_sirven_como_v1(directorio_cache):
+    ahora = datetime.now().isoformat()
+    _escribir(directorio_cache / "reviews_raw_cache.json", {PLACE_ID: {"timestamp": ahora, "data": {"result": {
+        "name": "Observatorio", "rating": 4.5, "user_ratings_total": 10, "reviews": [RESENA_LEGACY]}}}})
+
+    campos = ["displayName", "rating", "reviews", "userRatingCount"]
+    entrada = jerarquia_cache.leer("places.details", parametros_detalles(PLACE_ID, campos, "es"))
+
+    assert entrada["origen"] == "heredado" and not entrada["vencido"]
+    assert entrada["data"]["displayName"]["text"] == "Observatorio"
+    assert detalles_a_formato_legacy(entrada["data"])["reviews"][0] == RESENA_LEGACY
+    # Otro idioma u otra máscara no se pueden responder con ese archivo
+    assert jerarquia_cache.leer("places.details", parametros_detalles(PLACE_ID, campos, "en")) is None
+    assert jerarquia_cache.leer("places.details", parametros_detalles(PLACE_ID, campos + ["websiteUri"], "es")) is None
+
+
+def test_busqueda_heredada_responde_a_text_search_con_el_mismo_circulo(directorio_cache):
+    ahora = datetime.now().isoformat()
+    _escribir(directorio_cache / "geocode_cache.json", {"vicuña": {"timestamp": ahora, "data": {"lat": -30.03, "lng": -70.71}}})
+    _escribir(directorio_cache / "places_raw_cache.json", {"clave": {
+        "timestamp": ahora, "query": "Tour astronómico", "ubicacion": "Vicuña", "radio_km": 50,
+        "data": {"results": [{"place_id": PLACE_ID, "name": "Observatorio", "rating": 5, "price_level": 2,
+                              "geometry": {"location": {"lat": -30.0, "lng": -71.0}}, "types": ["establishment"]}]},
+    }})
+    centro = jerarquia_cache.leer("geocoding.geocode", parametros_geocode("Vicuña"))["data"]["results"][0]["geometry"]["location"]
+    cuerpo = {"textQuery": "tour astronómico", "languageCode": "es", "maxResultCount": 20,
+              "locationBias": {"circle": {"center": {"latitude": centro["lat"], "longitude": centro["lng"]}, "radius": 50000}}}
+    campos = ["places.displayName", "places.id", "places.location", "places.rating"]
+
+    entrada = jerarquia_cache.leer("places.searchText", {"cuerpo": cuerpo, "campos": campos})
+
+    assert entrada["origen"] == "heredado"
+    assert entrada["data"]["places"] == [{
+        "id": PLACE_ID, "displayName": {"text": "Observatorio"}, "location": {"latitude": -30.0, "longitude": -71.0},
+        "rating": 5, "types": ["establishment"], "priceLevel": "PRICE_LEVEL_MODERATE",
+    }]
+    otro_radio = {**cuerpo, "locationBias": {"circle": {**cuerpo["locationBias"]["circle"], "radius": 10000}}}
+    assert jerarquia_cache.leer("places.searchText", {"cuerpo": otro_radio, "campos": campos}) is None
+
+
+def test_cargas_concurrentes_de_una_clave_van_una_sola_vez_a_la_red(directorio_cache):
+    jerarquia = JerarquiaCache(directorio=directorio_cache / "api")
+    cargas = []
+    inicio = threading.Barrier(8)
+
+    def cargar():
+        cargas.append(1)
+        time.sleep(0.2)
+        return {"id": PLACE_ID}
+
+    def pedir(espera):
+        inicio.wait()
+        time.sleep(espera)  # Llegan escalonados, también mientras se suelta el candado
+        jerarquia.obtener("places.details", {"place_id": PLACE_ID}, cargar)
+
+    hilos = [threading.Thread(target=pedir, args=(i * 0.03,)) for i in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join(timeout=10)
+
+    assert len(cargas) == 1
+    assert jerarquia._en_vuelo == {}
@@ -0,0 +1,104 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import cost_ledger
+import offline_mode
+from cache_maintenance import ARCHIVOS_HEREDADOS, PRESUPUESTOS_CACHE, compactar_cache_json, compactar_todo
+from negative_cache import NEGATIVE_CACHE_TTL_LUGAR_H
+from cache_store import actualizar_json, leer_json
+
+
+def _hace(horas: float) -> str:
+    return (datetime.now() - timedelta(hours=horas)).isoformat()
+
+
+def test_compactacion_conserva_vencidas_dentro_de_la_retencion(directorio_cache):
+    archivo = directorio_cache / "places_cache.json"
+    actualizar_json(archivo, lambda data: data.update({
+        "vigente": {"data": {}, "timestamp": _hace(1)},
+        "vencida": {"data": {}, "timestamp": _hace(48)},  # Pasó CACHE_EXPIRY_HOURS (24 h)
+        "antigua": {"data": {}, "timestamp": _hace(24 * 40)},
+    }))
+
+    reporte = compactar_cache_json(archivo, PRESUPUESTOS_CACHE["places_cache.json"], retencion_vencidos_horas=24 * 30)
+
+    assert set(leer_json(archivo)) == {"vigente", "vencida"}
+    assert reporte["vencidas"] == 1
+
+
+def test_compactacion_en_modo_offline_conserva_lo_que_sirve_el_modo_offline(directorio_cache, monkeypatch):
+    import server
+
+    antigua = _hace(24 * 40)  # Pasó la retención de vencidos
+    actualizar_json(directorio_cache / "places_cache.json", lambda data: data.update({
+        server.get_cache_key("observatorio", "Vicuña", 20): {
+            "data": {"clasificacion": {"competencia_directa": [{"place_id": "P1", "name": "Observatorio Guardado"}]}},
+            "timestamp": antigua, "query": "observatorio", "ubicacion": "Vicuña", "radio_km": 20
+        }
+    }))
+    actualizar_json(directorio_cache / "reviews_cache.json", lambda data: data.update({
+        server.get_reviews_cache_key("P1", ["es"]): {
+            "data": {"place_id": "P1", "total_reviews": 3}, "timestamp": antigua, "place_id": "P1", "idiomas": ["es"]
+        }
+    }))
+    simulacion = compactar_todo(directorio_cache, retencion_vencidos_horas=24 * 30, dry_run=True)
+    assert {r["archivo"]: r["vencidas"] for r in simulacion["caches_json"]}["places_cache.json"] == 1
+
+    monkeypatch.setitem(offline_mode.config, "activo", True)
+    reporte = compactar_todo(directorio_cache, retencion_vencidos_horas=24 * 30)
+
+    assert reporte["purga_por_antiguedad"] is False
+    mapeo = server.mapeo_competencia_y_colaboradores.fn("observatorio", "Vicuña", 20)
+    assert mapeo["clasificacion"]["competencia_directa"][0]["name"] == "Observatorio Guardado"
+    assert mapeo["modo_offline"]["coincidencia"] == "exacta"
+    opiniones = server.analizador_de_opiniones.fn("P1", idiomas=["es"])
+    assert opiniones["total_reviews"] == 3
+    assert opiniones["modo_offline"]["vencido"] is True
+
+
+def test_compactacion_no_toca_los_archivos_heredados(directorio_cache):
+    antigua = _hace(24 * 400)
+    for nombre in ARCHIVOS_HEREDADOS:
+        (directorio_cache / nombre).write_text(json.dumps({
+            f"clave{i}": {"data": {"indice": i}, "timestamp": antigua} for i in range(3)
+        }))
+    respaldo = directorio_cache / "raw_place_details_P1.json"
+    respaldo.write_text(json.dumps({"data": {"id": "P1"}, "timestamp": antigua}))
+    hace_un_anio = datetime.now().timestamp() - 365 * 24 * 3600
+    os.utime(respaldo, (hace_un_anio, hace_un_anio))
+
+    reporte = compactar_todo(directorio_cache, retencion_vencidos_horas=1)
+
+    for nombre in ARCHIVOS_HEREDADOS:
+        assert set(leer_json(directorio_cache / nombre)) == {"clave0", "clave1", "clave2"}
+    assert respaldo.exists()
+    assert reporte["archivos_raw"]["bytes_recuperados"] == 0
+
+
+def test_compactacion_conserva_las_vencidas_que_se_siguen_sirviendo(directorio_cache):
+    archivo = directorio_cache / "reviews_cache.json"
+    actualizar_json(archivo, lambda data: data.update({
+        "en_uso": {"data": {}, "timestamp": _hace(24 * 40), "ultimo_acceso": _hace(2)},
+        "abandonada": {"data": {}, "timestamp": _hace(24 * 40), "ultimo_acceso": _hace(24 * 35)},
+    }))
+
+    compactar_todo(directorio_cache, retencion_vencidos_horas=24 * 30)
+
+    assert set(leer_json(archivo)) == {"en_uso"}
+
+
+def test_compactacion_sin_presupuesto_no_purga_por_antiguedad(directorio_cache, monkeypatch):
+    monkeypatch.setattr(cost_ledger, "PLACES_DAILY_BUDGET_USD", "1")
+    actualizar_json(cost_ledger.COST_LEDGER_FILE, lambda data: data.update({cost_ledger._hoy(): {"costo_usd": 1.5}}))
+    archivo = directorio_cache / "places_cache.json"
+    actualizar_json(archivo, lambda data: data.update({"antigua": {"data": {}, "timestamp": _hace(24 * 40)}}))
+
+    reporte = compactar_todo(directorio_cache, retencion_vencidos_horas=24 * 30)
+
+    assert reporte["purga_por_antiguedad"] is False
+    assert set(leer_json(archivo)) == {"antigua"}
+
+
+def test_retencion_del_cache_negativo_sigue_su_vigencia_mas_larga():
+    assert PRESUPUESTOS_CACHE["negative_cache.json"]["retencion_horas"] >= NEGATIVE_CACHE_TTL_LUGAR_H
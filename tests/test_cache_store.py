@@ -0,0 +1,91 @@
+import multiprocessing
+from pathlib import Path
+
+from cache_store import actualizar_json, intentar_bloqueo_exclusivo, leer_json, registrar_acceso, volcar_accesos
+
+INCREMENTOS = 150
+
+
+def _incrementar(ruta: str, worker: str, cantidad: int) -> None:
+    def _sumar(data):
+        data["contador"] = data.get("contador", 0) + 1
+        data.setdefault("claves", []).append(f"{worker}-{len(data['claves'])}")
+        data[worker] = data.get(worker, 0) + 1
+
+    for _ in range(cantidad):
+        actualizar_json(Path(ruta), _sumar)
+
+
+def _atender(ruta: str, aciertos: int) -> None:
+    for _ in range(aciertos):
+        registrar_acceso(Path(ruta), "caliente")
+    volcar_accesos()
+
+
+def _retener_bloqueo(ruta: str, tomado, soltar) -> None:
+    bloqueo = intentar_bloqueo_exclusivo(Path(ruta))
+    tomado.set()
+    soltar.wait(60)
+    bloqueo.close()
+
+
+def test_actualizar_json_concurrente_entre_procesos_no_pierde_escrituras(directorio_cache):
+    ruta = directorio_cache / "contador.json"
+    contexto = multiprocessing.get_context("spawn")
+    procesos = [contexto.Process(target=_incrementar, args=(str(ruta), f"w{i}", INCREMENTOS)) for i in range(2)]
+    for proceso in procesos:
+        proceso.start()
+    for proceso in procesos:
+        proceso.join(timeout=120)
+        assert proceso.exitcode == 0
+
+    data = leer_json(ruta)
+    assert data["contador"] == 2 * INCREMENTOS
+    assert data["w0"] == data["w1"] == INCREMENTOS
+    assert len(data["claves"]) == 2 * INCREMENTOS
+
+
+def test_leer_json_ve_la_escritura_de_otro_proceso(directorio_cache):
+    ruta = directorio_cache / "compartido.json"
+    actualizar_json(ruta, lambda data: data.update(contador=0))
+    assert leer_json(ruta)["contador"] == 0
+
+    proceso = multiprocessing.get_context("spawn").Process(target=_incrementar, args=(str(ruta), "otro", 1))
+    proceso.start()
+    proceso.join(timeout=60)
+
+    assert proceso.exitcode == 0
+    assert leer_json(ruta)["contador"] == 1
+
+
+def test_volcar_accesos_suma_el_trafico_de_todos_los_workers(directorio_cache):
+    ruta = directorio_cache / "places_cache.json"
+    actualizar_json(ruta, lambda data: data.update(caliente={"data": {}, "timestamp": "2026-01-01T00:00:00"}))
+    contexto = multiprocessing.get_context("spawn")
+    procesos = [contexto.Process(target=_atender, args=(str(ruta), aciertos)) for aciertos in (3, 4)]
+    for proceso in procesos:
+        proceso.start()
+    for proceso in procesos:
+        proceso.join(timeout=60)
+        assert proceso.exitcode == 0
+
+    entrada = leer_json(ruta)["caliente"]
+    assert entrada["accesos"] == 7
+    assert entrada["ultimo_acceso"] > entrada["timestamp"]
+
+
+def test_worker_en_marcha_toma_el_mantenimiento_cuando_el_dueno_termina(directorio_cache, monkeypatch):
+    import server
+
+    monkeypatch.setattr(server, "_bloqueo_mantenimiento", None)
+    contexto = multiprocessing.get_context("spawn")
+    tomado, soltar = contexto.Event(), contexto.Event()
+    dueno = contexto.Process(target=_retener_bloqueo, args=(str(directorio_cache / ".maintenance"), tomado, soltar))
+    dueno.start()
+    assert tomado.wait(60)
+
+    assert server._tomar_mantenimiento() is False
+    soltar.set()
+    dueno.join(timeout=60)
+    assert server._tomar_mantenimiento() is True
+    server._bloqueo_mantenimiento.close()
@@ -0,0 +1,40 @@
+import pytest
+
+from cost_ledger import (
+    SKU_ENTERPRISE, SKU_ENTERPRISE_ATMOSPHERE, SKU_ESSENTIALS, SKU_IDS_ONLY, SKU_PRO,
+    planificar_field_mask, sku_para_campos
+)
+from server import CAMPOS_DETALLES_ATMOSFERA_V1, CAMPOS_DETALLES_V1, CAMPOS_MAPEO_V1, CAMPOS_RESENAS_V1
+
+
+@pytest.mark.parametrize("campos, sku", [
+    (["id", "photos"], SKU_IDS_ONLY),
+    (["id", "formattedAddress", "location"], SKU_ESSENTIALS),
+    (["displayName.text", "location"], SKU_PRO),
+    (["displayName", "rating", "websiteUri"], SKU_ENTERPRISE),
+    (["rating", "reviews"], SKU_ENTERPRISE_ATMOSPHERE),
+    (["*"], SKU_ENTERPRISE_ATMOSPHERE),
+    (["campoDesconocido"], SKU_ENTERPRISE_ATMOSPHERE),  # Sin tarifa conocida se asume la más cara
+])
+def test_sku_para_campos_toma_el_nivel_mas_alto(campos, sku):
+    assert sku_para_campos(campos) == sku
+
+
+def test_planificar_field_mask_de_busqueda_antepone_places():
+    plan = planificar_field_mask(["displayName.text", "location", "location.latitude"], "places.searchText")
+    assert plan["campos"] == ["places.displayName", "places.location"]
+    assert plan["sku"] == SKU_PRO
+
+
+def test_mascara_por_defecto_de_detalles_no_factura_atmosphere():
+    plan = planificar_field_mask(CAMPOS_DETALLES_V1)
+    assert plan["sku"] == SKU_ENTERPRISE
+    assert plan["costo_estimado_usd"] < plan["costo_comodin_usd"]
+
+    con_atmosfera = planificar_field_mask(CAMPOS_DETALLES_V1 + CAMPOS_DETALLES_ATMOSFERA_V1)
+    assert con_atmosfera["sku"] == SKU_ENTERPRISE_ATMOSPHERE
+
+
+def test_mascaras_de_mapeo_y_resenas():
+    assert planificar_field_mask(CAMPOS_MAPEO_V1, "places.searchText")["sku"] == SKU_ENTERPRISE
+    assert sku_para_campos(CAMPOS_RESENAS_V1) == SKU_ENTERPRISE_ATMOSPHERE  # Las reseñas son Atmosphere
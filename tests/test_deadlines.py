@@ -0,0 +1,54 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+from fastmcp import Client, FastMCP
+
+import deadlines
+from deadlines import PlazoMiddleware
+
+
+def test_plazo_middleware_responde_plazo_agotado_si_la_herramienta_no_termina(monkeypatch):
+    monkeypatch.setenv("PLAZO_HERRAMIENTA_LENTA_S", "0.2")
+    monkeypatch.setattr(deadlines, "PLAZO_GRACIA_S", 0.1)
+    mcp = FastMCP("prueba-plazos")
+    mcp.add_middleware(PlazoMiddleware())
+
+    @mcp.tool()
+    def herramienta_lenta() -> dict:
+        time.sleep(2)
+        return {"status": "success"}
+
+    async def llamar():
+        async with Client(mcp) as cliente:
+            inicio = time.perf_counter()
+            resultado = await cliente.call_tool("herramienta_lenta", {}, raise_on_error=False)
+            return resultado.structured_content, time.perf_counter() - inicio
+
+    respuesta, duracion = asyncio.run(llamar())
+    assert respuesta["error_code"] == "PLAZO_AGOTADO"
+    assert respuesta["plazo"]["motivo"] == "timeout"
+    assert duracion < 1.5  # No espera a que la herramienta termine
+
+
+def test_mapeo_sin_plazo_sirve_el_resultado_vencido_del_cache(directorio_cache, monkeypatch):
+    import server
+
+    monkeypatch.setenv("PLAZO_MAPEO_COMPETENCIA_Y_COLABORADORES_S", "0.001")
+    clave = server.get_cache_key("observatorio", "Vicuña", 20)
+    vencido = (datetime.now() - timedelta(hours=server.CACHE_EXPIRY_HOURS + 1)).isoformat()
+    (directorio_cache / "places_cache.json").write_text(json.dumps({
+        clave: {"timestamp": vencido, "data": {"competencia_directa": [{"nombre": "Observatorio Guardado"}]}}
+    }))
+
+    async def llamar():
+        async with Client(server.mcp) as cliente:
+            resultado = await cliente.call_tool("mapeo_competencia_y_colaboradores",
+                                                {"query": "observatorio", "ubicacion": "Vicuña", "radio_km": 20},
+                                                raise_on_error=False)
+            return resultado.structured_content
+
+    respuesta = asyncio.run(llamar())
+    assert respuesta["competencia_directa"] == [{"nombre": "Observatorio Guardado"}]
+    assert respuesta["plazo_agotado"]["motivo"] == "timeout"
@@ -0,0 +1,24 @@
+"""
+Contexto de ejecución de las herramientas MCP.
+Expone el nombre de la herramienta en curso para que los módulos de soporte
+(contabilidad de costos, métricas) atribuyan su trabajo a la herramienta que
+lo originó, sin tener que pasar ese dato por cada función.
+"""
+from contextvars import ContextVar
+
+from fastmcp.server.middleware import Middleware
+
+
+# Nombre de la herramienta MCP que se está ejecutando en este contexto
+herramienta_actual: ContextVar[str] = ContextVar("herramienta_actual", default="sin_herramienta")
+
+
+class ContextoHerramientaMiddleware(Middleware):
+    """Middleware de FastMCP que fija herramienta_actual durante cada llamada a una herramienta."""
+
+    async def on_call_tool(self, context, call_next):
+        token = herramienta_actual.set(context.message.name)
+        try:
+            return await call_next(context)
+        finally:
+            herramienta_actual.reset(token)